@@ -1,5 +1,7 @@
+from array import array
 from utils import *
 from parse import *
+from arena import *
 
 # TODO: we need a list of all temp variable to allocate the correct stack size
 
@@ -21,12 +23,31 @@ class FunctionSignature:
                 and self.paramTypes == other.paramTypes
                 and self.returnType == other.returnType)
 
+    # Parameter order matters - f(int, bool) and f(bool, int) must not collide
     def __hash__(self):
-        _hash = hash(self.name)
-        _hash = _hash ^ hash(self.returnType)
-        for paramType in self.paramTypes:
-            _hash = _hash ^ hash(paramType)
-        return _hash
+        return hash((self.name, tuple(self.paramTypes), self.returnType))
+
+# Function signatures indexed by name and then by parameter types, so that
+# resolving a call (or an operator) is two dictionary lookups instead of a
+# scan over every known function.
+class SymbolTable:
+    def __init__(self):
+        self.signatures = {}
+
+    # The first signature added for a name and parameter types wins, the same
+    # way a scan in declaration order would find it first.
+    def add(self, signature):
+        overloads = self.signatures.get(signature.name)
+        if overloads is None:
+            overloads = {}
+            self.signatures[signature.name] = overloads
+        overloads.setdefault(tuple(signature.paramTypes), signature)
+
+    def find(self, name, paramTypes):
+        overloads = self.signatures.get(name)
+        if overloads is None:
+            return None
+        return overloads.get(tuple(paramTypes))
 
 class FunctionDetails:
     def __init__(self, signature, node):
@@ -55,6 +76,10 @@ BUILTINS = {
         FunctionSignature("!=", ["int", "int"], "int"): None,
 }
 
+# = is a builtin call whose first argument is the identifier assigned to
+def isAssignment(node):
+    return node.identifier == "=" and node.signature in BUILTINS
+
 class Analyzer:
     def __init__(self, nodes, originalString):
         self.nodes = nodes
@@ -66,8 +91,17 @@ class Analyzer:
         self.globalVariables = {}
         self.builtinFunctions = BUILTINS
         self.functions = {}
+        # Builtins go in first so that they take precedence
+        self.symbols = SymbolTable()
+        for functionSignature in self.builtinFunctions.keys():
+            self.symbols.add(functionSignature)
 
     def analyze(self):
+        # Annotating the tree allocates without making garbage
+        with gcPaused():
+            return self.analyzeNodes()
+
+    def analyzeNodes(self):
         for node in self.nodes:
             self.firstPass(node)
         for node in self.nodes:
@@ -82,11 +116,13 @@ class Analyzer:
         if isinstance(node, GlobalDeclarationNode):
             if self.inFunction: raise Exception("Found a GlobalDeclarationNode while in a function.")
             self.globalVariables[node.variable.name] = node.variable
+            self.annotate(node.literal)
         elif isinstance(node, FunctionNode):
             if self.inFunction: raise Exception("Found a FunctionNode while in a function.")
             functionSignature = self.functionSignatureFromFunctionNode(node)
             functionDetails = FunctionDetails(functionSignature, node)
             self.functions[functionSignature] = functionDetails
+            self.symbols.add(functionSignature)
             # TODO: maybe change this to args
             for variableNode in node.parameters:
                 functionDetails.localVariables[variableNode.name] = variableNode
@@ -120,23 +156,53 @@ class Analyzer:
                 self.secondPass(node.expression)
         elif isinstance(node, IfNode):
             # TODO: we can check the conditional type here
+            self.annotate(node.conditional)
             for statement in node.statements:
                 self.secondPass(statement)
+            for statement in node.elseStatements:
+                self.secondPass(statement)
         elif isinstance(node, WhileNode):
             # TODO: we can check the conditional type here
+            self.annotate(node.conditional)
             for statement in node.statements:
                 self.secondPass(statement)
         elif isinstance(node, CallNode):
-            # Will raise an exception if it's not found
-            self.findFunctionSignatureFromCallNode(node)
+            self.annotate(node)
         elif isinstance(node, IdentifierNode):
-            # Will raise an exception if it's not found
-            self.findIdentifierVariable(node)
+            self.annotate(node)
         elif isinstance(node, LiteralNode):
-            pass
+            self.annotate(node)
         elif isinstance(node, VariableNode):
             pass
 
+    # Resolves an expression bottom-up, once, and caches the result on each
+    # node: resolvedType everywhere, plus the signature on a CallNode and the
+    # variable on an IdentifierNode. Later phases read these instead of
+    # resolving again. An explicit stack keeps deep expressions off the
+    # Python call stack.
+    def annotate(self, expression):
+        stack = [(expression, False)]
+        while len(stack) > 0:
+            node, argumentsDone = stack.pop()
+            if isinstance(node, CallNode):
+                if argumentsDone:
+                    node.signature = self.findFunctionSignatureFromCallNode(node)
+                    if node.signature is not None:
+                        node.resolvedType = node.signature.returnType
+                else:
+                    stack.append((node, True))
+                    for argNode in reversed(node.arguments):
+                        stack.append((argNode, False))
+            elif isinstance(node, IdentifierNode):
+                node.variable = self.findIdentifierVariable(node)
+                if node.variable is not None:
+                    node.resolvedType = node.variable.type
+            elif isinstance(node, LiteralNode):
+                node.resolvedType = node.type
+            else:
+                raise Exception("Invalid attempt to get type on '{}'".format(node))
+        return expression.resolvedType
+
     def functionSignatureFromFunctionNode(self, node):
         name = node.name
         returnType = node.type
@@ -146,44 +212,38 @@ class Analyzer:
         return FunctionSignature(name, paramTypes, returnType)
 
     def findIdentifierVariable(self, node):
+        return self.findVariable(node.value, node.pos)
+
+    def findVariable(self, name, pos):
         if self.inFunction:
-            if node.value in self.currentFunction.localVariables:
-                return self.currentFunction.localVariables[node.value]
-        if node.value in self.globalVariables:
-            return self.globalVariables[node.value]
-        self.addAnalysisError(node.pos, "Variable not found: '{}'.".format(node.value))
+            if name in self.currentFunction.localVariables:
+                return self.currentFunction.localVariables[name]
+        if name in self.globalVariables:
+            return self.globalVariables[name]
+        self.addAnalysisError(pos, "Variable not found: '{}'.".format(name))
         return None
 
+    # The arguments must already have been annotated
     def findFunctionSignatureFromCallNode(self, callNode):
-        identifier = callNode.identifier
         argTypes = []
         for argNode in callNode.arguments:
             argTypes.append(self.getType(argNode))
-        # TODO: We can probably speed this up quite a bit with a hash approach
-        for functionSignature in self.builtinFunctions.keys():
-            if functionSignature.partialMatch(identifier, argTypes):
-                return functionSignature
-        for functionSignature in self.functions.keys():
-            if functionSignature.partialMatch(identifier, argTypes):
-                return functionSignature
-        self.addAnalysisError(callNode.pos, "Function signature not found: {}({}).".format(identifier, ", ".join(argTypes)))
+        return self.findFunctionSignature(callNode.identifier, argTypes, callNode.pos)
+
+    def findFunctionSignature(self, identifier, argTypes, pos):
+        if None in argTypes:
+            # The argument's own error has already been reported
+            return None
+        functionSignature = self.symbols.find(identifier, argTypes)
+        if functionSignature is not None:
+            return functionSignature
+        self.addAnalysisError(pos, "Function signature not found: {}({}).".format(identifier, ", ".join(argTypes)))
         return None
 
+    # Reads the type cached by annotate
     def getType(self, node):
-        if isinstance(node, IdentifierNode):
-            declarationNode = self.findIdentifierVariable(node)
-            if declarationNode is not None:
-                return declarationNode.type
-            else:
-                return None
-        elif isinstance(node, CallNode):
-            functionSignature = self.findFunctionSignatureFromCallNode(node)
-            if functionSignature is not None:
-                return functionSignature.returnType
-            else:
-                return None
-        elif isinstance(node, LiteralNode):
-            return node.type
+        if isinstance(node, (IdentifierNode, CallNode, LiteralNode)):
+            return node.resolvedType
         else:
             raise Exception("Invalid attempt to get type on '{}'".format(node))
 
@@ -194,5 +254,111 @@ class Analyzer:
         return len(self.errors) > 0
 
     def displayAnalysisErrors(self):
+        source = toSourceFile(self.originalString)
         for pos, message in self.errors:
-            displayError(self.originalString, pos, message)
+            displayError(source, pos, message)
+
+# The same analysis as Analyzer, walking an AstArena by node id instead of a
+# tree of node objects. Resolved types and signatures go in columns indexed
+# by node id: resolvedTypes (an index into the arena's constants) and
+# signatures. FunctionDetails.node is the id of the function node.
+class ArenaAnalyzer(Analyzer):
+    def __init__(self, arena, originalString):
+        super().__init__(list(arena.roots), originalString)
+        self.arena = arena
+        self.resolvedTypes = array("i", [NO_VALUE]) * len(arena)
+        self.signatures = [None] * len(arena)
+
+    def firstPass(self, nodeId):
+        arena = self.arena
+        kind = arena.kinds[nodeId]
+        if kind == NODE_GLOBAL_DECLARATION:
+            variableId, literalId = arena.childIds(nodeId)
+            variable = self.variableFromId(variableId)
+            self.globalVariables[variable.name] = variable
+            self.annotate(literalId)
+        elif kind == NODE_FUNCTION:
+            childIds = arena.childIds(nodeId)
+            parameters = [self.variableFromId(childId) for childId in childIds[:arena.splits[nodeId]]]
+            functionSignature = FunctionSignature(arena.value(nodeId), [parameter.type for parameter in parameters], arena.type(nodeId))
+            functionDetails = FunctionDetails(functionSignature, nodeId)
+            self.functions[functionSignature] = functionDetails
+            self.symbols.add(functionSignature)
+            for variableNode in parameters:
+                functionDetails.localVariables[variableNode.name] = variableNode
+
+    def secondPass(self, nodeId):
+        arena = self.arena
+        kind = arena.kinds[nodeId]
+        if kind == NODE_DECLARATION:
+            variableId, expressionId = arena.childIds(nodeId)
+            variable = self.variableFromId(variableId)
+            self.currentFunction.localVariables[variable.name] = variable
+            if expressionId != NO_NODE:
+                self.annotate(expressionId)
+        elif kind == NODE_FUNCTION:
+            childIds = arena.childIds(nodeId)
+            paramTypes = [arena.type(childId) for childId in childIds[:arena.splits[nodeId]]]
+            functionSignature = FunctionSignature(arena.value(nodeId), paramTypes, arena.type(nodeId))
+            self.inFunction = True
+            self.currentFunction = self.functions[functionSignature]
+            for statementId in childIds[arena.splits[nodeId]:]:
+                self.secondPass(statementId)
+            self.inFunction = False
+            self.currentFunction = None
+        elif kind == NODE_RETURN:
+            expressionId = arena.children[arena.childStarts[nodeId]]
+            if expressionId != NO_NODE:
+                self.annotate(expressionId)
+        elif kind == NODE_IF or kind == NODE_WHILE:
+            childIds = arena.childIds(nodeId)
+            self.annotate(childIds[0])
+            for statementId in childIds[1:]:
+                self.secondPass(statementId)
+        elif kind == NODE_CALL or kind == NODE_IDENTIFIER or kind == NODE_LITERAL:
+            self.annotate(nodeId)
+
+    # Ids are in post-order, so an expression is the contiguous run of ids
+    # ending at its root, starting at its leftmost leaf. Walking that run in
+    # order visits every node after its arguments - no stack needed.
+    def annotate(self, expressionId):
+        arena = self.arena
+        kinds = arena.kinds
+        childStarts = arena.childStarts
+        childCounts = arena.childCounts
+        children = arena.children
+        constants = arena.constants
+        resolvedTypes = self.resolvedTypes
+        firstId = expressionId
+        while childCounts[firstId] > 0:
+            firstId = children[childStarts[firstId]]
+        for nodeId in range(firstId, expressionId + 1):
+            kind = kinds[nodeId]
+            if kind == NODE_LITERAL:
+                resolvedTypes[nodeId] = arena.types[nodeId]
+            elif kind == NODE_IDENTIFIER:
+                variable = self.findVariable(arena.value(nodeId), arena.position(nodeId))
+                if variable is not None:
+                    resolvedTypes[nodeId] = arena.intern(variable.type)
+            elif kind == NODE_CALL:
+                start = childStarts[nodeId]
+                argTypes = []
+                for argId in children[start:start + childCounts[nodeId]]:
+                    typeIndex = resolvedTypes[argId]
+                    argTypes.append(None if typeIndex == NO_VALUE else constants[typeIndex])
+                functionSignature = self.findFunctionSignature(arena.value(nodeId), argTypes, arena.position(nodeId))
+                if functionSignature is not None:
+                    self.signatures[nodeId] = functionSignature
+                    resolvedTypes[nodeId] = arena.intern(functionSignature.returnType)
+            else:
+                raise Exception("Invalid attempt to get type on node {}".format(nodeId))
+        return self.getType(expressionId)
+
+    def getType(self, nodeId):
+        typeIndex = self.resolvedTypes[nodeId]
+        if typeIndex == NO_VALUE:
+            return None
+        return self.arena.constants[typeIndex]
+
+    def variableFromId(self, nodeId):
+        return VariableNode(self.arena.value(nodeId), self.arena.type(nodeId))
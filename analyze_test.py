@@ -26,5 +26,58 @@ class TestAnalyze(unittest.TestCase):
         analyzer.analyze()
         self.assertEqual(False, analyzer.hasErrors())
 
+    def testOverloads(self):
+        originalString = """
+        flag: bool = 1;
+        func pick(x: int, y: bool): int {
+            return x;
+        }
+        func pick(x: bool, y: int): bool {
+            return x;
+        }
+        func main(): int {
+            a: int = pick(1, flag);
+            b: bool = pick(flag, 1);
+            return pick(1, pick(flag, a));
+        }
+        """
+        nodes = Parser(Lexxer(originalString).lex(), originalString).parse()
+        analyzer = Analyzer(nodes, originalString)
+        analyzer.analyze()
+        self.assertEqual(False, analyzer.hasErrors())
+        self.assertEqual(FunctionSignature("pick", ["bool", "int"], "bool"), analyzer.symbols.find("pick", ["bool", "int"]))
+        self.assertEqual(None, analyzer.symbols.find("pick", ["int", "int"]))
+
+    def testSignatureHashIsOrderSensitive(self):
+        first = FunctionSignature("f", ["int", "bool"], "int")
+        second = FunctionSignature("f", ["bool", "int"], "int")
+        self.assertNotEqual(hash(first), hash(second))
+        self.assertEqual(hash(first), hash(FunctionSignature("f", ["int", "bool"], "int")))
+
+    def testAnnotations(self):
+        originalString = """
+        func add(x: int, y: int): int {
+            return x + y;
+        }
+        func main(): int {
+            a: int = 2;
+            return add(1 + a, 4);
+        }
+        """
+        nodes = Parser(Lexxer(originalString).lex(), originalString).parse()
+        analyzer = Analyzer(nodes, originalString)
+        lookups = []
+        find = analyzer.symbols.find
+        analyzer.symbols.find = lambda name, paramTypes: lookups.append(name) or find(name, paramTypes)
+        analyzer.analyze()
+        # Each call is resolved exactly once
+        self.assertEqual(["+", "+", "add"], lookups)
+        call = nodes[1].statements[1].expression
+        self.assertEqual(FunctionSignature("add", ["int", "int"], "int"), call.signature)
+        self.assertEqual("int", call.resolvedType)
+        self.assertEqual(FunctionSignature("+", ["int", "int"], "int"), call.arguments[0].signature)
+        self.assertEqual(VariableNode("a", "int"), call.arguments[0].arguments[1].variable)
+        self.assertEqual("int", call.arguments[1].resolvedType)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,209 @@
+from array import array
+from parse import *
+
+# A flat alternative to the tree of node objects. Every node is an integer id
+# into parallel typed arrays, and a node's children are a contiguous run of
+# ids in the children array. Children are always added before their parent,
+# so ids are in post-order and converting in either direction is a single
+# loop rather than a recursive walk.
+
+NODE_LITERAL = 0
+NODE_CALL = 1
+NODE_IF = 2
+NODE_WHILE = 3
+NODE_IDENTIFIER = 4
+NODE_VARIABLE = 5
+NODE_GLOBAL_DECLARATION = 6
+NODE_DECLARATION = 7
+NODE_FUNCTION = 8
+NODE_RETURN = 9
+
+# Stands in for a missing child, e.g. the expression of an empty return
+NO_NODE = -1
+
+# Stands in for a missing value, type or position
+NO_VALUE = -1
+
+class AstArena:
+    def __init__(self):
+        self.kinds = array("B")
+        # Index into constants of the node's literal value, identifier or name
+        self.values = array("i")
+        # Index into constants of the node's type name
+        self.types = array("i")
+        self.positions = array("q")
+        self.childStarts = array("i")
+        self.childCounts = array("i")
+        # Number of parameters of a function, or of statements in an if before the else statements
+        self.splits = array("i")
+        self.children = array("i")
+        self.constants = []
+        self.constantIndices = {}
+        # Ids of the top-level nodes, in program order
+        self.roots = array("i")
+
+    def __len__(self):
+        return len(self.kinds)
+
+    # constantIndices is only needed while adding nodes and can be rebuilt
+    # from constants, so it's left out when pickling
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["constantIndices"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.constantIndices = {}
+        for valueIndex, value in enumerate(self.constants):
+            self.constantIndices[(value.__class__, value)] = valueIndex
+
+    def add(self, kind, value, _type, pos, childIds, split = 0):
+        nodeId = len(self.kinds)
+        self.kinds.append(kind)
+        self.values.append(self.intern(value))
+        self.types.append(self.intern(_type))
+        self.positions.append(NO_VALUE if pos is None else pos)
+        self.childStarts.append(len(self.children))
+        self.childCounts.append(len(childIds))
+        self.splits.append(split)
+        self.children.extend(childIds)
+        return nodeId
+
+    def intern(self, value):
+        if value is None:
+            return NO_VALUE
+        # Keyed by type as well so that e.g. 1 and True can never share an entry
+        key = (value.__class__, value)
+        valueIndex = self.constantIndices.get(key)
+        if valueIndex is None:
+            valueIndex = len(self.constants)
+            self.constantIndices[key] = valueIndex
+            self.constants.append(value)
+        return valueIndex
+
+    def value(self, nodeId):
+        valueIndex = self.values[nodeId]
+        if valueIndex == NO_VALUE:
+            return None
+        return self.constants[valueIndex]
+
+    def type(self, nodeId):
+        typeIndex = self.types[nodeId]
+        if typeIndex == NO_VALUE:
+            return None
+        return self.constants[typeIndex]
+
+    def position(self, nodeId):
+        pos = self.positions[nodeId]
+        if pos == NO_VALUE:
+            return None
+        return pos
+
+    def childIds(self, nodeId):
+        start = self.childStarts[nodeId]
+        return self.children[start:start + self.childCounts[nodeId]]
+
+    @staticmethod
+    def fromNodes(nodes):
+        arena = AstArena()
+        ids = []
+        # Entries are (node, childrenAdded), children are pushed in reverse so
+        # that they're added in order
+        stack = []
+        for node in reversed(nodes):
+            stack.append((node, False))
+        while len(stack) > 0:
+            node, childrenAdded = stack.pop()
+            children = nodeChildren(node)
+            if not childrenAdded and len(children) > 0:
+                stack.append((node, True))
+                for child in reversed(children):
+                    stack.append((child, False))
+                continue
+            childIds = []
+            if len(children) > 0:
+                childIds = ids[len(ids) - len(children):]
+                del ids[len(ids) - len(children):]
+            ids.append(arena.addNode(node, childIds))
+        arena.roots.extend(ids)
+        return arena
+
+    def addNode(self, node, childIds):
+        if node is None:
+            return NO_NODE
+        elif isinstance(node, LiteralNode):
+            return self.add(NODE_LITERAL, node.value, node.type, None, childIds)
+        elif isinstance(node, CallNode):
+            return self.add(NODE_CALL, node.identifier, None, node.pos, childIds)
+        elif isinstance(node, IfNode):
+            return self.add(NODE_IF, None, None, None, childIds, len(node.statements))
+        elif isinstance(node, WhileNode):
+            return self.add(NODE_WHILE, None, None, None, childIds)
+        elif isinstance(node, IdentifierNode):
+            return self.add(NODE_IDENTIFIER, node.value, None, node.pos, childIds)
+        elif isinstance(node, VariableNode):
+            return self.add(NODE_VARIABLE, node.name, node.type, None, childIds)
+        elif isinstance(node, GlobalDeclarationNode):
+            return self.add(NODE_GLOBAL_DECLARATION, None, None, None, childIds)
+        elif isinstance(node, DeclarationNode):
+            return self.add(NODE_DECLARATION, None, None, None, childIds)
+        elif isinstance(node, FunctionNode):
+            return self.add(NODE_FUNCTION, node.name, node.type, None, childIds, len(node.parameters))
+        elif isinstance(node, ReturnNode):
+            return self.add(NODE_RETURN, None, None, None, childIds)
+        else:
+            raise Exception("Can't add '{}' to an arena".format(node))
+
+    def toNodes(self):
+        nodes = []
+        for nodeId in range(len(self.kinds)):
+            children = [None if childId == NO_NODE else nodes[childId] for childId in self.childIds(nodeId)]
+            nodes.append(self.makeNode(nodeId, children))
+        return [nodes[rootId] for rootId in self.roots]
+
+    def makeNode(self, nodeId, children):
+        kind = self.kinds[nodeId]
+        split = self.splits[nodeId]
+        if kind == NODE_LITERAL:
+            return LiteralNode(self.type(nodeId), self.value(nodeId))
+        elif kind == NODE_CALL:
+            return CallNode(self.value(nodeId), children, self.position(nodeId))
+        elif kind == NODE_IF:
+            return IfNode(children[0], children[1:split + 1], children[split + 1:])
+        elif kind == NODE_WHILE:
+            return WhileNode(children[0], children[1:])
+        elif kind == NODE_IDENTIFIER:
+            return IdentifierNode(self.value(nodeId), self.position(nodeId))
+        elif kind == NODE_VARIABLE:
+            return VariableNode(self.value(nodeId), self.type(nodeId))
+        elif kind == NODE_GLOBAL_DECLARATION:
+            return GlobalDeclarationNode(children[0], children[1])
+        elif kind == NODE_DECLARATION:
+            return DeclarationNode(children[0], children[1])
+        elif kind == NODE_FUNCTION:
+            return FunctionNode(self.value(nodeId), self.type(nodeId), children[:split], children[split:])
+        elif kind == NODE_RETURN:
+            return ReturnNode(children[0])
+        else:
+            raise Exception("Unknown node kind {}".format(kind))
+
+# The children of a node in the order the arena stores them. None stands in
+# for a missing expression so that positions within the children stay fixed.
+def nodeChildren(node):
+    if isinstance(node, CallNode):
+        return node.arguments
+    elif isinstance(node, IfNode):
+        return [node.conditional] + node.statements + node.elseStatements
+    elif isinstance(node, WhileNode):
+        return [node.conditional] + node.statements
+    elif isinstance(node, GlobalDeclarationNode):
+        return [node.variable, node.literal]
+    elif isinstance(node, DeclarationNode):
+        return [node.variable, node.expression]
+    elif isinstance(node, FunctionNode):
+        return node.parameters + node.statements
+    elif isinstance(node, ReturnNode):
+        return [node.expression]
+    else:
+        return []
@@ -0,0 +1,74 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from parse import *
+from lex import *
+from analyze import *
+from arena import *
+
+PROGRAM = """
+myNum: int = 1;
+func add(x: int, y: int): int {
+    return x + y;
+}
+func myFunction(x: int): int {
+    myLocal: int = 0 - x;
+    while myLocal != 0 {
+        myLocal = myLocal - 1;
+    }
+    if x == myNum {
+        myLocal = add(2, 3 * x);
+        return add(myLocal, myNum);
+    } else {
+        return;
+    }
+}
+"""
+
+def parseProgram(originalString):
+    return Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+
+class TestArena(unittest.TestCase):
+    def testRoundTrip(self):
+        nodes = parseProgram(PROGRAM)
+        arena = AstArena.fromNodes(nodes)
+        actual = arena.toNodes()
+        self.assertEqual(actual, nodes)
+        self.assertEqual(actual[2].statements[2].conditional.pos, nodes[2].statements[2].conditional.pos)
+        self.assertEqual(arena.kinds[arena.roots[1]], NODE_FUNCTION)
+        self.assertEqual(arena.value(arena.roots[1]), "add")
+
+    def testDeepExpression(self):
+        originalString = " + ".join(["x"] * 50000)
+        expression = Parser(Lexxer(originalString).lexCompact(), originalString).parseExpression()
+        arena = AstArena.fromNodes([ReturnNode(expression)])
+        self.assertEqual(len(arena), 100000)
+        self.assertEqual(arena.toNodes()[0].expression.arguments[1], IdentifierNode("x"))
+
+    def testAnalyzer(self):
+        nodes = parseProgram(PROGRAM)
+        expected = Analyzer(nodes, PROGRAM).analyze()
+        arena = AstArena.fromNodes(nodes)
+        analyzer = ArenaAnalyzer(arena, PROGRAM)
+        actual = analyzer.analyze()
+        self.assertEqual(list(actual.functions.keys()), list(expected.functions.keys()))
+        self.assertEqual(actual.globalVariables, expected.globalVariables)
+        for signature, functionDetails in actual.functions.items():
+            self.assertEqual(functionDetails.localVariables, expected.functions[signature].localVariables)
+        returnId = arena.childIds(arena.childIds(arena.roots[1])[2])[0]
+        self.assertEqual(analyzer.getType(returnId), "int")
+        self.assertEqual(analyzer.signatures[returnId], FunctionSignature("+", ["int", "int"], "int"))
+
+    def testAnalyzerErrors(self):
+        originalString = "func main(): int {\n  a: int = b + c(1);\n  return a;\n}\n"
+        nodes = parseProgram(originalString)
+        expected = Analyzer(nodes, originalString)
+        actual = ArenaAnalyzer(AstArena.fromNodes(nodes), originalString)
+        with redirect_stdout(io.StringIO()):
+            self.assertRaises(Exception, expected.analyze)
+            self.assertRaises(Exception, actual.analyze)
+        self.assertEqual(actual.errors, expected.errors)
+        self.assertEqual(len(actual.errors), 2)
+
+if __name__ == "__main__":
+    unittest.main()
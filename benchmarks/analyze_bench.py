@@ -0,0 +1,71 @@
+# Times Analyzer.analyze on programs with many functions and call sites,
+# against the previous linear scan over every signature for each call.
+# Run from the repository root: python -m benchmarks.analyze_bench
+import math
+import sys
+import time
+from lex import *
+from parse import *
+from analyze import *
+
+CALLS_PER_FUNCTION = 10
+
+def generateSource(functionCount):
+    parts = []
+    for i in range(functionCount):
+        calls = []
+        for j in range(CALLS_PER_FUNCTION):
+            calls.append("    x = function_{}(x, y);\n".format((i * 7919 + j * 104729) % functionCount))
+        parts.append("func function_{}(x: int, y: int): int {{\n{}    return x;\n}}\n".format(i, "".join(calls)))
+    return "".join(parts)
+
+# How calls were resolved before the symbol table, kept here as the baseline
+class ReferenceAnalyzer(Analyzer):
+    def findFunctionSignatureFromCallNode(self, callNode):
+        identifier = callNode.identifier
+        argTypes = []
+        for argNode in callNode.arguments:
+            argTypes.append(self.getType(argNode))
+        for functionSignature in self.builtinFunctions.keys():
+            if functionSignature.partialMatch(identifier, argTypes):
+                return functionSignature
+        for functionSignature in self.functions.keys():
+            if functionSignature.partialMatch(identifier, argTypes):
+                return functionSignature
+        self.addAnalysisError(callNode.pos, "Function signature not found.")
+        return None
+
+def timeAnalyzer(analyzerClass, nodes, source):
+    start = time.perf_counter()
+    analyzerClass(nodes, source).analyze()
+    return time.perf_counter() - start
+
+def printScaling(name, counts, times):
+    exponent = math.log(times[-1] / times[0]) / math.log(counts[-1] / counts[0])
+    print("{} scales as n^{:.2f}".format(name, exponent))
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 2500, 5000, 10000]
+    # The reference is quadratic, so it only runs on the smaller programs
+    referenceLimit = 2500
+    referenceCounts, referenceTimes, functionCounts, times = [], [], [], []
+    for count in counts:
+        source = generateSource(count)
+        nodes = Parser(Lexxer(source).lexCompact(), source).parse()
+        analyzeTime = timeAnalyzer(Analyzer, nodes, source)
+        functionCounts.append(count)
+        times.append(analyzeTime)
+        line = "{:>7} functions {:>8} call sites  symbol table {:>8.3f}s".format(count, count * CALLS_PER_FUNCTION, analyzeTime)
+        if count <= referenceLimit:
+            referenceTime = timeAnalyzer(ReferenceAnalyzer, nodes, source)
+            referenceCounts.append(count)
+            referenceTimes.append(referenceTime)
+            line += "  linear scan {:>8.3f}s".format(referenceTime)
+        print(line)
+    if len(functionCounts) > 1:
+        printScaling("symbol table", functionCounts, times)
+    if len(referenceCounts) > 1:
+        printScaling("linear scan", referenceCounts, referenceTimes)
+
+if __name__ == "__main__":
+    main()
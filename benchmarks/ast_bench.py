@@ -0,0 +1,50 @@
+# Compares the memory held by the node tree against the flat AstArena for a
+# large program, and the time taken to analyze each form.
+# Run from the repository root: python -m benchmarks.ast_bench
+import sys
+import time
+import tracemalloc
+from lex import *
+from parse import *
+from analyze import *
+from arena import *
+from benchmarks.lex_bench import generateSource
+
+def countNodes(nodes):
+    count = 0
+    stack = list(nodes)
+    while len(stack) > 0:
+        node = stack.pop()
+        if node is not None:
+            count += 1
+            stack.extend(nodeChildren(node))
+    return count
+
+def measure(function):
+    tracemalloc.start()
+    result = function()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+def timeAnalyzer(analyzerClass, nodes, source):
+    start = time.perf_counter()
+    analyzerClass(nodes, source).analyze()
+    return time.perf_counter() - start
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1024 * 1024, 4 * 1024 * 1024]
+    for size in sizes:
+        source = generateSource(size)
+        tokens = Lexxer(source).lexCompact()
+        nodes, nodesSize = measure(lambda: Parser(tokens, source).parse())
+        arena, arenaSize = measure(lambda: AstArena.fromNodes(nodes))
+        nodeCount = countNodes(nodes)
+        print("{:>10} bytes of source {:>9} nodes".format(len(source), nodeCount))
+        print("  nodes  {:>6.1f} bytes/node  {:>6.1f}x source  analyze {:>7.3f}s".format(
+            nodesSize / nodeCount, nodesSize / len(source), timeAnalyzer(Analyzer, nodes, source)))
+        print("  arena  {:>6.1f} bytes/node  {:>6.1f}x source  analyze {:>7.3f}s".format(
+            arenaSize / nodeCount, arenaSize / len(source), timeAnalyzer(ArenaAnalyzer, arena, source)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# Times compiling a directory of generated files with an increasing number of
+# worker processes. Wall-clock time should drop with each worker up to the
+# number of cores.
+# Run from the repository root: python -m benchmarks.build_bench [files]
+import os
+import sys
+import tempfile
+import time
+from build import *
+from benchmarks.incremental_bench import generateProgram
+
+def main():
+    fileCount = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    cores = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(fileCount):
+            text = generateProgram(50).replace("func f", "func m{}_f".format(i))
+            with open(os.path.join(directory, "m{}.ul".format(i)), "w") as outputFile:
+                outputFile.write(text)
+        workers = 1
+        baseline = None
+        while workers <= max(cores, 2):
+            start = time.perf_counter()
+            status = compileFiles([directory], workers)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = elapsed
+            print("{:>3} workers {:>8.3f}s {:>6.2f}x (status {})".format(workers, elapsed, baseline / elapsed, status))
+            workers *= 2
+    print("{} cores".format(cores))
+
+if __name__ == "__main__":
+    main()
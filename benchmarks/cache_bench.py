@@ -0,0 +1,30 @@
+# Times compiling a file from scratch against loading it back from the
+# on-disk cache, and reports the size of the cache entry.
+# Run from the repository root: python -m benchmarks.cache_bench [functions...]
+import os
+import sys
+import tempfile
+import time
+from cache import *
+from benchmarks.incremental_bench import generateProgram
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000]
+    for count in counts:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "source.ul")
+            with open(path, "w") as outputFile:
+                outputFile.write(generateProgram(count))
+            diskCache = DiskCache(os.path.join(directory, "cache"))
+            start = time.perf_counter()
+            diskCache.compile(path)
+            missTime = time.perf_counter() - start
+            start = time.perf_counter()
+            diskCache.compile(path)
+            hitTime = time.perf_counter() - start
+            entryBytes = sum(os.path.getsize(os.path.join(diskCache.directory, name)) for name in os.listdir(diskCache.directory))
+            print("{:>6} functions {:>8} bytes of source, entry {:>8} bytes, miss {:>8.2f}ms hit {:>8.2f}ms {:>6.1f}x".format(
+                count, os.path.getsize(path), entryBytes, missTime * 1000, hitTime * 1000, missTime / hitTime))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# Times the same programs compiled with linear scan register allocation and
+# with every virtual register on the stack. Assembles with GNU as through
+# gcc, which reads the GAS dialect of the same instructions.
+# Run from the repository root: python -m benchmarks.codegen_bench [iterations]
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from lex import *
+from parse import *
+from analyze import *
+from compile import *
+
+HARNESS = """
+#include <stdio.h>
+long compute(long n);
+int main(int argc, char **argv) {
+    long n = 0;
+    sscanf(argv[1], "%ld", &n);
+    printf("%ld\\n", compute(n));
+    return 0;
+}
+"""
+
+PROGRAMS = {
+    "arithmetic loop": """
+func compute(n: int): int {
+    i: int = 0;
+    total: int = 0;
+    while i != n {
+        total = total * 3 + i - (total == i);
+        i = i + 1;
+    }
+    return total;
+}
+""",
+    "division loop": """
+func compute(n: int): int {
+    i: int = 0;
+    total: int = 0;
+    while i != n {
+        total = total + i * 3 - total / 7;
+        i = i + 1;
+    }
+    return total;
+}
+""",
+    "calls in a loop": """
+func step(x: int, y: int): int {
+    return x * 31 + y;
+}
+func compute(n: int): int {
+    i: int = 0;
+    hash: int = 7;
+    while i != n {
+        hash = step(hash, i);
+        i = i + 1;
+    }
+    return hash;
+}
+""",
+}
+
+def build(originalString, directory, name, allocateRegisters):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    assembly = CodeGenerator(lowerProgram(nodes, programDetails), dialect = GAS, allocateRegisters = allocateRegisters).generate()
+    assemblyPath = os.path.join(directory, name + ".s")
+    with open(assemblyPath, "w") as outputFile:
+        outputFile.write(assembly)
+    executablePath = os.path.join(directory, name)
+    subprocess.run(["gcc", "-no-pie", "-o", executablePath, os.path.join(directory, "harness.c"), assemblyPath], check = True)
+    return executablePath
+
+def timeRun(executablePath, iterations):
+    start = time.perf_counter()
+    output = subprocess.run([executablePath, str(iterations)], check = True, capture_output = True, text = True).stdout
+    return time.perf_counter() - start, output
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000000
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "harness.c"), "w") as outputFile:
+            outputFile.write(HARNESS)
+        for name, originalString in PROGRAMS.items():
+            registerTime, registerOutput = timeRun(build(originalString, directory, "registers", True), iterations)
+            stackTime, stackOutput = timeRun(build(originalString, directory, "stack", False), iterations)
+            if registerOutput != stackOutput:
+                raise Exception("Results differ for {}: {} and {}".format(name, registerOutput, stackOutput))
+            print("{:<16} registers {:>7.3f}s stack only {:>7.3f}s {:>5.2f}x".format(name, registerTime, stackTime, stackTime / registerTime))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Compiles a generated library of functions where main only uses a small
+# fraction of them, with and without dead code elimination, and compares
+# compile time and the size of the generated code.
+# Run from the repository root: python -m benchmarks.dce_bench [functions...]
+import sys
+import time
+from lex import *
+from parse import *
+from analyze import *
+from dce import *
+from compile import *
+
+# Every tenth function is called from main, and each of those calls the
+# next one
+def generateProgram(functionCount):
+    lines = []
+    for i in range(functionCount):
+        lines.append("func f{}(x: int): int {{".format(i))
+        lines.append("  y: int = x * {} + 1;".format(i))
+        lines.append("  while y != x {")
+        lines.append("    y = y - 1;")
+        lines.append("  }")
+        if i % 10 == 0 and i + 1 < functionCount:
+            lines.append("  return f{}(y);".format(i + 1))
+        else:
+            lines.append("  return y;")
+        lines.append("  y = 0;")
+        lines.append("}")
+    lines.append("func main(): int {")
+    lines.append("  total: int = 0;")
+    for i in range(0, functionCount, 10):
+        lines.append("  total = total + f{}({});".format(i, i))
+    lines.append("  return total;")
+    lines.append("}")
+    return "\n".join(lines)
+
+def compileProgram(originalString, eliminate):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    start = time.perf_counter()
+    eliminator = None
+    if eliminate:
+        eliminator = eliminateDeadCode(nodes, programDetails)
+    eliminateTime = time.perf_counter() - start
+    assembly = CodeGenerator(lowerProgram(nodes, programDetails)).generate()
+    totalTime = time.perf_counter() - start
+    return eliminator, eliminateTime, totalTime, assembly.count("\n")
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [100, 1000]
+    for count in counts:
+        originalString = generateProgram(count)
+        _, _, plainTime, plainLines = compileProgram(originalString, False)
+        eliminator, eliminateTime, eliminatedTime, eliminatedLines = compileProgram(originalString, True)
+        print("{} functions: removed {} functions and {} unreachable statements in {:.3f}s".format(
+            count, len(eliminator.removedFunctions), eliminator.unreachableCount, eliminateTime))
+        print("  without dead code elimination {:>7.3f}s {:>7} lines of assembly".format(plainTime, plainLines))
+        print("  with dead code elimination    {:>7.3f}s {:>7} lines of assembly".format(eliminatedTime, eliminatedLines))
+
+if __name__ == "__main__":
+    main()
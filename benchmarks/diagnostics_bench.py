@@ -0,0 +1,70 @@
+# Times printing analysis errors for files with an error in every function,
+# against the previous displayError that rescanned the source for each error.
+# Run from the repository root: python -m benchmarks.diagnostics_bench
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+from lex import *
+from parse import *
+from analyze import *
+
+def generateSource(functionCount):
+    parts = []
+    for i in range(functionCount):
+        parts.append("func function_{i}(x: int): int {{\n    return missing_{i};\n}}\n".format(i = i))
+    return "".join(parts)
+
+# displayError as it was before offsets, kept here as the baseline
+def referenceDisplayError(string, pos, errorMessage):
+    errorLinePos, errorCharPos = pos
+    linePos = 0
+    linePrevious = ""
+    line = ""
+    lineNext = ""
+    for char in string:
+        if char == "\n":
+            if linePos > errorLinePos:
+                break
+            linePrevious = line
+            line = lineNext
+            lineNext = ""
+            linePos += 1
+        else:
+            lineNext += char
+    print()
+    print(linePrevious)
+    print(line)
+    print(repeat("-", errorCharPos) + "^")
+    print(lineNext)
+    print(errorMessage)
+    print()
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [250, 500, 1000, 2000]
+    for count in counts:
+        source = generateSource(count)
+        nodes = Parser(Lexxer(source).lexCompact(), source).parse()
+        analyzer = Analyzer(nodes, source)
+        for node in nodes:
+            analyzer.firstPass(node)
+        for node in nodes:
+            analyzer.secondPass(node)
+
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            analyzer.displayAnalysisErrors()
+        displayTime = time.perf_counter() - start
+
+        sourceFile = SourceFile(source)
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            for pos, message in analyzer.errors:
+                referenceDisplayError(source, sourceFile.position(pos), message)
+        referenceTime = time.perf_counter() - start
+
+        print("{:>8} errors {:>9} bytes  reference {:>8.3f}s  line index {:>8.3f}s".format(
+            len(analyzer.errors), len(source), referenceTime, displayTime))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# Times writing an object file for generated programs of growing size two
+# ways from the same machine instructions: as GAS assembly text assembled by
+# GNU as, and encoded in process by encode.py. Code generation up to the
+# machine instructions is shared, so it's timed once and left out of both.
+# Checks the two objects have the same code, data and relocations.
+# Run from the repository root: python -m benchmarks.encode_bench [functions...]
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from lex import *
+from parse import *
+from analyze import *
+from encode import *
+
+def generateProgram(functionCount):
+    lines = ["seed: int = 17;"]
+    for f in range(functionCount):
+        lines.append("func f{}(n: int, m: int): int {{".format(f))
+        lines.append("  a: int = n * {};".format(f + 3))
+        lines.append("  b: int = m + seed;")
+        lines.append("  i: int = 0;")
+        lines.append("  while i != n {")
+        lines.append("    if a == b {{ a = a / {}; }} else {{ b = b - a * 4294967296; }}".format(f + 2))
+        if f > 0:
+            lines.append("    seed = seed + f{}(a, i);".format(f - 1))
+        lines.append("    i = i + 1;")
+        lines.append("  }")
+        lines.append("  return (a == b) + a * b;")
+        lines.append("}")
+    return "\n".join(lines)
+
+def timeAssembler(machineProgram, directory):
+    assemblyPath = os.path.join(directory, "program.s")
+    objectPath = os.path.join(directory, "program-as.o")
+    start = time.perf_counter()
+    with open(assemblyPath, "w") as outputFile:
+        outputFile.write(formatAssembly(machineProgram, GAS))
+    subprocess.run(["as", "-o", objectPath, assemblyPath], check = True)
+    elapsed = time.perf_counter() - start
+    with open(objectPath, "rb") as inputFile:
+        return elapsed, readObjectFile(inputFile.read())
+
+def timeEncoder(machineProgram, directory):
+    objectPath = os.path.join(directory, "program.o")
+    start = time.perf_counter()
+    objectData = writeObjectFile(encodeProgram(machineProgram))
+    with open(objectPath, "wb") as outputFile:
+        outputFile.write(objectData)
+    return time.perf_counter() - start, readObjectFile(objectData)
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1, 10, 100, 1000]
+    with tempfile.TemporaryDirectory() as directory:
+        for count in counts:
+            originalString = generateProgram(count)
+            nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+            programDetails = Analyzer(nodes, originalString).analyze()
+            start = time.perf_counter()
+            machineProgram = CodeGenerator(lowerProgram(nodes, programDetails), dialect = GAS).generateMachineCode()
+            codegenTime = time.perf_counter() - start
+            assemblerTime, expected = timeAssembler(machineProgram, directory)
+            encoderTime, objectFile = timeEncoder(machineProgram, directory)
+            if (objectFile.text, objectFile.data, objectFile.relocations) != (expected.text, expected.data, expected.relocations):
+                raise Exception("Objects differ for {} functions".format(count))
+            print("{:>5} functions {:>8} bytes of code: codegen {:>8.2f}ms, text + as {:>8.2f}ms, encoder {:>8.2f}ms, {:>8.2f}ms saved per file".format(
+                count, len(objectFile.text), codegenTime * 1000, assemblerTime * 1000, encoderTime * 1000, (assemblerTime - encoderTime) * 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Compiles generated programs full of constant expressions and locals
+# assigned once from literals, with and without constant folding, and
+# compares compile time and the size of the generated code.
+# Run from the repository root: python -m benchmarks.fold_bench [functions...]
+import sys
+import time
+from lex import *
+from parse import *
+from analyze import *
+from fold import *
+from compile import *
+
+def generateProgram(functionCount):
+    lines = []
+    for i in range(functionCount):
+        lines.append("func f{}(x: int): int {{".format(i))
+        lines.append("  size: int = 64 * 1024 + {};".format(i))
+        lines.append("  mask: int = size - 1;")
+        lines.append("  scale: int = (size / 8) * (mask == 65535 + {}) + 3;".format(i))
+        lines.append("  i: int = 0;")
+        lines.append("  while i != size / 1024 {")
+        lines.append("    x = x * scale + mask - (2 * 3 * 7);")
+        lines.append("    i = i + 1;")
+        lines.append("  }")
+        lines.append("  return x + size * 9223372036854775807;")
+        lines.append("}")
+    return "\n".join(lines)
+
+def compileProgram(originalString, fold):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    start = time.perf_counter()
+    folder = None
+    if fold:
+        folder = foldConstants(nodes, programDetails, originalString)
+    foldTime = time.perf_counter() - start
+    program = lowerProgram(nodes, programDetails)
+    assembly = CodeGenerator(program).generate()
+    totalTime = time.perf_counter() - start
+    instructionCount = sum(len(block.instructions) for function in program.functions for block in function.blocks)
+    return folder, foldTime, totalTime, instructionCount, assembly.count("\n")
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [100, 1000]
+    for count in counts:
+        originalString = generateProgram(count)
+        _, _, plainTime, plainInstructions, plainLines = compileProgram(originalString, False)
+        folder, foldTime, foldedTime, foldedInstructions, foldedLines = compileProgram(originalString, True)
+        print("{} functions: folded {} calls and propagated {} identifiers, removing {} nodes in {:.3f}s".format(
+            count, folder.foldedCount, folder.propagatedCount, folder.removedCount, foldTime))
+        print("  without folding {:>7.3f}s {:>7} IR instructions {:>7} lines of assembly".format(plainTime, plainInstructions, plainLines))
+        print("  with folding    {:>7.3f}s {:>7} IR instructions {:>7} lines of assembly".format(foldedTime, foldedInstructions, foldedLines))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Deterministic synthetic programs for benchmarks, scaled along separate
+# axes so a phase that's only slow for one kind of growth still shows up:
+# how many functions, how many statements each has, how deeply expressions
+# nest, how often an expression operand is a call and how many globals
+# there are. The same shape and seed always give the same program, and
+# every program passes analysis.
+import random
+
+OPERATORS = ["+", "-", "*", "/", "==", "!="]
+
+class ProgramShape:
+    def __init__(self, functionCount = 100, statementCount = 10, expressionDepth = 3, callDensity = 0.2, globalCount = 10, seed = 0):
+        self.functionCount = functionCount
+        self.statementCount = statementCount
+        # Operators in each expression, nested one inside the next
+        self.expressionDepth = expressionDepth
+        # The chance that an expression operand is a call
+        self.callDensity = callDensity
+        self.globalCount = globalCount
+        self.seed = seed
+
+    def __repr__(self):
+        return "ProgramShape(functionCount = {}, statementCount = {}, expressionDepth = {}, callDensity = {}, globalCount = {}, seed = {})".format(
+            self.functionCount, self.statementCount, self.expressionDepth, self.callDensity, self.globalCount, self.seed)
+
+class ProgramGenerator:
+    def __init__(self, shape):
+        self.shape = shape
+        self.random = random.Random(shape.seed)
+        self.globalNames = ["global_{}".format(i) for i in range(shape.globalCount)]
+        self.parameterCounts = [self.random.randint(0, 3) for i in range(shape.functionCount)]
+        self.lines = []
+
+    def generate(self):
+        for name in self.globalNames:
+            self.lines.append("{}: int = {};".format(name, self.random.randint(0, 1000)))
+        for i in range(self.shape.functionCount):
+            self.generateFunction(i)
+        return "\n".join(self.lines) + "\n"
+
+    def generateFunction(self, index):
+        parameters = ["p{}".format(i) for i in range(self.parameterCounts[index])]
+        self.lines.append("func function_{}({}): int {{".format(index, ", ".join(name + ": int" for name in parameters)))
+        # Only locals declared at the top level are certain to be declared
+        # before every later statement
+        self.variables = list(parameters)
+        self.localCount = 0
+        for i in range(self.shape.statementCount):
+            self.generateStatement(1)
+        self.lines.append("    return {};".format(self.expression()))
+        self.lines.append("}")
+
+    def newLocal(self):
+        name = "local_{}".format(self.localCount)
+        self.localCount += 1
+        return name
+
+    def generateStatement(self, level):
+        indent = "    " * level
+        choice = self.random.random()
+        if choice < 0.4 or len(self.variables) == 0:
+            name = self.newLocal()
+            self.lines.append("{}{}: int = {};".format(indent, name, self.expression()))
+            if level == 1:
+                self.variables.append(name)
+        elif choice < 0.7:
+            target = self.random.choice(self.variables + self.globalNames)
+            self.lines.append("{}{} = {};".format(indent, target, self.expression()))
+        elif choice < 0.85 or level > 2:
+            self.lines.append("{}if {} == {} {{".format(indent, self.operand(), self.expression()))
+            self.generateStatement(level + 1)
+            self.lines.append("{}}} else {{".format(indent))
+            self.generateStatement(level + 1)
+            self.lines.append("{}}}".format(indent))
+        else:
+            counter = self.random.choice(self.variables)
+            self.lines.append("{}while {} != {} {{".format(indent, counter, self.operand()))
+            self.generateStatement(level + 1)
+            self.lines.append("{}    {} = {} + 1;".format(indent, counter, counter))
+            self.lines.append("{}}}".format(indent))
+
+    # expressionDepth operators, alternately nesting to the left and right
+    def expression(self):
+        text = self.operand()
+        for i in range(self.shape.expressionDepth):
+            operator = self.random.choice(OPERATORS)
+            if i % 2 == 0:
+                text = "({} {} {})".format(self.operand(), operator, text)
+            else:
+                text = "({} {} {})".format(text, operator, self.operand())
+        return text
+
+    def operand(self):
+        if self.random.random() < self.shape.callDensity:
+            callee = self.random.randrange(self.shape.functionCount)
+            arguments = [self.simpleOperand() for i in range(self.parameterCounts[callee])]
+            return "function_{}({})".format(callee, ", ".join(arguments))
+        return self.simpleOperand()
+
+    def simpleOperand(self):
+        choice = self.random.random()
+        if choice < 0.4 and len(self.variables) > 0:
+            return self.random.choice(self.variables)
+        if choice < 0.6 and len(self.globalNames) > 0:
+            return self.random.choice(self.globalNames)
+        return str(self.random.randint(0, 100000))
+
+def generateProgram(shape):
+    return ProgramGenerator(shape).generate()
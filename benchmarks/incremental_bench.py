@@ -0,0 +1,51 @@
+# Times one-character edits inside random functions with ParseResult.applyEdit
+# against re-parsing the whole file, as the file grows. Only the edited
+# declaration is read back, as an editor would. An edit that adds a function
+# is timed as well, as it folds the pending shifts into every span.
+# Run from the repository root: python -m benchmarks.incremental_bench
+import random
+import sys
+import time
+from lex import *
+from parse import *
+from incremental import *
+
+# Edits timed per file size
+EDITS = 200
+
+def generateProgram(functionCount):
+    parts = []
+    for i in range(functionCount):
+        parts.append("func f{}(x: int): int {{\n    y: int = x + {};\n    return y * 2;\n}}\n".format(i, i))
+    return "".join(parts)
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000, 100000]
+    random.seed(0)
+    for count in counts:
+        text = generateProgram(count)
+        start = time.perf_counter()
+        result = ParseResult.parse(text)
+        fullTime = time.perf_counter() - start
+
+        editTimes = []
+        for i in range(EDITS):
+            # Put a digit in front of the literal in a random function
+            function = random.randrange(count)
+            offset = result.getStart(function) + len("func f{}(x: int): int {{\n    y: int = x + ".format(function))
+            start = time.perf_counter()
+            result.applyEdit(offset, offset, "7")
+            result.getNode(function)
+            editTimes.append(time.perf_counter() - start)
+
+        offset = result.getStart(count // 2)
+        start = time.perf_counter()
+        result.applyEdit(offset, offset, "func added(): int { return 0; }\n")
+        result.getNode(count // 2)
+        addTime = time.perf_counter() - start
+
+        print("{:>6} functions {:>9} bytes full {:>9.2f}ms edit mean {:>6.3f}ms max {:>6.3f}ms add function {:>7.3f}ms".format(
+            count, len(text), fullTime * 1000, sum(editTimes) / len(editTimes) * 1000, max(editTimes) * 1000, addTime * 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# Runs a set of programs that call small functions in a loop, built with and
+# without inlining, and compares how many calls they make and how long they
+# take. Calls are counted by a second build whose functions each bump a
+# counter on entry. Assembles with GNU as through gcc.
+# Run from the repository root: python -m benchmarks.inline_bench [iterations]
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from lex import *
+from parse import *
+from analyze import *
+from inline import *
+from compile import *
+
+HARNESS = """
+#include <stdio.h>
+long compute(long n);
+long dynamicCalls;
+int main(int argc, char **argv) {
+    long n = 0;
+    sscanf(argv[1], "%ld", &n);
+    long result = compute(n);
+    printf("%ld %ld\\n", result, dynamicCalls);
+    return 0;
+}
+"""
+
+PROGRAMS = {
+    "leaf in a loop": """
+func add(x: int, y: int): int {
+    return x + y;
+}
+func compute(n: int): int {
+    i: int = 0;
+    total: int = 0;
+    while i != n {
+        total = add(total, i * 3);
+        i = add(i, 1);
+    }
+    return total;
+}
+""",
+    "nested helpers": """
+func square(x: int): int { return x * x; }
+func mix(a: int, b: int): int { return square(a) - square(b) + a; }
+func hash(h: int, x: int): int {
+    m: int = mix(h, x);
+    return m * 31 + x;
+}
+func compute(n: int): int {
+    i: int = 0;
+    h: int = 7;
+    while i != n {
+        h = hash(h, i);
+        i = i + 1;
+    }
+    return h;
+}
+""",
+    "recursive kept": """
+func fib(n: int): int {
+    if n == 0 { return 0; }
+    if n == 1 { return 1; }
+    return fib(n - 1) + fib(n - 2);
+}
+func step(x: int): int { return x + 1; }
+func compute(n: int): int {
+    i: int = 0;
+    total: int = 0;
+    while i != n / 1000 {
+        total = total + fib(12);
+        i = step(i);
+    }
+    return total;
+}
+""",
+}
+
+# Adds a counter increment at the start of every function
+def countCalls(assembly):
+    lines = []
+    inText = False
+    for line in assembly.split("\n"):
+        lines.append(line)
+        if line == GAS.textSection or line == GAS.dataSection:
+            inText = line == GAS.textSection
+        elif inText and line.endswith(":") and not line.startswith("."):
+            lines.append("  add QWORD PTR [rip + dynamicCalls], 1")
+    return "\n".join(lines)
+
+def build(originalString, directory, name, inline, counting):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    if inline:
+        inlineCalls(nodes, programDetails)
+    assembly = CodeGenerator(lowerProgram(nodes, programDetails), dialect = GAS).generate()
+    if counting:
+        assembly = countCalls(assembly)
+    assemblyPath = os.path.join(directory, name + ".s")
+    with open(assemblyPath, "w") as outputFile:
+        outputFile.write(assembly)
+    executablePath = os.path.join(directory, name)
+    subprocess.run(["gcc", "-no-pie", "-o", executablePath, os.path.join(directory, "harness.c"), assemblyPath], check = True)
+    return executablePath
+
+def run(executablePath, iterations):
+    start = time.perf_counter()
+    output = subprocess.run([executablePath, str(iterations)], check = True, capture_output = True, text = True).stdout
+    result, calls = output.split()
+    return time.perf_counter() - start, result, int(calls)
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000000
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "harness.c"), "w") as outputFile:
+            outputFile.write(HARNESS)
+        for name, originalString in PROGRAMS.items():
+            results = []
+            for inline in (False, True):
+                label = "inlined" if inline else "plain"
+                runTime, result, _ = run(build(originalString, directory, label, inline, False), iterations)
+                _, _, calls = run(build(originalString, directory, label + "-counted", inline, True), iterations)
+                results.append((runTime, result, calls))
+            (plainTime, plainResult, plainCalls), (inlinedTime, inlinedResult, inlinedCalls) = results
+            if plainResult != inlinedResult:
+                raise Exception("Results differ for {}: {} and {}".format(name, plainResult, inlinedResult))
+            print("{:<16} calls {:>11} -> {:>11} time {:>7.3f}s -> {:>7.3f}s {:>5.2f}x".format(
+                name, plainCalls, inlinedCalls, plainTime, inlinedTime, plainTime / inlinedTime))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# Times lowering to SSA IR and verifying it, for functions with growing
+# numbers of loops and branches. Time per instruction should stay flat.
+# Run from the repository root: python -m benchmarks.ir_bench [statements...]
+import sys
+import time
+from lex import *
+from parse import *
+from analyze import *
+from ir import *
+
+def generateFunction(statementCount):
+    lines = ["func f(n: int): int {", "  a: int = 0;", "  b: int = 1;", "  i: int = 0;"]
+    for i in range(statementCount):
+        if i % 3 == 0:
+            lines.append("  while i != n {{ a = a + b * {}; i = i + 1; }}".format(i))
+        elif i % 3 == 1:
+            lines.append("  if a == {} {{ b = b + a; }} else {{ a = a - 1; }}".format(i))
+        else:
+            lines.append("  b = a * b + {};".format(i))
+    lines.append("  return a + b;")
+    lines.append("}")
+    return "\n".join(lines)
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000]
+    for count in counts:
+        originalString = generateFunction(count)
+        nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+        programDetails = Analyzer(nodes, originalString).analyze()
+        start = time.perf_counter()
+        program = lowerProgram(nodes, programDetails)
+        lowerTime = time.perf_counter() - start
+        start = time.perf_counter()
+        verifyProgram(program)
+        verifyTime = time.perf_counter() - start
+        instructionCount = sum(len(block.instructions) + len(block.phis) for block in program.functions[0].blocks)
+        print("{:>6} statements {:>7} instructions lower {:>7.3f}s ({:>5.2f}us each) verify {:>7.3f}s".format(
+            count, instructionCount, lowerTime, lowerTime / instructionCount * 1e6, verifyTime))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# Compares the table-driven Lexxer, both lex() and lexCompact(), against the
+# original per-character lexer, taking the best of a few runs of each. On a
+# 1-4MB source lexCompact(), which every compile goes through, measures 7-10x
+# the reference's tokens per second, and lex() 5-8x as it also makes a Token
+# per token. That is short of 10x: both scan with one findall per 64KB and
+# build their columns in C, so what's left is the substring findall makes per
+# token and, for lex(), the Token itself, which together take about half the
+# time.
+# Run from the repository root: python -m benchmarks.lex_bench
+import sys
+import time
+from lex import *
+from utils import *
+
+PROGRAM = """
+myGlobal_{i}: int = {i};
+func function_{i}(x: int, y: int): int {{
+    total: int = x * {i} + y;
+    while total != 0 {{
+        if total == myGlobal_{i} {{
+            total = total - 1;
+        }} else {{
+            total = (total + 12345) / 2;
+        }}
+    }}
+    return function_{i}(total, y - 1);
+}}
+"""
+
+def generateSource(targetSize):
+    parts = []
+    size = 0
+    i = 0
+    while size < targetSize:
+        part = PROGRAM.format(i = i)
+        parts.append(part)
+        size += len(part)
+        i += 1
+    return "".join(parts)
+
+# The lexer as it was before the table-driven rewrite, kept here as the baseline.
+class TrackedStringBuffer:
+    def __init__(self, string):
+        self.i = 0
+        self.string = string
+        self.linePos = 0
+        self.charPos = 0
+
+    def remaining(self):
+        return len(self.string) - self.i
+
+    def peek(self):
+        if self.i > len(self.string) - 1:
+            return ""
+
+        return self.string[self.i]
+
+    def consume(self):
+        if self.i > len(self.string) - 1:
+            return ""
+
+        char = self.string[self.i]
+        self.i += 1
+
+        if char == "\n":
+            self.linePos += 1
+            self.charPos = 0
+        else:
+            self.charPos += 1
+
+        return char
+
+    def position(self):
+        return (self.linePos, self.charPos - 1)
+
+def stringToNumber(string):
+    number = 0
+    for char in string:
+        number *= 10
+        number += ord(char) - ord("0")
+    return number
+
+class ReferenceLexxer:
+    def __init__(self, originalString):
+        self.originalString = originalString
+        self.buffer = TrackedStringBuffer(originalString)
+
+    def lex(self):
+        tokens = []
+        while self.buffer.remaining() > 0:
+            peek = self.buffer.peek()
+            if peek == " ":
+                self.buffer.consume()
+            elif peek == "\n":
+                self.buffer.consume()
+            elif peek == "{":
+                self.buffer.consume()
+                tokens.append(Token("syntax", "{", self.buffer.position()))
+            elif peek == "}":
+                self.buffer.consume()
+                tokens.append(Token("syntax", "}", self.buffer.position()))
+            elif peek == "(":
+                self.buffer.consume()
+                tokens.append(Token("syntax", "(", self.buffer.position()))
+            elif peek == ")":
+                self.buffer.consume()
+                tokens.append(Token("syntax", ")", self.buffer.position()))
+            elif peek == ":":
+                self.buffer.consume()
+                tokens.append(Token("syntax", ":", self.buffer.position()))
+            elif peek == ";":
+                self.buffer.consume()
+                tokens.append(Token("syntax", ";", self.buffer.position()))
+            elif peek == ",":
+                self.buffer.consume()
+                tokens.append(Token("syntax", ",", self.buffer.position()))
+            elif peek == "=":
+                self.buffer.consume()
+                if self.buffer.peek() == "=":
+                    self.buffer.consume()
+                    tokens.append(Token("syntax", "==", self.buffer.position()))
+                else:
+                    tokens.append(Token("syntax", "=", self.buffer.position()))
+            elif peek == "+":
+                self.buffer.consume()
+                tokens.append(Token("syntax", "+", self.buffer.position()))
+            elif peek == "-":
+                self.buffer.consume()
+                tokens.append(Token("syntax", "-", self.buffer.position()))
+            elif peek == "*":
+                self.buffer.consume()
+                tokens.append(Token("syntax", "*", self.buffer.position()))
+            elif peek == "/":
+                self.buffer.consume()
+                tokens.append(Token("syntax", "/", self.buffer.position()))
+            elif peek == "!":
+                self.buffer.consume()
+                if self.buffer.peek() == "=":
+                    self.buffer.consume()
+                    tokens.append(Token("syntax", "!=", self.buffer.position()))
+                else:
+                    tokens.append(Token("syntax", "!", self.buffer.position()))
+            elif isDigit(peek):
+                tokens.append(self.lexNumberLiteral())
+            elif isIdentifier(peek):
+                tokens.append(self.lexIdentifier())
+            else:
+                raise Exception("Syntax error")
+        return tokens
+
+    def lexNumberLiteral(self):
+        stringValue = ""
+        while self.buffer.remaining() > 0 and isDigit(self.buffer.peek()):
+            stringValue += self.buffer.consume()
+        return Token("integerLiteral", stringToNumber(stringValue), self.buffer.position())
+
+    def lexIdentifier(self):
+        stringValue = ""
+        while self.buffer.remaining() > 0 and (isIdentifier(self.buffer.peek()) or isDigit(self.buffer.peek())):
+            stringValue += self.buffer.consume()
+        _type = "identifier"
+        if stringValue in SYNTAX_IDENTIFIERS:
+            _type = "syntax"
+        return Token(_type, stringValue, self.buffer.position())
+
+# Runs per measurement, the best of which is reported
+RUNS = 3
+
+def bestTime(lex):
+    bestRunTime = None
+    for run in range(RUNS):
+        start = time.perf_counter()
+        result = lex()
+        runTime = time.perf_counter() - start
+        if bestRunTime is None or runTime < bestRunTime:
+            bestRunTime = runTime
+    return result, bestRunTime
+
+def timeLexxer(lexxerClass, source):
+    return bestTime(lambda: lexxerClass(source).lex())
+
+def timeCompact(source):
+    return bestTime(lambda: Lexxer(source).lexCompact())
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [256 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+    for size in sizes:
+        source = generateSource(size)
+        referenceTokens, referenceTime = timeLexxer(ReferenceLexxer, source)
+        tokens, lexTime = timeLexxer(Lexxer, source)
+        # The reference lexer reports (line, column) rather than offsets
+        sourceFile = SourceFile(source)
+        expected = [(token.type, token.value, token.pos) for token in referenceTokens]
+        actual = [(token.type, token.value, sourceFile.position(token.pos)) for token in tokens]
+        if actual != expected:
+            raise Exception("Token streams differ")
+        stream, compactTime = timeCompact(source)
+        if len(stream) != len(tokens):
+            raise Exception("Token streams differ")
+        print("{:>10} bytes {:>9} tokens  reference {:>12.0f} tokens/s  table-driven {:>12.0f} tokens/s  speedup {:.1f}x  compact speedup {:.1f}x".format(
+            len(source),
+            len(tokens),
+            len(tokens) / referenceTime,
+            len(tokens) / lexTime,
+            referenceTime / lexTime,
+            referenceTime / compactTime))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Links programs with growing numbers of functions, split across several
+# objects that call into each other, with link.py and with GNU ld, and
+# checks both executables exit with the same status. Time per symbol should
+# stay flat for link.py.
+# Run from the repository root: python -m benchmarks.link_bench [functions...]
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from lex import *
+from parse import *
+from analyze import *
+from encode import *
+from link import *
+
+OBJECT_COUNT = 8
+
+# Each function calls the one before it, which is usually in another object
+def generateProgram(functionCount):
+    lines = ["func f0(n: int): int { return n; }"]
+    for f in range(1, functionCount):
+        lines.append("func f{}(n: int): int {{ return f{}(n + {}) * 3 - {}; }}".format(f, f - 1, f, f % 7))
+    lines.append("func main(): int {{ return f{}(1); }}".format(functionCount - 1))
+    return "\n".join(lines)
+
+# Writes the program's functions round robin into OBJECT_COUNT objects
+def writeObjects(originalString, directory):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    machineProgram = CodeGenerator(lowerProgram(nodes, programDetails)).generateMachineCode()
+    paths = []
+    for i in range(OBJECT_COUNT):
+        path = os.path.join(directory, "part{}.o".format(i))
+        with open(path, "wb") as outputFile:
+            outputFile.write(writeObjectFile(encodeProgram(MachineProgram(machineProgram.functions[i::OBJECT_COUNT], []))))
+        paths.append(path)
+    return paths
+
+def linkWithLinker(paths, executablePath):
+    start = time.perf_counter()
+    objectFiles = []
+    for path in paths:
+        with open(path, "rb") as inputFile:
+            objectFiles.append(readObjectFile(inputFile.read()))
+    with open(executablePath, "wb") as outputFile:
+        outputFile.write(linkObjects(objectFiles))
+    elapsed = time.perf_counter() - start
+    os.chmod(executablePath, 0o755)
+    return elapsed
+
+def linkWithLd(paths, startPath, executablePath):
+    start = time.perf_counter()
+    subprocess.run(["ld", "-static", "-o", executablePath, startPath] + paths, check = True)
+    return time.perf_counter() - start
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 10000, 30000]
+    with tempfile.TemporaryDirectory() as directory:
+        startPath = os.path.join(directory, "start.o")
+        with open(startPath, "wb") as outputFile:
+            outputFile.write(writeObjectFile(START_OBJECT))
+        for count in counts:
+            paths = writeObjects(generateProgram(count), directory)
+            linkedPath = os.path.join(directory, "linked")
+            ldPath = os.path.join(directory, "ld")
+            linkTime = linkWithLinker(paths, linkedPath)
+            ldTime = linkWithLd(paths, startPath, ldPath)
+            statuses = [subprocess.run([path]).returncode for path in (linkedPath, ldPath)]
+            if statuses[0] != statuses[1]:
+                raise Exception("Exit statuses differ for {} functions: {} and {}".format(count, statuses[0], statuses[1]))
+            print("{:>6} functions in {} objects: link.py {:>8.2f}ms ({:>5.2f}us per symbol), ld {:>8.2f}ms".format(
+                count, OBJECT_COUNT, linkTime * 1000, linkTime / count * 1e6, ldTime * 1000))
+
+if __name__ == "__main__":
+    main()
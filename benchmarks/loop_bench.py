@@ -0,0 +1,104 @@
+# Runs loop-heavy programs on the bytecode VM, plain, with the loop pass and
+# with the loop pass followed by constant folding, and reports how many
+# instructions each ran and how long it took.
+# Run from the repository root: python -m benchmarks.loop_bench [scale]
+import sys
+import time
+from lex import *
+from parse import *
+from analyze import *
+from fold import *
+from loop import *
+from vm import *
+
+# Each program's compute(n) with the n it's run with at scale 1
+PROGRAMS = {
+    "invariant arithmetic": ("""
+scale: int = 7;
+func compute(n: int): int {
+    i: int = 0;
+    total: int = 0;
+    while i != n {
+        total = total + i * (scale * n + 3) - (n / 16 + scale);
+        i = i + 1;
+    }
+    return total;
+}
+""", 100000),
+    "small inner loop": ("""
+func compute(n: int): int {
+    i: int = 0;
+    total: int = 0;
+    while i != n {
+        j: int = 0;
+        while j != 4 {
+            total = total * 3 + j * i;
+            j = j + 1;
+        }
+        i = i + 1;
+    }
+    return total;
+}
+""", 30000),
+    "fixed trip count": ("""
+func compute(n: int): int {
+    round: int = 0;
+    h: int = n;
+    while round != n / 1000 {
+        k: int = 0;
+        while k != 1000 {
+            h = h * 31 + k - h / 8;
+            k = k + 1;
+        }
+        round = round + 1;
+    }
+    return h;
+}
+""", 100000),
+    "calls kept in place": ("""
+seed: int = 12345;
+func next(): int {
+    seed = seed * 6364136223846793005 + 1442695040888963407;
+    return seed;
+}
+func compute(n: int): int {
+    i: int = 0;
+    total: int = 0;
+    while i != n {
+        total = total + next() / 4294967296 + seed * (n + 1);
+        i = i + 1;
+    }
+    return total;
+}
+""", 50000),
+}
+
+def run(originalString, argument, loops, fold):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    if loops:
+        optimizeLoops(nodes, programDetails)
+    if fold:
+        foldConstants(nodes, programDetails, originalString)
+    program = compileBytecode(nodes, programDetails)
+    machine = VirtualMachine(program)
+    start = time.perf_counter()
+    result = machine.call(program.findFunction("compute", ["int"]), [argument])
+    return time.perf_counter() - start, machine.executedCount, result
+
+def main():
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    for name, (originalString, argument) in PROGRAMS.items():
+        argument = int(argument * scale)
+        results = [run(originalString, argument, loops, fold) for loops, fold in ((False, False), (True, False), (True, True))]
+        for runTime, executed, result in results[1:]:
+            if result != results[0][2]:
+                raise Exception("Results differ for {}: {} and {}".format(name, results[0][2], result))
+        print(name)
+        plainTime, plainExecuted, _ = results[0]
+        for label, (runTime, executed, result) in zip(("plain", "loops", "loops and fold"), results):
+            print("  {:<15} {:>10} instructions {:>6.1f}% {:>7.3f}s {:>5.2f}x".format(
+                label, executed, 100 * executed / plainExecuted, runTime, plainTime / runTime))
+
+if __name__ == "__main__":
+    main()
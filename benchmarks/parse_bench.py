@@ -0,0 +1,36 @@
+# Times Parser.parseExpression on long operator chains and deeply nested
+# expressions, far past Python's recursion limit.
+# Run from the repository root: python -m benchmarks.parse_bench
+import sys
+import time
+from lex import *
+from parse import *
+
+OPERATORS = ["+", "*", "-", "/", "==", "!="]
+
+def generateChain(operandCount):
+    parts = ["x0"]
+    for i in range(1, operandCount):
+        parts.append(OPERATORS[i % len(OPERATORS)])
+        parts.append("x{}".format(i) if i % 3 else str(i))
+    return " ".join(parts)
+
+def generateNested(depth):
+    return "(" * depth + "-f(1 + " * depth + "x" + "))" * depth + ")" * depth
+
+def timeParse(source):
+    tokens = Lexxer(source).lexCompact()
+    start = time.perf_counter()
+    Parser(tokens, source).parseExpression()
+    return len(tokens), time.perf_counter() - start
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 50000, 100000]
+    for count in counts:
+        tokenCount, chainTime = timeParse(generateChain(count))
+        print("chain  {:>7} operands {:>8} tokens {:>8.3f}s {:>10.0f} tokens/s".format(count, tokenCount, chainTime, tokenCount / chainTime))
+        tokenCount, nestedTime = timeParse(generateNested(count))
+        print("nested {:>7} levels   {:>8} tokens {:>8.3f}s {:>10.0f} tokens/s".format(count, tokenCount, nestedTime, tokenCount / nestedTime))
+
+if __name__ == "__main__":
+    main()
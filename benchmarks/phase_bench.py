@@ -0,0 +1,128 @@
+# Times Lexxer.lex, Parser.parse and Analyzer.analyze separately on
+# generated programs (see benchmarks/generate.py) growing along each axis,
+# and fits how each phase's time scales with the number of tokens, as the
+# exponent k in time ~ tokens^k. A linear phase has k close to 1.
+#
+# Results can be written as JSON and a previous run's JSON given as the
+# baseline. Exits with status 1 if any phase scales worse than
+# --max-exponent or its time per token at the largest size grew by more
+# than --tolerance over the baseline's.
+# Run from the repository root: python -m benchmarks.phase_bench [--output results.json] [--baseline results.json]
+import argparse
+import json
+import math
+import sys
+import time
+from lex import *
+from parse import *
+from analyze import *
+from benchmarks.generate import *
+
+PHASES = ["lex", "parse", "analyze"]
+
+# Each axis grows one part of the base shape, through these values
+AXES = {
+    "functions": (lambda n: ProgramShape(functionCount = n), [250, 500, 1000, 2000]),
+    "statements": (lambda n: ProgramShape(functionCount = 20, statementCount = n), [50, 100, 200, 400]),
+    "depth": (lambda n: ProgramShape(functionCount = 20, expressionDepth = n), [10, 20, 40, 80]),
+    "calls": (lambda n: ProgramShape(functionCount = n, callDensity = 0.8), [250, 500, 1000, 2000]),
+    "globals": (lambda n: ProgramShape(functionCount = 20, globalCount = n), [1000, 2000, 4000, 8000]),
+}
+
+DEFAULT_MAX_EXPONENT = 1.3
+DEFAULT_TOLERANCE = 0.5
+
+# Least squares slope of log time against log size
+def fitExponent(sizes, times):
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(seconds, 1e-9)) for seconds in times]
+    meanX = sum(xs) / len(xs)
+    meanY = sum(ys) / len(ys)
+    variance = sum((x - meanX) ** 2 for x in xs)
+    if variance == 0:
+        return 0
+    return sum((x - meanX) * (y - meanY) for x, y in zip(xs, ys)) / variance
+
+# The fastest of repeats runs of each phase, and the token count. Each run
+# starts from fresh input, since parsing consumes the tokens and analysis
+# annotates the nodes.
+def timePhases(source, repeats):
+    best = dict((phase, float("inf")) for phase in PHASES)
+    tokenCount = 0
+    for i in range(repeats):
+        start = time.perf_counter()
+        tokens = Lexxer(source).lex()
+        best["lex"] = min(best["lex"], time.perf_counter() - start)
+        tokenCount = len(tokens)
+        start = time.perf_counter()
+        nodes = Parser(tokens, source).parse()
+        best["parse"] = min(best["parse"], time.perf_counter() - start)
+        start = time.perf_counter()
+        Analyzer(nodes, source).analyze()
+        best["analyze"] = min(best["analyze"], time.perf_counter() - start)
+    return tokenCount, best
+
+def runAxis(name, scale, repeats):
+    makeShape, values = AXES[name]
+    values = [max(1, int(value * scale)) for value in values]
+    result = {"values": values, "tokens": [], "phases": dict((phase, {"seconds": []}) for phase in PHASES)}
+    for value in values:
+        tokenCount, times = timePhases(generateProgram(makeShape(value)), repeats)
+        result["tokens"].append(tokenCount)
+        for phase in PHASES:
+            result["phases"][phase]["seconds"].append(times[phase])
+    for phase in PHASES:
+        result["phases"][phase]["exponent"] = fitExponent(result["tokens"], result["phases"][phase]["seconds"])
+    return result
+
+def secondsPerToken(axisResult, phase):
+    return axisResult["phases"][phase]["seconds"][-1] / axisResult["tokens"][-1]
+
+def findFailures(results, baseline, maxExponent, tolerance):
+    failures = []
+    for name, axisResult in results["axes"].items():
+        for phase in PHASES:
+            exponent = axisResult["phases"][phase]["exponent"]
+            if exponent > maxExponent:
+                failures.append("{} along {} scales as tokens^{:.2f}, over {:.2f}".format(phase, name, exponent, maxExponent))
+            if baseline is None or name not in baseline["axes"]:
+                continue
+            previous = secondsPerToken(baseline["axes"][name], phase)
+            current = secondsPerToken(axisResult, phase)
+            if current > previous * (1 + tolerance):
+                failures.append("{} along {} takes {:.3f}us per token, up from {:.3f}us".format(phase, name, current * 1e6, previous * 1e6))
+    return failures
+
+def main():
+    argparser = argparse.ArgumentParser(prog = "python -m benchmarks.phase_bench", description = "Time each compiler phase on generated programs and fit how it scales")
+    argparser.add_argument("--axes", nargs = "+", choices = list(AXES), default = list(AXES), help = "Axes to grow programs along")
+    argparser.add_argument("--scale", type = float, default = 1, help = "Multiplies every axis's sizes")
+    argparser.add_argument("--repeats", type = int, default = 3, help = "Runs per size, the fastest is kept")
+    argparser.add_argument("--output", help = "Write the results as JSON here")
+    argparser.add_argument("--baseline", help = "JSON from an earlier run to check for regressions against")
+    argparser.add_argument("--max-exponent", type = float, default = DEFAULT_MAX_EXPONENT, help = "Fail if a phase scales worse than tokens to this power")
+    argparser.add_argument("--tolerance", type = float, default = DEFAULT_TOLERANCE, help = "Fail if time per token grew by more than this fraction over the baseline")
+    args = argparser.parse_args()
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as inputFile:
+            baseline = json.load(inputFile)
+    results = {"repeats": args.repeats, "scale": args.scale, "axes": {}}
+    for name in args.axes:
+        axisResult = runAxis(name, args.scale, args.repeats)
+        results["axes"][name] = axisResult
+        print("{} {}".format(name, axisResult["values"]))
+        for phase in PHASES:
+            phaseResult = axisResult["phases"][phase]
+            print("  {:<8} {} tokens^{:.2f}".format(phase, " ".join("{:>8.3f}s".format(seconds) for seconds in phaseResult["seconds"]), phaseResult["exponent"]))
+    failures = findFailures(results, baseline, args.max_exponent, args.tolerance)
+    results["failures"] = failures
+    if args.output is not None:
+        with open(args.output, "w") as outputFile:
+            json.dump(results, outputFile, indent = 2)
+    for failure in failures:
+        print("FAIL " + failure)
+    return 1 if len(failures) > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
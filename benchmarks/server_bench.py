@@ -0,0 +1,48 @@
+# Times compiling an unchanged file with a fresh `python cli.py` process per
+# call, with and without the disk cache, with a `python cli.py --connect`
+# thin client process per call, and with requests sent straight to the
+# server's socket.
+# Run from the repository root: python -m benchmarks.server_bench [runs]
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import cli
+from server import *
+from benchmarks.incremental_bench import generateProgram
+
+def timeRuns(runs, function):
+    start = time.perf_counter()
+    for i in range(runs):
+        function()
+    return (time.perf_counter() - start) / runs
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "source.ul")
+        with open(path, "w") as outputFile:
+            outputFile.write(generateProgram(2000))
+        socketPath = os.path.join(directory, "compile.sock")
+        cache = CompileCache()
+        server = CompileServer(socketPath, lambda argv: cli.main(argv, cache))
+        thread = threading.Thread(target = server.serve_forever)
+        thread.start()
+        try:
+            coldTime = timeRuns(runs, lambda: subprocess.run([sys.executable, "cli.py", path, "--no-cache"], check = True))
+            cachedTime = timeRuns(runs, lambda: subprocess.run([sys.executable, "cli.py", path], check = True))
+            clientTime = timeRuns(runs, lambda: subprocess.run([sys.executable, "cli.py", path, "--connect", socketPath], check = True))
+            socketTime = timeRuns(runs, lambda: sendRequest(socketPath, [path]))
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+    print("cold process  {:>8.2f}ms per compile".format(coldTime * 1000))
+    print("disk cache    {:>8.2f}ms per compile".format(cachedTime * 1000))
+    print("thin client   {:>8.2f}ms per compile".format(clientTime * 1000))
+    print("socket        {:>8.2f}ms per compile".format(socketTime * 1000))
+
+if __name__ == "__main__":
+    main()
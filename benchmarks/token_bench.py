@@ -0,0 +1,44 @@
+# Compares a list of Tokens against the compact TokenStream: memory held per
+# token, lexing speed and parsing speed.
+# Run from the repository root: python -m benchmarks.token_bench
+import sys
+import time
+import tracemalloc
+from lex import *
+from parse import *
+from benchmarks.lex_bench import generateSource
+
+# Timing and memory are measured in separate runs since tracing slows allocation down
+def measure(function):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    result = function()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, size
+
+def timeParse(tokens, source):
+    start = time.perf_counter()
+    nodes = Parser(tokens, source).parse()
+    return nodes, time.perf_counter() - start
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [256 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+    for size in sizes:
+        source = generateSource(size)
+        tokens, lexTime, tokensSize = measure(lambda: Lexxer(source).lex())
+        stream, compactLexTime, streamSize = measure(lambda: Lexxer(source).lexCompact())
+        nodes, parseTime = timeParse(tokens, source)
+        compactNodes, compactParseTime = timeParse(stream, source)
+        if compactNodes != nodes:
+            raise Exception("Parse results differ")
+        print("{:>10} bytes {:>9} tokens".format(len(source), len(tokens)))
+        print("  Token list   {:>6.1f} bytes/token  lex {:>10.0f} tokens/s  parse {:>10.0f} tokens/s".format(
+            tokensSize / len(tokens), len(tokens) / lexTime, len(tokens) / parseTime))
+        print("  TokenStream  {:>6.1f} bytes/token  lex {:>10.0f} tokens/s  parse {:>10.0f} tokens/s".format(
+            streamSize / len(stream), len(stream) / compactLexTime, len(stream) / compactParseTime))
+
+if __name__ == "__main__":
+    main()
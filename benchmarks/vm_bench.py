@@ -0,0 +1,97 @@
+# Runs recursive and loop-heavy programs on the bytecode VM, with and
+# without superinstructions, and reports instructions run per second.
+# Run from the repository root: python -m benchmarks.vm_bench [scale]
+import sys
+import time
+from lex import *
+from parse import *
+from analyze import *
+from vm import *
+
+# Each program's compute(n) with the n it's run with at scale 1. fib's n
+# isn't scaled, its run time grows exponentially with it.
+PROGRAMS = {
+    "fib": ("""
+func fib(n: int): int {
+    if n == 0 { return 0; }
+    if n == 1 { return 1; }
+    return fib(n - 1) + fib(n - 2);
+}
+func compute(n: int): int { return fib(n); }
+""", 24),
+    "ackermann": ("""
+func ack(m: int, n: int): int {
+    if m == 0 { return n + 1; }
+    if n == 0 { return ack(m - 1, 1); }
+    return ack(m - 1, ack(m, n - 1));
+}
+func compute(n: int): int { return ack(2, n); }
+""", 200),
+    "arithmetic loop": ("""
+func compute(n: int): int {
+    i: int = 0;
+    total: int = 0;
+    while i != n {
+        total = total * 3 + i - (total == i);
+        i = i + 1;
+    }
+    return total;
+}
+""", 200000),
+    "nested loops": ("""
+func compute(n: int): int {
+    i: int = 0;
+    count: int = 0;
+    while i != n {
+        j: int = 0;
+        while j != i {
+            if (i + j) / 3 * 3 == i + j { count = count + 1; }
+            j = j + 1;
+        }
+        i = i + 1;
+    }
+    return count;
+}
+""", 400),
+    "globals and calls": ("""
+seed: int = 12345;
+func next(): int {
+    seed = seed * 6364136223846793005 + 1442695040888963407;
+    return seed;
+}
+func compute(n: int): int {
+    i: int = 0;
+    total: int = 0;
+    while i != n {
+        total = total + next() / 4294967296;
+        i = i + 1;
+    }
+    return total;
+}
+""", 100000),
+}
+
+def run(originalString, argument, superinstructions):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    program = compileBytecode(nodes, programDetails, superinstructions)
+    machine = VirtualMachine(program)
+    start = time.perf_counter()
+    result = machine.call(program.findFunction("compute", ["int"]), [argument])
+    return time.perf_counter() - start, machine.executedCount, result
+
+def main():
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1
+    for name, (originalString, argument) in PROGRAMS.items():
+        if name != "fib":
+            argument = int(argument * scale)
+        results = [run(originalString, argument, superinstructions) for superinstructions in (True, False)]
+        if results[0][2] != results[1][2]:
+            raise Exception("Results differ for {}: {} and {}".format(name, results[0][2], results[1][2]))
+        print(name)
+        for label, (runTime, executed, result) in zip(("superinstructions", "plain"), results):
+            print("  {:<18} {:>10} instructions {:>7.3f}s {:>6.2f}M instructions/s".format(label, executed, runTime, executed / runTime / 1e6))
+        print("  {:.2f}x faster with superinstructions".format(results[1][0] / results[0][0]))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import io
+import multiprocessing
+import os
+from contextlib import redirect_stdout
+from lex import *
+from parse import *
+from analyze import *
+
+# Compiles many files as one program across a pool of processes. Files are
+# lexed and parsed in parallel, and each returns only what the other files
+# need to see: its global variables and function signatures. Those are
+# merged, in file order, into one program-wide table, and then every file's
+# function bodies are checked against it in parallel. Merging in file order
+# gives the same result as analyzing the files concatenated together.
+#
+# Each worker process is given a fixed share of the files, balanced by size,
+# and keeps their parsed nodes between the two steps, so every file is only
+# lexed and parsed once and no AST is sent through the parent.
+
+SOURCE_EXTENSION = ".ul"
+
+# Expands directories into the source files under them. The order is fixed
+# by sorting so that diagnostics come out the same on every run.
+def findSourceFiles(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, directoryNames, fileNames in os.walk(path):
+                for fileName in fileNames:
+                    if fileName.endswith(SOURCE_EXTENSION):
+                        files.append(os.path.join(directory, fileName))
+        else:
+            files.append(path)
+    return sorted(files)
+
+# What one file declares for the rest of the program
+class FileInterface:
+    def __init__(self, path, globalVariables, signatures, output):
+        self.path = path
+        # Name -> VariableNode, and FunctionSignatures in declaration order
+        self.globalVariables = globalVariables
+        self.signatures = signatures
+        # Diagnostics printed while parsing, or None if it succeeded
+        self.output = output
+
+# A file after the first step, kept by the process that parsed it
+class DeclaredFile:
+    def __init__(self, interface, analyzer):
+        self.interface = interface
+        # Holds the parsed nodes and the file's own functions, or None if
+        # parsing failed
+        self.analyzer = analyzer
+
+def parseSource(path):
+    with open(path) as inputFile:
+        inputString = inputFile.read()
+    nodes = Parser(Lexxer(inputString).lexCompact(), inputString).parse()
+    return inputString, nodes
+
+def declareFile(path):
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            inputString, nodes = parseSource(path)
+            analyzer = Analyzer(nodes, inputString)
+            for node in nodes:
+                analyzer.firstPass(node)
+    except Exception as e:
+        print(e, file = output)
+        return DeclaredFile(FileInterface(path, {}, [], output.getvalue()), None)
+    signatures = [functionDetails.signature for functionDetails in analyzer.functions.values()]
+    return DeclaredFile(FileInterface(path, analyzer.globalVariables, signatures, None), analyzer)
+
+# Returns the diagnostics for the file's function bodies, or None if there
+# were none or it didn't parse, which declareFile already reported
+def checkFile(declaredFile, globalVariables, signatures):
+    analyzer = declaredFile.analyzer
+    if analyzer is None:
+        return None
+    output = io.StringIO()
+    try:
+        with redirect_stdout(output):
+            # Swap in the program-wide table now the file's own functions are known
+            analyzer.globalVariables = globalVariables
+            analyzer.symbols = SymbolTable()
+            for functionSignature in analyzer.builtinFunctions.keys():
+                analyzer.symbols.add(functionSignature)
+            for functionSignature in signatures:
+                analyzer.symbols.add(functionSignature)
+            for node in analyzer.nodes:
+                analyzer.secondPass(node)
+            if analyzer.hasErrors():
+                analyzer.displayAnalysisErrors()
+                raise Exception("Analysis errors")
+    except Exception as e:
+        print(e, file = output)
+        return output.getvalue()
+    return None
+
+# The globals and signatures of every file that parsed, merged in file order
+def mergeInterfaces(interfaces):
+    globalVariables = {}
+    signatures = []
+    for interface in interfaces:
+        globalVariables.update(interface.globalVariables)
+        signatures.extend(interface.signatures)
+    return globalVariables, signatures
+
+# Runs both steps over a share of the files in a worker process, talking to
+# the parent over connection: it sends the interfaces, receives the merged
+# table and sends back the diagnostics
+def runWorker(paths, connection):
+    declaredFiles = [declareFile(path) for path in paths]
+    connection.send([declaredFile.interface for declaredFile in declaredFiles])
+    globalVariables, signatures = connection.recv()
+    connection.send([checkFile(declaredFile, globalVariables, signatures) for declaredFile in declaredFiles])
+    connection.close()
+
+# Prints diagnostics grouped by file, in file order, and returns the exit status
+def compileFiles(paths, workers = None):
+    paths = findSourceFiles(paths)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(paths))
+    if workers <= 1:
+        declaredFiles = [declareFile(path) for path in paths]
+        interfaces = [declaredFile.interface for declaredFile in declaredFiles]
+        globalVariables, signatures = mergeInterfaces(interfaces)
+        outputs = [checkFile(declaredFile, globalVariables, signatures) for declaredFile in declaredFiles]
+        return reportDiagnostics(interfaces, outputs)
+    shares = splitBySize(paths, workers)
+    connections = []
+    processes = []
+    try:
+        for share in shares:
+            parentConnection, childConnection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target = runWorker, args = (share, childConnection), daemon = True)
+            process.start()
+            childConnection.close()
+            connections.append(parentConnection)
+            processes.append(process)
+        interfaces = {}
+        for share, connection, process in zip(shares, connections, processes):
+            for interface in receiveFromWorker(share, connection, process):
+                interfaces[interface.path] = interface
+        # The table is pickled once per worker rather than once per file
+        table = mergeInterfaces(interfaces[path] for path in paths)
+        for share, connection, process in zip(shares, connections, processes):
+            sendToWorker(share, connection, process, table)
+        outputs = {}
+        for share, connection, process in zip(shares, connections, processes):
+            outputs.update(zip(share, receiveFromWorker(share, connection, process)))
+    except BaseException:
+        # The others could be waiting for a table that won't come. A forked
+        # worker holds both ends of its own connection, so closing ours
+        # wouldn't wake it.
+        for process in processes:
+            process.terminate()
+        raise
+    finally:
+        for connection in connections:
+            connection.close()
+        for process in processes:
+            process.join()
+    return reportDiagnostics([interfaces[path] for path in paths], [outputs[path] for path in paths])
+
+# A worker that dies, by a signal, running out of memory or an exception its
+# results can't be pickled with, closes its end of the connection. These turn
+# that into an error naming the worker's files.
+def receiveFromWorker(share, connection, process):
+    try:
+        return connection.recv()
+    except EOFError:
+        raiseWorkerError(share, process)
+
+def sendToWorker(share, connection, process, value):
+    try:
+        connection.send(value)
+    except BrokenPipeError:
+        raiseWorkerError(share, process)
+
+def raiseWorkerError(share, process):
+    process.join()
+    if process.exitcode is not None and process.exitcode < 0:
+        reason = "was killed by signal {}".format(-process.exitcode)
+    else:
+        reason = "exited with code {}".format(process.exitcode)
+    raise Exception("The worker compiling {} {} before finishing".format(", ".join(share), reason))
+
+# Splits the paths into count shares of about the same total size, largest
+# files first, each going to the share with the least so far
+def splitBySize(paths, count):
+    shares = [[] for i in range(count)]
+    sizes = [0] * count
+    for size, path in sorted(((fileSize(path), path) for path in paths), reverse = True):
+        smallest = sizes.index(min(sizes))
+        shares[smallest].append(path)
+        sizes[smallest] += size
+    return shares
+
+# Unreadable files still get a share, and report their error when declared
+def fileSize(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+# interfaces and the outputs of checkFile are in file order
+def reportDiagnostics(interfaces, outputs):
+    status = 0
+    for interface, checkOutput in zip(interfaces, outputs):
+        output = interface.output
+        if output is None:
+            output = checkOutput
+        if output is not None:
+            print("In {}:".format(interface.path))
+            print(output, end = "")
+            status = 1
+    return status
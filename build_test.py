@@ -0,0 +1,106 @@
+import io
+import multiprocessing
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+import build
+from build import *
+
+FILES = {
+    "a.ul": "total: int = 0;\nfunc add(x: int, y: int): int {\n  return x + y;\n}\n",
+    "lib/b.ul": "func main(): int {\n  return add(total, double(2));\n}\n",
+    "lib/c.ul": "func double(x: int): int {\n  return add(x, x);\n}\n",
+}
+
+class TestBuild(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def writeFiles(self, files):
+        for name, text in files.items():
+            path = os.path.join(self.directory.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+            with open(path, "w") as outputFile:
+                outputFile.write(text)
+
+    def compile(self, workers):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            status = compileFiles([self.directory.name], workers)
+        return status, output.getvalue().replace(self.directory.name, "")
+
+    def testFindSourceFiles(self):
+        self.writeFiles(FILES)
+        self.writeFiles({"notes.txt": ""})
+        found = findSourceFiles([self.directory.name])
+        self.assertEqual([os.path.relpath(path, self.directory.name) for path in found], ["a.ul", "lib/b.ul", "lib/c.ul"])
+
+    def testCrossFileReferences(self):
+        self.writeFiles(FILES)
+        self.assertEqual(self.compile(1), (0, ""))
+        self.assertEqual(self.compile(2), (0, ""))
+
+    def testDiagnosticsAreDeterministic(self):
+        files = dict(FILES)
+        files["lib/b.ul"] = "func main(): int {\n  return missing(1);\n}\n"
+        files["lib/d.ul"] = "func broken( {\n"
+        files["e.ul"] = "func other(): int {\n  return unknown;\n}\n"
+        self.writeFiles(files)
+        status, output = self.compile(1)
+        self.assertEqual(status, 1)
+        self.assertEqual(output.count("In "), 3)
+        self.assertLess(output.index("/e.ul"), output.index("/lib/b.ul"))
+        self.assertLess(output.index("/lib/b.ul"), output.index("/lib/d.ul"))
+        self.assertIn("Function signature not found: missing(int).", output)
+        self.assertIn("Variable not found: 'unknown'.", output)
+        for i in range(3):
+            self.assertEqual(self.compile(3), (status, output))
+
+    def testParsesEachFileOnce(self):
+        self.writeFiles(FILES)
+        parsed = []
+        originalParseSource = build.parseSource
+
+        def countedParseSource(path):
+            parsed.append(os.path.relpath(path, self.directory.name))
+            return originalParseSource(path)
+
+        build.parseSource = countedParseSource
+        try:
+            self.assertEqual(self.compile(1), (0, ""))
+        finally:
+            build.parseSource = originalParseSource
+        self.assertEqual(parsed, ["a.ul", "lib/b.ul", "lib/c.ul"])
+
+    def testSplitBySize(self):
+        self.writeFiles({"big.ul": "x" * 300, "medium.ul": "x" * 200, "small.ul": "x" * 100, "tiny.ul": ""})
+        paths = findSourceFiles([self.directory.name])
+        shares = splitBySize(paths, 2)
+        self.assertEqual([[os.path.basename(path) for path in share] for share in shares], [["big.ul", "tiny.ul"], ["medium.ul", "small.ul"]])
+
+    @unittest.skipIf(multiprocessing.get_start_method() != "fork", "needs forked workers to see the patched function")
+    def testWorkerDies(self):
+        self.writeFiles(FILES)
+        originalRunWorker = build.runWorker
+
+        def dyingRunWorker(paths, connection):
+            if any(path.endswith("c.ul") for path in paths):
+                os._exit(3)
+            originalRunWorker(paths, connection)
+
+        build.runWorker = dyingRunWorker
+        try:
+            with self.assertRaises(Exception) as context:
+                self.compile(2)
+        finally:
+            build.runWorker = originalRunWorker
+        message = str(context.exception)
+        self.assertIn("c.ul", message)
+        self.assertIn("exited with code 3", message)
+
+if __name__ == "__main__":
+    unittest.main()
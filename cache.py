@@ -0,0 +1,189 @@
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import zlib
+from lex import *
+from parse import *
+from arena import *
+from analyze import *
+
+# An on-disk cache of compiled files, shared between runs. Entries are keyed
+# by a hash of the source content and a fingerprint of the compiler itself,
+# so editing either one misses the cache rather than reading a stale entry.
+# An entry holds the file's AstArena with its analysis: the ProgramDetails
+# (signatures, globals and local variables per function, with node ids for
+# nodes) and the resolved type and signature columns. Only files that compile
+# without errors are stored.
+#
+# The same cache also keeps whole outputs of the compiler, the assembly,
+# object or executable written to --output, as bytes. Those are keyed by the
+# content, a fingerprint of every module the output depends on, and the
+# options that shape it, so a file compiled again with the same flags skips
+# every phase. Output that prints as it's made, such as an optimization
+# report, can't be cached and is left to the caller to compile directly.
+#
+# Entries are written to a temporary file and renamed into place, so a
+# concurrent build sees either a whole entry or none. Reading an entry bumps
+# its modification time, and once the directory grows past maxBytes the
+# least recently used entries are removed.
+#
+# Entries are pickled, so the cache directory must only be writable by
+# whoever runs the compiler.
+
+ENTRY_EXTENSION = ".entry"
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+# Every module that affects what goes into an entry
+COMPILER_MODULES = ["utils.py", "lex.py", "parse.py", "arena.py", "analyze.py", "cache.py"]
+
+# And every further module that affects what goes into an output
+OUTPUT_MODULES = ["ir.py", "compile.py", "encode.py", "elf.py", "link.py", "callgraph.py",
+        "inline.py", "fold.py", "dce.py", "loop.py", "peephole.py", "cli.py"]
+
+def defaultCacheDirectory():
+    cacheHome = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cacheHome, "ul-compiler")
+
+compilerFingerprint = None
+
+def getCompilerFingerprint():
+    global compilerFingerprint
+    if compilerFingerprint is None:
+        fingerprint = hashlib.sha256()
+        # Pickles aren't guaranteed to load across Python versions
+        fingerprint.update(sys.version.encode())
+        moduleDirectory = os.path.dirname(os.path.abspath(__file__))
+        for moduleName in COMPILER_MODULES:
+            with open(os.path.join(moduleDirectory, moduleName), "rb") as moduleFile:
+                fingerprint.update(moduleFile.read())
+        compilerFingerprint = fingerprint.digest()
+    return compilerFingerprint
+
+outputFingerprint = None
+
+def getOutputFingerprint():
+    global outputFingerprint
+    if outputFingerprint is None:
+        fingerprint = hashlib.sha256(getCompilerFingerprint())
+        moduleDirectory = os.path.dirname(os.path.abspath(__file__))
+        for moduleName in OUTPUT_MODULES:
+            with open(os.path.join(moduleDirectory, moduleName), "rb") as moduleFile:
+                fingerprint.update(moduleFile.read())
+        outputFingerprint = fingerprint.digest()
+    return outputFingerprint
+
+class CacheEntry:
+    def __init__(self, arena, programDetails, resolvedTypes, signatures):
+        self.arena = arena
+        self.programDetails = programDetails
+        # Columns indexed by node id, as filled in by ArenaAnalyzer
+        self.resolvedTypes = resolvedTypes
+        self.signatures = signatures
+
+def compileToEntry(inputString):
+    nodes = Parser(Lexxer(inputString).lexCompact(), inputString).parse()
+    arena = AstArena.fromNodes(nodes)
+    analyzer = ArenaAnalyzer(arena, inputString)
+    programDetails = analyzer.analyze()
+    return CacheEntry(arena, programDetails, analyzer.resolvedTypes, analyzer.signatures)
+
+class DiskCache:
+    def __init__(self, directory = None, maxBytes = DEFAULT_CACHE_BYTES):
+        self.directory = directory or defaultCacheDirectory()
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, content):
+        return hashlib.sha256(getCompilerFingerprint() + content).hexdigest()
+
+    def entryPath(self, key):
+        return os.path.join(self.directory, key + ENTRY_EXTENSION)
+
+    # Returns the CacheEntry for the file at path, compiling it on a miss
+    def compile(self, path):
+        with open(path, "rb") as inputFile:
+            content = inputFile.read()
+        key = self.key(content)
+        entry = self.load(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = compileToEntry(content.decode())
+        self.store(key, entry)
+        return entry
+
+    # Returns what generate(inputString) makes of the file at path, generating
+    # it on a miss. options is a string of everything besides
+    # the content that changes them.
+    def compileOutput(self, path, options, generate):
+        with open(path, "rb") as inputFile:
+            content = inputFile.read()
+        key = hashlib.sha256(getOutputFingerprint() + options.encode() + b"\0" + content).hexdigest()
+        output = self.load(key)
+        if output is not None:
+            self.hits += 1
+            return output
+        self.misses += 1
+        output = generate(content.decode())
+        self.store(key, output)
+        return output
+
+    def load(self, key):
+        entryPath = self.entryPath(key)
+        try:
+            with open(entryPath, "rb") as entryFile:
+                entry = pickle.loads(zlib.decompress(entryFile.read()))
+            os.utime(entryPath)
+        except FileNotFoundError:
+            # Missing, or evicted by another build since
+            return None
+        except (zlib.error, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            self.remove(entryPath)
+            return None
+        return entry
+
+    def store(self, key, entry):
+        os.makedirs(self.directory, exist_ok = True)
+        # Fast compression - the arrays in an arena shrink by about 10x
+        data = zlib.compress(pickle.dumps(entry, protocol = pickle.HIGHEST_PROTOCOL), 1)
+        fileDescriptor, temporaryPath = tempfile.mkstemp(dir = self.directory, suffix = ".tmp")
+        try:
+            with os.fdopen(fileDescriptor, "wb") as temporaryFile:
+                temporaryFile.write(data)
+            os.replace(temporaryPath, self.entryPath(key))
+        except BaseException:
+            self.remove(temporaryPath)
+            raise
+        self.evict()
+
+    # Removes the least recently used entries until the cache fits in maxBytes
+    def evict(self):
+        entries = []
+        totalBytes = 0
+        for fileName in os.listdir(self.directory):
+            if not fileName.endswith(ENTRY_EXTENSION):
+                continue
+            entryPath = os.path.join(self.directory, fileName)
+            try:
+                stat = os.stat(entryPath)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, entryPath))
+            totalBytes += stat.st_size
+        entries.sort()
+        for mtime, size, entryPath in entries:
+            if totalBytes <= self.maxBytes:
+                break
+            self.remove(entryPath)
+            totalBytes -= size
+
+    def remove(self, path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,151 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+import cache
+import cli
+from cache import *
+
+PROGRAM = """total: int = 1;
+func add(x: int, y: int): int {
+  z: int = x + y;
+  return z + total;
+}
+"""
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cacheDirectory = os.path.join(self.directory.name, "cache")
+        self.sourcePath = os.path.join(self.directory.name, "source.ul")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def writeSource(self, text, name = "source.ul"):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as outputFile:
+            outputFile.write(text)
+        return path
+
+    def entryFiles(self):
+        return sorted(os.listdir(self.cacheDirectory))
+
+    def testHitMatchesCompile(self):
+        self.writeSource(PROGRAM)
+        diskCache = DiskCache(self.cacheDirectory)
+        compiled = diskCache.compile(self.sourcePath)
+        loaded = DiskCache(self.cacheDirectory).compile(self.sourcePath)
+        self.assertEqual((diskCache.hits, diskCache.misses), (0, 1))
+        self.assertEqual(loaded.arena.toNodes(), compiled.arena.toNodes())
+        self.assertEqual(loaded.arena.constantIndices, compiled.arena.constantIndices)
+        self.assertEqual(list(loaded.resolvedTypes), list(compiled.resolvedTypes))
+        self.assertEqual(loaded.signatures, compiled.signatures)
+        functions = loaded.programDetails.functions
+        self.assertEqual(list(functions.keys()), [FunctionSignature("add", ["int", "int"], "int")])
+        self.assertEqual(sorted(next(iter(functions.values())).localVariables.keys()), ["x", "y", "z"])
+        self.assertEqual(list(loaded.programDetails.globalVariables.keys()), ["total"])
+
+    def testKeyedByContentAndFingerprint(self):
+        self.writeSource(PROGRAM)
+        diskCache = DiskCache(self.cacheDirectory)
+        diskCache.compile(self.sourcePath)
+        self.writeSource(PROGRAM.replace("total", "other"))
+        diskCache.compile(self.sourcePath)
+        self.assertEqual(diskCache.misses, 2)
+        fingerprint = getCompilerFingerprint()
+        try:
+            cache.compilerFingerprint = b"another compiler"
+            diskCache.compile(self.sourcePath)
+        finally:
+            cache.compilerFingerprint = fingerprint
+        self.assertEqual(diskCache.misses, 3)
+        self.assertEqual(len(self.entryFiles()), 3)
+
+    def testErrorsAreNotCached(self):
+        self.writeSource(PROGRAM.replace("x + y", "x + w"))
+        diskCache = DiskCache(self.cacheDirectory)
+        with redirect_stdout(io.StringIO()):
+            self.assertRaises(Exception, diskCache.compile, self.sourcePath)
+        self.assertFalse(os.path.exists(self.cacheDirectory))
+
+    def testCorruptEntry(self):
+        self.writeSource(PROGRAM)
+        diskCache = DiskCache(self.cacheDirectory)
+        diskCache.compile(self.sourcePath)
+        entryPath = os.path.join(self.cacheDirectory, self.entryFiles()[0])
+        with open(entryPath, "wb") as entryFile:
+            entryFile.write(b"not an entry")
+        diskCache.compile(self.sourcePath)
+        self.assertEqual((diskCache.hits, diskCache.misses), (0, 2))
+        diskCache.compile(self.sourcePath)
+        self.assertEqual(diskCache.hits, 1)
+
+    def testLeastRecentlyUsedEviction(self):
+        paths = [self.writeSource(PROGRAM.replace("total", "total{}".format(i)), "{}.ul".format(i)) for i in range(3)]
+        diskCache = DiskCache(self.cacheDirectory)
+        for path in paths:
+            diskCache.compile(path)
+        sizes = [os.path.getsize(os.path.join(self.cacheDirectory, name)) for name in self.entryFiles()]
+        # Room for three entries, then make the first the most recently used
+        diskCache.maxBytes = sum(sizes) + 10
+        firstEntry = diskCache.entryPath(diskCache.key(PROGRAM.replace("total", "total0").encode()))
+        secondEntry = diskCache.entryPath(diskCache.key(PROGRAM.replace("total", "total1").encode()))
+        for i, path in enumerate([secondEntry, firstEntry]):
+            os.utime(path, ns = (i, i + 1))
+        os.utime(diskCache.entryPath(diskCache.key(PROGRAM.replace("total", "total2").encode())), ns = (5, 5))
+        diskCache.compile(paths[0])
+        self.assertEqual(diskCache.hits, 1)
+        diskCache.compile(self.writeSource(PROGRAM.replace("total", "total3"), "3.ul"))
+        self.assertEqual(len(self.entryFiles()), 3)
+        self.assertFalse(os.path.exists(secondEntry))
+        self.assertTrue(os.path.exists(firstEntry))
+        self.assertFalse(any(name.endswith(".tmp") for name in self.entryFiles()))
+
+    def testOutputCachedByOptions(self):
+        self.writeSource(PROGRAM)
+        diskCache = DiskCache(self.cacheDirectory)
+        generated = []
+
+        def generate(inputString):
+            generated.append(inputString)
+            return inputString.encode()
+
+        self.assertEqual(diskCache.compileOutput(self.sourcePath, "a", generate), PROGRAM.encode())
+        self.assertEqual(diskCache.compileOutput(self.sourcePath, "a", generate), PROGRAM.encode())
+        diskCache.compileOutput(self.sourcePath, "b", generate)
+        self.assertEqual((diskCache.hits, diskCache.misses, len(generated)), (1, 2, 2))
+
+    def testCliCachesOutput(self):
+        self.writeSource(PROGRAM)
+        outputPath = os.path.join(self.directory.name, "source.s")
+        arguments = [self.sourcePath, "--cache-dir", self.cacheDirectory, "-o", outputPath]
+        for flags in ([], ["--syntax", "gas"], ["--fold", "--syntax", "gas"]):
+            self.assertEqual(cli.main(arguments + flags), 0)
+            with open(outputPath) as inputFile:
+                cached = inputFile.read()
+            self.assertEqual(cli.main(arguments + flags + ["--no-cache"]), 0)
+            with open(outputPath) as inputFile:
+                self.assertEqual(inputFile.read(), cached)
+        # One per set of flags
+        self.assertEqual(len(self.entryFiles()), 3)
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(cli.main(arguments + ["--report-fold"]), 0)
+        self.assertEqual(len(self.entryFiles()), 3)
+
+    def testCliCachesWarnings(self):
+        self.writeSource("func f(): int {\n  zero: int = 0;\n  return 1 / zero;\n}\n")
+        outputPath = os.path.join(self.directory.name, "source.s")
+        arguments = [self.sourcePath, "--cache-dir", self.cacheDirectory, "--fold", "-o", outputPath]
+        # Shown on the miss and again on the hit
+        for _ in range(2):
+            output = io.StringIO()
+            with redirect_stdout(output):
+                self.assertEqual(cli.main(arguments), 0)
+            self.assertIn("Division by zero, left to trap at run time.", output.getvalue())
+            self.assertNotIn("Constant folding:", output.getvalue())
+        self.assertEqual(len(self.entryFiles()), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+from parse import *
+from analyze import *
+
+# Which functions call which, from the signatures Analyzer resolved on each
+# CallNode. Builtin operators aren't functions here.
+
+class CallGraph:
+    def __init__(self, programDetails):
+        # FunctionSignature -> the signatures it calls, in the order of
+        # their first call
+        self.callees = {}
+        functions = programDetails.functions
+        for signature, functionDetails in functions.items():
+            self.callees[signature] = [callee for callee in findCallees(functionDetails.node) if callee in functions]
+
+    # Every function reachable from the roots, the roots included
+    def reachableFrom(self, roots):
+        reachable = set()
+        stack = [signature for signature in roots if signature in self.callees]
+        while len(stack) > 0:
+            signature = stack.pop()
+            if signature in reachable:
+                continue
+            reachable.add(signature)
+            for callee in self.callees[signature]:
+                if callee not in reachable:
+                    stack.append(callee)
+        return reachable
+
+    # Tarjan's algorithm with an explicit stack. Components come out with
+    # every function after the ones it calls, apart from calls within the
+    # same component.
+    def stronglyConnectedComponents(self):
+        index = {}
+        lowLink = {}
+        onStack = set()
+        componentStack = []
+        components = []
+        for root in self.callees:
+            if root in index:
+                continue
+            # (signature, position of the next callee to visit)
+            work = [(root, 0)]
+            while len(work) > 0:
+                signature, position = work.pop()
+                if position == 0:
+                    index[signature] = len(index)
+                    lowLink[signature] = index[signature]
+                    componentStack.append(signature)
+                    onStack.add(signature)
+                callees = self.callees[signature]
+                if position < len(callees):
+                    work.append((signature, position + 1))
+                    callee = callees[position]
+                    if callee not in index:
+                        work.append((callee, 0))
+                    elif callee in onStack:
+                        lowLink[signature] = min(lowLink[signature], index[callee])
+                    continue
+                if len(work) > 0:
+                    caller = work[-1][0]
+                    lowLink[caller] = min(lowLink[caller], lowLink[signature])
+                if lowLink[signature] == index[signature]:
+                    component = []
+                    while True:
+                        member = componentStack.pop()
+                        onStack.discard(member)
+                        component.append(member)
+                        if member == signature:
+                            break
+                    components.append(component)
+        return components
+
+    # Functions that can end up calling themselves
+    def findRecursiveFunctions(self):
+        recursive = set()
+        for component in self.stronglyConnectedComponents():
+            if len(component) > 1 or component[0] in self.callees[component[0]]:
+                recursive.update(component)
+        return recursive
+
+# The signatures a function calls, walking every statement and expression
+# with an explicit stack
+def findCallees(functionNode):
+    callees = {}
+    stack = list(reversed(functionNode.statements))
+    while len(stack) > 0:
+        node = stack.pop()
+        if isinstance(node, CallNode):
+            if node.signature is not None and node.signature not in BUILTINS:
+                callees[node.signature] = None
+            stack.extend(reversed(node.arguments))
+        elif isinstance(node, (DeclarationNode, ReturnNode)):
+            if node.expression is not None:
+                stack.append(node.expression)
+        elif isinstance(node, IfNode):
+            stack.extend(reversed(node.elseStatements))
+            stack.extend(reversed(node.statements))
+            stack.append(node.conditional)
+        elif isinstance(node, WhileNode):
+            stack.extend(reversed(node.statements))
+            stack.append(node.conditional)
+    return list(callees)
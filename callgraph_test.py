@@ -0,0 +1,26 @@
+import unittest
+from lex import *
+from parse import *
+from analyze import *
+from callgraph import *
+
+class TestCallGraph(unittest.TestCase):
+    def testCallees(self):
+        originalString = """
+        func a(x: int): int { return x; }
+        func b(x: int): int { if a(x) == 1 { return b(x - 1); } while x != 0 { x = c(); } return a(x) + 1; }
+        func c(): int { return 0; }
+        func d(): int { return b(c()); }
+        """
+        nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+        programDetails = Analyzer(nodes, originalString).analyze()
+        callGraph = CallGraph(programDetails)
+        names = lambda signatures: sorted(signature.name for signature in signatures)
+        callees = dict((signature.name, [callee.name for callee in calls]) for signature, calls in callGraph.callees.items())
+        self.assertEqual(callees, {"a": [], "b": ["a", "b", "c"], "c": [], "d": ["b", "c"]})
+        roots = [signature for signature in programDetails.functions if signature.name == "b"]
+        self.assertEqual(names(callGraph.reachableFrom(roots)), ["a", "b", "c"])
+        self.assertEqual(callGraph.reachableFrom([]), set())
+
+if __name__ == "__main__":
+    unittest.main()
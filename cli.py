@@ -1,21 +1,365 @@
+import sys
+from client import *
+
+# Forwarded before anything else is imported, see client.py
+if __name__ == "__main__":
+    socketPath = findConnectSocket(sys.argv[1:])
+    if socketPath is not None:
+        sys.exit(forwardArgs(socketPath, sys.argv[1:]))
+
 import argparse
+import cProfile
+import contextlib
+import io
+import json
+import os
+import pstats
 from parse import *
 from lex import *
 from analyze import *
+from server import *
+from build import *
+from cache import *
+from inline import *
+from fold import *
+from dce import *
+from loop import *
+from compile import *
+from encode import *
+from link import *
+from stats import *
+from peephole import *
+from vm import *
 
-# Currently just for testing
-def main():
+def makeArgParser():
     argparser = argparse.ArgumentParser(description = "Toy compiler")
-    argparser.add_argument("file", help = "File to compile")
-    args = argparser.parse_args()
-    inputFile = open(args.file)
-    inputString = inputFile.read()
-    lexxer = Lexxer(inputString)
-    tokens = lexxer.lex()
-    parser = Parser(tokens, inputString)
-    nodes = parser.parse()
-    analyzer = Analyzer(nodes, inputString)
-    analyzer.analyze()
+    argparser.add_argument("files", nargs = "*", help = "Files or directories to compile as one program")
+    argparser.add_argument("--stream", action = "store_true", help = "Lex and parse the file in chunks instead of reading it all at once")
+    argparser.add_argument("--server", metavar = "SOCKET", help = "Stay resident and serve compile requests on a Unix socket")
+    argparser.add_argument("--connect", metavar = "SOCKET", help = "Forward this compile to the server listening on a Unix socket")
+    argparser.add_argument("--jobs", type = int, help = "Number of processes to compile multiple files with, defaults to the number of cores")
+    argparser.add_argument("-o", "--output", help = "Write x86-64 assembly for the file here")
+    argparser.add_argument("--syntax", choices = ["nasm", "gas"], default = "nasm", help = "Assembler syntax for --output")
+    argparser.add_argument("-c", "--object", action = "store_true", help = "Write a relocatable ELF object to --output instead of assembly, without running an assembler")
+    argparser.add_argument("--executable", action = "store_true", help = "Write a static executable to --output that exits with what main returns, without an assembler or linker")
+    argparser.add_argument("--peephole", action = "store_true", help = "Run the peephole optimizer over the assembly before writing it")
+    argparser.add_argument("--report-peephole", action = "store_true", help = "Run the peephole optimizer and print how often each rule matched")
+    addOptimizationArguments(argparser)
+    argparser.add_argument("--no-cache", action = "store_true", help = "Don't read or write the on-disk cache of compiled files")
+    argparser.add_argument("--cache-dir", help = "Directory for the on-disk cache, defaults to ~/.cache/ul-compiler")
+    # The file is a separate option, so --stats doesn't take the input file
+    # after it as the place to write to
+    argparser.add_argument("--stats", dest = "stats", action = "store_const", const = "-", help = "Write each phase's time and peak memory and counts of tokens, nodes, signature lookups and errors as JSON to stderr")
+    argparser.add_argument("--stats-file", dest = "stats", metavar = "FILE", help = "Write what --stats does to FILE instead")
+    argparser.add_argument("--profile", dest = "profile", action = "store_const", const = "-", help = "Run under cProfile and write the functions taking the most time to stderr")
+    argparser.add_argument("--profile-file", dest = "profile", metavar = "FILE", help = "Write what --profile does to FILE instead")
+    return argparser
+
+# Runs a program on the bytecode VM instead: cli.py run FILE [ARGUMENT...]
+def makeRunArgParser():
+    argparser = argparse.ArgumentParser(prog = "cli.py run", description = "Run a program on the bytecode VM and print what its entry function returns")
+    argparser.add_argument("file", help = "File to run")
+    argparser.add_argument("arguments", nargs = "*", type = int, help = "Integer arguments for the entry function")
+    argparser.add_argument("--entry", default = "main", help = "Function to call, defaults to main")
+    argparser.add_argument("--no-superinstructions", action = "store_true", help = "Only use the plain instruction forms")
+    addOptimizationArguments(argparser)
+    argparser.set_defaults(stream = False)
+    return argparser
+
+# Links objects into a static executable: cli.py link -o OUTPUT OBJECT...
+def makeLinkArgParser():
+    argparser = argparse.ArgumentParser(prog = "cli.py link", description = "Link ELF objects into a static executable that exits with what main returns")
+    argparser.add_argument("objects", nargs = "+", help = "Objects to link, e.g. from cli.py -c")
+    argparser.add_argument("-o", "--output", required = True, help = "Where to write the executable")
+    argparser.add_argument("--no-start", action = "store_true", help = "Don't add the _start stub, one of the objects defines _start")
+    return argparser
+
+# Optimizes assembly from any code generator or written by hand, between
+# codegen and the assembler: cli.py peephole INPUT [-o OUTPUT]
+def makePeepholeArgParser():
+    argparser = argparse.ArgumentParser(prog = "cli.py peephole", description = "Remove redundant instructions from x86-64 Intel syntax assembly")
+    argparser.add_argument("input", help = "Assembly to optimize, or - for stdin")
+    argparser.add_argument("-o", "--output", help = "Where to write the optimized assembly, defaults to stdout")
+    argparser.add_argument("--report", action = "store_true", help = "Print how often each rule matched to stderr")
+    return argparser
+
+def addOptimizationArguments(argparser):
+    argparser.add_argument("--inline", action = "store_true", help = "Inline calls to small functions that aren't recursive")
+    argparser.add_argument("--inline-budget", type = float, default = DEFAULT_GROWTH_BUDGET, help = "How much inlining may grow the program, as a fraction of its size")
+    argparser.add_argument("--fold", action = "store_true", help = "Fold constant expressions and propagate constant locals")
+    argparser.add_argument("--report-fold", action = "store_true", help = "Fold constants and print how many nodes were removed")
+    argparser.add_argument("--loops", action = "store_true", help = "Hoist loop-invariant expressions out of whiles and unroll loops with a known trip count")
+    argparser.add_argument("--unroll-budget", type = int, default = DEFAULT_UNROLL_BUDGET, help = "How many nodes an unrolled loop body may grow to")
+    argparser.add_argument("--report-loops", action = "store_true", help = "Optimize loops and print how many expressions were hoisted and loops unrolled")
+    argparser.add_argument("--dce", action = "store_true", help = "Remove unreachable statements, constant branches and functions main never calls")
+    argparser.add_argument("--report-dce", action = "store_true", help = "Remove dead code and print a summary of what was removed")
+
+# stats is a CompileStats to measure each phase with, or None
+def compileFile(args, path, stats = None):
+    # Streamed tokens are read from the file as the parser asks for them,
+    # so it stays open until parsing is done
+    with open(path) as inputFile:
+        with measurePhase(stats, "lex"):
+            if args.stream:
+                # Only read back in full if there's an error to display. Tokens
+                # are lexed as the parser asks for them, so this is all parse time.
+                inputString = SourceFile(None, path)
+                lexxer = Lexxer(inputString)
+                tokens = lexxer.lexStream(inputFile)
+                if stats is not None:
+                    tokens = stats.countTokens(tokens)
+            else:
+                inputString = inputFile.read()
+                lexxer = Lexxer(inputString)
+                tokens = lexxer.lexCompact()
+                if stats is not None:
+                    stats.count("tokens", len(tokens))
+        with measurePhase(stats, "parse"):
+            parser = Parser(tokens, inputString)
+            nodes = parser.parse()
+    if stats is not None:
+        stats.countNodes(nodes)
+    with measurePhase(stats, "analyze"):
+        analyzer = Analyzer(nodes, inputString)
+        if stats is not None:
+            stats.watchAnalyzer(analyzer)
+        programDetails = analyzer.analyze()
+    return inputString, nodes, programDetails
+
+def isOptimizing(args):
+    return args.inline or args.fold or args.report_fold or args.loops or args.report_loops or args.dce or args.report_dce
+
+# Rewrites the analyzed nodes in place
+def optimize(args, inputString, nodes, programDetails):
+    if args.inline:
+        inlineCalls(nodes, programDetails, growthBudget = args.inline_budget)
+    if args.fold or args.report_fold:
+        folder = foldConstants(nodes, programDetails, inputString)
+        folder.displayWarnings()
+        if args.report_fold:
+            print("Constant folding: {} calls folded, {} identifiers propagated, {} nodes removed".format(
+                folder.foldedCount, folder.propagatedCount, folder.removedCount))
+    if args.loops or args.report_loops:
+        optimizer = optimizeLoops(nodes, programDetails, args.unroll_budget)
+        if args.report_loops:
+            print(optimizer.formatReport())
+        # Unrolled copies of the body can fold further, now the counter is
+        # known in each of them. A copy can divide by zero where a guard
+        # around it never lets it run, so its warnings aren't shown.
+        if (args.fold or args.report_fold) and optimizer.unrolledCount + optimizer.partiallyUnrolledCount > 0:
+            foldConstants(nodes, programDetails, inputString)
+    if args.dce or args.report_dce:
+        eliminator = eliminateDeadCode(nodes, programDetails)
+        if args.report_dce:
+            print(eliminator.formatReport())
+
+def generateAssembly(args, nodes, programDetails):
+    dialect = NASM
+    if args.syntax == "gas":
+        dialect = GAS
+    assembly = CodeGenerator(lowerProgram(nodes, programDetails), dialect).generate()
+    if args.peephole or args.report_peephole:
+        assembly, optimizer = optimizeAssembly(assembly)
+        if args.report_peephole:
+            print(optimizer.formatReport())
+    return assembly
+
+# What --output gets, as bytes
+def generateOutput(args, nodes, programDetails):
+    if args.executable:
+        return linkObjects([readObjectFile(generateObject(nodes, programDetails))])
+    if args.object:
+        return generateObject(nodes, programDetails)
+    return generateAssembly(args, nodes, programDetails).encode()
+
+def writeOutput(args, output):
+    with open(args.output, "wb") as outputFile:
+        outputFile.write(output)
+    if args.executable:
+        os.chmod(args.output, 0o755)
+
+# Every flag that changes what's written to --output, for the cache key
+def outputOptions(args):
+    return json.dumps({
+        "syntax": args.syntax, "object": args.object, "executable": args.executable, "peephole": args.peephole,
+        "inline": args.inline, "inlineBudget": args.inline_budget, "fold": args.fold, "loops": args.loops,
+        "unrollBudget": args.unroll_budget, "dce": args.dce,
+    }, sort_keys = True)
+
+# Whether the compile prints anything besides errors, which a cached output
+# wouldn't
+def isReporting(args):
+    return args.report_fold or args.report_loops or args.report_dce or args.report_peephole
+
+def writeExecutable(path, objectFiles, includeStart = True):
+    executable = linkObjects(objectFiles, includeStart)
+    with open(path, "wb") as outputFile:
+        outputFile.write(executable)
+    os.chmod(path, 0o755)
+
+def linkProgram(argv):
+    args = makeLinkArgParser().parse_args(argv)
+    objectFiles = []
+    for path in args.objects:
+        with open(path, "rb") as inputFile:
+            objectFiles.append(readObjectFile(inputFile.read()))
+    writeExecutable(args.output, objectFiles, not args.no_start)
+    return 0
+
+def peepholeProgram(argv):
+    args = makePeepholeArgParser().parse_args(argv)
+    if args.input == "-":
+        assembly = sys.stdin.read()
+    else:
+        with open(args.input) as inputFile:
+            assembly = inputFile.read()
+    assembly, optimizer = optimizeAssembly(assembly)
+    if args.output is None:
+        sys.stdout.write(assembly)
+    else:
+        with open(args.output, "w") as outputFile:
+            outputFile.write(assembly)
+    if args.report:
+        sys.stderr.write(optimizer.formatReport() + "\n")
+    return 0
+
+def runProgram(argv):
+    argparser = makeRunArgParser()
+    args = argparser.parse_args(argv)
+    inputString, nodes, programDetails = compileFile(args, args.file)
+    optimize(args, inputString, nodes, programDetails)
+    program = compileBytecode(nodes, programDetails, not args.no_superinstructions)
+    function = program.findFunction(args.entry, ["int"] * len(args.arguments))
+    if function is None:
+        argparser.error("no function {} taking {} arguments".format(args.entry, len(args.arguments)))
+    print(VirtualMachine(program).call(function, args.arguments))
+    return 0
+
+def writeReport(path, text):
+    if path == "-":
+        sys.stderr.write(text)
+    else:
+        with open(path, "w") as outputFile:
+            outputFile.write(text)
+
+PROFILE_LIMIT = 40
+
+def writeProfile(profile, path):
+    report = io.StringIO()
+    pstats.Stats(profile, stream = report).sort_stats("cumulative").print_stats(PROFILE_LIMIT)
+    writeReport(path, report.getvalue())
+
+# Currently just for testing
+# cache is set when running inside the server, so unchanged files are reused
+# from memory. Otherwise single files go through the on-disk cache.
+def main(argv = None, cache = None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) > 0 and argv[0] == "run":
+        return runProgram(argv[1:])
+    if len(argv) > 0 and argv[0] == "link":
+        return linkProgram(argv[1:])
+    if len(argv) > 0 and argv[0] == "peephole":
+        return peepholeProgram(argv[1:])
+    argparser = makeArgParser()
+    args = argparser.parse_args(argv)
+    if args.server is not None:
+        if cache is not None:
+            argparser.error("--server can't be forwarded to a server")
+        serverCache = CompileCache()
+        with CompileServer(args.server, lambda argv: main(argv, serverCache)) as server:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+        return 0
+    if len(args.files) == 0:
+        argparser.error("the following arguments are required: files")
+    if args.connect is not None:
+        # It would wait on itself
+        if cache is not None:
+            argparser.error("--connect can't be forwarded to a server")
+        return forwardArgs(args.connect, argv)
+    if args.profile is None:
+        return compileArgs(argparser, args, cache)
+    # Like --stats, what's profiled is the compile, not a cache lookup
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        return compileArgs(argparser, args, None)
+    finally:
+        profile.disable()
+        writeProfile(profile, args.profile)
+
+def compileArgs(argparser, args, cache):
+    if (args.peephole or args.report_peephole) and (args.object or args.executable):
+        argparser.error("--peephole works on assembly, not with --object or --executable")
+    if len(args.files) > 1 or os.path.isdir(args.files[0]):
+        if args.output is not None:
+            argparser.error("--output takes a single file")
+        if isOptimizing(args):
+            argparser.error("optimizations take a single file")
+        if args.stats is not None:
+            argparser.error("--stats takes a single file")
+        return compileFiles(args.files, args.jobs)
+    if args.stats is None:
+        return compileSingleFile(args, cache, None)
+    # Every phase has to actually run to be measured, so no caches
+    stats = CompileStats()
+    try:
+        return compileSingleFile(args, None, stats)
+    finally:
+        stats.finish()
+        writeReport(args.stats, stats.toJson() + "\n")
+
+def compileSingleFile(args, cache, stats):
+    if args.no_cache:
+        cache = None
+    # Unless there's a cache in memory already, or every phase has to run
+    useDiskCache = cache is None and not args.no_cache and not args.stream and stats is None and args.profile is None
+    if args.output is not None and useDiskCache and not isReporting(args):
+        output, warnings = DiskCache(args.cache_dir).compileOutput(args.files[0], outputOptions(args), lambda inputString: generateFromSource(args, inputString))
+        sys.stdout.write(warnings)
+        writeOutput(args, output)
+        return 0
+    if args.output is not None or isOptimizing(args):
+        # The code generator needs the analyzed nodes, which the in-memory
+        # server cache keeps. Optimizations rewrite the nodes, so they don't
+        # get its cached ones.
+        if cache is not None and not isOptimizing(args):
+            compiledFile = cache.compile(args.files[0])
+            nodes, programDetails = compiledFile.nodes, compiledFile.programDetails
+        else:
+            inputString, nodes, programDetails = compileFile(args, args.files[0], stats)
+            with measurePhase(stats, "optimize"):
+                optimize(args, inputString, nodes, programDetails)
+        if args.output is not None:
+            with measurePhase(stats, "codegen"):
+                writeOutput(args, generateOutput(args, nodes, programDetails))
+        return 0
+    if useDiskCache:
+        cache = DiskCache(args.cache_dir)
+    if cache is not None:
+        cache.compile(args.files[0])
+    else:
+        compileFile(args, args.files[0], stats)
+    return 0
+
+# Compiles the source through to what --output gets, along with the warnings
+# printed on the way, which the disk cache keeps to show again on a hit
+def generateFromSource(args, inputString):
+    printed = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(printed):
+            nodes = Parser(Lexxer(inputString).lexCompact(), inputString).parse()
+            programDetails = Analyzer(nodes, inputString).analyze()
+            optimize(args, inputString, nodes, programDetails)
+            output = generateOutput(args, nodes, programDetails)
+    except BaseException:
+        # The errors explaining it
+        sys.stdout.write(printed.getvalue())
+        raise
+    return output, printed.getvalue()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,49 @@
+import json
+import os
+import socket
+import sys
+
+# The thin client for the compile server in server.py. It only needs the
+# standard library, so cli.py can forward a --connect compile before it
+# imports the compiler, which takes longer than the compile the server does.
+
+# Returns (output, status) of running argv on the server at socketPath
+def sendRequest(socketPath, argv, cwd = None):
+    request = {"argv": argv, "cwd": cwd or os.getcwd()}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socketPath)
+        connection.sendall((json.dumps(request) + "\n").encode())
+        responseFile = connection.makefile("rb")
+        response = json.loads(responseFile.readline())
+    return response["output"], response["status"]
+
+# Everything but --connect and its value, for forwarding to the server
+def forwardedArgs(argv):
+    forwarded = []
+    i = 0
+    while i < len(argv):
+        if argv[i] == "--connect":
+            i += 2
+            continue
+        if not argv[i].startswith("--connect="):
+            forwarded.append(argv[i])
+        i += 1
+    return forwarded
+
+# The socket argv asks to forward to, or None. Only the spellings
+# forwardedArgs removes are recognized, anything else is left to argparse.
+def findConnectSocket(argv):
+    socketPath = None
+    for i, arg in enumerate(argv):
+        if arg == "--connect" and i + 1 < len(argv):
+            socketPath = argv[i + 1]
+        elif arg.startswith("--connect="):
+            socketPath = arg[len("--connect="):]
+    return socketPath
+
+# Forwards argv to the server at socketPath, prints what it printed and
+# returns its exit status
+def forwardArgs(socketPath, argv):
+    output, status = sendRequest(socketPath, forwardedArgs(argv))
+    sys.stdout.write(output)
+    return status
@@ -0,0 +1,1021 @@
+from bisect import bisect_right
+from parse import *
+from analyze import *
+from ir import *
+
+# x86-64 code generation. Each function's SSA IR (see ir.py) is lowered to a
+# linear list of instructions over an unlimited number of virtual registers,
+# leaving SSA by turning phis into copies. Multiplication and division by
+# constants and branches on comparisons are given cheaper instruction
+# sequences (see InstructionSelector). Then virtual registers are assigned
+# to machine registers with a linear scan over their live intervals
+# (Poletto and Sarkar), and only spilled to the stack when more are live at
+# once than there are registers to hold them. Finally the
+# instructions are emitted as machine instructions, which are either written
+# out as Intel syntax assembly, for NASM by default, or encoded straight into
+# an object file by encode.py.
+#
+# Functions follow the System V calling convention: the first six arguments
+# in rdi, rsi, rdx, rcx, r8 and r9, the rest on the stack, and the result in
+# rax. Every value is a 64-bit integer.
+
+ARGUMENT_REGISTERS = ["rdi", "rsi", "rdx", "rcx", "r8", "r9"]
+
+# Registers handed out by the allocator. Caller saved registers are preferred
+# since they don't need saving in the prologue, but they don't survive a
+# call, so values live across one only go in callee saved registers.
+CALLER_SAVED_REGISTERS = ["rcx", "rsi", "rdi", "r8", "r9", "r10"]
+CALLEE_SAVED_REGISTERS = ["rbx", "r12", "r13", "r14", "r15"]
+
+# Never allocated: rax and rdx are taken by division, multiplication and
+# call results, and rax and r11 are scratch for instructions that can't take
+# two memory operands
+SCRATCH_REGISTER = "rax"
+HIGH_REGISTER = "rdx"
+MOVE_REGISTER = "r11"
+
+BYTE_REGISTERS = {"rax": "al"}
+
+# Writing the 32-bit half of a register zeroes the upper half
+DWORD_REGISTERS = {
+        "rax": "eax", "rbx": "ebx", "rcx": "ecx", "rdx": "edx", "rsi": "esi", "rdi": "edi",
+        "r8": "r8d", "r9": "r9d", "r10": "r10d", "r11": "r11d", "r12": "r12d", "r13": "r13d", "r14": "r14d", "r15": "r15d",
+}
+
+INT32_MIN = -(1 << 31)
+INT32_MAX = (1 << 31) - 1
+
+def fitsInt32(value):
+    return value >= INT32_MIN and value <= INT32_MAX
+
+# Assembler syntax. NASM is the target, GAS (GNU as with .intel_syntax) lets
+# the output be assembled where NASM isn't installed.
+class Dialect:
+    def __init__(self, header, globalDirective, dataSection, textSection, quadDirective, memoryFormat, globalMemoryFormat):
+        self.header = header
+        self.globalDirective = globalDirective
+        self.dataSection = dataSection
+        self.textSection = textSection
+        self.quadDirective = quadDirective
+        self.memoryFormat = memoryFormat
+        self.globalMemoryFormat = globalMemoryFormat
+
+NASM = Dialect([], "global {}", "section .data", "section .text", "dq {}", "qword [{}]", "qword [rel {}]")
+GAS = Dialect([".intel_syntax noprefix", ".section .note.GNU-stack,\"\",@progbits"], ".globl {}", ".data", ".text", ".quad {}", "QWORD PTR [{}]", "QWORD PTR [rip + {}]")
+
+# Instruction operands. Virtual registers are plain ints.
+class Immediate:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = toInt64(value)
+
+    def __repr__(self):
+        return "Immediate({})".format(self.value)
+
+    def __eq__(self, other):
+        return isinstance(other, Immediate) and self.value == other.value
+
+# A slot in the current function's frame, at rbp + offset
+class StackSlot:
+    __slots__ = ("offset",)
+
+    def __init__(self, offset):
+        self.offset = offset
+
+    def __repr__(self):
+        return "StackSlot({})".format(self.offset)
+
+    def __eq__(self, other):
+        return isinstance(other, StackSlot) and self.offset == other.offset
+
+    def __hash__(self):
+        return hash(self.offset)
+
+# A global variable's quadword, addressed relative to rip
+class GlobalMemory:
+    __slots__ = ("symbol",)
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+    def __repr__(self):
+        return "GlobalMemory({})".format(self.symbol)
+
+    def __eq__(self, other):
+        return isinstance(other, GlobalMemory) and self.symbol == other.symbol
+
+# base + index * scale, for lea
+class Address:
+    __slots__ = ("base", "index", "scale")
+
+    def __init__(self, base, index, scale):
+        self.base = base
+        self.index = index
+        self.scale = scale
+
+    def __repr__(self):
+        return "Address({}, {}, {})".format(self.base, self.index, self.scale)
+
+    def __eq__(self, other):
+        return isinstance(other, Address) and (self.base, self.index, self.scale) == (other.base, other.index, other.scale)
+
+# A label or function named as a jump or call target
+class Symbol:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "Symbol({})".format(self.name)
+
+    def __eq__(self, other):
+        return isinstance(other, Symbol) and self.name == other.name
+
+# Machine instructions, kept in memory so they can either be written out as
+# assembly or encoded straight into an object file (see encode.py). Operands
+# are register names, Immediates, StackSlots, GlobalMemory, Addresses and
+# Symbols.
+class MachineInstruction:
+    __slots__ = ("mnemonic", "operands")
+
+    def __init__(self, mnemonic, operands):
+        self.mnemonic = mnemonic
+        self.operands = operands
+
+    def __repr__(self):
+        return "MachineInstruction({}, {})".format(self.mnemonic, self.operands)
+
+# Where a label is defined, among a function's MachineInstructions
+class Label:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "Label({})".format(self.name)
+
+# A function's code, under its global symbol
+class MachineFunction:
+    def __init__(self, name, code):
+        self.name = name
+        self.code = code
+
+# The whole program as machine code. globals are (symbol, value) pairs, in
+# declaration order.
+class MachineProgram:
+    def __init__(self, functions, globals):
+        self.functions = functions
+        self.globals = globals
+
+# Instructions on virtual registers:
+#   parameters          sources are the parameter registers, all defined on entry
+#   mov                 dst = sources[0]
+#   add sub mul div     dst = sources[0] op sources[1]
+#   eq ne               dst = 1 if the comparison holds, else 0
+#   shl sar shr         dst = sources[0] shifted by the Immediate sources[1]
+#   neg                 dst = -sources[0]
+#   lea                 dst = sources[0] + sources[0] * the Immediate sources[1]
+#   mulHigh             dst = the high 64 bits of sources[0] * the Immediate sources[1]
+#   loadGlobal          dst = the global named target
+#   storeGlobal         the global named target = sources[0]
+#   call                dst = call of the function symbol target with sources
+#   label               target is the label
+#   jump                to target
+#   jumpIfZero          to target if sources[0] is 0
+#   jumpIfEqual         to target if sources[0] == sources[1]
+#   jumpIfNotEqual      to target if sources[0] != sources[1]
+#   return              sources[0] from the function
+BINARY_OPERATIONS = {"add": "add", "sub": "sub", "mul": "imul"}
+COMPARISONS = {"eq": "sete", "ne": "setne"}
+SHIFTS = ["shl", "sar", "shr"]
+CONDITIONAL_JUMPS = {"jumpIfEqual": "je", "jumpIfNotEqual": "jne"}
+# Jumps to a label that may fall through
+BRANCHES = ["jumpIfZero", "jumpIfEqual", "jumpIfNotEqual"]
+
+class Instruction:
+    __slots__ = ("op", "dst", "sources", "target")
+
+    def __init__(self, op, dst = None, sources = None, target = None):
+        self.op = op
+        self.dst = dst
+        self.sources = sources or []
+        self.target = target
+
+    def __repr__(self):
+        return "Instruction({}, dst = {}, sources = {}, target = {})".format(self.op, self.dst, self.sources, self.target)
+
+    def defs(self):
+        if self.op == "parameters":
+            return self.sources
+        if self.dst is None:
+            return []
+        return [self.dst]
+
+    def uses(self):
+        if self.op == "parameters":
+            return []
+        return [source for source in self.sources if isinstance(source, int)]
+
+# Lowers a function from the SSA IR to instructions on virtual registers.
+# Every IR value becomes the virtual register with the same id. Phis are
+# replaced by copies at the end of each predecessor, and when the
+# predecessor branches, on a separate path for that edge so the copies only
+# happen when it's taken.
+class FunctionLowering:
+    def __init__(self, generator, function):
+        self.generator = generator
+        self.function = function
+        self.instructions = []
+        self.registerCount = function.valueCount
+        self.labels = dict((block, generator.newLabel()) for block in function.blocks)
+
+    def newRegister(self):
+        register = self.registerCount
+        self.registerCount += 1
+        return register
+
+    def emit(self, op, dst = None, sources = None, target = None):
+        self.instructions.append(Instruction(op, dst, sources, target))
+
+    def operand(self, value):
+        if isinstance(value, Constant):
+            return Immediate(value.value)
+        return value.id
+
+    def lower(self):
+        blocks = self.function.blocks
+        self.emit("parameters", sources = [parameter.id for parameter in self.function.parameters])
+        for i, block in enumerate(blocks):
+            # The entry block is never jumped to
+            if i > 0:
+                self.emit("label", target = self.labels[block])
+            nextBlock = blocks[i + 1] if i + 1 < len(blocks) else None
+            for instruction in block.instructions:
+                self.lowerInstruction(block, instruction, nextBlock)
+        return self.instructions
+
+    def lowerInstruction(self, block, instruction, nextBlock):
+        op = instruction.op
+        operands = [self.operand(operand) for operand in instruction.operands]
+        if op in BINARY_OPS:
+            self.emit(op, instruction.result.id, operands)
+        elif op == "call":
+            self.emit("call", instruction.result.id, operands, self.generator.symbolName(instruction.callee))
+        elif op == "load":
+            self.emit("loadGlobal", instruction.result.id, target = instruction.name)
+        elif op == "store":
+            self.emit("storeGlobal", sources = operands, target = instruction.name)
+        elif op == "jump":
+            self.jumpTo(block, instruction.targets[0], nextBlock)
+        elif op == "branch":
+            trueTarget, falseTarget = instruction.targets
+            falseLabel = self.labels[falseTarget]
+            if len(falseTarget.phis) > 0:
+                falseLabel = self.generator.newLabel()
+            self.emit("jumpIfZero", sources = operands, target = falseLabel)
+            self.jumpTo(block, trueTarget, nextBlock if falseLabel == self.labels[falseTarget] else None)
+            if falseLabel != self.labels[falseTarget]:
+                self.emit("label", target = falseLabel)
+                self.jumpTo(block, falseTarget, nextBlock)
+        elif op == "return":
+            self.emit("return", sources = operands)
+        else:
+            raise Exception("Can't generate code for '{}'".format(instruction))
+
+    # Copies block's values into target's phis, then jumps unless target is
+    # laid out next
+    def jumpTo(self, block, target, nextBlock):
+        copies = []
+        for phi in target.phis:
+            for predecessor, value in phi.incoming:
+                if predecessor is block:
+                    copies.append((phi.result.id, self.operand(value)))
+        for dst, src in sequentializeCopies(copies, self.newRegister):
+            self.emit("mov", dst, [src])
+        if target is not nextBlock:
+            self.emit("jump", target = self.labels[target])
+
+# Orders copies that must appear to happen at once, e.g. the phis of a loop
+# header swapping two values, so that no source is overwritten before it's
+# read. Cycles go through a new register.
+def sequentializeCopies(copies, newRegister):
+    pending = [(dst, src) for dst, src in copies if dst != src]
+    ordered = []
+    while len(pending) > 0:
+        sources = [src for dst, src in pending]
+        ready = None
+        for i, (dst, src) in enumerate(pending):
+            if dst not in sources:
+                ready = i
+                break
+        if ready is not None:
+            ordered.append(pending.pop(ready))
+            continue
+        dst, src = pending[0]
+        temporary = newRegister()
+        ordered.append((temporary, dst))
+        pending = [(pendingDst, temporary if pendingSrc == dst else pendingSrc) for pendingDst, pendingSrc in pending]
+    return ordered
+
+# Multiplying by an odd factor of 3, 5 or 9 is one lea
+LEA_FACTORS = {3: 2, 5: 4, 9: 8}
+
+# The smallest multiplier and shift that divide by d with a multiply high,
+# from Hacker's Delight, figure 10-1, for 64 bits. Then for any 64-bit x,
+# with q = the high 64 bits of x * magic, plus x if d > 0 and magic < 0, or
+# minus x if d < 0 and magic > 0, x / d rounded toward zero is
+# (q >> shift) + 1 if that's negative. d can't be 0, 1, -1 or INT64_MIN.
+def signedDivisionMagic(d):
+    absoluteD = abs(d)
+    t = (1 << 63) + (1 if d < 0 else 0)
+    absoluteNc = t - 1 - t % absoluteD
+    p = 63
+    q1, r1 = divmod(1 << 63, absoluteNc)
+    q2, r2 = divmod(1 << 63, absoluteD)
+    while True:
+        p += 1
+        q1 = 2 * q1
+        r1 = 2 * r1
+        if r1 >= absoluteNc:
+            q1 += 1
+            r1 -= absoluteNc
+        q2 = 2 * q2
+        r2 = 2 * r2
+        if r2 >= absoluteD:
+            q2 += 1
+            r2 -= absoluteD
+        delta = absoluteD - r2
+        if q1 > delta or (q1 == delta and r1 != 0):
+            break
+    magic = toInt64(q2 + 1)
+    if d < 0:
+        magic = toInt64(-magic)
+    return magic, p - 64
+
+# Picks cheaper instructions for mul and div by a constant, and fuses
+# comparisons into the branches on them, before register allocation so the
+# temporaries they need are allocated like any other virtual register:
+#   - mul by 0, 1 or -1 is a mov or neg, and by 1, 3, 5 or 9 times a power of
+#     two, or its negation, at most two of lea, shl and neg
+#   - div by plus or minus a power of two is shifts that round toward zero,
+#     and by any other constant a multiply high with the divisor's magic
+#     number. Division by 0, -1 and INT64_MIN keeps idiv, which traps on 0
+#     and on INT64_MIN / -1.
+#   - eq or ne only used by the jumpIfZero after it is a cmp and conditional
+#     jump, rather than making the 0 or 1 and testing it
+class InstructionSelector:
+    def __init__(self, lowering):
+        self.lowering = lowering
+        self.instructions = []
+        self.reducedCount = 0
+        self.fusedCount = 0
+
+    def emit(self, op, dst = None, sources = None, target = None):
+        self.instructions.append(Instruction(op, dst, sources, target))
+
+    def select(self):
+        instructions = self.lowering.instructions
+        useCounts = {}
+        for instruction in instructions:
+            for register in instruction.uses():
+                useCounts[register] = useCounts.get(register, 0) + 1
+        i = 0
+        while i < len(instructions):
+            instruction = instructions[i]
+            nextInstruction = instructions[i + 1] if i + 1 < len(instructions) else None
+            if instruction.op in COMPARISONS and nextInstruction is not None and nextInstruction.op == "jumpIfZero" \
+                    and nextInstruction.sources[0] == instruction.dst and useCounts[instruction.dst] == 1:
+                # Jumps when the comparison is 0, i.e. doesn't hold
+                op = "jumpIfNotEqual" if instruction.op == "eq" else "jumpIfEqual"
+                self.emit(op, sources = instruction.sources, target = nextInstruction.target)
+                self.fusedCount += 1
+                i += 2
+                continue
+            if instruction.op == "mul" and self.selectMultiply(instruction):
+                self.reducedCount += 1
+            elif instruction.op == "div" and self.selectDivide(instruction):
+                self.reducedCount += 1
+            else:
+                self.instructions.append(instruction)
+            i += 1
+        return self.instructions
+
+    # Emits op on value for each step but the last, which writes dst
+    def emitSteps(self, dst, value, steps):
+        for i, (op, operands) in enumerate(steps):
+            result = dst if i == len(steps) - 1 else self.lowering.newRegister()
+            self.emit(op, result, [value] + operands)
+            value = result
+
+    def selectMultiply(self, instruction):
+        left, right = instruction.sources
+        if isinstance(left, Immediate):
+            left, right = right, left
+        if not isinstance(left, int) or not isinstance(right, Immediate):
+            return False
+        factor = right.value
+        if factor == 0:
+            self.emit("mov", instruction.dst, [Immediate(0)])
+            return True
+        # INT64_MIN's magnitude is 1 << 63, which negates back to itself
+        magnitude = abs(factor)
+        shift = (magnitude & -magnitude).bit_length() - 1
+        odd = magnitude >> shift
+        if odd != 1 and odd not in LEA_FACTORS:
+            return False
+        steps = []
+        if odd != 1:
+            steps.append(("lea", [Immediate(LEA_FACTORS[odd])]))
+        if shift > 0:
+            steps.append(("shl", [Immediate(shift)]))
+        if factor < 0:
+            steps.append(("neg", []))
+        # imul takes 3 cycles, as long as three single cycle instructions
+        if len(steps) > 2:
+            return False
+        if len(steps) == 0:
+            self.emit("mov", instruction.dst, [left])
+        else:
+            self.emitSteps(instruction.dst, left, steps)
+        return True
+
+    def selectDivide(self, instruction):
+        dividend, divisor = instruction.sources
+        if not isinstance(dividend, int) or not isinstance(divisor, Immediate) or divisor.value in (0, -1, INT64_MIN):
+            return False
+        d = divisor.value
+        magnitude = abs(d)
+        if d == 1:
+            self.emit("mov", instruction.dst, [dividend])
+        elif magnitude & (magnitude - 1) == 0:
+            self.divideByPowerOfTwo(instruction.dst, dividend, d)
+        else:
+            self.divideByMagic(instruction.dst, dividend, d)
+        return True
+
+    # Shifting right rounds down, so negative dividends get the divisor
+    # minus 1 added first to round toward zero instead
+    def divideByPowerOfTwo(self, dst, dividend, d):
+        shift = abs(d).bit_length() - 1
+        if shift == 1:
+            # The sign bit is the bias
+            bias = self.lowering.newRegister()
+            self.emit("shr", bias, [dividend, Immediate(63)])
+        else:
+            sign = self.lowering.newRegister()
+            self.emit("sar", sign, [dividend, Immediate(63)])
+            bias = self.lowering.newRegister()
+            self.emit("shr", bias, [sign, Immediate(64 - shift)])
+        biased = self.lowering.newRegister()
+        self.emit("add", biased, [dividend, bias])
+        steps = [("sar", [Immediate(shift)])]
+        if d < 0:
+            steps.append(("neg", []))
+        self.emitSteps(dst, biased, steps)
+
+    def divideByMagic(self, dst, dividend, d):
+        magic, shift = signedDivisionMagic(d)
+        quotient = self.lowering.newRegister()
+        self.emit("mulHigh", quotient, [dividend, Immediate(magic)])
+        if d > 0 and magic < 0:
+            adjusted = self.lowering.newRegister()
+            self.emit("add", adjusted, [quotient, dividend])
+            quotient = adjusted
+        elif d < 0 and magic > 0:
+            adjusted = self.lowering.newRegister()
+            self.emit("sub", adjusted, [quotient, dividend])
+            quotient = adjusted
+        if shift > 0:
+            shifted = self.lowering.newRegister()
+            self.emit("sar", shifted, [quotient, Immediate(shift)])
+            quotient = shifted
+        sign = self.lowering.newRegister()
+        self.emit("shr", sign, [quotient, Immediate(63)])
+        self.emit("add", dst, [quotient, sign])
+
+# A virtual register's live interval, from the position of its first
+# definition or use to its last, covering any loops it's live around
+class Interval:
+    __slots__ = ("register", "start", "end", "location")
+
+    def __init__(self, register, start, end):
+        self.register = register
+        self.start = start
+        self.end = end
+        # A machine register name or a StackSlot, once allocated
+        self.location = None
+
+    def __repr__(self):
+        return "Interval({}, {}, {}, {})".format(self.register, self.start, self.end, self.location)
+
+class BasicBlock:
+    __slots__ = ("start", "end", "successors", "liveIn", "liveOut")
+
+    def __init__(self, start, end):
+        # Positions of the first and last instructions
+        self.start = start
+        self.end = end
+        self.successors = []
+        self.liveIn = set()
+        self.liveOut = set()
+
+def findBasicBlocks(instructions):
+    blocks = []
+    blockStarts = {}
+    start = 0
+    for i, instruction in enumerate(instructions):
+        endsBlock = instruction.op in ("jump", "return") or instruction.op in BRANCHES or (i + 1 < len(instructions) and instructions[i + 1].op == "label")
+        if endsBlock or i == len(instructions) - 1:
+            block = BasicBlock(start, i)
+            if instructions[start].op == "label":
+                blockStarts[instructions[start].target] = len(blocks)
+            blocks.append(block)
+            start = i + 1
+    for blockIndex, block in enumerate(blocks):
+        last = instructions[block.end]
+        if last.op == "jump" or last.op in BRANCHES:
+            block.successors.append(blockStarts[last.target])
+        if last.op != "jump" and last.op != "return" and blockIndex + 1 < len(blocks):
+            block.successors.append(blockIndex + 1)
+    return blocks
+
+def computeLiveness(instructions, blocks):
+    uses = []
+    kills = []
+    for block in blocks:
+        blockUses = set()
+        blockKills = set()
+        for instruction in instructions[block.start:block.end + 1]:
+            for register in instruction.uses():
+                if register not in blockKills:
+                    blockUses.add(register)
+            blockKills.update(instruction.defs())
+        uses.append(blockUses)
+        kills.append(blockKills)
+    changed = True
+    while changed:
+        changed = False
+        for blockIndex in reversed(range(len(blocks))):
+            block = blocks[blockIndex]
+            liveOut = set()
+            for successor in block.successors:
+                liveOut |= blocks[successor].liveIn
+            liveIn = uses[blockIndex] | (liveOut - kills[blockIndex])
+            if liveIn != block.liveIn or liveOut != block.liveOut:
+                block.liveIn = liveIn
+                block.liveOut = liveOut
+                changed = True
+
+def buildIntervals(instructions):
+    blocks = findBasicBlocks(instructions)
+    computeLiveness(instructions, blocks)
+    intervals = {}
+
+    def extend(register, position):
+        interval = intervals.get(register)
+        if interval is None:
+            intervals[register] = Interval(register, position, position)
+        else:
+            interval.start = min(interval.start, position)
+            interval.end = max(interval.end, position)
+
+    for position, instruction in enumerate(instructions):
+        for register in instruction.defs():
+            extend(register, position)
+        for register in instruction.uses():
+            extend(register, position)
+    for block in blocks:
+        for register in block.liveIn:
+            extend(register, block.start)
+        for register in block.liveOut:
+            extend(register, block.end)
+    return sorted(intervals.values(), key = lambda interval: (interval.start, interval.register))
+
+# Linear scan allocation. An interval only gets a register nothing else holds
+# at any point it covers - even one whose interval ends where it starts - so
+# an instruction's result never shares a register with its operands. When
+# every suitable register is taken, whichever interval ends last goes on
+# the stack for its whole lifetime.
+class LinearScanAllocator:
+    def __init__(self, instructions, allocateRegisters = True):
+        self.instructions = instructions
+        self.allocateRegisters = allocateRegisters
+        self.intervals = buildIntervals(instructions)
+        self.callPositions = [i for i, instruction in enumerate(instructions) if instruction.op == "call"]
+        self.spillCount = 0
+        self.usedCalleeSaved = set()
+        # Registers that would save a move: the argument register a
+        # parameter arrives in or an argument is passed in
+        self.hints = {}
+        for instruction in instructions:
+            if instruction.op == "parameters" or instruction.op == "call":
+                for register, hint in zip(instruction.sources, ARGUMENT_REGISTERS):
+                    if isinstance(register, int):
+                        self.hints.setdefault(register, hint)
+
+    def crossesCall(self, interval):
+        i = bisect_right(self.callPositions, interval.start)
+        return i < len(self.callPositions) and self.callPositions[i] < interval.end
+
+    def allocate(self):
+        active = []
+        freeRegisters = set(CALLER_SAVED_REGISTERS + CALLEE_SAVED_REGISTERS)
+        for interval in self.intervals:
+            if not self.allocateRegisters:
+                self.spill(interval)
+                continue
+            # Expire intervals that ended before this one starts
+            stillActive = []
+            for activeInterval in active:
+                if activeInterval.end < interval.start:
+                    freeRegisters.add(activeInterval.location)
+                else:
+                    stillActive.append(activeInterval)
+            active = stillActive
+
+            candidates = CALLEE_SAVED_REGISTERS
+            if not self.crossesCall(interval):
+                candidates = CALLER_SAVED_REGISTERS + CALLEE_SAVED_REGISTERS
+            register = None
+            hint = self.hints.get(interval.register)
+            if hint in candidates and hint in freeRegisters:
+                register = hint
+            else:
+                for candidate in candidates:
+                    if candidate in freeRegisters:
+                        register = candidate
+                        break
+            if register is not None:
+                freeRegisters.remove(register)
+                self.assign(interval, register)
+                active.append(interval)
+                continue
+            victim = None
+            for activeInterval in active:
+                if activeInterval.location in candidates and (victim is None or activeInterval.end > victim.end):
+                    victim = activeInterval
+            if victim is not None and victim.end > interval.end:
+                self.assign(interval, victim.location)
+                self.spill(victim)
+                active.remove(victim)
+                active.append(interval)
+            else:
+                self.spill(interval)
+        return dict((interval.register, interval.location) for interval in self.intervals)
+
+    def assign(self, interval, register):
+        interval.location = register
+        if register in CALLEE_SAVED_REGISTERS:
+            self.usedCalleeSaved.add(register)
+
+    def spill(self, interval):
+        # The offset is relative to the spill area and fixed up once the
+        # number of saved registers is known
+        interval.location = StackSlot(self.spillCount)
+        self.spillCount += 1
+
+class FunctionEmitter:
+    def __init__(self, generator, function, instructions, allocator, locations):
+        self.generator = generator
+        self.function = function
+        self.instructions = instructions
+        self.code = []
+        self.savedRegisters = [register for register in CALLEE_SAVED_REGISTERS if register in allocator.usedCalleeSaved]
+        # The frame below rbp is the saved registers then the spill slots,
+        # padded so that rsp stays 16 byte aligned for calls
+        self.spillBytes = 8 * allocator.spillCount
+        if (len(self.savedRegisters) + allocator.spillCount) % 2 == 1:
+            self.spillBytes += 8
+        spillBase = -8 * len(self.savedRegisters)
+        self.locations = {}
+        for register, location in locations.items():
+            if isinstance(location, StackSlot):
+                location = StackSlot(spillBase - 8 * (location.offset + 1))
+            self.locations[register] = location
+        self.returnLabel = generator.newLabel()
+
+    def write(self, mnemonic, *operands):
+        self.code.append(MachineInstruction(mnemonic, operands))
+
+    # Where a virtual register lives, or the operand itself for an immediate
+    def location(self, operand):
+        if isinstance(operand, Immediate):
+            return operand
+        return self.locations[operand]
+
+    def globalMemory(self, name):
+        return GlobalMemory(self.generator.globalSymbolName(name))
+
+    def move(self, dst, src):
+        if dst == src:
+            return
+        if isinstance(src, Immediate) and src.value == 0 and isinstance(dst, str):
+            self.write("xor", DWORD_REGISTERS[dst], DWORD_REGISTERS[dst])
+            return
+        memoryToMemory = isinstance(dst, StackSlot) and isinstance(src, StackSlot)
+        wideImmediate = isinstance(dst, StackSlot) and isinstance(src, Immediate) and not fitsInt32(src.value)
+        if memoryToMemory or wideImmediate:
+            self.write("mov", MOVE_REGISTER, src)
+            src = MOVE_REGISTER
+        self.write("mov", dst, src)
+
+    # Moves that all take effect at once: no move's source is overwritten
+    # before it's read. Cycles are broken through SCRATCH_REGISTER, since
+    # move itself may need MOVE_REGISTER.
+    def parallelMove(self, moves):
+        moves = [(dst, src) for dst, src in moves if dst != src]
+        while len(moves) > 0:
+            sources = [src for dst, src in moves]
+            ready = None
+            for i, (dst, src) in enumerate(moves):
+                if dst not in sources:
+                    ready = i
+                    break
+            if ready is not None:
+                dst, src = moves.pop(ready)
+                self.move(dst, src)
+                continue
+            # Every destination is still to be read, so they form cycles
+            dst, src = moves[0]
+            self.write("mov", SCRATCH_REGISTER, dst)
+            moves = [(moveDst, SCRATCH_REGISTER if moveSrc == dst else moveSrc) for moveDst, moveSrc in moves]
+
+    # Operand for an instruction that can take a register, memory or a 32-bit
+    # immediate, loading a wide immediate into MOVE_REGISTER first
+    def sourceOperand(self, operand):
+        location = self.location(operand)
+        if isinstance(location, Immediate) and not fitsInt32(location.value):
+            self.write("mov", MOVE_REGISTER, location)
+            return MOVE_REGISTER
+        return location
+
+    def emit(self):
+        name = self.generator.symbolName(self.function.signature)
+        self.write("push", "rbp")
+        self.write("mov", "rbp", "rsp")
+        for register in self.savedRegisters:
+            self.write("push", register)
+        if self.spillBytes > 0:
+            self.write("sub", "rsp", Immediate(self.spillBytes))
+        for position, instruction in enumerate(self.instructions):
+            self.emitInstruction(instruction, position == len(self.instructions) - 1)
+        self.code.append(Label(self.returnLabel))
+        if self.spillBytes > 0:
+            self.write("add", "rsp", Immediate(self.spillBytes))
+        for register in reversed(self.savedRegisters):
+            self.write("pop", register)
+        self.write("pop", "rbp")
+        self.write("ret")
+        return MachineFunction(name, self.code)
+
+    def emitInstruction(self, instruction, isLast):
+        op = instruction.op
+        if op == "parameters":
+            moves = []
+            for i, register in enumerate(instruction.sources):
+                if i < len(ARGUMENT_REGISTERS):
+                    moves.append((self.location(register), ARGUMENT_REGISTERS[i]))
+                else:
+                    # Above the saved rbp and the return address
+                    moves.append((self.location(register), StackSlot(16 + 8 * (i - len(ARGUMENT_REGISTERS)))))
+            self.parallelMove(moves)
+        elif op == "mov":
+            self.move(self.location(instruction.dst), self.location(instruction.sources[0]))
+        elif op in BINARY_OPERATIONS:
+            self.emitBinary(instruction)
+        elif op == "div":
+            self.move(SCRATCH_REGISTER, self.location(instruction.sources[0]))
+            divisor = self.location(instruction.sources[1])
+            if isinstance(divisor, Immediate):
+                self.write("mov", MOVE_REGISTER, divisor)
+                divisor = MOVE_REGISTER
+            self.write("cqo")
+            self.write("idiv", divisor)
+            self.move(self.location(instruction.dst), SCRATCH_REGISTER)
+        elif op in SHIFTS or op == "neg" or op == "lea":
+            self.emitInPlace(instruction)
+        elif op == "mulHigh":
+            self.move(SCRATCH_REGISTER, self.location(instruction.sources[1]))
+            self.write("imul", self.location(instruction.sources[0]))
+            self.move(self.location(instruction.dst), HIGH_REGISTER)
+        elif op in COMPARISONS:
+            left = self.location(instruction.sources[0])
+            if not isinstance(left, str):
+                self.move(SCRATCH_REGISTER, left)
+                left = SCRATCH_REGISTER
+            self.write("cmp", left, self.sourceOperand(instruction.sources[1]))
+            self.write(COMPARISONS[op], BYTE_REGISTERS[SCRATCH_REGISTER])
+            self.write("movzx", DWORD_REGISTERS[SCRATCH_REGISTER], BYTE_REGISTERS[SCRATCH_REGISTER])
+            self.move(self.location(instruction.dst), SCRATCH_REGISTER)
+        elif op == "loadGlobal":
+            dst = self.location(instruction.dst)
+            if isinstance(dst, str):
+                self.write("mov", dst, self.globalMemory(instruction.target))
+            else:
+                self.write("mov", SCRATCH_REGISTER, self.globalMemory(instruction.target))
+                self.move(dst, SCRATCH_REGISTER)
+        elif op == "storeGlobal":
+            src = self.location(instruction.sources[0])
+            if isinstance(src, StackSlot) or (isinstance(src, Immediate) and not fitsInt32(src.value)):
+                self.move(SCRATCH_REGISTER, src)
+                src = SCRATCH_REGISTER
+            self.write("mov", self.globalMemory(instruction.target), src)
+        elif op == "call":
+            self.emitCall(instruction)
+        elif op == "label":
+            self.code.append(Label(instruction.target))
+        elif op == "jump":
+            self.write("jmp", Symbol(instruction.target))
+        elif op == "jumpIfZero":
+            condition = self.location(instruction.sources[0])
+            if isinstance(condition, Immediate):
+                if condition.value == 0:
+                    self.write("jmp", Symbol(instruction.target))
+                return
+            if isinstance(condition, str):
+                self.write("test", condition, condition)
+            else:
+                self.write("cmp", condition, Immediate(0))
+            self.write("jz", Symbol(instruction.target))
+        elif op in CONDITIONAL_JUMPS:
+            self.emitConditionalJump(instruction)
+        elif op == "return":
+            self.move(SCRATCH_REGISTER, self.location(instruction.sources[0]))
+            if not isLast:
+                self.write("jmp", Symbol(self.returnLabel))
+        else:
+            raise Exception("Unknown instruction '{}'".format(op))
+
+    def emitBinary(self, instruction):
+        mnemonic = BINARY_OPERATIONS[instruction.op]
+        dst = self.location(instruction.dst)
+        left = self.location(instruction.sources[0])
+        target = dst if isinstance(dst, str) else SCRATCH_REGISTER
+        self.move(target, left)
+        right = self.location(instruction.sources[1])
+        if mnemonic == "imul" and isinstance(right, Immediate) and fitsInt32(right.value):
+            self.write("imul", target, target, right)
+        else:
+            self.write(mnemonic, target, self.sourceOperand(instruction.sources[1]))
+        self.move(dst, target)
+
+    # Operates on dst's register, or on SCRATCH_REGISTER if it's on the
+    # stack, after copying the source there
+    def emitInPlace(self, instruction):
+        op = instruction.op
+        dst = self.location(instruction.dst)
+        source = self.location(instruction.sources[0])
+        target = dst if isinstance(dst, str) else SCRATCH_REGISTER
+        if op == "lea":
+            scale = instruction.sources[1].value
+            if not isinstance(source, str):
+                self.move(target, source)
+                source = target
+            self.write("lea", target, Address(source, source, scale))
+        else:
+            self.move(target, source)
+            if op == "neg":
+                self.write("neg", target)
+            else:
+                self.write(op, target, instruction.sources[1])
+        self.move(dst, target)
+
+    def emitConditionalJump(self, instruction):
+        left, right = instruction.sources
+        # cmp can't take an immediate on the left, and ==, != are symmetric
+        if isinstance(self.location(left), Immediate):
+            left, right = right, left
+        leftLocation = self.location(left)
+        rightLocation = self.location(right)
+        if isinstance(leftLocation, Immediate):
+            if (leftLocation.value == rightLocation.value) == (instruction.op == "jumpIfEqual"):
+                self.write("jmp", Symbol(instruction.target))
+            return
+        if isinstance(leftLocation, str) and rightLocation == Immediate(0):
+            self.write("test", leftLocation, leftLocation)
+        else:
+            if isinstance(leftLocation, StackSlot) and isinstance(rightLocation, StackSlot):
+                self.move(SCRATCH_REGISTER, leftLocation)
+                leftLocation = SCRATCH_REGISTER
+            self.write("cmp", leftLocation, self.sourceOperand(right))
+        self.write(CONDITIONAL_JUMPS[instruction.op], Symbol(instruction.target))
+
+    def emitCall(self, instruction):
+        arguments = [self.location(source) for source in instruction.sources]
+        stackArguments = arguments[len(ARGUMENT_REGISTERS):]
+        stackBytes = 8 * len(stackArguments)
+        if len(stackArguments) % 2 == 1:
+            self.write("sub", "rsp", Immediate(8))
+            stackBytes += 8
+        # Pushed last to first so the first ends up lowest. Every location is
+        # rbp relative, so moving rsp doesn't change them.
+        for argument in reversed(stackArguments):
+            if isinstance(argument, Immediate) and not fitsInt32(argument.value):
+                self.write("mov", SCRATCH_REGISTER, argument)
+                argument = SCRATCH_REGISTER
+            self.write("push", argument)
+        self.parallelMove(list(zip(ARGUMENT_REGISTERS, arguments)))
+        self.write("call", Symbol(instruction.target))
+        if stackBytes > 0:
+            self.write("add", "rsp", Immediate(stackBytes))
+        self.move(self.location(instruction.dst), SCRATCH_REGISTER)
+
+class CodeGenerator:
+    # program is an IRProgram, see ir.lowerProgram. allocateRegisters = False
+    # puts every virtual register on the stack, and selectInstructions = False
+    # leaves every mul and div to imul and idiv and every comparison to
+    # setcc, for comparison.
+    def __init__(self, program, dialect = NASM, symbolPrefix = "", allocateRegisters = True, selectInstructions = True):
+        self.program = program
+        self.dialect = dialect
+        self.symbolPrefix = symbolPrefix
+        self.allocateRegisters = allocateRegisters
+        self.selectInstructions = selectInstructions
+        self.labelCount = 0
+        self.spillCount = 0
+        self.reducedCount = 0
+        self.fusedCount = 0
+        # Names with more than one signature get their parameter types appended
+        self.overloadCounts = {}
+        for function in program.functions:
+            self.overloadCounts[function.signature.name] = self.overloadCounts.get(function.signature.name, 0) + 1
+
+    def newLabel(self):
+        label = ".L{}".format(self.labelCount)
+        self.labelCount += 1
+        return label
+
+    def symbolName(self, functionSignature):
+        name = functionSignature.name
+        if self.overloadCounts.get(name, 0) > 1:
+            name = ".".join([name] + functionSignature.paramTypes)
+        return self.symbolPrefix + name
+
+    def globalSymbolName(self, name):
+        return self.symbolPrefix + name
+
+    # The program as machine instructions, for encode.py or formatAssembly
+    def generateMachineCode(self):
+        functions = [self.generateFunction(function) for function in self.program.functions]
+        globals = [(self.globalSymbolName(irGlobal.name), toInt64(irGlobal.value)) for irGlobal in self.program.globals]
+        return MachineProgram(functions, globals)
+
+    def generate(self):
+        return formatAssembly(self.generateMachineCode(), self.dialect)
+
+    def generateFunction(self, function):
+        lowering = FunctionLowering(self, function)
+        instructions = lowering.lower()
+        if self.selectInstructions:
+            selector = InstructionSelector(lowering)
+            instructions = selector.select()
+            self.reducedCount += selector.reducedCount
+            self.fusedCount += selector.fusedCount
+        allocator = LinearScanAllocator(instructions, self.allocateRegisters)
+        locations = allocator.allocate()
+        self.spillCount += allocator.spillCount
+        return FunctionEmitter(self, function, instructions, allocator, locations).emit()
+
+def formatOperand(operand, dialect):
+    if isinstance(operand, str):
+        return operand
+    elif isinstance(operand, Immediate):
+        return str(operand.value)
+    elif isinstance(operand, StackSlot):
+        if operand.offset < 0:
+            return dialect.memoryFormat.format("rbp - {}".format(-operand.offset))
+        return dialect.memoryFormat.format("rbp + {}".format(operand.offset))
+    elif isinstance(operand, GlobalMemory):
+        return dialect.globalMemoryFormat.format(operand.symbol)
+    elif isinstance(operand, Address):
+        return "[{} + {}*{}]".format(operand.base, operand.index, operand.scale)
+    return operand.name
+
+# Writes a MachineProgram out as assembly in the given dialect
+def formatAssembly(machineProgram, dialect):
+    lines = list(dialect.header)
+    for function in machineProgram.functions:
+        lines.append(dialect.globalDirective.format(function.name))
+    if len(machineProgram.globals) > 0:
+        lines.append("")
+        lines.append(dialect.dataSection)
+        for name, value in machineProgram.globals:
+            lines.append("")
+            lines.append("{}:".format(name))
+            lines.append("  " + dialect.quadDirective.format(value))
+    lines.append("")
+    lines.append(dialect.textSection)
+    for function in machineProgram.functions:
+        lines.append("")
+        lines.append("{}:".format(function.name))
+        for item in function.code:
+            if isinstance(item, Label):
+                lines.append("{}:".format(item.name))
+            elif len(item.operands) == 0:
+                lines.append("  " + item.mnemonic)
+            else:
+                lines.append("  {} {}".format(item.mnemonic, ", ".join(formatOperand(operand, dialect) for operand in item.operands)))
+    return "\n".join(lines) + "\n"
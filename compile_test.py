@@ -0,0 +1,351 @@
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import unittest
+from lex import *
+from parse import *
+from analyze import *
+from fold import *
+from inline import *
+from compile import *
+
+# Calls the program's compute() and prints what it returns
+HARNESS = """
+#include <stdio.h>
+long compute(void);
+int main(void) {
+    printf("%ld\\n", compute());
+    return 0;
+}
+"""
+
+def analyzeSource(originalString):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    return nodes, programDetails
+
+def generateAssembly(originalString, fold = False, inline = False, **options):
+    nodes, programDetails = analyzeSource(originalString)
+    if inline:
+        inlineCalls(nodes, programDetails, growthBudget = 10)
+    if fold:
+        foldConstants(nodes, programDetails, originalString)
+    generator = CodeGenerator(lowerProgram(nodes, programDetails), **options)
+    return generator.generate(), generator
+
+# Assembles with GNU as, links against HARNESS and returns what compute()
+# returned. NASM isn't needed, the GAS dialect is the same instructions.
+def runCompute(originalString, **options):
+    assembly, generator = generateAssembly(originalString, dialect = GAS, **options)
+    with tempfile.TemporaryDirectory() as directory:
+        assemblyPath = os.path.join(directory, "program.s")
+        harnessPath = os.path.join(directory, "harness.c")
+        executablePath = os.path.join(directory, "program")
+        with open(assemblyPath, "w") as outputFile:
+            outputFile.write(assembly)
+        with open(harnessPath, "w") as outputFile:
+            outputFile.write(HARNESS)
+        subprocess.run(["gcc", "-no-pie", "-o", executablePath, harnessPath, assemblyPath], check = True)
+        output = subprocess.run([executablePath], check = True, capture_output = True, text = True).stdout
+    return int(output)
+
+PROGRAMS = [
+    ("func compute(): int { return 1 + 2 * 3 - 10 / 3; }", 4),
+    ("func compute(): int { return 0 - 7 / 2; }", -3),
+    ("func compute(): int { x: int = 0 - 7; return x / 2; }", -3),
+    ("func compute(): int { return (3 == 3) + (3 != 3) * 10 + (2 != 3) * 100; }", 101),
+    ("func compute(): int { return 9223372036854775807 + 1; }", -9223372036854775808),
+    ("func compute(): int { x: int = 4294967296; return x * x + x; }", 4294967296),
+    ("""
+    func compute(): int {
+        i: int = 0;
+        total: int = 0;
+        while i != 10 {
+            i = i + 1;
+            total = total + i;
+        }
+        return total;
+    }""", 55),
+    ("""
+    func fib(n: int): int {
+        if n == 0 { return 0; }
+        if n == 1 { return 1; }
+        return fib(n - 1) + fib(n - 2);
+    }
+    func compute(): int { return fib(15); }""", 610),
+    ("""
+    counter: int = 5;
+    big: int = 9223372036854775807;
+    func bump(by: int): int {
+        counter = counter + by;
+        return counter;
+    }
+    func compute(): int {
+        bump(2);
+        x: int = bump(3);
+        if big == 9223372036854775807 { return x * 100 + counter; } else { return 0; }
+    }""", 1010),
+    ("""
+    func weigh(a: int, b: int, c: int, d: int, e: int, f: int, g: int, h: int, i: int): int {
+        return a + 2 * b + 3 * c + 4 * d + 5 * e + 6 * f + 7 * g + 8 * h + 9 * i;
+    }
+    func compute(): int {
+        return weigh(1, 2, 3, 4, 5, 6, 7, 8, 9) + weigh(9223372036854775807, 0, 0, 0, 0, 0, 0, 0, 0 - 1);
+    }""", 285 + 9223372036854775807 - 9),
+    # The arguments arrive in each other's registers
+    ("""
+    func sub(a: int, b: int, c: int): int { return a - b * 10 + c * 100; }
+    func rotate(a: int, b: int, c: int): int { return sub(c, a, b); }
+    func compute(): int { return rotate(1, 2, 3); }""", 3 - 10 + 200),
+    # The loop header's phis swap a and b every iteration
+    ("""
+    func compute(): int {
+        a: int = 1;
+        b: int = 2;
+        i: int = 0;
+        while i != 5 {
+            t: int = a;
+            a = b;
+            b = t;
+            i = i + 1;
+        }
+        return a * 10 + b;
+    }""", 21),
+    ("""
+    func pick(x: int): int {
+        y: int = 3;
+        if x == 1 { y = 10; } else { if x == 2 { return 7; } }
+        return y;
+    }
+    func compute(): int { return pick(1) * 100 + pick(2) * 10 + pick(3); }""", 1073),
+    # Inlining has to keep the bumps of g in order with its reads
+    ("""
+    g: int = 3;
+    func add(x: int, y: int): int { return x + y; }
+    func bump(): int { g = g + 1; return g; }
+    func clamp(x: int, hi: int): int {
+        r: int = x;
+        if x == hi { r = hi - 1; }
+        x = r * 2;
+        return x;
+    }
+    func compute(): int {
+        a: int = 2;
+        b: int = add(1 + 2, a) + add(a * 3, bump());
+        c: int = g * 1000 + clamp(bump(), 5) * 100 + add(g, bump()) + g;
+        while add(a, 1) != 10 { a = a + 1; }
+        return add(b, c) * 10 + a;
+    }""", (15 + 4817) * 10 + 9),
+    ("""
+    func overload(x: int): int { return x + 1; }
+    func overload(x: int, y: int): int { return x * y; }
+    func compute(): int { return overload(3) + overload(3, 4); }""", 16),
+    # Constant operands on either side of comparisons, multiplies and divides
+    ("""
+    func compute(): int {
+        x: int = 0 - 1000;
+        total: int = 0;
+        while 7 != x {
+            if x == 0 { total = total + 1; }
+            if 3 == 3 { total = total + x * 9 / 4 - x / (0 - 8) + x * 40; }
+            x = x + 1;
+        }
+        return total;
+    }""", -21206989),
+]
+
+# Checks every selected mul and div against C's arithmetic, which truncates
+# division the same way. mul_i and div_i multiply and divide by
+# constants[i], and div_i is NULL for 0.
+DIFFERENTIAL_HARNESS = """
+#include <stdio.h>
+#include <stdint.h>
+typedef long (*Function)(long);
+{declarations}
+long constants[] = {{{constants}}};
+Function multiplies[] = {{{multiplies}}};
+Function divides[] = {{{divides}}};
+long values[] = {{{values}}};
+int main(void) {{
+    int failures = 0;
+    for (int i = 0; i < sizeof(constants) / sizeof(long); i++) {{
+        for (int j = 0; j < sizeof(values) / sizeof(long); j++) {{
+            long x = values[j];
+            long product = (long)((unsigned long)x * (unsigned long)constants[i]);
+            if (multiplies[i](x) != product) {{
+                printf("%ld * %ld\\n", x, constants[i]);
+                failures++;
+            }}
+            // INT64_MIN / -1 traps in C and idiv alike
+            if (divides[i] != NULL && !(x == INT64_MIN && constants[i] == -1) && divides[i](x) != x / constants[i]) {{
+                printf("%ld / %ld\\n", x, constants[i]);
+                failures++;
+            }}
+        }}
+    }}
+    printf("%d failures\\n", failures);
+    return 0;
+}}
+"""
+
+def differentialConstants():
+    constants = list(range(-70, 71))
+    for shift in (8, 16, 31, 32, 40, 62, 63):
+        constants += [1 << shift, -(1 << shift), (1 << shift) - 1, (1 << shift) + 1]
+    for odd in (3, 5, 9):
+        constants += [odd << 10, -(odd << 20), odd << 60]
+    constants += [641, 6700417, -6700417, 1000000007, 10 ** 18, -(10 ** 18), INT64_MIN + 1]
+    return sorted(set(toInt64(constant) for constant in constants))
+
+def differentialValues():
+    values = list(range(-300, 301))
+    for shift in (7, 8, 15, 16, 31, 32, 62, 63):
+        values += [1 << shift, -(1 << shift), (1 << shift) - 1, -(1 << shift) + 1, (1 << shift) + 1]
+    rng = random.Random(0)
+    values += [rng.randrange(-(1 << 63), 1 << 63) for i in range(200)]
+    return sorted(set(toInt64(value) for value in values))
+
+# A literal for any 64-bit value, which folds to a constant
+def sourceLiteral(value):
+    if value == INT64_MIN:
+        return "(0 - 9223372036854775807 - 1)"
+    if value < 0:
+        return "(0 - {})".format(-value)
+    return str(value)
+
+# Emulates the multiply high sequence InstructionSelector emits
+def divideByMagic(x, d):
+    magic, shift = signedDivisionMagic(d)
+    quotient = (x * magic) >> 64
+    if d > 0 and magic < 0:
+        quotient = toInt64(quotient + x)
+    elif d < 0 and magic > 0:
+        quotient = toInt64(quotient - x)
+    quotient >>= shift
+    if quotient < 0:
+        quotient += 1
+    return quotient
+
+def truncatingDivide(x, d):
+    quotient = abs(x) // abs(d)
+    return -quotient if (x < 0) != (d < 0) else quotient
+
+# More values live across calls than there are callee saved registers
+PRESSURE_PROGRAM = """
+func id(x: int): int { return x; }
+func compute(): int {
+    a: int = id(1); b: int = id(2); c: int = id(3); d: int = id(4);
+    e: int = id(5); f: int = id(6); g: int = id(7); h: int = id(8);
+    i: int = id(9); j: int = id(10); k: int = id(11); l: int = id(12);
+    return a + b * 2 + c * 3 + d * 4 + e * 5 + f * 6 + g * 7 + h * 8 + i * 9 + j * 10 + k * 11 + l * 12;
+}
+"""
+
+class TestCompile(unittest.TestCase):
+    def testBasicHasNoSpills(self):
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "examples", "basic.ul")) as inputFile:
+            assembly, generator = generateAssembly(inputFile.read())
+        self.assertEqual(generator.spillCount, 0)
+        self.assertNotIn("rbp -", assembly)
+        self.assertIn("global main", assembly)
+        self.assertIn("call add", assembly)
+
+    def testNasmSyntax(self):
+        assembly, generator = generateAssembly("total: int = 3; func main(): int { total = total + 1; return total; }")
+        self.assertIn("total:\n  dq 3", assembly)
+        self.assertIn("mov rcx, qword [rel total]", assembly)
+        self.assertNotIn("PTR", assembly)
+
+    def testSymbolPrefix(self):
+        assembly, generator = generateAssembly("func main(): int { return 0; }", symbolPrefix = "_")
+        self.assertIn("global _main", assembly)
+        self.assertIn("_main:", assembly)
+
+    def testSpillsUnderPressure(self):
+        assembly, generator = generateAssembly(PRESSURE_PROGRAM)
+        self.assertGreater(generator.spillCount, 0)
+
+    def testStrengthReduction(self):
+        source = "func f(x: int): int { return x * 8 + x * 5 + x * 40 + x * 7 + x / 4 + x / 7 + x / 0; }"
+        assembly, generator = generateAssembly(source)
+        self.assertEqual(generator.reducedCount, 5)
+        self.assertIn("shl rcx, 3", assembly)
+        self.assertIn("[rdi + rdi*4]", assembly)
+        self.assertRegex(assembly, r"imul (\w+), \1, 7")
+        self.assertIn("sar", assembly)
+        self.assertIn("imul rdi\n", assembly)
+        # Division by 0 still traps
+        self.assertEqual(assembly.count("idiv"), 1)
+        assembly, generator = generateAssembly(source, selectInstructions = False)
+        self.assertEqual(assembly.count("idiv"), 3)
+        self.assertNotIn("shl", assembly)
+
+    def testFusedBranches(self):
+        source = "func f(x: int): int { while x != 3 { if x == 0 { return 1; } x = x - 1; } b: int = x == 2; return b; }"
+        assembly, generator = generateAssembly(source)
+        self.assertEqual(generator.fusedCount, 2)
+        self.assertIn("je", assembly)
+        self.assertIn("jne", assembly)
+        # Comparing with 0
+        self.assertRegex(assembly, r"test (\w+), \1")
+        # Used as a value, not just a condition
+        self.assertEqual(assembly.count("sete"), 1)
+        assembly, generator = generateAssembly(source, selectInstructions = False)
+        self.assertEqual(assembly.count("sete") + assembly.count("setne"), 3)
+
+    def testDivisionMagic(self):
+        values = differentialValues()
+        divisors = [d for d in range(-1000, 1001) if abs(d) & (abs(d) - 1) != 0]
+        divisors += [d for d in differentialConstants() if abs(d) & (abs(d) - 1) != 0 and d != INT64_MIN]
+        for d in divisors:
+            for x in values:
+                if divideByMagic(x, d) != truncatingDivide(x, d):
+                    self.fail("{} / {}".format(x, d))
+
+    @unittest.skipIf(shutil.which("gcc") is None, "needs gcc to assemble and link")
+    def testSelectedArithmeticMatchesPlainArithmetic(self):
+        constants = differentialConstants()
+        lines = []
+        for i, constant in enumerate(constants):
+            lines.append("func mul_{}(x: int): int {{ return x * {}; }}".format(i, sourceLiteral(constant)))
+            if constant != 0:
+                lines.append("func div_{}(x: int): int {{ return x / {}; }}".format(i, sourceLiteral(constant)))
+        source = "\n".join(lines)
+        declarations = ["long mul_{}(long);".format(i) for i in range(len(constants))]
+        declarations += ["long div_{}(long);".format(i) for i, constant in enumerate(constants) if constant != 0]
+        harness = DIFFERENTIAL_HARNESS.format(
+                declarations = "\n".join(declarations),
+                constants = ", ".join("{}L".format(constant) if constant != INT64_MIN else "INT64_MIN" for constant in constants),
+                multiplies = ", ".join("mul_{}".format(i) for i in range(len(constants))),
+                divides = ", ".join("NULL" if constant == 0 else "div_{}".format(i) for i, constant in enumerate(constants)),
+                values = ", ".join("{}L".format(value) if value != INT64_MIN else "INT64_MIN" for value in differentialValues()))
+        with tempfile.TemporaryDirectory() as directory:
+            assemblyPath = os.path.join(directory, "program.s")
+            harnessPath = os.path.join(directory, "harness.c")
+            executablePath = os.path.join(directory, "program")
+            with open(harnessPath, "w") as outputFile:
+                outputFile.write(harness)
+            for allocateRegisters in (True, False):
+                with self.subTest(allocateRegisters = allocateRegisters):
+                    assembly, generator = generateAssembly(source, fold = True, dialect = GAS, allocateRegisters = allocateRegisters)
+                    # Only division by -1 and INT64_MIN, which have to trap
+                    self.assertEqual(assembly.count("idiv"), 2)
+                    with open(assemblyPath, "w") as outputFile:
+                        outputFile.write(assembly)
+                    subprocess.run(["gcc", "-no-pie", "-o", executablePath, harnessPath, assemblyPath], check = True)
+                    output = subprocess.run([executablePath], check = True, capture_output = True, text = True).stdout
+                    self.assertEqual(output, "0 failures\n")
+
+    @unittest.skipIf(shutil.which("gcc") is None, "needs gcc to assemble and link")
+    def testPrograms(self):
+        for originalString, expected in PROGRAMS + [(PRESSURE_PROGRAM, 650)]:
+            with self.subTest(originalString):
+                self.assertEqual(runCompute(originalString), toInt64(expected))
+                self.assertEqual(runCompute(originalString, allocateRegisters = False), toInt64(expected))
+                self.assertEqual(runCompute(originalString, fold = True), toInt64(expected))
+                self.assertEqual(runCompute(originalString, inline = True, fold = True), toInt64(expected))
+
+if __name__ == "__main__":
+    unittest.main()
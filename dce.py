@@ -0,0 +1,102 @@
+from parse import *
+from analyze import *
+from callgraph import *
+
+# Dead code elimination over the analyzed tree, before code generation.
+# Statements after a return are dropped, an if whose condition is a literal
+# is replaced by the branch it takes, and a while whose condition is a
+# literal 0 is dropped. Run constant folding first to turn more conditions
+# into literals. Then any function that isn't reachable in the call graph
+# from main is removed, from both the nodes and programDetails.
+#
+# Locals belong to the whole function rather than to a block, so splicing
+# a branch's statements into the enclosing block doesn't change what any
+# identifier refers to.
+
+ENTRY_POINTS = ["main"]
+
+class DeadCodeEliminator:
+    # roots are the names of the functions to keep along with everything
+    # they call. If none of them is defined, no function is removed.
+    def __init__(self, nodes, programDetails, roots = ENTRY_POINTS):
+        self.nodes = nodes
+        self.programDetails = programDetails
+        self.roots = roots
+        # Statements after a return, counting a nested block as one
+        self.unreachableCount = 0
+        # Ifs and whiles with a literal condition
+        self.branchCount = 0
+        # Signatures of the removed functions, in declaration order
+        self.removedFunctions = []
+
+    def eliminate(self):
+        for functionDetails in self.programDetails.functions.values():
+            functionDetails.node.statements = self.eliminateStatements(functionDetails.node.statements)
+        self.removeUncalledFunctions()
+
+    def eliminateStatements(self, statements):
+        kept = []
+        # A stack, so that a taken branch's statements are handled in place
+        # of its if
+        pending = list(reversed(statements))
+        while len(pending) > 0:
+            statement = pending.pop()
+            if isinstance(statement, IfNode):
+                if isinstance(statement.conditional, LiteralNode):
+                    self.branchCount += 1
+                    if statement.conditional.value != 0:
+                        pending.extend(reversed(statement.statements))
+                    else:
+                        pending.extend(reversed(statement.elseStatements))
+                    continue
+                statement.statements = self.eliminateStatements(statement.statements)
+                statement.elseStatements = self.eliminateStatements(statement.elseStatements)
+            elif isinstance(statement, WhileNode):
+                if isinstance(statement.conditional, LiteralNode) and statement.conditional.value == 0:
+                    self.branchCount += 1
+                    continue
+                statement.statements = self.eliminateStatements(statement.statements)
+            kept.append(statement)
+            if alwaysReturns(kept):
+                self.unreachableCount += len(pending)
+                break
+        return kept
+
+    def removeUncalledFunctions(self):
+        functions = self.programDetails.functions
+        roots = [signature for signature in functions if signature.name in self.roots]
+        if len(roots) == 0:
+            return
+        reachable = CallGraph(self.programDetails).reachableFrom(roots)
+        for signature in list(functions):
+            if signature not in reachable:
+                self.removedFunctions.append(signature)
+                del functions[signature]
+        keptNodes = set(id(functionDetails.node) for functionDetails in functions.values())
+        self.nodes[:] = [node for node in self.nodes if not isinstance(node, FunctionNode) or id(node) in keptNodes]
+
+    def formatReport(self):
+        lines = ["Dead code elimination removed {} unreachable statements, {} constant branches and {} uncalled functions".format(
+            self.unreachableCount, self.branchCount, len(self.removedFunctions))]
+        for signature in self.removedFunctions:
+            lines.append("  {}".format(signature))
+        return "\n".join(lines)
+
+# Whether control can't fall off the end of the statements, given that
+# nothing follows a return in them
+def alwaysReturns(statements):
+    while len(statements) > 0:
+        last = statements[-1]
+        if isinstance(last, ReturnNode):
+            return True
+        if not isinstance(last, IfNode) or not alwaysReturns(last.elseStatements):
+            return False
+        statements = last.statements
+    return False
+
+# Eliminates dead code from the analyzed program in place and returns the
+# DeadCodeEliminator, for its report
+def eliminateDeadCode(nodes, programDetails, roots = ENTRY_POINTS):
+    eliminator = DeadCodeEliminator(nodes, programDetails, roots)
+    eliminator.eliminate()
+    return eliminator
@@ -0,0 +1,95 @@
+import unittest
+from lex import *
+from parse import *
+from analyze import *
+from fold import *
+from dce import *
+
+def eliminateSource(originalString, fold = False, **options):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    if fold:
+        foldConstants(nodes, programDetails, originalString)
+    eliminator = eliminateDeadCode(nodes, programDetails, **options)
+    return nodes, programDetails, eliminator
+
+def functionNames(nodes):
+    return [node.name for node in nodes if isinstance(node, FunctionNode)]
+
+class TestDeadCode(unittest.TestCase):
+    def testAfterReturn(self):
+        nodes, programDetails, eliminator = eliminateSource("""
+        func main(): int {
+            return 1;
+            x: int = 2;
+            if x == 2 { return x; }
+        }""")
+        self.assertEqual(nodes[0].statements, [ReturnNode(LiteralNode("int", 1))])
+        self.assertEqual(eliminator.unreachableCount, 2)
+
+    def testAfterIfThatAlwaysReturns(self):
+        nodes, programDetails, eliminator = eliminateSource("""
+        func main(): int {
+            x: int = 2;
+            if x == 2 { return 1; } else { if x == 3 { return 2; } else { return 3; } }
+            return 4;
+        }""")
+        self.assertEqual(len(nodes[0].statements), 2)
+        self.assertEqual(eliminator.unreachableCount, 1)
+
+    def testConstantBranches(self):
+        nodes, programDetails, eliminator = eliminateSource("""
+        func main(): int {
+            x: int = 0;
+            if 1 { x = 1; } else { x = 2; }
+            if 0 { x = 3; } else { x = 4; return x; }
+            while 0 { x = 5; }
+            return 6;
+        }""")
+        statements = nodes[0].statements
+        self.assertEqual(len(statements), 4)
+        self.assertEqual(statements[1].arguments[1], LiteralNode("int", 1))
+        self.assertEqual(statements[2].arguments[1], LiteralNode("int", 4))
+        self.assertEqual(statements[3], ReturnNode(IdentifierNode("x")))
+        self.assertEqual(eliminator.branchCount, 2)
+        self.assertEqual(eliminator.unreachableCount, 2)
+
+    def testFoldedConditions(self):
+        nodes, programDetails, eliminator = eliminateSource("""
+        func main(): int {
+            debug: int = 0;
+            if debug == 1 { return 1; }
+            return 2;
+        }""", fold = True)
+        self.assertEqual(nodes[0].statements[1], ReturnNode(LiteralNode("int", 2)))
+
+    def testUncalledFunctions(self):
+        nodes, programDetails, eliminator = eliminateSource("""
+        g: int = 1;
+        func leaf(x: int): int { return x; }
+        func leaf(x: int, y: int): int { return x + y; }
+        func unused(): int { return leaf(1, 2); }
+        func onlyAfterReturn(): int { return 0; }
+        func recursive(n: int): int { if n == 0 { return 0; } return recursive(n - 1); }
+        func main(): int {
+            return leaf(recursive(3));
+            onlyAfterReturn();
+        }""")
+        self.assertEqual(functionNames(nodes), ["leaf", "recursive", "main"])
+        self.assertEqual([repr(signature) for signature in programDetails.functions], ["leaf(int): int", "recursive(int): int", "main(): int"])
+        self.assertEqual([repr(signature) for signature in eliminator.removedFunctions], ["leaf(int, int): int", "unused(): int", "onlyAfterReturn(): int"])
+        self.assertIsInstance(nodes[0], GlobalDeclarationNode)
+        self.assertIn("removed 1 unreachable statements, 0 constant branches and 3 uncalled functions\n  leaf(int, int): int\n", eliminator.formatReport())
+
+    def testNoEntryPoint(self):
+        nodes, programDetails, eliminator = eliminateSource("""
+        func a(): int { return 1; }
+        func compute(): int { return 2; }""")
+        self.assertEqual(functionNames(nodes), ["a", "compute"])
+        nodes, programDetails, eliminator = eliminateSource("""
+        func a(): int { return 1; }
+        func compute(): int { return 2; }""", roots = ["compute"])
+        self.assertEqual(functionNames(nodes), ["compute"])
+
+if __name__ == "__main__":
+    unittest.main()
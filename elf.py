@@ -0,0 +1,223 @@
+import struct
+from utils import *
+
+# Relocatable ELF64 object files for x86-64, just the parts the compiler
+# needs: a .text and a .data section, their symbols and relocations against
+# each. Objects are written from an ObjectFile, and objects written by any
+# assembler can be read back into one, keeping only those parts.
+#
+# Symbols and relocations refer to symbols by name. A relocation against a
+# section's own symbol, which is what assemblers use for local symbols, has
+# the section's name.
+
+ELF_HEADER = struct.Struct("<16sHHIQQQIHHHHHH")
+SECTION_HEADER = struct.Struct("<IIQQQQIIQQ")
+SYMBOL = struct.Struct("<IBBHQQ")
+RELA = struct.Struct("<QQq")
+
+ELF_IDENT = b"\x7fELF\x02\x01\x01" + bytes(9)
+ET_REL = 1
+EM_X86_64 = 62
+
+SHT_PROGBITS = 1
+SHT_SYMTAB = 2
+SHT_STRTAB = 3
+SHT_RELA = 4
+
+SHF_WRITE = 0x1
+SHF_ALLOC = 0x2
+SHF_EXECINSTR = 0x4
+SHF_INFO_LINK = 0x40
+
+STB_LOCAL = 0
+STB_GLOBAL = 1
+STT_NOTYPE = 0
+STT_SECTION = 3
+STT_FILE = 4
+SHN_UNDEF = 0
+
+R_X86_64_64 = 1
+R_X86_64_PC32 = 2
+R_X86_64_PLT32 = 4
+
+RELOCATION_NAMES = {R_X86_64_64: "R_X86_64_64", R_X86_64_PC32: "R_X86_64_PC32", R_X86_64_PLT32: "R_X86_64_PLT32"}
+
+# Where a symbol is defined: section is ".text" or ".data", or None if it's
+# defined in another object
+class ObjectSymbol:
+    __slots__ = ("name", "section", "value", "isGlobal")
+
+    def __init__(self, name, section, value = 0, isGlobal = False):
+        self.name = name
+        self.section = section
+        self.value = value
+        self.isGlobal = isGlobal
+
+    def __repr__(self):
+        return "ObjectSymbol({}, {}, {}, isGlobal = {})".format(self.name, self.section, self.value, self.isGlobal)
+
+    def __eq__(self, other):
+        return isinstance(other, ObjectSymbol) and (self.name, self.section, self.value, self.isGlobal) == (other.name, other.section, other.value, other.isGlobal)
+
+# Patch the bytes at offset in the section it's for with symbol + addend,
+# computed as the relocation type says
+class Relocation:
+    __slots__ = ("offset", "type", "symbol", "addend")
+
+    def __init__(self, offset, type, symbol, addend):
+        self.offset = offset
+        self.type = type
+        self.symbol = symbol
+        self.addend = addend
+
+    def __repr__(self):
+        return "Relocation({}, {}, {}, {})".format(self.offset, RELOCATION_NAMES.get(self.type, self.type), self.symbol, self.addend)
+
+    def __eq__(self, other):
+        return isinstance(other, Relocation) and (self.offset, self.type, self.symbol, self.addend) == (other.offset, other.type, other.symbol, other.addend)
+
+class ObjectFile:
+    # relocations are against .text and dataRelocations against .data, say
+    # for a dq of a function's address
+    def __init__(self, text = b"", data = b"", symbols = None, relocations = None, dataRelocations = None):
+        self.text = text
+        self.data = data
+        self.symbols = symbols or []
+        self.relocations = relocations or []
+        self.dataRelocations = dataRelocations or []
+
+    def findSymbol(self, name):
+        for symbol in self.symbols:
+            if symbol.name == name:
+                return symbol
+        return None
+
+class StringTable:
+    def __init__(self):
+        self.data = bytearray(b"\0")
+        self.offsets = {"": 0}
+
+    def add(self, string):
+        if string not in self.offsets:
+            self.offsets[string] = len(self.data)
+            self.data += string.encode() + b"\0"
+        return self.offsets[string]
+
+# Section header indexes in written objects
+TEXT_INDEX = 1
+RELA_TEXT_INDEX = 2
+DATA_INDEX = 3
+RELA_DATA_INDEX = 4
+NOTE_INDEX = 5
+SYMTAB_INDEX = 6
+STRTAB_INDEX = 7
+SHSTRTAB_INDEX = 8
+
+def writeObjectFile(objectFile):
+    sectionIndexes = {".text": TEXT_INDEX, ".data": DATA_INDEX}
+    # Locals come first, as ELF requires: the section symbols then locally
+    # defined ones. Symbols only relocations name are undefined globals.
+    symbols = [ObjectSymbol(".text", ".text"), ObjectSymbol(".data", ".data")]
+    symbols += [symbol for symbol in objectFile.symbols if not symbol.isGlobal]
+    localCount = len(symbols) + 1
+    symbols += [symbol for symbol in objectFile.symbols if symbol.isGlobal]
+    symbolIndexes = {}
+    for i, symbol in enumerate(symbols):
+        symbolIndexes.setdefault(symbol.name, i + 1)
+    for relocation in objectFile.relocations + objectFile.dataRelocations:
+        if relocation.symbol not in symbolIndexes:
+            symbolIndexes[relocation.symbol] = len(symbols) + 1
+            symbols.append(ObjectSymbol(relocation.symbol, None, isGlobal = True))
+
+    strtab = StringTable()
+    symtab = bytearray(SYMBOL.size)
+    for i, symbol in enumerate(symbols):
+        shndx = sectionIndexes[symbol.section] if symbol.section is not None else SHN_UNDEF
+        if i < 2:
+            symtab += SYMBOL.pack(0, (STB_LOCAL << 4) | STT_SECTION, 0, shndx, 0, 0)
+        else:
+            binding = STB_GLOBAL if symbol.isGlobal else STB_LOCAL
+            symtab += SYMBOL.pack(strtab.add(symbol.name), (binding << 4) | STT_NOTYPE, 0, shndx, symbol.value, 0)
+    def packRelocations(relocations):
+        rela = bytearray()
+        for relocation in relocations:
+            rela += RELA.pack(relocation.offset, (symbolIndexes[relocation.symbol] << 32) | relocation.type, relocation.addend)
+        return rela
+
+    shstrtab = StringTable()
+    # (name, type, flags, contents, link, info, alignment, entry size)
+    sections = [
+        (".text", SHT_PROGBITS, SHF_ALLOC | SHF_EXECINSTR, objectFile.text, 0, 0, 16, 0),
+        (".rela.text", SHT_RELA, SHF_INFO_LINK, packRelocations(objectFile.relocations), SYMTAB_INDEX, TEXT_INDEX, 8, RELA.size),
+        (".data", SHT_PROGBITS, SHF_ALLOC | SHF_WRITE, objectFile.data, 0, 0, 8, 0),
+        (".rela.data", SHT_RELA, SHF_INFO_LINK, packRelocations(objectFile.dataRelocations), SYMTAB_INDEX, DATA_INDEX, 8, RELA.size),
+        # Marks the stack as not executable
+        (".note.GNU-stack", SHT_PROGBITS, 0, b"", 0, 0, 1, 0),
+        (".symtab", SHT_SYMTAB, 0, symtab, STRTAB_INDEX, localCount, 8, SYMBOL.size),
+        (".strtab", SHT_STRTAB, 0, strtab.data, 0, 0, 1, 0),
+        (".shstrtab", SHT_STRTAB, 0, shstrtab.data, 0, 0, 1, 0),
+    ]
+    names = [shstrtab.add(section[0]) for section in sections]
+    contents = bytearray(ELF_HEADER.size)
+    headers = bytearray(SECTION_HEADER.size)
+    for name, (_, sectionType, flags, data, link, info, alignment, entrySize) in zip(names, sections):
+        contents += bytes(-len(contents) % alignment)
+        headers += SECTION_HEADER.pack(name, sectionType, flags, 0, len(contents), len(data), link, info, alignment, entrySize)
+        contents += data
+    contents += bytes(-len(contents) % 8)
+    contents[:ELF_HEADER.size] = ELF_HEADER.pack(ELF_IDENT, ET_REL, EM_X86_64, 1, 0, 0, len(contents), 0,
+            ELF_HEADER.size, 0, 0, SECTION_HEADER.size, len(sections) + 1, SHSTRTAB_INDEX)
+    return bytes(contents + headers)
+
+def readString(data, offset):
+    return data[offset:data.index(b"\0", offset)].decode()
+
+def readObjectFile(data):
+    # Every symbol and relocation read is a new object
+    with gcPaused():
+        return parseObjectFile(data)
+
+def parseObjectFile(data):
+    ident, fileType, machine, _, _, _, sectionOffset, _, _, _, _, _, sectionCount, shstrndx = ELF_HEADER.unpack_from(data)
+    if ident[:4] != ELF_IDENT[:4] or fileType != ET_REL or machine != EM_X86_64:
+        raise Exception("Not an x86-64 relocatable ELF object")
+    headers = [SECTION_HEADER.unpack_from(data, sectionOffset + i * SECTION_HEADER.size) for i in range(sectionCount)]
+    shstrtabOffset = headers[shstrndx][4]
+    names = [readString(data, shstrtabOffset + header[0]) for header in headers]
+
+    def contents(index):
+        offset, size = headers[index][4], headers[index][5]
+        return data[offset:offset + size]
+
+    objectFile = ObjectFile()
+    if ".text" in names:
+        objectFile.text = contents(names.index(".text"))
+    if ".data" in names:
+        objectFile.data = contents(names.index(".data"))
+    symbolNames = [None]
+    if ".symtab" in names:
+        symtabIndex = names.index(".symtab")
+        symtab = contents(symtabIndex)
+        strtab = contents(headers[symtabIndex][6])
+        for offset in range(SYMBOL.size, len(symtab), SYMBOL.size):
+            name, info, _, shndx, value, _ = SYMBOL.unpack_from(symtab, offset)
+            if info & 0xf == STT_SECTION:
+                symbolNames.append(names[shndx])
+                continue
+            name = readString(strtab, name)
+            symbolNames.append(name)
+            if info & 0xf == STT_FILE:
+                continue
+            # Absolute and common symbols aren't in any section either
+            section = None
+            if shndx != SHN_UNDEF and shndx < len(names):
+                section = names[shndx]
+            objectFile.symbols.append(ObjectSymbol(name, section, value, info >> 4 == STB_GLOBAL))
+    for name, relocations in ((".rela.text", objectFile.relocations), (".rela.data", objectFile.dataRelocations)):
+        if name not in names:
+            continue
+        rela = contents(names.index(name))
+        for offset in range(0, len(rela), RELA.size):
+            relocationOffset, info, addend = RELA.unpack_from(rela, offset)
+            relocations.append(Relocation(relocationOffset, info & 0xffffffff, symbolNames[info >> 32], addend))
+    return objectFile
@@ -0,0 +1,37 @@
+import shutil
+import subprocess
+import tempfile
+import unittest
+from elf import *
+
+class TestElf(unittest.TestCase):
+    def testRoundTrip(self):
+        objectFile = ObjectFile(b"\xe8\x00\x00\x00\x00\xc3", b"\x05" + bytes(7), [
+            ObjectSymbol("counter", ".data", 0),
+            ObjectSymbol("main", ".text", 0, isGlobal = True),
+        ], [Relocation(1, R_X86_64_PLT32, "puts", -4)], [Relocation(0, R_X86_64_64, "main", 0)])
+        read = readObjectFile(writeObjectFile(objectFile))
+        self.assertEqual(read.text, objectFile.text)
+        self.assertEqual(read.data, objectFile.data)
+        # The undefined symbol the relocation names is added as a global
+        self.assertEqual(read.symbols, objectFile.symbols + [ObjectSymbol("puts", None, isGlobal = True)])
+        self.assertEqual(read.relocations, objectFile.relocations)
+        self.assertEqual(read.dataRelocations, objectFile.dataRelocations)
+        self.assertEqual(read.findSymbol("main").section, ".text")
+
+    def testNotAnObject(self):
+        with self.assertRaisesRegex(Exception, "Not an x86-64 relocatable ELF object"):
+            readObjectFile(b"\x7fELF" + bytes(60))
+
+    @unittest.skipIf(shutil.which("readelf") is None, "needs readelf")
+    def testReadelfAcceptsIt(self):
+        objectFile = ObjectFile(b"\xc3", b"", [ObjectSymbol("main", ".text", 0, isGlobal = True)])
+        with tempfile.NamedTemporaryFile(suffix = ".o") as outputFile:
+            outputFile.write(writeObjectFile(objectFile))
+            outputFile.flush()
+            result = subprocess.run(["readelf", "-a", "-W", outputFile.name], check = True, capture_output = True, text = True)
+        self.assertNotIn("Warning", result.stdout + result.stderr)
+        self.assertIn("GLOBAL DEFAULT    1 main", result.stdout)
+
+if __name__ == "__main__":
+    unittest.main()
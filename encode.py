@@ -0,0 +1,384 @@
+import struct
+from compile import *
+from elf import *
+
+# x86-64 machine code for the instructions compile.py emits, encoded in
+# process from its MachineProgram and written out as a relocatable ELF
+# object, so no assembler has to run and no assembly text is written or
+# parsed.
+#
+# Only the instruction forms the code generator uses are supported. Each one
+# is given the encoding GNU as picks for the same assembly, so an object
+# from here has the same .text and .data bytes and relocations as one
+# assembled from the GAS dialect output:
+#   - A register or memory operand with an immediate uses the sign extended
+#     8-bit immediate form when the value fits, and otherwise the 32-bit
+#     form, the shorter accumulator form when the register is rax.
+#   - mov of a 64-bit immediate that doesn't fit in 32 bits is movabs.
+#   - Shifts by 1 use the form without an immediate.
+#   - Register to register instructions use the form with the destination
+#     in the r/m field.
+#   - Jumps between labels are two bytes when the distance fits in 8 bits.
+#     Every jump starts short and the ones that don't fit are made long
+#     until none change, since making one long can push another out of
+#     range.
+#   - Calls are relocated against the callee's symbol even when it's in the
+#     same object, since a global symbol can be overridden at link time.
+#     Globals are local symbols, so accesses to them are relocated against
+#     .data.
+
+REGISTER_NUMBERS = {
+        "rax": 0, "rcx": 1, "rdx": 2, "rbx": 3, "rsp": 4, "rbp": 5, "rsi": 6, "rdi": 7,
+        "r8": 8, "r9": 9, "r10": 10, "r11": 11, "r12": 12, "r13": 13, "r14": 14, "r15": 15,
+}
+DWORD_REGISTER_NUMBERS = dict((DWORD_REGISTERS[register], REGISTER_NUMBERS[register]) for register in DWORD_REGISTERS)
+# Only the legacy byte registers, the rest need a REX prefix to address
+BYTE_REGISTER_NUMBERS = {"al": 0, "cl": 1, "dl": 2, "bl": 3}
+
+REX_W = 0x48
+
+# (opcode with the destination in r/m, with the destination in reg, /digit
+# for the immediate forms, accumulator opcode with a 32-bit immediate)
+ARITHMETIC_OPCODES = {
+        "add": (0x01, 0x03, 0, 0x05),
+        "sub": (0x29, 0x2b, 5, 0x2d),
+        "cmp": (0x39, 0x3b, 7, 0x3d),
+}
+SETCC_OPCODES = {"sete": 0x94, "setne": 0x95}
+# /digit of the shift instructions
+SHIFT_DIGITS = {"shl": 4, "shr": 5, "sar": 7}
+# SIB scale field for each scale
+SCALE_BITS = {1: 0, 2: 1, 4: 2, 8: 3}
+# (short opcode, long opcode bytes)
+JUMP_OPCODES = {
+        "jmp": (b"\xeb", b"\xe9"),
+        "jz": (b"\x74", b"\x0f\x84"),
+        "je": (b"\x74", b"\x0f\x84"),
+        "jne": (b"\x75", b"\x0f\x85"),
+}
+
+def fitsInt8(value):
+    return value >= -128 and value <= 127
+
+def packInt8(value):
+    return struct.pack("<b", value)
+
+def packInt32(value):
+    return struct.pack("<i", value)
+
+# A jump to a label, encoded once its distance is known
+class Jump:
+    __slots__ = ("mnemonic", "label", "long", "offset")
+
+    def __init__(self, mnemonic, label):
+        self.mnemonic = mnemonic
+        self.label = label
+        self.long = False
+        self.offset = 0
+
+    def size(self):
+        if self.long:
+            return len(JUMP_OPCODES[self.mnemonic][1]) + 4
+        return 2
+
+# Straight line code between jumps. relocations are (offset into the bytes,
+# type, symbol, addend).
+class Chunk:
+    __slots__ = ("code", "relocations", "labels", "offset")
+
+    def __init__(self):
+        self.code = bytearray()
+        self.relocations = []
+        # Labels defined at offsets into the code
+        self.labels = []
+        self.offset = 0
+
+    def size(self):
+        return len(self.code)
+
+class Encoder:
+    def __init__(self, machineProgram):
+        self.machineProgram = machineProgram
+        self.text = bytearray()
+        self.symbols = []
+        self.relocations = []
+        self.instructionCount = 0
+        self.encoders = {
+                "mov": self.encodeMov,
+                "add": self.encodeArithmetic,
+                "sub": self.encodeArithmetic,
+                "cmp": self.encodeArithmetic,
+                "imul": self.encodeImul,
+                "shl": self.encodeShift,
+                "shr": self.encodeShift,
+                "sar": self.encodeShift,
+                "neg": self.encodeNeg,
+                "lea": self.encodeLea,
+                "idiv": self.encodeIdiv,
+                "cqo": self.encodeCqo,
+                "xor": self.encodeXor,
+                "test": self.encodeTest,
+                "sete": self.encodeSetcc,
+                "setne": self.encodeSetcc,
+                "movzx": self.encodeMovzx,
+                "push": self.encodePush,
+                "pop": self.encodePop,
+                "call": self.encodeCall,
+                "ret": self.encodeRet,
+        }
+
+    def encode(self):
+        data = bytearray()
+        self.dataOffsets = {}
+        for name, value in self.machineProgram.globals:
+            self.dataOffsets[name] = len(data)
+            self.symbols.append(ObjectSymbol(name, ".data", len(data)))
+            data += struct.pack("<q", value)
+        for function in self.machineProgram.functions:
+            self.symbols.append(ObjectSymbol(function.name, ".text", len(self.text), isGlobal = True))
+            self.encodeFunction(function)
+        return ObjectFile(bytes(self.text), bytes(data), self.symbols, self.relocations)
+
+    def encodeFunction(self, function):
+        pieces = [Chunk()]
+        for item in function.code:
+            if isinstance(item, Label):
+                chunk = pieces[-1]
+                if not isinstance(chunk, Chunk):
+                    chunk = Chunk()
+                    pieces.append(chunk)
+                chunk.labels.append((item.name, len(chunk.code)))
+                continue
+            self.instructionCount += 1
+            if item.mnemonic in JUMP_OPCODES:
+                pieces.append(Jump(item.mnemonic, item.operands[0].name))
+                continue
+            chunk = pieces[-1]
+            if not isinstance(chunk, Chunk):
+                chunk = Chunk()
+                pieces.append(chunk)
+            encoder = self.encoders.get(item.mnemonic)
+            if encoder is None:
+                raise Exception("Can't encode '{}'".format(item.mnemonic))
+            encoder(chunk, item.mnemonic, item.operands)
+        labels = self.layOut(pieces)
+        base = len(self.text)
+        for piece in pieces:
+            if isinstance(piece, Jump):
+                short, long = JUMP_OPCODES[piece.mnemonic]
+                displacement = labels[piece.label] - (piece.offset + piece.size())
+                if piece.long:
+                    self.text += long + packInt32(displacement)
+                else:
+                    self.text += short + packInt8(displacement)
+                continue
+            for offset, relocationType, symbol, addend in piece.relocations:
+                self.relocations.append(Relocation(base + piece.offset + offset, relocationType, symbol, addend))
+            self.text += piece.code
+
+    # Sets each piece's offset from the start of the function, making jumps
+    # long until they all reach, and returns the label offsets
+    def layOut(self, pieces):
+        while True:
+            labels = {}
+            offset = 0
+            for piece in pieces:
+                piece.offset = offset
+                if isinstance(piece, Chunk):
+                    for name, labelOffset in piece.labels:
+                        labels[name] = offset + labelOffset
+                offset += piece.size()
+            changed = False
+            for piece in pieces:
+                if isinstance(piece, Jump) and not piece.long:
+                    if piece.label not in labels:
+                        raise Exception("Jump to undefined label '{}'".format(piece.label))
+                    if not fitsInt8(labels[piece.label] - (piece.offset + 2)):
+                        piece.long = True
+                        changed = True
+            if not changed:
+                return labels
+
+    # The REX prefix, if one is needed, then the opcode and ModRM for reg
+    # and an r/m operand. trailing is how many immediate bytes follow, which
+    # rip relative addressing has to account for.
+    def emitModRM(self, chunk, opcode, reg, rm, wide = True, trailing = 0):
+        rex = REX_W if wide else 0
+        if reg >= 8:
+            rex |= 0x44
+        if isinstance(rm, StackSlot):
+            if rex != 0:
+                chunk.code.append(rex)
+            chunk.code += opcode
+            if fitsInt8(rm.offset):
+                chunk.code.append(0x45 | (reg & 7) << 3)
+                chunk.code += packInt8(rm.offset)
+            else:
+                chunk.code.append(0x85 | (reg & 7) << 3)
+                chunk.code += packInt32(rm.offset)
+        elif isinstance(rm, GlobalMemory):
+            if rex != 0:
+                chunk.code.append(rex)
+            chunk.code += opcode
+            chunk.code.append(0x05 | (reg & 7) << 3)
+            # The displacement is from the end of the instruction
+            chunk.relocations.append((len(chunk.code), R_X86_64_PC32, ".data", self.dataOffsets[rm.symbol] - 4 - trailing))
+            chunk.code += bytes(4)
+        elif isinstance(rm, Address):
+            base = REGISTER_NUMBERS[rm.base]
+            index = REGISTER_NUMBERS[rm.index]
+            if index >= 8:
+                rex |= 0x42
+            if base >= 8:
+                rex |= 0x41
+            if rex != 0:
+                chunk.code.append(rex)
+            chunk.code += opcode
+            sib = SCALE_BITS[rm.scale] << 6 | (index & 7) << 3 | (base & 7)
+            # A base of rbp or r13 without a displacement would mean no base
+            if base & 7 == 5:
+                chunk.code.append(0x44 | (reg & 7) << 3)
+                chunk.code.append(sib)
+                chunk.code.append(0)
+            else:
+                chunk.code.append(0x04 | (reg & 7) << 3)
+                chunk.code.append(sib)
+        else:
+            if rm >= 8:
+                rex |= 0x41
+            if rex != 0:
+                chunk.code.append(rex)
+            chunk.code += opcode
+            chunk.code.append(0xc0 | (reg & 7) << 3 | (rm & 7))
+
+    def rmOperand(self, operand):
+        if isinstance(operand, str):
+            return REGISTER_NUMBERS[operand]
+        return operand
+
+    def encodeMov(self, chunk, mnemonic, operands):
+        dst, src = operands
+        if isinstance(src, Immediate):
+            if isinstance(dst, str) and not fitsInt32(src.value):
+                register = REGISTER_NUMBERS[dst]
+                chunk.code.append(REX_W | (register >> 3))
+                chunk.code.append(0xb8 | (register & 7))
+                chunk.code += struct.pack("<q", src.value)
+                return
+            self.emitModRM(chunk, b"\xc7", 0, self.rmOperand(dst), trailing = 4)
+            chunk.code += packInt32(src.value)
+        elif isinstance(src, str):
+            self.emitModRM(chunk, b"\x89", REGISTER_NUMBERS[src], self.rmOperand(dst))
+        else:
+            self.emitModRM(chunk, b"\x8b", REGISTER_NUMBERS[dst], src)
+
+    def encodeArithmetic(self, chunk, mnemonic, operands):
+        dst, src = operands
+        toRM, toReg, digit, accumulator = ARITHMETIC_OPCODES[mnemonic]
+        if isinstance(src, Immediate):
+            if fitsInt8(src.value):
+                self.emitModRM(chunk, b"\x83", digit, self.rmOperand(dst), trailing = 1)
+                chunk.code += packInt8(src.value)
+            elif dst == "rax":
+                chunk.code.append(REX_W)
+                chunk.code.append(accumulator)
+                chunk.code += packInt32(src.value)
+            else:
+                self.emitModRM(chunk, b"\x81", digit, self.rmOperand(dst), trailing = 4)
+                chunk.code += packInt32(src.value)
+        elif isinstance(src, str):
+            self.emitModRM(chunk, bytes((toRM,)), REGISTER_NUMBERS[src], self.rmOperand(dst))
+        else:
+            self.emitModRM(chunk, bytes((toReg,)), REGISTER_NUMBERS[dst], src)
+
+    def encodeImul(self, chunk, mnemonic, operands):
+        if len(operands) == 3:
+            dst, src, immediate = operands
+            if fitsInt8(immediate.value):
+                self.emitModRM(chunk, b"\x6b", REGISTER_NUMBERS[dst], self.rmOperand(src), trailing = 1)
+                chunk.code += packInt8(immediate.value)
+            else:
+                self.emitModRM(chunk, b"\x69", REGISTER_NUMBERS[dst], self.rmOperand(src), trailing = 4)
+                chunk.code += packInt32(immediate.value)
+            return
+        if len(operands) == 1:
+            # rdx:rax = rax * operand
+            self.emitModRM(chunk, b"\xf7", 5, self.rmOperand(operands[0]))
+            return
+        dst, src = operands
+        self.emitModRM(chunk, b"\x0f\xaf", REGISTER_NUMBERS[dst], self.rmOperand(src))
+
+    def encodeShift(self, chunk, mnemonic, operands):
+        dst, count = operands
+        if count.value == 1:
+            self.emitModRM(chunk, b"\xd1", SHIFT_DIGITS[mnemonic], self.rmOperand(dst))
+        else:
+            self.emitModRM(chunk, b"\xc1", SHIFT_DIGITS[mnemonic], self.rmOperand(dst), trailing = 1)
+            chunk.code += packInt8(count.value)
+
+    def encodeNeg(self, chunk, mnemonic, operands):
+        self.emitModRM(chunk, b"\xf7", 3, self.rmOperand(operands[0]))
+
+    def encodeLea(self, chunk, mnemonic, operands):
+        dst, address = operands
+        self.emitModRM(chunk, b"\x8d", REGISTER_NUMBERS[dst], address)
+
+    def encodeIdiv(self, chunk, mnemonic, operands):
+        self.emitModRM(chunk, b"\xf7", 7, self.rmOperand(operands[0]))
+
+    def encodeCqo(self, chunk, mnemonic, operands):
+        chunk.code += b"\x48\x99"
+
+    def encodeXor(self, chunk, mnemonic, operands):
+        dst, src = operands
+        self.emitModRM(chunk, b"\x31", DWORD_REGISTER_NUMBERS[src], DWORD_REGISTER_NUMBERS[dst], wide = False)
+
+    def encodeTest(self, chunk, mnemonic, operands):
+        dst, src = operands
+        self.emitModRM(chunk, b"\x85", REGISTER_NUMBERS[src], REGISTER_NUMBERS[dst])
+
+    def encodeSetcc(self, chunk, mnemonic, operands):
+        self.emitModRM(chunk, bytes((0x0f, SETCC_OPCODES[mnemonic])), 0, BYTE_REGISTER_NUMBERS[operands[0]], wide = False)
+
+    def encodeMovzx(self, chunk, mnemonic, operands):
+        dst, src = operands
+        self.emitModRM(chunk, b"\x0f\xb6", DWORD_REGISTER_NUMBERS[dst], BYTE_REGISTER_NUMBERS[src], wide = False)
+
+    def encodePush(self, chunk, mnemonic, operands):
+        operand = operands[0]
+        if isinstance(operand, str):
+            register = REGISTER_NUMBERS[operand]
+            if register >= 8:
+                chunk.code.append(0x41)
+            chunk.code.append(0x50 | (register & 7))
+        elif isinstance(operand, Immediate):
+            if fitsInt8(operand.value):
+                chunk.code.append(0x6a)
+                chunk.code += packInt8(operand.value)
+            else:
+                chunk.code.append(0x68)
+                chunk.code += packInt32(operand.value)
+        else:
+            self.emitModRM(chunk, b"\xff", 6, operand, wide = False)
+
+    def encodePop(self, chunk, mnemonic, operands):
+        register = REGISTER_NUMBERS[operands[0]]
+        if register >= 8:
+            chunk.code.append(0x41)
+        chunk.code.append(0x58 | (register & 7))
+
+    def encodeCall(self, chunk, mnemonic, operands):
+        chunk.code.append(0xe8)
+        chunk.relocations.append((len(chunk.code), R_X86_64_PLT32, operands[0].name, -4))
+        chunk.code += bytes(4)
+
+    def encodeRet(self, chunk, mnemonic, operands):
+        chunk.code.append(0xc3)
+
+def encodeProgram(machineProgram):
+    return Encoder(machineProgram).encode()
+
+# Compiles an analyzed program straight to the bytes of an ELF object
+def generateObject(nodes, programDetails, **options):
+    machineProgram = CodeGenerator(lowerProgram(nodes, programDetails), **options).generateMachineCode()
+    return writeObjectFile(encodeProgram(machineProgram))
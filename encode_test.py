@@ -0,0 +1,179 @@
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import unittest
+from compile_test import HARNESS, PROGRAMS, PRESSURE_PROGRAM, analyzeSource
+from encode import *
+
+def encodeInstructions(code):
+    machineProgram = MachineProgram([MachineFunction("f", code)], [("g", 5)])
+    return encodeProgram(machineProgram)
+
+def generateMachineCode(originalString, **options):
+    nodes, programDetails = analyzeSource(originalString)
+    return CodeGenerator(lowerProgram(nodes, programDetails), dialect = GAS, **options).generateMachineCode()
+
+# Random programs with deep nesting, wide constants, many arguments and lots
+# of live values, for covering instruction forms. They aren't run, their
+# loops may never end.
+def randomProgram(seed, functionCount = 4, statementCount = 25):
+    rng = random.Random(seed)
+    globalNames = ["g0", "g1"]
+    lines = ["g0: int = 7;", "g1: int = 9223372036854775807;"]
+    constants = [0, 1, 5, 127, 128, 300, 2147483647, 2147483648, 4294967295, 1 << 40]
+    signatures = []
+    for f in range(functionCount):
+        variables = ["p{}".format(i) for i in range(rng.randint(0, 8))]
+        parameters = ", ".join("{}: int".format(name) for name in variables)
+        declaredCount = 0
+
+        def expression(depth):
+            choice = rng.random()
+            if depth > 2 or choice < 0.3:
+                return str(rng.choice(variables + globalNames + constants))
+            if choice < 0.4 and len(signatures) > 0:
+                name, count = rng.choice(signatures)
+                return "{}({})".format(name, ", ".join(expression(depth + 1) for i in range(count)))
+            return "({} {} {})".format(expression(depth + 1), rng.choice(["+", "-", "*", "/", "==", "!="]), expression(depth + 1))
+
+        def block(depth, count):
+            nonlocal declaredCount
+            statements = []
+            for i in range(count):
+                choice = rng.random()
+                if choice < 0.35 or len(variables) == 0:
+                    name = "v{}".format(declaredCount)
+                    declaredCount += 1
+                    statements.append("{}: int = {};".format(name, expression(0)))
+                    # Only top level declarations are sure to come before later uses
+                    if depth == 0:
+                        variables.append(name)
+                elif choice < 0.55:
+                    statements.append("{} = {};".format(rng.choice(variables + globalNames), expression(0)))
+                elif choice < 0.75 and depth < 3:
+                    statements.append("if {} == {} {{".format(expression(1), expression(1)))
+                    statements += block(depth + 1, rng.randint(1, 8))
+                    statements.append("} else {")
+                    statements += block(depth + 1, rng.randint(0, 4))
+                    statements.append("}")
+                elif choice < 0.9 and depth < 3:
+                    statements.append("while {} != {} {{".format(rng.choice(variables), expression(1)))
+                    statements += block(depth + 1, rng.randint(1, 12))
+                    statements.append("}")
+                elif depth > 0:
+                    statements.append("return {};".format(expression(0)))
+            return statements
+
+        body = block(0, statementCount)
+        lines.append("func f{}({}): int {{".format(f, parameters))
+        lines += body
+        lines.append("return {};".format(expression(0)))
+        lines.append("}")
+        signatures.append(("f{}".format(f), parameters.count(":")))
+    return "\n".join(lines)
+
+class TestEncode(unittest.TestCase):
+    def testEncodings(self):
+        cases = [
+            (MachineInstruction("mov", ("rax", Immediate(5))), "48c7c005000000"),
+            (MachineInstruction("mov", ("r11", Immediate(-9223372036854775808))), "49bb0000000000000080"),
+            (MachineInstruction("mov", (StackSlot(-200), Immediate(-1))), "48c78538ffffffffffffff"),
+            (MachineInstruction("mov", ("rbp", "rsp")), "4889e5"),
+            (MachineInstruction("add", ("rax", Immediate(1000))), "4805e8030000"),
+            (MachineInstruction("add", ("rcx", Immediate(1000))), "4881c1e8030000"),
+            (MachineInstruction("cmp", (StackSlot(-8), Immediate(0))), "48837df800"),
+            (MachineInstruction("imul", ("rcx", "rcx", Immediate(3))), "486bc903"),
+            (MachineInstruction("imul", ("rcx", StackSlot(-8))), "480faf4df8"),
+            (MachineInstruction("push", (StackSlot(16),)), "ff7510"),
+            (MachineInstruction("push", ("r12",)), "4154"),
+            (MachineInstruction("xor", ("r11d", "r11d")), "4531db"),
+            (MachineInstruction("idiv", ("r11",)), "49f7fb"),
+            (MachineInstruction("setne", ("al",)), "0f95c0"),
+            (MachineInstruction("movzx", ("eax", "al")), "0fb6c0"),
+            (MachineInstruction("shl", ("rax", Immediate(1))), "48d1e0"),
+            (MachineInstruction("sar", ("r13", Immediate(63))), "49c1fd3f"),
+            (MachineInstruction("shr", (StackSlot(-8), Immediate(5))), "48c16df805"),
+            (MachineInstruction("neg", ("r12",)), "49f7dc"),
+            (MachineInstruction("imul", (StackSlot(-16),)), "48f76df0"),
+            (MachineInstruction("lea", ("rax", Address("rcx", "rcx", 2))), "488d0449"),
+            (MachineInstruction("lea", ("r13", Address("r13", "r13", 4))), "4f8d6cad00"),
+        ]
+        for instruction, expected in cases:
+            with self.subTest(instruction):
+                self.assertEqual(encodeInstructions([instruction]).text.hex(), expected)
+
+    def testRelocations(self):
+        objectFile = encodeInstructions([
+            MachineInstruction("mov", (GlobalMemory("g"), Immediate(7))),
+            MachineInstruction("mov", ("r13", GlobalMemory("g"))),
+            MachineInstruction("call", (Symbol("puts"),)),
+        ])
+        self.assertEqual(objectFile.text.hex(), "48c70500000000070000004c8b2d00000000e800000000")
+        self.assertEqual(objectFile.relocations, [
+            Relocation(3, R_X86_64_PC32, ".data", -8),
+            Relocation(14, R_X86_64_PC32, ".data", -4),
+            Relocation(19, R_X86_64_PLT32, "puts", -4)])
+
+    def testJumpsGrowOnlyWhenTheyMustReach(self):
+        def jumpOver(count):
+            return [MachineInstruction("jz", (Symbol(".L0"),))] + [MachineInstruction("ret", ())] * count + [Label(".L0")]
+        self.assertEqual(encodeInstructions(jumpOver(127)).text[:2].hex(), "747f")
+        self.assertEqual(encodeInstructions(jumpOver(128)).text[:6].hex(), "0f8480000000")
+        # The jmp would reach .L1 if the jz it jumps over didn't have to grow
+        code = [Label(".L0")] + [MachineInstruction("ret", ())] * 65 + [MachineInstruction("jmp", (Symbol(".L1"),))]
+        code += [MachineInstruction("ret", ())] * 60 + [MachineInstruction("jz", (Symbol(".L0"),))]
+        code += [MachineInstruction("ret", ())] * 65 + [Label(".L1")]
+        text = encodeInstructions(code).text
+        self.assertEqual(text[65:70].hex(), "e983000000")
+        self.assertEqual(text[130:136].hex(), "0f8478ffffff")
+        backward = [Label(".L0")] + [MachineInstruction("ret", ())] * 126 + [MachineInstruction("jmp", (Symbol(".L0"),))]
+        self.assertEqual(encodeInstructions(backward).text[-2:].hex(), "eb80")
+
+    def testUnknownInstruction(self):
+        with self.assertRaisesRegex(Exception, "Can't encode 'nop'"):
+            encodeInstructions([MachineInstruction("nop", ())])
+
+    # NASM isn't installed here, so the reference is GNU as assembling the
+    # GAS dialect of the same instructions
+    @unittest.skipIf(shutil.which("as") is None, "needs GNU as to compare against")
+    def testMatchesGnuAs(self):
+        sources = [originalString for originalString, expected in PROGRAMS] + [PRESSURE_PROGRAM]
+        sources += [randomProgram(seed) for seed in range(4)]
+        with tempfile.TemporaryDirectory() as directory:
+            assemblyPath = os.path.join(directory, "program.s")
+            objectPath = os.path.join(directory, "program.o")
+            for originalString in sources:
+                for allocateRegisters in (True, False):
+                    with self.subTest(originalString, allocateRegisters = allocateRegisters):
+                        machineProgram = generateMachineCode(originalString, allocateRegisters = allocateRegisters)
+                        with open(assemblyPath, "w") as outputFile:
+                            outputFile.write(formatAssembly(machineProgram, GAS))
+                        subprocess.run(["as", "-o", objectPath, assemblyPath], check = True)
+                        with open(objectPath, "rb") as inputFile:
+                            expected = readObjectFile(inputFile.read())
+                        objectFile = readObjectFile(writeObjectFile(encodeProgram(machineProgram)))
+                        self.assertEqual(objectFile.text.hex(), expected.text.hex())
+                        self.assertEqual(objectFile.data, expected.data)
+                        self.assertEqual(objectFile.relocations, expected.relocations)
+
+    @unittest.skipIf(shutil.which("gcc") is None, "needs gcc to link")
+    def testProgramsRun(self):
+        with tempfile.TemporaryDirectory() as directory:
+            harnessPath = os.path.join(directory, "harness.c")
+            objectPath = os.path.join(directory, "program.o")
+            executablePath = os.path.join(directory, "program")
+            with open(harnessPath, "w") as outputFile:
+                outputFile.write(HARNESS)
+            for originalString, expected in PROGRAMS + [(PRESSURE_PROGRAM, 650)]:
+                with self.subTest(originalString):
+                    nodes, programDetails = analyzeSource(originalString)
+                    with open(objectPath, "wb") as outputFile:
+                        outputFile.write(generateObject(nodes, programDetails))
+                    subprocess.run(["gcc", "-no-pie", "-o", executablePath, harnessPath, objectPath], check = True)
+                    output = subprocess.run([executablePath], check = True, capture_output = True, text = True).stdout
+                    self.assertEqual(int(output), toInt64(expected))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,200 @@
+from utils import *
+from parse import *
+from analyze import *
+
+# Constant folding and propagation over the analyzed tree. A builtin operator
+# call whose arguments are all literals is replaced by a literal holding its
+# result, computed with the same 64-bit wraparound and truncating division as
+# the generated code. Each function is walked in order, keeping track of the
+# locals known to hold a literal after a declaration or an = assignment. An
+# identifier for one of those is replaced by the literal, which in turn lets
+# the expression around it fold.
+#
+# After an if, only what both branches agree on is known, unless one of them
+# always returns. A while forgets every variable assigned anywhere in its
+# body before looking at its condition, since the body may run any number of
+# times. Globals are never propagated, as any call could assign them.
+#
+# A division by a literal 0 is never folded or reported as an error, since
+# it may be in code that never runs, like an if 0 branch. It's left to trap
+# at run time, the same as without folding, and only recorded as a warning.
+#
+# The tree is rewritten in place. Folded literals get their resolvedType set,
+# so the result can go straight to lowerProgram.
+
+class ConstantFolder:
+    def __init__(self, nodes, programDetails, originalString):
+        self.nodes = nodes
+        self.programDetails = programDetails
+        self.originalString = originalString
+        self.globalVariableIds = set(id(variableNode) for variableNode in programDetails.globalVariables.values())
+        # (pos, message) for each division left to trap
+        self.warnings = []
+        # Operator calls replaced by a literal
+        self.foldedCount = 0
+        # Identifiers replaced by a literal
+        self.propagatedCount = 0
+        # How many fewer nodes the tree has
+        self.removedCount = 0
+
+    def fold(self):
+        for functionDetails in self.programDetails.functions.values():
+            self.foldStatements(functionDetails.node.statements, {})
+        return self.removedCount
+
+    # constants maps id() of a local VariableNode to the value it holds, and
+    # is updated to what's known after the statements. Returns whether the
+    # statements always return.
+    def foldStatements(self, statements, constants):
+        returns = False
+        for statement in statements:
+            if isinstance(statement, DeclarationNode):
+                statement.expression = self.foldExpression(statement.expression, constants)
+                self.assign(statement.variable, statement.expression, constants)
+            elif isinstance(statement, ReturnNode):
+                if statement.expression is not None:
+                    statement.expression = self.foldExpression(statement.expression, constants)
+                returns = True
+            elif isinstance(statement, IfNode):
+                statement.conditional = self.foldExpression(statement.conditional, constants)
+                thenConstants = dict(constants)
+                thenReturns = self.foldStatements(statement.statements, thenConstants)
+                elseConstants = dict(constants)
+                elseReturns = self.foldStatements(statement.elseStatements, elseConstants)
+                constants.clear()
+                if thenReturns and elseReturns:
+                    returns = True
+                elif thenReturns:
+                    constants.update(elseConstants)
+                elif elseReturns:
+                    constants.update(thenConstants)
+                else:
+                    for variableId, value in thenConstants.items():
+                        if elseConstants.get(variableId) == value:
+                            constants[variableId] = value
+            elif isinstance(statement, WhileNode):
+                for variableId in findAssignedVariables(statement.statements):
+                    constants.pop(variableId, None)
+                statement.conditional = self.foldExpression(statement.conditional, constants)
+                self.foldStatements(statement.statements, dict(constants))
+            elif isinstance(statement, CallNode):
+                self.foldExpression(statement, constants)
+                if isAssignment(statement):
+                    self.assign(statement.arguments[0].variable, statement.arguments[1], constants)
+            elif isinstance(statement, (IdentifierNode, LiteralNode)):
+                pass
+            else:
+                raise Exception("Can't fold '{}'".format(statement))
+        return returns
+
+    def assign(self, variableNode, expression, constants):
+        if variableNode is None or id(variableNode) in self.globalVariableIds:
+            return
+        if isinstance(expression, LiteralNode) and expression.type == "int":
+            constants[id(variableNode)] = expression.value
+        else:
+            constants.pop(id(variableNode), None)
+
+    # Returns the folded expression, which is a new node if the expression
+    # itself was replaced. Arguments are folded bottom-up with an explicit
+    # stack, the same as Analyzer.annotate.
+    def foldExpression(self, expression, constants):
+        values = []
+        stack = [(expression, False)]
+        while len(stack) > 0:
+            node, argumentsDone = stack.pop()
+            if isinstance(node, IdentifierNode):
+                if node.variable is not None and id(node.variable) in constants:
+                    self.propagatedCount += 1
+                    node = makeLiteral(constants[id(node.variable)])
+                values.append(node)
+            elif isinstance(node, CallNode):
+                # The target of an assignment is left alone
+                start = 1 if isAssignment(node) else 0
+                argumentCount = len(node.arguments) - start
+                if not argumentsDone:
+                    stack.append((node, True))
+                    for argument in reversed(node.arguments[start:]):
+                        stack.append((argument, False))
+                else:
+                    if argumentCount > 0:
+                        node.arguments[start:] = values[len(values) - argumentCount:]
+                        del values[len(values) - argumentCount:]
+                    values.append(self.foldCall(node))
+            elif isinstance(node, LiteralNode):
+                values.append(node)
+            else:
+                raise Exception("Can't fold '{}'".format(node))
+        return values[0]
+
+    def foldCall(self, node):
+        if node.signature not in BUILTINS or isAssignment(node):
+            return node
+        for argument in node.arguments:
+            if not isinstance(argument, LiteralNode) or argument.type != "int":
+                return node
+        left = toInt64(node.arguments[0].value)
+        right = toInt64(node.arguments[1].value)
+        operator = node.identifier
+        if operator == "+":
+            value = left + right
+        elif operator == "-":
+            value = left - right
+        elif operator == "*":
+            value = left * right
+        elif operator == "/":
+            if right == 0:
+                self.warnings.append((node.pos, "Division by zero, left to trap at run time."))
+                return node
+            # idiv traps on the one quotient that doesn't fit, so leave it
+            # for run time rather than pick a result
+            if left == INT64_MIN and right == -1:
+                return node
+            # Truncates toward zero, unlike Python's //
+            value = abs(left) // abs(right)
+            if (left < 0) != (right < 0):
+                value = -value
+        elif operator == "==":
+            value = 1 if left == right else 0
+        elif operator == "!=":
+            value = 1 if left != right else 0
+        else:
+            return node
+        self.foldedCount += 1
+        self.removedCount += len(node.arguments)
+        return makeLiteral(toInt64(value))
+
+    def displayWarnings(self):
+        source = toSourceFile(self.originalString)
+        for pos, message in self.warnings:
+            displayError(source, pos, message)
+
+def makeLiteral(value):
+    literal = LiteralNode("int", value)
+    literal.resolvedType = "int"
+    return literal
+
+# id() of every variable declared or assigned in the statements, nested
+# blocks included
+def findAssignedVariables(statements):
+    assigned = set()
+    stack = list(statements)
+    while len(stack) > 0:
+        statement = stack.pop()
+        if isinstance(statement, DeclarationNode):
+            assigned.add(id(statement.variable))
+        elif isinstance(statement, CallNode) and isAssignment(statement):
+            assigned.add(id(statement.arguments[0].variable))
+        elif isinstance(statement, IfNode):
+            stack.extend(statement.statements)
+            stack.extend(statement.elseStatements)
+        elif isinstance(statement, WhileNode):
+            stack.extend(statement.statements)
+    return assigned
+
+# Folds the analyzed program in place and returns the ConstantFolder, for its
+# counts
+def foldConstants(nodes, programDetails, originalString):
+    folder = ConstantFolder(nodes, programDetails, originalString)
+    folder.fold()
+    return folder
@@ -0,0 +1,113 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+from lex import *
+from parse import *
+from analyze import *
+from fold import *
+
+def foldSource(originalString):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    folder = foldConstants(nodes, programDetails, originalString)
+    return nodes, folder
+
+# The expression each function returns, after folding
+def foldReturn(body):
+    nodes, folder = foldSource("func f(p: int): int { " + body + " }")
+    return nodes[0].statements[-1].expression
+
+class TestFold(unittest.TestCase):
+    def testArithmetic(self):
+        self.assertEqual(foldReturn("return 1 + 2 * 3 - 10 / 3;"), LiteralNode("int", 4))
+        self.assertEqual(foldReturn("return (3 == 3) + (3 != 3) * 10;"), LiteralNode("int", 1))
+
+    def testWraparound(self):
+        self.assertEqual(foldReturn("return 9223372036854775807 + 1;"), LiteralNode("int", -9223372036854775808))
+        self.assertEqual(foldReturn("return 4294967296 * 4294967296 + 5;"), LiteralNode("int", 5))
+        self.assertEqual(foldReturn("return 0 - 9223372036854775807 - 2;"), LiteralNode("int", 9223372036854775807))
+
+    def testDivisionTruncates(self):
+        self.assertEqual(foldReturn("return (0 - 7) / 2;"), LiteralNode("int", -3))
+        self.assertEqual(foldReturn("return 7 / (0 - 2);"), LiteralNode("int", -3))
+        self.assertEqual(foldReturn("return (0 - 7) / (0 - 2);"), LiteralNode("int", 3))
+
+    def testOverflowingDivisionLeftAlone(self):
+        expression = foldReturn("return (0 - 9223372036854775807 - 1) / (0 - 1);")
+        self.assertIsInstance(expression, CallNode)
+        self.assertEqual(expression.arguments, [LiteralNode("int", -9223372036854775808), LiteralNode("int", -1)])
+
+    def testDivisionByZero(self):
+        originalString = "func f(): int {\n  zero: int = 0;\n  return 1 / zero;\n}"
+        nodes, folder = foldSource(originalString)
+        # Left to trap at run time
+        expression = nodes[0].statements[-1].expression
+        self.assertIsInstance(expression, CallNode)
+        self.assertEqual(expression.arguments, [LiteralNode("int", 1), LiteralNode("int", 0)])
+        output = io.StringIO()
+        with redirect_stdout(output):
+            folder.displayWarnings()
+        self.assertIn("Division by zero, left to trap at run time.", output.getvalue())
+        self.assertIn("  return 1 / zero;\n-----------^", output.getvalue())
+        # In a branch that never runs, the program is still fine
+        nodes, folder = foldSource("func f(): int { x: int = 2; if 0 { x = 1 / 0; } return x; }")
+        self.assertIsInstance(nodes[0].statements[1].statements[0].arguments[1], CallNode)
+        self.assertEqual(len(folder.warnings), 1)
+
+    def testPropagation(self):
+        nodes, folder = foldSource("""
+        func f(p: int): int {
+            a: int = 2 * 3;
+            b: int = a + 1;
+            a = b * 2;
+            return a + b + p;
+        }""")
+        statements = nodes[0].statements
+        self.assertEqual(statements[1].expression, LiteralNode("int", 7))
+        self.assertEqual(statements[2].arguments[1], LiteralNode("int", 14))
+        self.assertEqual(statements[3].expression, CallNode("+", [LiteralNode("int", 21), IdentifierNode("p")]))
+        self.assertEqual(folder.foldedCount, 4)
+        self.assertEqual(folder.propagatedCount, 4)
+        self.assertEqual(folder.removedCount, 8)
+
+    def testIfKeepsWhatBranchesAgreeOn(self):
+        self.assertEqual(foldReturn("a: int = 1; if p == 0 { a = 1; } else { a = 1; } return a;"), LiteralNode("int", 1))
+        self.assertEqual(foldReturn("a: int = 1; if p == 0 { a = 2; } return a;"), IdentifierNode("a"))
+        self.assertEqual(foldReturn("a: int = 1; if p == 0 { a = 2; return a; } return a;"), LiteralNode("int", 1))
+
+    def testWhileForgetsAssignedVariables(self):
+        nodes, folder = foldSource("""
+        func f(p: int): int {
+            i: int = 0;
+            n: int = 10;
+            while i != n {
+                i = i + 1;
+            }
+            return i + n;
+        }""")
+        loop = nodes[0].statements[2]
+        self.assertEqual(loop.conditional, CallNode("!=", [IdentifierNode("i"), LiteralNode("int", 10)]))
+        self.assertEqual(loop.statements[0].arguments[1], CallNode("+", [IdentifierNode("i"), LiteralNode("int", 1)]))
+        self.assertEqual(nodes[0].statements[3].expression, CallNode("+", [IdentifierNode("i"), LiteralNode("int", 10)]))
+
+    def testGlobalsNotPropagated(self):
+        nodes, folder = foldSource("""
+        g: int = 1;
+        func f(): int {
+            g = 2;
+            return g + 1;
+        }""")
+        self.assertEqual(nodes[1].statements[1].expression, CallNode("+", [IdentifierNode("g"), LiteralNode("int", 1)]))
+
+    def testUserCallsNotFolded(self):
+        nodes, folder = foldSource("""
+        func add(x: int, y: int): int { return x + y; }
+        func f(): int { return add(1, 2); }""")
+        self.assertEqual(nodes[1].statements[0].expression, CallNode("add", [LiteralNode("int", 1), LiteralNode("int", 2)]))
+        self.assertEqual(folder.removedCount, 0)
+
+    def testDeepExpression(self):
+        self.assertEqual(foldReturn("return " + "(1 + " * 3000 + "1" + ")" * 3000 + ";"), LiteralNode("int", 3001))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+import io
+import itertools
+import operator
+from bisect import bisect_left, bisect_right
+from contextlib import redirect_stdout
+from array import array
+from lex import *
+from parse import *
+from arena import nodeChildren
+
+# Incremental re-parsing for editors. A ParseResult remembers the source span
+# of every top-level declaration, so an edit only re-lexes and re-parses the
+# declarations it touches. The text is kept in pieces, one per declaration and
+# one per gap between them, so an edit only rebuilds the pieces it touches too.
+#
+# Declarations after the edit keep their nodes and their stored spans. The
+# change in length is added to a ShiftTree at the index of the first
+# declaration after the edit, and a declaration's span is its stored span plus
+# the sum of the tree up to its index. Node positions are only shifted when the
+# nodes are next asked for. An edit that keeps the number of declarations
+# costs the same whatever the size of the file. One that adds or removes
+# declarations first folds the tree into the spans, which is a pass over them,
+# done in C by itertools.accumulate and map.
+class ParseResult:
+    def __init__(self, text, nodes, starts, ends):
+        self.declarations = nodes
+        # Offset of the first character of each declaration, and one past its
+        # last, less the tree's sum up to its index
+        self.starts = starts
+        self.ends = ends
+        # Tree sum each declaration's node positions were last right at
+        self.nodeShifts = [0] * len(nodes)
+        self.tree = ShiftTree(len(nodes))
+        # Gaps and declarations in turn, with the gap before declaration i at
+        # 2 * i and the declaration at 2 * i + 1
+        self.pieces = splitPieces(text, 0, starts, ends)
+        # The joined pieces, or None until they're asked for after an edit
+        self.text = text
+
+    @staticmethod
+    def parse(text):
+        nodes, starts, ends = parseDeclarations(text, 0, text)
+        return ParseResult(text, nodes, starts, ends)
+
+    def getText(self):
+        if self.text is None:
+            self.text = "".join(self.pieces)
+        return self.text
+
+    def getStart(self, i):
+        return self.starts[i] + self.tree.sum(i)
+
+    def getEnd(self, i):
+        return self.ends[i] + self.tree.sum(i)
+
+    def getNode(self, i):
+        shift = self.tree.sum(i)
+        if self.nodeShifts[i] != shift:
+            shiftPositions(self.declarations[i], shift - self.nodeShifts[i])
+            self.nodeShifts[i] = shift
+        return self.declarations[i]
+
+    def getNodes(self):
+        for i in range(len(self.declarations)):
+            self.getNode(i)
+        return self.declarations
+
+    # Index of the declaration containing offset, or None if it's between declarations
+    def findDeclaration(self, offset):
+        indices = range(len(self.declarations))
+        i = bisect_right(indices, offset, key = self.getStart) - 1
+        if i >= 0 and offset < self.getEnd(i):
+            return i
+        return None
+
+    # Replaces text[start:end] with replacement and updates the result in
+    # place to match what a full parse of the new text would produce.
+    def applyEdit(self, start, end, replacement):
+        delta = len(replacement) - (end - start)
+        # Declarations touching the edit are [first, last). Anything between
+        # the end of the one before and the start of the one after is re-parsed.
+        indices = range(len(self.declarations))
+        first = bisect_left(indices, start, key = self.getEnd)
+        last = bisect_right(indices, end, key = self.getStart)
+        regionStart = 0
+        if first > 0:
+            regionStart = self.getEnd(first - 1)
+        region = "".join(self.pieces[2 * first:2 * last + 1])
+        region = region[:start - regionStart] + replacement + region[end - regionStart:]
+        try:
+            # A failure might only be because the edit joined the region with
+            # the declarations around it, which a full parse will sort out.
+            with redirect_stdout(io.StringIO()):
+                nodes, starts, ends = parseDeclarations(region, regionStart, None)
+        except Exception:
+            text = "".join(self.pieces[:2 * first]) + region + "".join(self.pieces[2 * last + 1:])
+            nodes, starts, ends = parseDeclarations(text, 0, text)
+            self.__init__(text, nodes, starts, ends)
+            return self
+
+        pieces = splitPieces(region, regionStart, starts, ends)
+        if len(nodes) == last - first:
+            # The tree's sums up to the new declarations, which this edit
+            # only adds to after them
+            shifts = [self.tree.sum(i) for i in range(first, last)]
+        else:
+            # Indices after the edit move, so the tree no longer fits them
+            self.foldShifts()
+            shifts = [0] * len(nodes)
+        self.declarations[first:last] = nodes
+        self.starts[first:last] = map(operator.sub, starts, shifts)
+        self.ends[first:last] = map(operator.sub, ends, shifts)
+        self.nodeShifts[first:last] = shifts
+        self.pieces[2 * first:2 * last + 1] = pieces
+        if len(nodes) != last - first:
+            self.tree = ShiftTree(len(self.declarations))
+        if delta != 0 and first + len(nodes) < len(self.declarations):
+            self.tree.add(first + len(nodes), delta)
+        self.text = None
+        return self
+
+    # Adds the tree's sums into the stored spans and node shifts, after which
+    # the tree is left for the caller to replace with an empty one
+    def foldShifts(self):
+        sums = list(itertools.accumulate(self.tree.deltas))
+        self.starts = list(map(operator.add, self.starts, sums))
+        self.ends = list(map(operator.add, self.ends, sums))
+        self.nodeShifts = list(map(operator.sub, self.nodeShifts, sums))
+
+# A Fenwick tree of the amounts added at each declaration index, for the sum of
+# those up to an index in O(log n). deltas keeps the amounts themselves, for
+# adding them all up at once.
+class ShiftTree:
+    def __init__(self, size):
+        self.deltas = [0] * size
+        self.tree = [0] * (size + 1)
+
+    def add(self, i, delta):
+        self.deltas[i] += delta
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    # Sum of the amounts added at indices 0 to i
+    def sum(self, i):
+        total = 0
+        i += 1
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+# Splits text, which starts at textStart, into the gaps around the
+# declarations at starts and ends and the declarations themselves
+def splitPieces(text, textStart, starts, ends):
+    pieces = []
+    previousEnd = 0
+    for start, end in zip(starts, ends):
+        pieces.append(text[previousEnd:start - textStart])
+        pieces.append(text[start - textStart:end - textStart])
+        previousEnd = end - textStart
+    pieces.append(text[previousEnd:])
+    return pieces
+
+# Parses text, which starts at regionStart within the whole source, into
+# top-level declarations and their spans.
+def parseDeclarations(text, regionStart, originalString):
+    stream = Lexxer(text).lexCompact()
+    if regionStart != 0:
+        stream.offsets = array("q", [offset + regionStart for offset in stream.offsets])
+    parser = Parser(stream, originalString)
+    nodes = []
+    starts = []
+    ends = []
+    while parser.buffer.remaining() > 0:
+        firstToken = parser.buffer.i
+        nodes.append(parser.parseTopLevel())
+        starts.append(stream.offsets[firstToken] - len(stream.value(firstToken)) + 1)
+        ends.append(stream.offsets[parser.buffer.i - 1] + 1)
+    return nodes, starts, ends
+
+def shiftPositions(node, delta):
+    stack = [node]
+    while len(stack) > 0:
+        node = stack.pop()
+        if isinstance(node, (CallNode, IdentifierNode)) and node.pos is not None:
+            node.pos += delta
+        stack.extend(child for child in nodeChildren(node) if child is not None)
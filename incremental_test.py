@@ -0,0 +1,115 @@
+import io
+import random
+import unittest
+from contextlib import redirect_stdout
+from lex import *
+from parse import *
+from incremental import *
+from arena import nodeChildren
+
+PROGRAM = """myNum: int = 1;
+func add(x: int, y: int): int {
+    return x + y;
+}
+
+func main(): int {
+    a: int = add(myNum, 2);
+    while a != 0 {
+        a = a - 1;
+    }
+    return a;
+}
+other: int = 5;
+"""
+
+def positions(nodes):
+    result = []
+    stack = list(reversed(nodes))
+    while len(stack) > 0:
+        node = stack.pop()
+        if isinstance(node, (CallNode, IdentifierNode)):
+            result.append(node.pos)
+        stack.extend(reversed([child for child in nodeChildren(node) if child is not None]))
+    return result
+
+class TestIncremental(unittest.TestCase):
+    def assertMatchesFullParse(self, result):
+        expected = Parser(Lexxer(result.getText()).lexCompact(), result.getText()).parse()
+        actual = result.getNodes()
+        self.assertEqual(actual, expected)
+        self.assertEqual(positions(actual), positions(expected))
+        fresh = ParseResult.parse(result.getText())
+        spans = [(result.getStart(i), result.getEnd(i)) for i in range(len(actual))]
+        self.assertEqual(spans, list(zip(fresh.starts, fresh.ends)))
+
+    def edit(self, result, old, new):
+        start = result.getText().index(old)
+        result.applyEdit(start, start + len(old), new)
+        self.assertMatchesFullParse(result)
+
+    def testEdits(self):
+        result = ParseResult.parse(PROGRAM)
+        self.assertMatchesFullParse(result)
+        # Inside a function body
+        self.edit(result, "x + y", "x * y + 10")
+        # Between declarations
+        self.edit(result, "}\n\nfunc", "}\nfunc sub(x: int): int { return 0 - x; }\nfunc")
+        # Changing the first token of a declaration
+        self.edit(result, "myNum: int = 1", "myNumber: int = 1")
+        self.edit(result, "add(myNum, 2)", "add(myNumber, 2)")
+        # Joining two declarations into one and splitting them again
+        self.edit(result, "other: int = 5;", "")
+        self.edit(result, "return a;\n}", "return a;\n} other: int = 6;")
+        self.edit(result, "", "first: int = 0;\n")
+
+    def testEditsAcrossTheFile(self):
+        program = "".join("func f{}(x: int): int {{ return x + {}; }}\n".format(i, i) for i in range(50))
+        result = ParseResult.parse(program)
+        random.seed(2)
+        # Edits inside declarations leave their spans to the shift tree
+        literals = list(range(50))
+        for i in range(100):
+            n = random.randrange(50)
+            self.edit(result, "x + {};".format(literals[n]), "x + {};".format(n * 1000 + i))
+            literals[n] = n * 1000 + i
+        self.assertNotEqual(result.tree.deltas, [0] * 50)
+        # Adding a declaration folds the tree into the spans, leaving only
+        # this edit's shift in it
+        added = "func g(): int { return 1; }\n"
+        self.edit(result, "func f10(", added + "func f10(")
+        self.assertEqual([delta for delta in result.tree.deltas if delta != 0], [len(added)])
+        self.edit(result, "return x + {}".format(literals[7]), "return 7 + x")
+
+    def testFindDeclaration(self):
+        result = ParseResult.parse(PROGRAM)
+        self.edit(result, "myNum: int = 1", "myNumber: int = 100")
+        i = result.findDeclaration(result.getText().index("a - 1"))
+        self.assertEqual(result.getNode(i).name, "main")
+        self.assertEqual(result.findDeclaration(result.getText().index("\n\nfunc")), None)
+
+    def testEditThatBreaksTheProgram(self):
+        result = ParseResult.parse(PROGRAM)
+        start = PROGRAM.index("}")
+        with redirect_stdout(io.StringIO()):
+            self.assertRaises(Exception, result.applyEdit, start, start + 1, "")
+
+    def testRandomEdits(self):
+        random.seed(1)
+        result = ParseResult.parse(PROGRAM)
+        replacements = ["1", "x", " ", "\n", "a + 2", "b: int = 3;", "q(1, 2)"]
+        for i in range(200):
+            start = random.randrange(len(result.getText()) + 1)
+            end = min(len(result.getText()), start + random.randrange(3))
+            replacement = random.choice(replacements)
+            text = result.getText()[:start] + replacement + result.getText()[end:]
+            try:
+                with redirect_stdout(io.StringIO()):
+                    Parser(Lexxer(text).lexCompact(), text).parse()
+            except Exception:
+                # Only follow edits that leave a valid program
+                continue
+            result.applyEdit(start, end, replacement)
+            self.assertMatchesFullParse(result)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,351 @@
+from parse import *
+from analyze import *
+from callgraph import *
+from fold import *
+
+# Inlines calls to small functions over the analyzed tree. A function can be
+# inlined if its body is straight-line or branching statements ending in its
+# only return, with an expression, and it isn't part of a recursive cycle.
+# The call is replaced by a copy of the returned expression, and the
+# statements before the return are copied in front of the statement holding
+# the call, along with a declaration for each argument that has to be
+# evaluated exactly once. The callee's locals and those argument temporaries
+# get fresh names with a "." in them, which can't clash with any identifier,
+# and are added to the caller's localVariables.
+#
+# Arguments are still evaluated in order, before the callee's statements.
+# A literal or a local is substituted for its parameter directly, since
+# nothing in the callee can change a caller's local. So is any other
+# argument without effects if its parameter is used at most once and the
+# body is just the return. Anything copied in front of the statement runs
+# before the rest of the statement, so a call is only inlined that way if
+# nothing with an effect, or a read of a global, is evaluated before it.
+# Nothing can be copied in front of a while's condition, which runs on
+# every iteration.
+#
+# The cost of inlining a call is the number of nodes in the callee. A call
+# is inlined if the callee costs at most maxCalleeSize and the total cost so
+# far stays within growthBudget times the size of the program. Functions are
+# visited callees first, so what's copied has had its own calls inlined.
+
+DEFAULT_MAX_CALLEE_SIZE = 40
+DEFAULT_GROWTH_BUDGET = 0.5
+
+class Inliner:
+    def __init__(self, nodes, programDetails, maxCalleeSize = DEFAULT_MAX_CALLEE_SIZE, growthBudget = DEFAULT_GROWTH_BUDGET):
+        self.nodes = nodes
+        self.programDetails = programDetails
+        self.maxCalleeSize = maxCalleeSize
+        self.growthBudget = growthBudget
+        self.globalVariableIds = set(id(variableNode) for variableNode in programDetails.globalVariables.values())
+        # Signature -> number of nodes in the body, or None if it can't be inlined
+        self.calleeSizes = {}
+        self.recursiveFunctions = set()
+        self.currentFunction = None
+        self.budget = 0
+        self.growth = 0
+        self.inlinedCount = 0
+        # Calls left alone because the callee is recursive
+        self.recursiveCount = 0
+        # Calls left alone because they'd go over the budget
+        self.overBudgetCount = 0
+
+    def inline(self):
+        callGraph = CallGraph(self.programDetails)
+        self.recursiveFunctions = callGraph.findRecursiveFunctions()
+        functions = self.programDetails.functions
+        programSize = sum(countNodes(functionDetails.node.statements) for functionDetails in functions.values())
+        self.budget = int(programSize * self.growthBudget)
+        for component in callGraph.stronglyConnectedComponents():
+            for signature in component:
+                self.currentFunction = functions[signature]
+                self.currentFunction.node.statements = self.inlineStatements(self.currentFunction.node.statements)
+        self.currentFunction = None
+
+    def inlineStatements(self, statements):
+        inlined = []
+        for statement in statements:
+            # Statements copied in front of this one
+            hoisted = []
+            if isinstance(statement, (DeclarationNode, ReturnNode)):
+                if statement.expression is not None:
+                    statement.expression = self.inlineExpression(statement.expression, hoisted, True)
+            elif isinstance(statement, IfNode):
+                statement.conditional = self.inlineExpression(statement.conditional, hoisted, True)
+                statement.statements = self.inlineStatements(statement.statements)
+                statement.elseStatements = self.inlineStatements(statement.elseStatements)
+            elif isinstance(statement, WhileNode):
+                statement.conditional = self.inlineExpression(statement.conditional, hoisted, False)
+                statement.statements = self.inlineStatements(statement.statements)
+            elif isinstance(statement, CallNode) and isAssignment(statement):
+                statement.arguments[1] = self.inlineExpression(statement.arguments[1], hoisted, True)
+            elif isinstance(statement, CallNode):
+                statement = self.inlineExpression(statement, hoisted, True)
+            inlined.extend(hoisted)
+            inlined.append(statement)
+        return inlined
+
+    # Returns the expression with calls inlined, appending anything that has
+    # to run first to hoisted. canHoist is whether anything can be. Built
+    # bottom-up with an explicit stack, the same as ConstantFolder.
+    def inlineExpression(self, expression, hoisted, canHoist):
+        values = []
+        # Whether anything evaluated so far has an effect or reads a global
+        impure = False
+        # (node, whether its arguments are done, impure before its arguments)
+        stack = [(expression, False, False)]
+        while len(stack) > 0:
+            node, argumentsDone, impureBefore = stack.pop()
+            if isinstance(node, CallNode):
+                start = 1 if isAssignment(node) else 0
+                argumentCount = len(node.arguments) - start
+                if not argumentsDone:
+                    stack.append((node, True, impure))
+                    for argument in reversed(node.arguments[start:]):
+                        stack.append((argument, False, False))
+                    continue
+                if argumentCount > 0:
+                    node.arguments[start:] = values[len(values) - argumentCount:]
+                    del values[len(values) - argumentCount:]
+                hoistedCount = len(hoisted)
+                replacement = None
+                if node.signature is not None and node.signature not in BUILTINS:
+                    replacement = self.inlineCall(node, hoisted, canHoist, impureBefore)
+                if replacement is None:
+                    values.append(node)
+                    if node.signature not in BUILTINS:
+                        impure = True
+                else:
+                    values.append(replacement)
+                    if len(hoisted) > hoistedCount or not self.isPure(replacement):
+                        impure = True
+            elif isinstance(node, IdentifierNode):
+                if id(node.variable) in self.globalVariableIds:
+                    impure = True
+                values.append(node)
+            else:
+                values.append(node)
+        return values[0]
+
+    # Returns what replaces the call, or None if it can't be inlined here
+    def inlineCall(self, node, hoisted, canHoist, impureBefore):
+        size = self.getCalleeSize(node.signature)
+        if size is None or size > self.maxCalleeSize:
+            return None
+        if node.signature in self.recursiveFunctions:
+            self.recursiveCount += 1
+            return None
+        if self.growth + size > self.budget:
+            self.overBudgetCount += 1
+            return None
+        calleeNode = self.programDetails.functions[node.signature].node
+        body = calleeNode.statements
+        assigned = findAssignedVariables(body)
+        uses = countUses(body)
+        # Parameter -> the argument substituted for it
+        substitutions = {}
+        # Parameters and callee locals -> their renamed VariableNode
+        renames = {}
+        temporaries = []
+        needsHoisting = len(body) > 1
+        hasEffects = len(body) > 1
+        for parameter, argument in zip(calleeNode.parameters, node.arguments):
+            if id(parameter) not in assigned and self.isSimple(argument):
+                substitutions[id(parameter)] = argument
+            elif id(parameter) not in assigned and len(body) == 1 and uses.get(id(parameter), 0) <= 1 and self.isPure(argument):
+                substitutions[id(parameter)] = argument
+            else:
+                variable = self.renameVariable(calleeNode, parameter, renames)
+                temporaries.append(DeclarationNode(variable, argument))
+                needsHoisting = True
+                hasEffects = hasEffects or not self.isPure(argument)
+        if needsHoisting and not canHoist:
+            return None
+        if hasEffects and impureBefore:
+            return None
+        for variable in findDeclaredVariables(body):
+            if id(variable) not in renames:
+                self.renameVariable(calleeNode, variable, renames)
+        hoisted.extend(temporaries)
+        hoisted.extend(cloneStatements(body[:-1], renames, substitutions))
+        self.growth += size
+        self.inlinedCount += 1
+        return cloneExpression(body[-1].expression, renames, substitutions)
+
+    # The size of the callee's body if it's a shape that can be inlined
+    def getCalleeSize(self, signature):
+        if signature in self.calleeSizes:
+            return self.calleeSizes[signature]
+        size = None
+        functionDetails = self.programDetails.functions.get(signature)
+        if functionDetails is not None:
+            body = functionDetails.node.statements
+            if (len(body) > 0 and isinstance(body[-1], ReturnNode) and body[-1].expression is not None
+                    and not containsReturn(body[:-1])):
+                size = countNodes(body)
+        self.calleeSizes[signature] = size
+        return size
+
+    def renameVariable(self, calleeNode, variable, renames):
+        renamed = VariableNode("{}.{}.{}".format(calleeNode.name, variable.name, self.inlinedCount), variable.type)
+        renames[id(variable)] = renamed
+        self.currentFunction.localVariables[renamed.name] = renamed
+        return renamed
+
+    # A literal or a local, which can be copied to every use
+    def isSimple(self, expression):
+        if isinstance(expression, LiteralNode):
+            return True
+        return isinstance(expression, IdentifierNode) and id(expression.variable) not in self.globalVariableIds
+
+    # Only builtin operators over literals and locals
+    def isPure(self, expression):
+        stack = [expression]
+        while len(stack) > 0:
+            node = stack.pop()
+            if isinstance(node, CallNode):
+                if node.signature not in BUILTINS or isAssignment(node):
+                    return False
+                stack.extend(node.arguments)
+            elif isinstance(node, IdentifierNode):
+                if id(node.variable) in self.globalVariableIds:
+                    return False
+        return True
+
+# Number of nodes in the statements, nested ones included
+def countNodes(statements):
+    count = 0
+    stack = list(statements)
+    while len(stack) > 0:
+        node = stack.pop()
+        count += 1
+        if isinstance(node, CallNode):
+            stack.extend(node.arguments)
+        elif isinstance(node, (DeclarationNode, ReturnNode)):
+            if node.expression is not None:
+                stack.append(node.expression)
+        elif isinstance(node, IfNode):
+            stack.append(node.conditional)
+            stack.extend(node.statements)
+            stack.extend(node.elseStatements)
+        elif isinstance(node, WhileNode):
+            stack.append(node.conditional)
+            stack.extend(node.statements)
+    return count
+
+# id() of a variable -> how many identifiers refer to it
+def countUses(statements):
+    uses = {}
+    stack = list(statements)
+    while len(stack) > 0:
+        node = stack.pop()
+        if isinstance(node, IdentifierNode):
+            uses[id(node.variable)] = uses.get(id(node.variable), 0) + 1
+        elif isinstance(node, CallNode):
+            stack.extend(node.arguments)
+        elif isinstance(node, (DeclarationNode, ReturnNode)):
+            if node.expression is not None:
+                stack.append(node.expression)
+        elif isinstance(node, IfNode):
+            stack.append(node.conditional)
+            stack.extend(node.statements)
+            stack.extend(node.elseStatements)
+        elif isinstance(node, WhileNode):
+            stack.append(node.conditional)
+            stack.extend(node.statements)
+    return uses
+
+def findDeclaredVariables(statements):
+    variables = []
+    stack = list(reversed(statements))
+    while len(stack) > 0:
+        statement = stack.pop()
+        if isinstance(statement, DeclarationNode):
+            variables.append(statement.variable)
+        elif isinstance(statement, IfNode):
+            stack.extend(reversed(statement.elseStatements))
+            stack.extend(reversed(statement.statements))
+        elif isinstance(statement, WhileNode):
+            stack.extend(reversed(statement.statements))
+    return variables
+
+def containsReturn(statements):
+    stack = list(statements)
+    while len(stack) > 0:
+        statement = stack.pop()
+        if isinstance(statement, ReturnNode):
+            return True
+        elif isinstance(statement, IfNode):
+            stack.extend(statement.statements)
+            stack.extend(statement.elseStatements)
+        elif isinstance(statement, WhileNode):
+            stack.extend(statement.statements)
+    return False
+
+# Copies of the statements, with renamed variables swapped in and
+# substituted parameters replaced by a copy of their argument
+def cloneStatements(statements, renames, substitutions):
+    clones = []
+    for statement in statements:
+        if isinstance(statement, DeclarationNode):
+            variable = renames.get(id(statement.variable), statement.variable)
+            clones.append(DeclarationNode(variable, cloneExpression(statement.expression, renames, substitutions)))
+        elif isinstance(statement, ReturnNode):
+            expression = statement.expression
+            if expression is not None:
+                expression = cloneExpression(expression, renames, substitutions)
+            clones.append(ReturnNode(expression))
+        elif isinstance(statement, IfNode):
+            clones.append(IfNode(
+                cloneExpression(statement.conditional, renames, substitutions),
+                cloneStatements(statement.statements, renames, substitutions),
+                cloneStatements(statement.elseStatements, renames, substitutions)))
+        elif isinstance(statement, WhileNode):
+            clones.append(WhileNode(
+                cloneExpression(statement.conditional, renames, substitutions),
+                cloneStatements(statement.statements, renames, substitutions)))
+        else:
+            clones.append(cloneExpression(statement, renames, substitutions))
+    return clones
+
+def cloneExpression(expression, renames, substitutions):
+    values = []
+    stack = [(expression, False)]
+    while len(stack) > 0:
+        node, argumentsDone = stack.pop()
+        if isinstance(node, CallNode):
+            if not argumentsDone:
+                stack.append((node, True))
+                for argument in reversed(node.arguments):
+                    stack.append((argument, False))
+                continue
+            arguments = values[len(values) - len(node.arguments):]
+            del values[len(values) - len(node.arguments):]
+            clone = CallNode(node.identifier, arguments, node.pos)
+            clone.signature = node.signature
+            clone.resolvedType = node.resolvedType
+            values.append(clone)
+        elif isinstance(node, IdentifierNode):
+            substitution = substitutions.get(id(node.variable))
+            if substitution is not None:
+                values.append(cloneExpression(substitution, {}, {}))
+                continue
+            variable = renames.get(id(node.variable), node.variable)
+            clone = IdentifierNode(variable.name, node.pos)
+            clone.variable = variable
+            clone.resolvedType = node.resolvedType
+            values.append(clone)
+        elif isinstance(node, LiteralNode):
+            clone = LiteralNode(node.type, node.value)
+            clone.resolvedType = node.resolvedType
+            values.append(clone)
+        else:
+            raise Exception("Can't copy '{}'".format(node))
+    return values[0]
+
+# Inlines calls in the analyzed program in place and returns the Inliner,
+# for its counts
+def inlineCalls(nodes, programDetails, maxCalleeSize = DEFAULT_MAX_CALLEE_SIZE, growthBudget = DEFAULT_GROWTH_BUDGET):
+    inliner = Inliner(nodes, programDetails, maxCalleeSize, growthBudget)
+    inliner.inline()
+    return inliner
@@ -0,0 +1,121 @@
+import unittest
+from lex import *
+from parse import *
+from analyze import *
+from inline import *
+
+def inlineSource(originalString, **options):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    inliner = inlineCalls(nodes, programDetails, **options)
+    return nodes, programDetails, inliner
+
+def findFunction(programDetails, name):
+    for signature, functionDetails in programDetails.functions.items():
+        if signature.name == name:
+            return functionDetails
+
+# Names of the user functions still called in the statements
+def calledNames(statements):
+    return sorted(signature.name for signature in findCallees(FunctionNode("f", "int", [], statements)))
+
+class TestInline(unittest.TestCase):
+    def testExpressionBody(self):
+        nodes, programDetails, inliner = inlineSource("""
+        func add(x: int, y: int): int { return x + y; }
+        func main(): int {
+            a: int = 2;
+            return add(a, 4) * add(a + 1, 5);
+        }""", growthBudget = 10)
+        expression = nodes[1].statements[1].expression
+        expected = CallNode("*", [
+            CallNode("+", [IdentifierNode("a"), LiteralNode("int", 4)]),
+            CallNode("+", [CallNode("+", [IdentifierNode("a"), LiteralNode("int", 1)]), LiteralNode("int", 5)])])
+        self.assertEqual(expression, expected)
+        self.assertEqual(inliner.inlinedCount, 2)
+        # The copies are separate nodes, so later passes can rewrite them in place
+        self.assertIsNot(expression.arguments[0], nodes[0].statements[0].expression)
+
+    def testLocalsRenamed(self):
+        nodes, programDetails, inliner = inlineSource("""
+        func scale(x: int): int {
+            a: int = x * 2;
+            x = a + 1;
+            return x;
+        }
+        func main(): int {
+            a: int = 5;
+            return scale(a) + a;
+        }""", growthBudget = 10)
+        statements = nodes[1].statements
+        self.assertEqual([repr(statement.variable) for statement in statements[1:3]], [
+            "VariableNode(name = 'scale.x.0', type = 'int')",
+            "VariableNode(name = 'scale.a.0', type = 'int')"])
+        self.assertEqual(statements[2].expression, CallNode("*", [IdentifierNode("scale.x.0"), LiteralNode("int", 2)]))
+        self.assertEqual(statements[4].expression, CallNode("+", [IdentifierNode("scale.x.0"), IdentifierNode("a")]))
+        self.assertIs(statements[4].expression.arguments[1].variable, statements[0].variable)
+        localVariables = findFunction(programDetails, "main").localVariables
+        self.assertIn("scale.a.0", localVariables)
+        self.assertIs(localVariables["a"], statements[0].variable)
+
+    def testRecursionRefused(self):
+        nodes, programDetails, inliner = inlineSource("""
+        func self(n: int): int { return self(n - 1); }
+        func ping(n: int): int { return pong(n); }
+        func pong(n: int): int { return ping(n); }
+        func main(): int { return self(1) + ping(2); }""", growthBudget = 10)
+        self.assertEqual(calledNames(nodes[3].statements), ["ping", "self"])
+        self.assertEqual(inliner.inlinedCount, 0)
+        self.assertEqual(inliner.recursiveCount, 5)
+
+    def testBudget(self):
+        originalString = """
+        func add(x: int, y: int): int { return x + y; }
+        func main(): int { return add(1, 2) + add(3, 4); }"""
+        nodes, programDetails, inliner = inlineSource(originalString, growthBudget = 0)
+        self.assertEqual(inliner.inlinedCount, 0)
+        self.assertEqual(inliner.overBudgetCount, 2)
+        nodes, programDetails, inliner = inlineSource(originalString, maxCalleeSize = 3, growthBudget = 10)
+        self.assertEqual(inliner.inlinedCount, 0)
+        nodes, programDetails, inliner = inlineSource(originalString, growthBudget = 10)
+        self.assertEqual(inliner.inlinedCount, 2)
+        self.assertEqual(inliner.growth, 8)
+
+    def testNestedCallsInlinedBottomUp(self):
+        nodes, programDetails, inliner = inlineSource("""
+        func add(x: int, y: int): int { return x + y; }
+        func twice(x: int): int { return add(x, x); }
+        func main(): int { return twice(add(1, 2)); }""", growthBudget = 10)
+        self.assertEqual(calledNames(nodes[2].statements), [])
+        self.assertEqual(nodes[2].statements[-1], ReturnNode(CallNode("+", [IdentifierNode("twice.x.2"), IdentifierNode("twice.x.2")])))
+
+    def testNothingHoistedIntoWhileCondition(self):
+        nodes, programDetails, inliner = inlineSource("""
+        func add(x: int, y: int): int { return x + y; }
+        func double(x: int): int { y: int = x; return y + y; }
+        func main(): int {
+            i: int = 0;
+            while add(i, 1) != double(3) { i = i + 1; }
+            return i;
+        }""", growthBudget = 10)
+        self.assertEqual(calledNames(nodes[2].statements), ["double"])
+
+    def testEffectsKeepTheirOrder(self):
+        nodes, programDetails, inliner = inlineSource("""
+        g: int = 0;
+        func bump(): int { g = g + 1; return g; }
+        func add(x: int, y: int): int { return x + y; }
+        func main(): int {
+            a: int = g + bump();
+            b: int = bump() + g;
+            return add(g, bump());
+        }""", growthBudget = 10)
+        statements = nodes[3].statements
+        # bump() can't run ahead of the read of g before it
+        self.assertEqual(calledNames(statements[:1]), ["bump"])
+        self.assertEqual(statements[1], CallNode("=", [IdentifierNode("g"), CallNode("+", [IdentifierNode("g"), LiteralNode("int", 1)])]))
+        self.assertEqual(statements[2].expression, CallNode("+", [IdentifierNode("g"), IdentifierNode("g")]))
+        self.assertEqual(calledNames(statements[3:]), ["bump"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,686 @@
+from utils import *
+from parse import *
+from analyze import *
+
+# A three-address intermediate representation in SSA form, between the
+# analyzed AST and the backends. A function is a list of basic blocks. Each
+# block starts with its phis, then has straight-line instructions, and ends
+# with exactly one terminator: jump, branch or return. Every value is defined
+# once and carries the type Analyzer resolved for it.
+#
+# SSA is built directly from the AST in one pass with the algorithm from
+# Braun et al., "Simple and Efficient Construction of Static Single
+# Assignment Form" (2013): a read of a local variable looks for its
+# definition in the current block, and otherwise asks the predecessors,
+# placing a phi where they meet. The walk is iterative rather than recursive
+# as in the paper. Blocks whose predecessors aren't all known
+# yet - loop headers, until the loop body has been built - get placeholder
+# phis that are filled in when the block is sealed. Phis that turn out to
+# merge a single value are removed afterwards.
+#
+# Globals live in memory and are read and written with load and store.
+
+# Instructions:
+#   add sub mul div eq ne   result = operands[0] op operands[1]
+#   call                    result = callee (a FunctionSignature) applied to operands
+#   load                    result = the global named name
+#   store                   the global named name = operands[0]
+#   jump                    to targets[0]
+#   branch                  to targets[0] if operands[0] is non-zero, else targets[1]
+#   return                  operands[0] from the function
+BINARY_OPS = ["add", "sub", "mul", "div", "eq", "ne"]
+TERMINATOR_OPS = ["jump", "branch", "return"]
+
+# Builtin operators and the instruction they lower to
+OPERATOR_OPS = {"+": "add", "-": "sub", "*": "mul", "/": "div", "==": "eq", "!=": "ne"}
+
+class Value:
+    __slots__ = ("id", "type")
+
+    def __init__(self, _id, _type):
+        self.id = _id
+        self.type = _type
+
+    def __repr__(self):
+        return "%{}".format(self.id)
+
+class Constant:
+    __slots__ = ("value", "type")
+
+    def __init__(self, value, _type):
+        self.value = value
+        self.type = _type
+
+    def __repr__(self):
+        return str(self.value)
+
+    def __eq__(self, other):
+        return isinstance(other, Constant) and self.value == other.value and self.type == other.type
+
+    def __hash__(self):
+        return hash((self.value, self.type))
+
+class IRInstruction:
+    __slots__ = ("op", "result", "operands", "targets", "name", "callee")
+
+    def __init__(self, op, result = None, operands = None, targets = None, name = None, callee = None):
+        self.op = op
+        self.result = result
+        self.operands = operands or []
+        self.targets = targets or []
+        self.name = name
+        self.callee = callee
+
+    def __repr__(self):
+        return formatInstruction(self)
+
+class Phi:
+    __slots__ = ("result", "incoming")
+
+    def __init__(self, result):
+        self.result = result
+        # (predecessor block, value) pairs
+        self.incoming = []
+
+    def __repr__(self):
+        return formatPhi(self)
+
+class IRBlock:
+    __slots__ = ("id", "phis", "instructions", "predecessors", "sealed")
+
+    def __init__(self, _id):
+        self.id = _id
+        self.phis = []
+        self.instructions = []
+        self.predecessors = []
+        self.sealed = False
+
+    def __repr__(self):
+        return "b{}".format(self.id)
+
+    def terminator(self):
+        if len(self.instructions) == 0 or self.instructions[-1].op not in TERMINATOR_OPS:
+            return None
+        return self.instructions[-1]
+
+    def successors(self):
+        terminator = self.terminator()
+        if terminator is None:
+            return []
+        return terminator.targets
+
+class IRFunction:
+    def __init__(self, signature, parameters):
+        self.signature = signature
+        self.parameters = parameters
+        # The first block is the entry
+        self.blocks = []
+        self.valueCount = len(parameters)
+
+    def __repr__(self):
+        return formatFunction(self)
+
+    def newValue(self, _type):
+        value = Value(self.valueCount, _type)
+        self.valueCount += 1
+        return value
+
+class IRGlobal:
+    def __init__(self, name, _type, value):
+        self.name = name
+        self.type = _type
+        self.value = value
+
+class IRProgram:
+    def __init__(self, globals, functions):
+        self.globals = globals
+        self.functions = functions
+
+    def __repr__(self):
+        return formatProgram(self)
+
+# Builds one function's IR from its analyzed FunctionNode
+class FunctionBuilder:
+    def __init__(self, functionDetails):
+        self.node = functionDetails.node
+        parameters = [Value(i, parameter.type) for i, parameter in enumerate(self.node.parameters)]
+        self.function = IRFunction(functionDetails.signature, parameters)
+        # id() of a local VariableNode -> {block: value it holds at the end of block}
+        self.definitions = {}
+        # Placeholder phis of unsealed blocks, block -> [(variableNode, phi)]
+        self.incompletePhis = {}
+        # Phis whose operands still have to be looked up, (variableNode, phi, block)
+        self.pendingPhis = []
+        # Removed phi results -> the value that replaces them
+        self.replacements = {}
+        self.block = None
+
+    def build(self):
+        entry = self.newBlock()
+        self.seal(entry)
+        self.block = entry
+        for parameter, value in zip(self.node.parameters, self.function.parameters):
+            self.writeVariable(parameter, entry, value)
+        for statement in self.node.statements:
+            self.buildStatement(statement)
+        # Falling off the end returns 0
+        if self.block.terminator() is None:
+            self.emit(IRInstruction("return", operands = [Constant(0, self.function.signature.returnType)]))
+        removeUnreachableBlocks(self.function)
+        self.removeTrivialPhis()
+        renumber(self.function)
+        return self.function
+
+    def newBlock(self):
+        block = IRBlock(len(self.function.blocks))
+        self.function.blocks.append(block)
+        return block
+
+    def emit(self, instruction):
+        self.block.instructions.append(instruction)
+        return instruction.result
+
+    def jump(self, target):
+        self.emit(IRInstruction("jump", targets = [target]))
+        target.predecessors.append(self.block)
+
+    def branch(self, condition, trueTarget, falseTarget):
+        self.emit(IRInstruction("branch", operands = [condition], targets = [trueTarget, falseTarget]))
+        trueTarget.predecessors.append(self.block)
+        falseTarget.predecessors.append(self.block)
+
+    # Anything after a return goes in a block nothing jumps to, which is
+    # removed once the function is built
+    def startUnreachableBlock(self):
+        self.block = self.newBlock()
+        self.seal(self.block)
+
+    def buildStatement(self, node):
+        if isinstance(node, DeclarationNode):
+            self.writeVariable(node.variable, self.block, self.buildExpression(node.expression))
+        elif isinstance(node, ReturnNode):
+            value = Constant(0, self.function.signature.returnType)
+            if node.expression is not None:
+                value = self.buildExpression(node.expression)
+            self.emit(IRInstruction("return", operands = [value]))
+            self.startUnreachableBlock()
+        elif isinstance(node, IfNode):
+            condition = self.buildExpression(node.conditional)
+            thenBlock = self.newBlock()
+            elseBlock = self.newBlock()
+            self.branch(condition, thenBlock, elseBlock)
+            self.seal(thenBlock)
+            self.block = thenBlock
+            for statement in node.statements:
+                self.buildStatement(statement)
+            if len(node.elseStatements) == 0:
+                # The else block is where both paths meet
+                self.jump(elseBlock)
+                self.seal(elseBlock)
+                self.block = elseBlock
+                return
+            thenEnd = self.block
+            self.seal(elseBlock)
+            self.block = elseBlock
+            for statement in node.elseStatements:
+                self.buildStatement(statement)
+            endBlock = self.newBlock()
+            self.jump(endBlock)
+            self.block = thenEnd
+            self.jump(endBlock)
+            self.seal(endBlock)
+            self.block = endBlock
+        elif isinstance(node, WhileNode):
+            header = self.newBlock()
+            self.jump(header)
+            # Not sealed until the loop body has jumped back to it
+            self.block = header
+            condition = self.buildExpression(node.conditional)
+            body = self.newBlock()
+            exit = self.newBlock()
+            self.branch(condition, body, exit)
+            self.seal(body)
+            self.seal(exit)
+            self.block = body
+            for statement in node.statements:
+                self.buildStatement(statement)
+            self.jump(header)
+            self.seal(header)
+            self.block = exit
+        elif isinstance(node, (CallNode, IdentifierNode, LiteralNode)):
+            self.buildExpression(node)
+        else:
+            raise Exception("Can't build IR for '{}'".format(node))
+
+    # Returns the value of the expression. Arguments are built left to right
+    # with an explicit stack, the same as Analyzer.annotate.
+    def buildExpression(self, expression):
+        values = []
+        stack = [(expression, False)]
+        while len(stack) > 0:
+            node, argumentsDone = stack.pop()
+            if isinstance(node, LiteralNode):
+                if node.type != "int":
+                    raise Exception("Can't build IR for a {} literal".format(node.type))
+                values.append(Constant(node.value, node.resolvedType))
+            elif isinstance(node, IdentifierNode):
+                values.append(self.readIdentifier(node))
+            elif isinstance(node, CallNode):
+                arguments = node.arguments
+                # The target of an assignment isn't evaluated
+                if isAssignment(node):
+                    arguments = arguments[1:]
+                if not argumentsDone:
+                    stack.append((node, True))
+                    for argument in reversed(arguments):
+                        stack.append((argument, False))
+                else:
+                    argumentValues = values[len(values) - len(arguments):]
+                    del values[len(values) - len(arguments):]
+                    values.append(self.buildCall(node, argumentValues))
+            else:
+                raise Exception("Can't build IR for '{}'".format(node))
+        return values[0]
+
+    def isLocal(self, variableNode):
+        return id(variableNode) in self.definitions
+
+    def readIdentifier(self, node):
+        if node.variable is None:
+            raise Exception("Can't build IR for unresolved variable '{}'".format(node.value))
+        if self.isLocal(node.variable):
+            return self.readVariable(node.variable, self.block)
+        return self.emit(IRInstruction("load", self.function.newValue(node.resolvedType), name = node.variable.name))
+
+    def buildCall(self, node, argumentValues):
+        if node.signature is None:
+            raise Exception("Can't build IR for unresolved call '{}'".format(node.identifier))
+        if isAssignment(node):
+            value = argumentValues[0]
+            variable = node.arguments[0].variable
+            if self.isLocal(variable):
+                self.writeVariable(variable, self.block, value)
+            else:
+                self.emit(IRInstruction("store", operands = [value], name = variable.name))
+            return value
+        result = self.function.newValue(node.resolvedType)
+        if node.signature in BUILTINS:
+            return self.emit(IRInstruction(OPERATOR_OPS[node.identifier], result, argumentValues))
+        return self.emit(IRInstruction("call", result, argumentValues, callee = node.signature))
+
+    def writeVariable(self, variableNode, block, value):
+        self.definitions.setdefault(id(variableNode), {})[block] = value
+
+    def readVariable(self, variableNode, block):
+        value = self.lookupVariable(variableNode, block)
+        self.fillPendingPhis()
+        return value
+
+    # Finds the variable's value at the end of block, walking back through
+    # single predecessors iteratively rather than recursively, since a
+    # function can have thousands of blocks in a row. A phi placed where
+    # predecessors meet is returned straight away, with its operands left to
+    # fillPendingPhis.
+    def lookupVariable(self, variableNode, block):
+        definitions = self.definitions[id(variableNode)]
+        path = []
+        while definitions.get(block) is None and block.sealed and len(block.predecessors) == 1:
+            path.append(block)
+            block = block.predecessors[0]
+        value = definitions.get(block)
+        if value is None:
+            if not block.sealed:
+                phi = Phi(self.function.newValue(variableNode.type))
+                block.phis.append(phi)
+                self.incompletePhis.setdefault(block, []).append((variableNode, phi))
+                value = phi.result
+            elif len(block.predecessors) == 0:
+                # Read before it's ever written, e.g. declared in only one branch
+                value = Constant(0, variableNode.type)
+            else:
+                phi = Phi(self.function.newValue(variableNode.type))
+                block.phis.append(phi)
+                self.pendingPhis.append((variableNode, phi, block))
+                value = phi.result
+            # Written before the operands are looked up so that loops find the phi
+            definitions[block] = value
+        for pathBlock in path:
+            definitions[pathBlock] = value
+        return value
+
+    def fillPendingPhis(self):
+        while len(self.pendingPhis) > 0:
+            variableNode, phi, block = self.pendingPhis.pop()
+            for predecessor in block.predecessors:
+                phi.incoming.append((predecessor, self.lookupVariable(variableNode, predecessor)))
+
+    def seal(self, block):
+        for variableNode, phi in self.incompletePhis.pop(block, []):
+            self.pendingPhis.append((variableNode, phi, block))
+        block.sealed = True
+        self.fillPendingPhis()
+
+    def resolve(self, value):
+        while value in self.replacements:
+            value = self.replacements[value]
+        return value
+
+    # Removes phis whose operands are all the same value or the phi itself,
+    # repeating since removing one can make others trivial, then rewrites
+    # every use of a removed phi
+    def removeTrivialPhis(self):
+        changed = True
+        while changed:
+            changed = False
+            for block in self.function.blocks:
+                for phi in list(block.phis):
+                    operands = set()
+                    for predecessor, value in phi.incoming:
+                        value = self.resolve(value)
+                        if value is not phi.result:
+                            operands.add(value)
+                    if len(operands) > 1:
+                        continue
+                    replacement = Constant(0, phi.result.type)
+                    if len(operands) == 1:
+                        replacement = operands.pop()
+                    self.replacements[phi.result] = replacement
+                    block.phis.remove(phi)
+                    changed = True
+        for block in self.function.blocks:
+            for phi in block.phis:
+                phi.incoming = [(predecessor, self.resolve(value)) for predecessor, value in phi.incoming]
+            for instruction in block.instructions:
+                instruction.operands = [self.resolve(operand) for operand in instruction.operands]
+
+def removeUnreachableBlocks(function):
+    reachable = set()
+    stack = [function.blocks[0]]
+    while len(stack) > 0:
+        block = stack.pop()
+        if block in reachable:
+            continue
+        reachable.add(block)
+        stack.extend(block.successors())
+    function.blocks = [block for block in function.blocks if block in reachable]
+    for block in function.blocks:
+        block.predecessors = [predecessor for predecessor in block.predecessors if predecessor in reachable]
+        for phi in block.phis:
+            phi.incoming = [(predecessor, value) for predecessor, value in phi.incoming if predecessor in reachable]
+
+# Numbers blocks and values in order, closing the gaps left by removed ones
+def renumber(function):
+    valueCount = len(function.parameters)
+    for blockIndex, block in enumerate(function.blocks):
+        block.id = blockIndex
+        for phi in block.phis:
+            phi.result.id = valueCount
+            valueCount += 1
+        for instruction in block.instructions:
+            if instruction.result is not None:
+                instruction.result.id = valueCount
+                valueCount += 1
+    function.valueCount = valueCount
+
+def lowerFunction(functionDetails):
+    # Blocks point at each other, but anything left over is still collected
+    # once the collector is back on
+    with gcPaused():
+        return FunctionBuilder(functionDetails).build()
+
+# nodes are the analyzed top-level nodes and programDetails what
+# Analyzer.analyze returned for them
+def lowerProgram(nodes, programDetails):
+    globals = []
+    for node in nodes:
+        if isinstance(node, GlobalDeclarationNode):
+            if node.literal.type != "int":
+                raise Exception("Can't build IR for a {} literal".format(node.literal.type))
+            globals.append(IRGlobal(node.variable.name, node.variable.type, node.literal.value))
+    functions = [lowerFunction(functionDetails) for functionDetails in programDetails.functions.values()]
+    return IRProgram(globals, functions)
+
+# Textual form, e.g.
+#   func add(%0: int, %1: int): int {
+#   b0:
+#     %2: int = add %0, %1
+#     return %2
+#   }
+def formatSignature(signature):
+    return "{}({})".format(signature.name, ", ".join(signature.paramTypes))
+
+def formatInstruction(instruction):
+    op = instruction.op
+    operands = ", ".join(repr(operand) for operand in instruction.operands)
+    if op == "call":
+        text = "call {} {}".format(formatSignature(instruction.callee), operands).rstrip()
+    elif op == "load":
+        text = "load @{}".format(instruction.name)
+    elif op == "store":
+        text = "store @{}, {}".format(instruction.name, operands)
+    elif op == "jump":
+        text = "jump {}".format(instruction.targets[0])
+    elif op == "branch":
+        text = "branch {}, {}, {}".format(operands, instruction.targets[0], instruction.targets[1])
+    else:
+        text = "{} {}".format(op, operands)
+    if instruction.result is not None:
+        return "{}: {} = {}".format(instruction.result, instruction.result.type, text)
+    return text
+
+def formatPhi(phi):
+    incoming = ", ".join("[{}: {}]".format(predecessor, value) for predecessor, value in phi.incoming)
+    return "{}: {} = phi {}".format(phi.result, phi.result.type, incoming)
+
+def formatFunction(function):
+    parameters = ", ".join("{}: {}".format(parameter, parameter.type) for parameter in function.parameters)
+    lines = ["func {}({}): {} {{".format(function.signature.name, parameters, function.signature.returnType)]
+    for block in function.blocks:
+        lines.append("{}:".format(block))
+        for phi in block.phis:
+            lines.append("  " + formatPhi(phi))
+        for instruction in block.instructions:
+            lines.append("  " + formatInstruction(instruction))
+    lines.append("}")
+    return "\n".join(lines)
+
+def formatProgram(program):
+    lines = []
+    for irGlobal in program.globals:
+        lines.append("global @{}: {} = {}".format(irGlobal.name, irGlobal.type, irGlobal.value))
+    if len(program.globals) > 0:
+        lines.append("")
+    lines.append("\n\n".join(formatFunction(function) for function in program.functions))
+    return "\n".join(lines) + "\n"
+
+# Immediate dominators, by Cooper, Harvey and Kennedy's iterative algorithm.
+# Returns {block: its immediate dominator}, with the entry mapped to itself.
+def findDominators(function):
+    order = reversePostorder(function)
+    index = dict((block, i) for i, block in enumerate(order))
+    dominators = {order[0]: order[0]}
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            newDominator = None
+            for predecessor in block.predecessors:
+                if predecessor not in dominators:
+                    continue
+                if newDominator is None:
+                    newDominator = predecessor
+                    continue
+                first = predecessor
+                second = newDominator
+                while first is not second:
+                    while index[first] > index[second]:
+                        first = dominators[first]
+                    while index[second] > index[first]:
+                        second = dominators[second]
+                newDominator = first
+            if dominators.get(block) is not newDominator:
+                dominators[block] = newDominator
+                changed = True
+    return dominators
+
+def reversePostorder(function):
+    order = []
+    visited = set()
+    # Entries are (block, index of the next successor to visit)
+    stack = [(function.blocks[0], 0)]
+    visited.add(function.blocks[0])
+    while len(stack) > 0:
+        block, i = stack.pop()
+        successors = block.successors()
+        if i < len(successors):
+            stack.append((block, i + 1))
+            successor = successors[i]
+            if successor not in visited:
+                visited.add(successor)
+                stack.append((successor, 0))
+        else:
+            order.append(block)
+    order.reverse()
+    return order
+
+# Answers "does first dominate second" in constant time, by numbering the
+# dominator tree so that each block's subtree is a contiguous range
+class DominatorTree:
+    def __init__(self, function):
+        self.dominators = findDominators(function)
+        children = {}
+        for block, dominator in self.dominators.items():
+            if dominator is not block:
+                children.setdefault(dominator, []).append(block)
+        self.enter = {}
+        self.exit = {}
+        counter = 0
+        entry = function.blocks[0]
+        # Entries are (block, exiting)
+        stack = [(entry, False)]
+        while len(stack) > 0:
+            block, exiting = stack.pop()
+            if exiting:
+                self.exit[block] = counter
+                continue
+            self.enter[block] = counter
+            counter += 1
+            stack.append((block, True))
+            for child in children.get(block, []):
+                stack.append((child, False))
+
+    def __contains__(self, block):
+        return block in self.enter
+
+    def dominates(self, first, second):
+        return self.enter[first] <= self.enter[second] and self.exit[second] <= self.exit[first]
+
+# Operand counts for the ops that aren't binary, None for any number
+EXPECTED_OPERAND_COUNTS = {"call": None, "load": 0, "store": 1, "jump": 0, "branch": 1, "return": 1}
+
+# Checks the structural rules every pass can rely on, and raises an
+# Exception listing everything that's wrong
+def verifyFunction(function):
+    # The tables built here are all reachable until it returns
+    with gcPaused():
+        checkFunction(function)
+
+def checkFunction(function):
+    errors = []
+    name = formatSignature(function.signature)
+    def error(message):
+        errors.append("{}: {}".format(name, message))
+
+    if len(function.blocks) == 0:
+        error("has no blocks")
+        raise Exception("IR verification failed:\n" + "\n".join(errors))
+    blocks = set(function.blocks)
+    # Where each value is defined: (block, index), with phis at -1 and
+    # parameters at (None, -1)
+    definitions = {}
+    for parameter in function.parameters:
+        definitions[parameter] = (None, -1)
+    for block in function.blocks:
+        for phi in block.phis:
+            if phi.result in definitions:
+                error("{} is defined more than once".format(phi.result))
+            definitions[phi.result] = (block, -1)
+        for i, instruction in enumerate(block.instructions):
+            if instruction.result is not None:
+                if instruction.result in definitions:
+                    error("{} is defined more than once".format(instruction.result))
+                definitions[instruction.result] = (block, i)
+
+    for block in function.blocks:
+        if block.terminator() is None:
+            error("{} doesn't end with a terminator".format(block))
+        for instruction in block.instructions[:-1]:
+            if instruction.op in TERMINATOR_OPS:
+                error("{} has a terminator before its end".format(block))
+        for target in block.successors():
+            if target not in blocks:
+                error("{} jumps to {}, which isn't in the function".format(block, target))
+            elif block not in target.predecessors:
+                error("{} jumps to {} but isn't one of its predecessors".format(block, target))
+        for predecessor in block.predecessors:
+            if predecessor not in blocks or block not in predecessor.successors():
+                error("{} lists {} as a predecessor, which doesn't jump to it".format(block, predecessor))
+    if len(errors) > 0:
+        raise Exception("IR verification failed:\n" + "\n".join(errors))
+
+    dominatorTree = DominatorTree(function)
+    def checkOperand(operand, block, i, describe):
+        if isinstance(operand, Constant):
+            return
+        if not isinstance(operand, Value):
+            error("{} uses {!r}, which isn't a value".format(describe(), operand))
+            return
+        if operand.type is None:
+            error("{} uses {}, which has no type".format(describe(), operand))
+        definition = definitions.get(operand)
+        if definition is None:
+            error("{} uses {}, which is never defined".format(describe(), operand))
+            return
+        definitionBlock, definitionIndex = definition
+        if definitionBlock is None:
+            return
+        if definitionBlock is block:
+            if definitionIndex >= i:
+                error("{} uses {} before it's defined".format(describe(), operand))
+        elif not dominatorTree.dominates(definitionBlock, block):
+            error("{} uses {}, whose definition doesn't dominate it".format(describe(), operand))
+
+    for block in function.blocks:
+        if block not in dominatorTree:
+            error("{} is unreachable".format(block))
+            continue
+        for phi in block.phis:
+            incomingBlocks = [predecessor for predecessor, value in phi.incoming]
+            if sorted(incomingBlocks, key = lambda b: b.id) != sorted(block.predecessors, key = lambda b: b.id):
+                error("{} in {} doesn't have exactly one value per predecessor".format(phi.result, block))
+            for predecessor, value in phi.incoming:
+                # Only has to be available at the end of the predecessor
+                checkOperand(value, predecessor, len(predecessor.instructions), lambda: "phi {} in {}".format(phi.result, block))
+        for i, instruction in enumerate(block.instructions):
+            # Only formatted when there's an error to report
+            describe = lambda: "'{}' in {}".format(formatInstruction(instruction), block)
+            operandCount = 2 if instruction.op in BINARY_OPS else EXPECTED_OPERAND_COUNTS.get(instruction.op, -1)
+            if operandCount == -1:
+                error("{} has an unknown op".format(describe()))
+            elif operandCount is not None and len(instruction.operands) != operandCount:
+                error("{} should have {} operands".format(describe(), operandCount))
+            elif instruction.op == "call" and len(instruction.operands) != len(instruction.callee.paramTypes):
+                error("{} has the wrong number of arguments".format(describe()))
+            hasResult = instruction.op in BINARY_OPS or instruction.op in ("call", "load")
+            if hasResult != (instruction.result is not None):
+                error("{} {} a result".format(describe(), "should have" if hasResult else "shouldn't have"))
+            elif hasResult and instruction.result.type is None:
+                error("{} has no type".format(describe()))
+            for operand in instruction.operands:
+                checkOperand(operand, block, i, describe)
+    if len(errors) > 0:
+        raise Exception("IR verification failed:\n" + "\n".join(errors))
+
+def verifyProgram(program):
+    for function in program.functions:
+        verifyFunction(function)
@@ -0,0 +1,157 @@
+import unittest
+from lex import *
+from parse import *
+from analyze import *
+from ir import *
+
+def lowerSource(originalString):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    program = lowerProgram(nodes, programDetails)
+    verifyProgram(program)
+    return program
+
+class TestIR(unittest.TestCase):
+    def testDump(self):
+        program = lowerSource("""
+        total: int = 5;
+        func add(x: int, y: int): int {
+            return x + y;
+        }
+        func main(): int {
+            total = add(total, 2);
+            return total;
+        }
+        """)
+        expected = """global @total: int = 5
+
+func add(%0: int, %1: int): int {
+b0:
+  %2: int = add %0, %1
+  return %2
+}
+
+func main(): int {
+b0:
+  %0: int = load @total
+  %1: int = call add(int, int) %0, 2
+  store @total, %1
+  %2: int = load @total
+  return %2
+}
+"""
+        self.assertEqual(repr(program), expected)
+
+    def testLoopPhis(self):
+        program = lowerSource("""
+        func count(n: int): int {
+            i: int = 0;
+            unchanged: int = 7;
+            while i != n {
+                i = i + 1;
+            }
+            return i + unchanged;
+        }
+        """)
+        expected = """func count(%0: int): int {
+b0:
+  jump b1
+b1:
+  %1: int = phi [b0: 0], [b2: %3]
+  %2: int = ne %1, %0
+  branch %2, b2, b3
+b2:
+  %3: int = add %1, 1
+  jump b1
+b3:
+  %4: int = add %1, 7
+  return %4
+}"""
+        self.assertEqual(repr(program.functions[0]), expected)
+
+    def testIfJoin(self):
+        function = lowerSource("""
+        func pick(x: int): int {
+            y: int = 1;
+            if x == 0 { y = 2; } else { y = 3; }
+            if x == 1 { y = 4; }
+            return y;
+        }
+        """).functions[0]
+        phis = [phi for block in function.blocks for phi in block.phis]
+        self.assertEqual(len(phis), 2)
+        self.assertEqual(sorted(repr(value) for block, value in phis[0].incoming), ["2", "3"])
+        self.assertEqual(sorted(repr(value) for block, value in phis[1].incoming), sorted([repr(phis[0].result), "4"]))
+
+    def testUnreachableCodeRemoved(self):
+        function = lowerSource("""
+        func early(x: int): int {
+            return x;
+            x = x + 1;
+            return x;
+        }
+        """).functions[0]
+        self.assertEqual(len(function.blocks), 1)
+        self.assertEqual([instruction.op for instruction in function.blocks[0].instructions], ["return"])
+
+    def testTypes(self):
+        function = lowerSource("""
+        flag: bool = 1;
+        func choose(x: int, y: bool): bool {
+            return y;
+        }
+        func main(): int {
+            b: bool = choose(1, flag);
+            return 0;
+        }
+        """).functions[1]
+        call = function.blocks[0].instructions[1]
+        self.assertEqual(call.op, "call")
+        self.assertEqual(call.result.type, "bool")
+        self.assertEqual(function.blocks[0].instructions[0].result.type, "bool")
+
+    def testDeepExpression(self):
+        lowerSource("func deep(x: int): int { return " + "(x + " * 3000 + "1" + ")" * 3000 + "; }")
+
+    def assertVerifyFails(self, function, message):
+        with self.assertRaises(Exception) as context:
+            verifyFunction(function)
+        self.assertIn(message, str(context.exception))
+
+    def testVerifier(self):
+        signature = FunctionSignature("broken", ["int"], "int")
+        parameter = Value(0, "int")
+
+        function = IRFunction(signature, [parameter])
+        entry = IRBlock(0)
+        function.blocks.append(entry)
+        entry.instructions.append(IRInstruction("add", Value(1, "int"), [parameter, Value(2, "int")]))
+        self.assertVerifyFails(function, "doesn't end with a terminator")
+        entry.instructions.append(IRInstruction("return", operands = [parameter]))
+        self.assertVerifyFails(function, "uses %2, which is never defined")
+
+        # A value used in a block its definition doesn't dominate
+        function = IRFunction(signature, [parameter])
+        blocks = [IRBlock(i) for i in range(4)]
+        function.blocks = blocks
+        blocks[0].instructions.append(IRInstruction("branch", operands = [parameter], targets = [blocks[1], blocks[2]]))
+        defined = Value(1, "int")
+        blocks[1].instructions.append(IRInstruction("add", defined, [parameter, Constant(1, "int")]))
+        blocks[1].instructions.append(IRInstruction("jump", targets = [blocks[3]]))
+        blocks[2].instructions.append(IRInstruction("jump", targets = [blocks[3]]))
+        blocks[3].instructions.append(IRInstruction("return", operands = [defined]))
+        for source, target in [(0, 1), (0, 2), (1, 3), (2, 3)]:
+            blocks[target].predecessors.append(blocks[source])
+        self.assertVerifyFails(function, "whose definition doesn't dominate it")
+
+        # Fixed with a phi, then broken again by leaving out a predecessor
+        phi = Phi(Value(2, "int"))
+        phi.incoming = [(blocks[1], defined), (blocks[2], Constant(0, "int"))]
+        blocks[3].phis.append(phi)
+        blocks[3].instructions[0].operands = [phi.result]
+        verifyFunction(function)
+        phi.incoming.pop()
+        self.assertVerifyFails(function, "doesn't have exactly one value per predecessor")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,80 @@
+import re
+from array import array
+from collections import namedtuple
+import itertools
 from utils import *
 
 # TODO: simplify the types here
 
-SYNTAX_IDENTIFIERS = ["func", "if", "else", "while", "return"]
+SYNTAX_IDENTIFIERS = {"func", "if", "else", "while", "return"}
 
-class Token:
-    def __init__(self, _type, value, pos):
-        self.type = _type
-        self.value = value
-        self.pos = pos
+# Integer token kinds. Every piece of syntax gets a kind of its own, so the
+# parser can tell tokens apart without looking at (or comparing) their values.
+KIND_END = 0
+KIND_IDENTIFIER = 1
+KIND_INTEGER_LITERAL = 2
+KIND_STRING_LITERAL = 3
+KIND_FUNC = 4
+KIND_IF = 5
+KIND_ELSE = 6
+KIND_WHILE = 7
+KIND_RETURN = 8
+KIND_LEFT_BRACE = 9
+KIND_RIGHT_BRACE = 10
+KIND_LEFT_PAREN = 11
+KIND_RIGHT_PAREN = 12
+KIND_COLON = 13
+KIND_SEMICOLON = 14
+KIND_COMMA = 15
+KIND_ASSIGN = 16
+KIND_EQUAL = 17
+KIND_NOT_EQUAL = 18
+KIND_NOT = 19
+KIND_PLUS = 20
+KIND_MINUS = 21
+KIND_MULTIPLY = 22
+KIND_DIVIDE = 23
+
+# Value of each syntax kind, and the name used in error messages for the others
+KIND_NAMES = [
+    "end of input", "identifier", "integerLiteral", "stringLiteral",
+    "func", "if", "else", "while", "return",
+    "{", "}", "(", ")", ":", ";", ",",
+    "=", "==", "!=", "!", "+", "-", "*", "/",
+]
+
+SYNTAX_KINDS = {}
+for kind in range(KIND_FUNC, len(KIND_NAMES)):
+    SYNTAX_KINDS[KIND_NAMES[kind]] = kind
+
+TYPE_KINDS = {
+    "identifier": KIND_IDENTIFIER,
+    "integerLiteral": KIND_INTEGER_LITERAL,
+    "stringLiteral": KIND_STRING_LITERAL,
+}
+
+# The type of each kind's tokens
+KIND_TYPES = KIND_NAMES[:KIND_FUNC] + ["syntax"] * (len(KIND_NAMES) - KIND_FUNC)
+
+# A tuple of (kind, value, pos), so the lexer can build every Token in C with
+# tuple.__new__ rather than running an __init__ per token. The type follows
+# from the kind.
+class Token(namedtuple("TokenFields", ["kind", "value", "pos"])):
+    __slots__ = ()
+
+    def __new__(cls, _type, value, pos):
+        if _type == "syntax":
+            kind = SYNTAX_KINDS[value]
+        else:
+            kind = TYPE_KINDS[_type]
+        return tuple.__new__(cls, (kind, value, pos))
+
+    def __getnewargs__(self):
+        return (self.type, self.value, self.pos)
+
+    @property
+    def type(self):
+        return KIND_TYPES[self.kind]
 
     def matchType(self, _type):
         return _type == self.type
@@ -28,94 +94,272 @@ class Token:
                 or self.type == "stringLiteral")
 
     def __eq__(self, other):
-        return isinstance(other, self.__class__) and self.type == other.type and self.value == other.value and self.pos == other.pos
+        return isinstance(other, self.__class__) and self.kind == other.kind and self.value == other.value and self.pos == other.pos
 
     def __repr__(self):
         return "Token(type = '{}', value = '{}', pos = '{}')".format(self.type, self.value, self.pos)
 
+# The compact alternative to a list of Tokens. Instead of an object per token,
+# each token is an index into parallel arrays: its kind, the index of its
+# value in a shared table of identifier names and literal values (-1 for
+# syntax), and the offset of its last character in the source.
+class TokenStream:
+    def __init__(self):
+        self.kinds = array("B")
+        self.values = array("i")
+        self.offsets = array("q")
+        self.constants = []
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def value(self, i):
+        valueIndex = self.values[i]
+        if valueIndex < 0:
+            return KIND_NAMES[self.kinds[i]]
+        return self.constants[valueIndex]
+
+    def position(self, i):
+        return self.offsets[i]
+
+    def toTokens(self):
+        tokens = []
+        for i in range(len(self.kinds)):
+            tokens.append(Token(KIND_TYPES[self.kinds[i]], self.value(i), self.position(i)))
+        return tokens
+
+    @staticmethod
+    def fromTokens(tokens):
+        stream = TokenStream()
+        constantIndices = {}
+        for token in tokens:
+            stream.kinds.append(token.kind)
+            if token.kind >= KIND_FUNC:
+                stream.values.append(-1)
+            else:
+                stream.values.append(stream.intern(token.value, constantIndices))
+            stream.offsets.append(token.pos)
+        return stream
+
+    def intern(self, value, constantIndices):
+        valueIndex = constantIndices.get(value)
+        if valueIndex is None:
+            valueIndex = len(self.constants)
+            constantIndices[value] = valueIndex
+            self.constants.append(value)
+        return valueIndex
+
+# The parser reads tokens through one of the two buffers below. Both hand out
+# an opaque handle per consumed token, which is then used to ask for the
+# token's value or position.
+
+# Reads the columns of a TokenStream directly; handles are token indices.
+class TokenStreamBuffer:
+    def __init__(self, stream):
+        self.i = 0
+        self.stream = stream
+        self.kinds = stream.kinds
+        self.values = stream.values
+        self.constants = stream.constants
+        self.count = len(stream.kinds)
+
+    def remaining(self):
+        return self.count - self.i
+
+    def peekKind(self):
+        if self.i >= self.count:
+            return KIND_END
+        return self.kinds[self.i]
+
+    def consume(self):
+        if self.i >= self.count:
+            return None
+        self.i += 1
+        return self.i - 1
+
+    def value(self, handle):
+        valueIndex = self.values[handle]
+        if valueIndex < 0:
+            return KIND_NAMES[self.kinds[handle]]
+        return self.constants[valueIndex]
+
+    def position(self, handle):
+        return self.stream.offsets[handle]
+
+    def lookbackPosition(self):
+        if self.count == 0:
+            return None
+        return self.stream.offsets[max(self.i - 1, 0)]
+
+    def release(self):
+        pass
+
+# Adapts an ArrayBuffer or StreamBuffer of Tokens; handles are the Tokens.
+class TokenBuffer:
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def remaining(self):
+        return self.buffer.remaining()
+
+    def peekKind(self):
+        token = self.buffer.peek()
+        if token is None:
+            return KIND_END
+        return token.kind
+
+    def consume(self):
+        return self.buffer.consume()
+
+    def value(self, handle):
+        return handle.value
+
+    def position(self, handle):
+        return handle.pos
+
+    def lookbackPosition(self):
+        token = self.buffer.lookback()
+        if token is None:
+            return None
+        return token.pos
+
+    def release(self):
+        self.buffer.release()
+
+# A single master pattern, applied to the whole source at once. Each match is
+# the run of spaces and newlines before a token plus the token itself, so the
+# matches laid end to end cover the source up to its last token, and the
+# offset of each token's last character is a running sum of their lengths.
+# The last alternative catches anything else, syntax included, which is then
+# identified by its text so that an invalid character is reported rather
+# than silently skipped.
+TOKEN_PATTERN = re.compile(r"[ \n]*(?:[A-Za-z_][A-Za-z_0-9]*|[0-9]+|[=!]=|[^ \n])")
+
+# Tokens that aren't syntax are identified by their first character
+FIRST_CHARACTER_KINDS = dict.fromkeys("0123456789", KIND_INTEGER_LITERAL)
+FIRST_CHARACTER_KINDS.update(dict.fromkeys("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_", KIND_IDENTIFIER))
+
+# How much of the input lexStream reads at a time
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# How much of the source lex() and lexCompact() scan at a time. The matches
+# of a piece this size are still in the CPU cache when they're looked up.
+SCAN_CHUNK_SIZE = 64 * 1024
+
+# (start, end) of consecutive pieces of text, each ending just after the
+# first newline at least chunkSize into it, or at the end of text
+def splitText(text, chunkSize):
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start + chunkSize)
+        end = len(text) if end < 0 else end + 1
+        yield start, end
+        start = end
+
+# The offset of the last character of each match's token, when the first
+# match starts at textStart
+def matchOffsets(matches, textStart):
+    return itertools.islice(itertools.accumulate(map(len, matches), initial = textStart - 1), 1, None)
+
 class Lexxer:
     def __init__(self, originalString):
         self.originalString = originalString
-        self.buffer = TrackedStringBuffer(originalString)
 
     def lex(self):
+        text = self.originalString
         tokens = []
-        while self.buffer.remaining() > 0:
-            peek = self.buffer.peek()
-            if peek == " ":
-                self.buffer.consume()
-            elif peek == "\n":
-                self.buffer.consume()
-            elif peek == "{":
-                self.buffer.consume()
-                tokens.append(Token("syntax", "{", self.buffer.position()))
-            elif peek == "}":
-                self.buffer.consume()
-                tokens.append(Token("syntax", "}", self.buffer.position()))
-            elif peek == "(":
-                self.buffer.consume()
-                tokens.append(Token("syntax", "(", self.buffer.position()))
-            elif peek == ")":
-                self.buffer.consume()
-                tokens.append(Token("syntax", ")", self.buffer.position()))
-            elif peek == ":":
-                self.buffer.consume()
-                tokens.append(Token("syntax", ":", self.buffer.position()))
-            elif peek == ";":
-                self.buffer.consume()
-                tokens.append(Token("syntax", ";", self.buffer.position()))
-            elif peek == ",":
-                self.buffer.consume()
-                tokens.append(Token("syntax", ",", self.buffer.position()))
-            elif peek == "=":
-                self.buffer.consume()
-                if self.buffer.peek() == "=":
-                    self.buffer.consume()
-                    tokens.append(Token("syntax", "==", self.buffer.position()))
-                else:
-                    tokens.append(Token("syntax", "=", self.buffer.position()))
-            elif peek == "+":
-                self.buffer.consume()
-                tokens.append(Token("syntax", "+", self.buffer.position()))
-            elif peek == "-":
-                self.buffer.consume()
-                tokens.append(Token("syntax", "-", self.buffer.position()))
-            elif peek == "*":
-                self.buffer.consume()
-                tokens.append(Token("syntax", "*", self.buffer.position()))
-            elif peek == "/":
-                self.buffer.consume()
-                tokens.append(Token("syntax", "/", self.buffer.position()))
-            elif peek == "!":
-                self.buffer.consume()
-                if self.buffer.peek() == "=":
-                    self.buffer.consume()
-                    tokens.append(Token("syntax", "!=", self.buffer.position()))
-                else:
-                    tokens.append(Token("syntax", "!", self.buffer.position()))
-            elif isDigit(peek):
-                tokens.append(self.lexNumberLiteral())
-            elif isIdentifier(peek):
-                tokens.append(self.lexIdentifier())
-            else:
-                displayError(self.originalString, self.buffer.position(), "Unexpected token: '{}'.".format(peek))
-                raise Exception("Syntax error")
+        kinds = {}
+        values = {}
+        # Tokens never form reference cycles
+        with gcPaused():
+            for start, end in splitText(text, SCAN_CHUNK_SIZE):
+                matches = TOKEN_PATTERN.findall(text, start, end)
+                tokens.extend(self.scanMatches(matches, start, kinds, values))
         return tokens
 
-    # TODO: eventually this will support more than integers -- floats, etc
-    def lexNumberLiteral(self):
-        stringValue = ""
-        while self.buffer.remaining() > 0 and isDigit(self.buffer.peek()):
-            stringValue += self.buffer.consume()
-        numberValue = stringToNumber(stringValue)
-        return Token("integerLiteral", numberValue, self.buffer.position())
-
-    def lexIdentifier(self):
-        stringValue = ""
-        while self.buffer.remaining() > 0 and (isIdentifier(self.buffer.peek()) or isDigit(self.buffer.peek())):
-            stringValue += self.buffer.consume()
-        # Doing this for the potential of better syntax highlighting
-        _type = "identifier"
-        if stringValue in SYNTAX_IDENTIFIERS:
-            _type = "syntax"
-        return Token(_type, stringValue, self.buffer.position())
+    # Reads the input file in chunks and yields tokens one chunk at a time, so
+    # neither the whole source nor the whole token list is ever in memory.
+    # Text is only lexed up to the last newline read - a token never spans lines.
+    def lexStream(self, inputFile, chunkSize = STREAM_CHUNK_SIZE):
+        textStart = 0
+        pending = []
+        while True:
+            chunk = inputFile.read(chunkSize)
+            if chunk == "":
+                break
+            pending.append(chunk)
+            if "\n" not in chunk:
+                continue
+            text = "".join(pending)
+            end = text.rindex("\n") + 1
+            pending = [text[end:]]
+            with gcPaused():
+                tokens = list(self.scanMatches(TOKEN_PATTERN.findall(text, 0, end), textStart, {}, {}))
+            yield from tokens
+            textStart += end
+        with gcPaused():
+            tokens = list(self.scanMatches(TOKEN_PATTERN.findall("".join(pending)), textStart, {}, {}))
+        yield from tokens
+
+    # Same tokens as lex(), as a TokenStream instead of a list of Tokens
+    def lexCompact(self):
+        text = self.originalString
+        stream = TokenStream()
+        kinds = {}
+        values = {}
+        constantIndices = {}
+        # Each match's kind and value index as the bytes they take up in the
+        # arrays, so a column is one join rather than an append per token
+        kindBytes = {}
+        valueBytes = {}
+        for start, end in splitText(text, SCAN_CHUNK_SIZE):
+            matches = TOKEN_PATTERN.findall(text, start, end)
+            for match in self.identifyMatches(matches, start, kinds, values):
+                kind = kinds[match]
+                kindBytes[match] = bytes((kind,))
+                if kind >= KIND_FUNC:
+                    valueBytes[match] = array("i", [-1]).tobytes()
+                else:
+                    valueBytes[match] = array("i", [stream.intern(values[match], constantIndices)]).tobytes()
+            stream.kinds.frombytes(b"".join(map(kindBytes.__getitem__, matches)))
+            stream.values.frombytes(b"".join(map(valueBytes.__getitem__, matches)))
+            stream.offsets.extend(matchOffsets(matches, start))
+        return stream
+
+    # Iterates over the Tokens of matches, the first of which starts at
+    # textStart. Each column is looked up per match in the tables
+    # identifyMatches fills, and the Tokens are put together by zip, without a
+    # Python-level step per token.
+    def scanMatches(self, matches, textStart, kinds, values):
+        self.identifyMatches(matches, textStart, kinds, values)
+        columns = zip(map(kinds.__getitem__, matches), map(values.__getitem__, matches), matchOffsets(matches, textStart))
+        return map(tuple.__new__, itertools.repeat(Token), columns)
+
+    # Adds the kind and value of each match that isn't in the tables yet, and
+    # returns those matches
+    def identifyMatches(self, matches, textStart, kinds, values):
+        newMatches = set(matches).difference(kinds)
+        for match in newMatches:
+            value = match.lstrip(" \n")
+            kind = SYNTAX_KINDS.get(value)
+            if kind is None:
+                kind = FIRST_CHARACTER_KINDS.get(value[0])
+                if kind is None:
+                    self.raiseFirstUnexpectedToken(matches, textStart)
+                # TODO: eventually this will support more than integers -- floats, etc
+                if kind == KIND_INTEGER_LITERAL:
+                    value = int(value)
+            kinds[match] = kind
+            values[match] = value
+        return newMatches
+
+    # Reports the first of matches that isn't a token
+    def raiseFirstUnexpectedToken(self, matches, textStart):
+        for match, offset in zip(matches, matchOffsets(matches, textStart)):
+            value = match.lstrip(" \n")
+            if value not in SYNTAX_KINDS and value[0] not in FIRST_CHARACTER_KINDS:
+                self.raiseUnexpectedToken(offset, value)
+
+    def raiseUnexpectedToken(self, offset, value):
+        displayError(self.originalString, offset, "Unexpected token: '{}'.".format(value))
+        raise Exception("Syntax error")
@@ -1,3 +1,5 @@
+import contextlib
+import io
 import unittest
 from lex import *
 
@@ -6,17 +8,70 @@ class TestLex(unittest.TestCase):
         lexxer = Lexxer("if (10 + mynum2 == 12)")
         actual = lexxer.lex()
         expected = [
-            Token("syntax", "if", (0, 1)),
-            Token("syntax", "(", (0, 3)),
-            Token("integerLiteral", 10, (0, 5)),
-            Token("syntax", "+", (0, 7)),
-            Token("identifier", "mynum2", (0, 14)),
-            Token("syntax", "==", (0, 17)),
-            Token("integerLiteral", 12, (0, 20)),
-            Token("syntax", ")", (0, 21)),
+            Token("syntax", "if", 1),
+            Token("syntax", "(", 3),
+            Token("integerLiteral", 10, 5),
+            Token("syntax", "+", 7),
+            Token("identifier", "mynum2", 14),
+            Token("syntax", "==", 17),
+            Token("integerLiteral", 12, 20),
+            Token("syntax", ")", 21),
         ]
 
         self.assertEqual(actual, expected)
 
+    def testMultipleLines(self):
+        lexxer = Lexxer("x: int = 007;\n\n  return x!=y;")
+        actual = lexxer.lex()
+        expected = [
+            Token("identifier", "x", 0),
+            Token("syntax", ":", 1),
+            Token("identifier", "int", 5),
+            Token("syntax", "=", 7),
+            Token("integerLiteral", 7, 11),
+            Token("syntax", ";", 12),
+            Token("syntax", "return", 22),
+            Token("identifier", "x", 24),
+            Token("syntax", "!=", 26),
+            Token("identifier", "y", 27),
+            Token("syntax", ";", 28),
+        ]
+
+        self.assertEqual(actual, expected)
+
+    def testStream(self):
+        originalString = "func main(): int {\n  myNumber: int = 12345;\n  return myNumber != 0;\n}\n"
+        expected = Lexxer(originalString).lex()
+        for chunkSize in [1, 2, 7, 1024]:
+            lexxer = Lexxer(None)
+            actual = list(lexxer.lexStream(io.StringIO(originalString), chunkSize))
+            self.assertEqual(actual, expected)
+
+    def testCompact(self):
+        originalString = "func main(): int {\n  myNumber: int = 12345;\n  return myNumber != 0;\n}\n"
+        expected = Lexxer(originalString).lex()
+        stream = Lexxer(originalString).lexCompact()
+        self.assertEqual(stream.toTokens(), expected)
+        self.assertEqual(stream.kinds[0], KIND_FUNC)
+        self.assertEqual(stream.value(1), "main")
+        self.assertEqual(TokenStream.fromTokens(expected).toTokens(), expected)
+
+    def testManyChunks(self):
+        originalString = "".join("x{}: int = {};\n  return x{} != 0;\n".format(i, i, i) for i in range(5000))
+        self.assertGreater(len(originalString), 2 * SCAN_CHUNK_SIZE)
+        expected = Lexxer(originalString).lex()
+        self.assertEqual(len(expected), 5000 * 11)
+        self.assertEqual(expected[-1], Token("syntax", ";", len(originalString) - 2))
+        self.assertEqual(Lexxer(originalString).lexCompact().toTokens(), expected)
+        self.assertEqual(list(Lexxer(None).lexStream(io.StringIO(originalString), 1000)), expected)
+
+    def testUnexpectedToken(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            with self.assertRaises(Exception):
+                Lexxer("x: int = 1;\n  y $ 2 # 3").lex()
+        self.assertIn("Unexpected token: '$'.", output.getvalue())
+        self.assertIn("----^", output.getvalue())
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,163 @@
+import struct
+from elf import *
+
+# A static linker for the objects encode.py writes, or any x86-64 objects
+# that only use .text and .data and relocations against them. Each object's .text is laid out one after
+# another in a read-only executable segment and each .data in a writable
+# one, then relocations are applied and a static ELF executable written.
+# There's no C runtime: execution starts in a small _start stub that calls
+# main and exits with what it returns as the status.
+#
+# Global symbols go in one table, and each object's local symbols and
+# sections in one of its own, so resolving a symbol is a dictionary lookup
+# however many functions the program has.
+
+PROGRAM_HEADER = struct.Struct("<IIQQQQQQ")
+
+ET_EXEC = 2
+PT_LOAD = 1
+PT_GNU_STACK = 0x6474e551
+PF_X = 0x1
+PF_W = 0x2
+PF_R = 0x4
+
+BASE_ADDRESS = 0x400000
+PAGE_SIZE = 0x1000
+TEXT_ALIGNMENT = 16
+DATA_ALIGNMENT = 8
+
+ENTRY_SYMBOL = "_start"
+
+#   xor ebp, ebp        marks the outermost frame
+#   call main
+#   mov rdi, rax
+#   mov eax, 60         exit
+#   syscall
+START_OBJECT = ObjectFile(
+        b"\x31\xed" + b"\xe8\x00\x00\x00\x00" + b"\x48\x89\xc7" + b"\xb8\x3c\x00\x00\x00" + b"\x0f\x05",
+        b"", [ObjectSymbol(ENTRY_SYMBOL, ".text", 0, isGlobal = True)], [Relocation(3, R_X86_64_PLT32, "main", -4)])
+
+def alignTo(value, alignment):
+    return value + (-value % alignment)
+
+class Linker:
+    # objectFiles are ObjectFiles, see elf.readObjectFile. The start stub is
+    # added unless includeStart is False, in which case one of the objects
+    # has to define _start.
+    def __init__(self, objectFiles, includeStart = True):
+        self.objectFiles = list(objectFiles)
+        if includeStart:
+            self.objectFiles.insert(0, START_OBJECT)
+        self.errors = []
+
+    def link(self):
+        # Where each object's sections go, relative to the start of the
+        # merged ones
+        textOffsets = []
+        dataOffsets = []
+        textSize = 0
+        dataSize = 0
+        for objectFile in self.objectFiles:
+            textSize = alignTo(textSize, TEXT_ALIGNMENT)
+            textOffsets.append(textSize)
+            textSize += len(objectFile.text)
+            dataSize = alignTo(dataSize, DATA_ALIGNMENT)
+            dataOffsets.append(dataSize)
+            dataSize += len(objectFile.data)
+        # A segment for the code, one for data if there is any, and one
+        # marking the stack as not executable
+        segmentCount = 3 if dataSize > 0 else 2
+        headersSize = ELF_HEADER.size + segmentCount * PROGRAM_HEADER.size
+        textAddress = BASE_ADDRESS + alignTo(headersSize, TEXT_ALIGNMENT)
+        textFileOffset = textAddress - BASE_ADDRESS
+        dataFileOffset = alignTo(textFileOffset + textSize, PAGE_SIZE)
+        dataAddress = BASE_ADDRESS + dataFileOffset
+
+        sectionAddresses = []
+        globalAddresses = {}
+        localAddresses = []
+        for objectFile, textOffset, dataOffset in zip(self.objectFiles, textOffsets, dataOffsets):
+            sections = {".text": textAddress + textOffset, ".data": dataAddress + dataOffset}
+            sectionAddresses.append(sections)
+            localSymbols = {}
+            for symbol in objectFile.symbols:
+                if symbol.section is None:
+                    continue
+                if symbol.section not in sections:
+                    self.errors.append("Symbol '{}' is in unsupported section {}".format(symbol.name, symbol.section))
+                    continue
+                address = sections[symbol.section] + symbol.value
+                if not symbol.isGlobal:
+                    localSymbols[symbol.name] = address
+                elif symbol.name in globalAddresses:
+                    self.errors.append("Duplicate symbol '{}'".format(symbol.name))
+                else:
+                    globalAddresses[symbol.name] = address
+            localAddresses.append(localSymbols)
+        if ENTRY_SYMBOL not in globalAddresses:
+            self.errors.append("Undefined symbol '{}'".format(ENTRY_SYMBOL))
+
+        text = bytearray(textSize)
+        data = bytearray(dataSize)
+        for i, objectFile in enumerate(self.objectFiles):
+            text[textOffsets[i]:textOffsets[i] + len(objectFile.text)] = objectFile.text
+            data[dataOffsets[i]:dataOffsets[i] + len(objectFile.data)] = objectFile.data
+        for i, objectFile in enumerate(self.objectFiles):
+            sections = sectionAddresses[i]
+            localSymbols = localAddresses[i]
+            # (relocations, the merged section they patch, where this
+            # object's part of it starts in there and once loaded)
+            targets = [
+                (objectFile.relocations, text, textOffsets[i], textAddress + textOffsets[i]),
+                (objectFile.dataRelocations, data, dataOffsets[i], dataAddress + dataOffsets[i]),
+            ]
+            for relocations, merged, sectionOffset, sectionAddress in targets:
+                for relocation in relocations:
+                    if relocation.symbol in sections:
+                        address = sections[relocation.symbol]
+                    elif relocation.symbol in localSymbols:
+                        address = localSymbols[relocation.symbol]
+                    elif relocation.symbol in globalAddresses:
+                        address = globalAddresses[relocation.symbol]
+                    else:
+                        self.errors.append("Undefined symbol '{}'".format(relocation.symbol))
+                        continue
+                    self.relocate(merged, sectionOffset + relocation.offset, sectionAddress + relocation.offset, relocation, address)
+        if len(self.errors) > 0:
+            raise Exception("Link errors:\n" + "\n".join(self.errors))
+
+        elfHeader = ELF_HEADER.pack(ELF_IDENT, ET_EXEC, EM_X86_64, 1, globalAddresses[ENTRY_SYMBOL], ELF_HEADER.size, 0, 0,
+                ELF_HEADER.size, PROGRAM_HEADER.size, segmentCount, SECTION_HEADER.size, 0, 0)
+        contents = bytearray(elfHeader)
+        textEnd = textFileOffset + textSize
+        # The code's segment maps the headers too
+        contents += PROGRAM_HEADER.pack(PT_LOAD, PF_R | PF_X, 0, BASE_ADDRESS, BASE_ADDRESS, textEnd, textEnd, PAGE_SIZE)
+        if dataSize > 0:
+            contents += PROGRAM_HEADER.pack(PT_LOAD, PF_R | PF_W, dataFileOffset, dataAddress, dataAddress, dataSize, dataSize, PAGE_SIZE)
+        contents += PROGRAM_HEADER.pack(PT_GNU_STACK, PF_R | PF_W, 0, 0, 0, 0, 0, 16)
+        contents += bytes(textFileOffset - len(contents))
+        contents += text
+        if dataSize > 0:
+            contents += bytes(dataFileOffset - len(contents))
+            contents += data
+        return bytes(contents)
+
+    # Patches the relocation at offset into contents, at address once loaded,
+    # with its symbol's address
+    def relocate(self, contents, offset, address, relocation, symbolAddress):
+        value = symbolAddress + relocation.addend
+        if relocation.type == R_X86_64_PC32 or relocation.type == R_X86_64_PLT32:
+            # Without shared libraries there's no PLT, calls go straight to
+            # the function
+            value -= address
+            if value < -(1 << 31) or value >= 1 << 31:
+                self.errors.append("Relocation against '{}' is out of range".format(relocation.symbol))
+                return
+            struct.pack_into("<i", contents, offset, value)
+        elif relocation.type == R_X86_64_64:
+            struct.pack_into("<Q", contents, offset, value & 0xffffffffffffffff)
+        else:
+            self.errors.append("Unsupported relocation type {} against '{}'".format(relocation.type, relocation.symbol))
+
+def linkObjects(objectFiles, includeStart = True):
+    return Linker(objectFiles, includeStart).link()
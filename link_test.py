@@ -0,0 +1,83 @@
+import os
+import platform
+import subprocess
+import tempfile
+import unittest
+from compile_test import PROGRAMS, PRESSURE_PROGRAM, analyzeSource
+from encode import *
+from link import *
+
+def compileObject(originalString):
+    nodes, programDetails = analyzeSource(originalString)
+    return readObjectFile(generateObject(nodes, programDetails))
+
+# Links and runs the objects, returning the exit status
+def runObjects(objectFiles):
+    with tempfile.TemporaryDirectory() as directory:
+        executablePath = os.path.join(directory, "program")
+        with open(executablePath, "wb") as outputFile:
+            outputFile.write(linkObjects(objectFiles))
+        os.chmod(executablePath, 0o755)
+        return subprocess.run([executablePath]).returncode
+
+canRun = platform.system() == "Linux" and platform.machine() == "x86_64"
+
+class TestLink(unittest.TestCase):
+    @unittest.skipIf(not canRun, "needs x86-64 Linux to run executables")
+    def testProgramsRun(self):
+        for originalString, expected in PROGRAMS + [(PRESSURE_PROGRAM, 650)]:
+            with self.subTest(originalString):
+                objectFile = compileObject(originalString + "\nfunc main(): int { return compute(); }")
+                # The exit status is the low byte of what main returns
+                self.assertEqual(runObjects([objectFile]), toInt64(expected) & 0xff)
+
+    @unittest.skipIf(not canRun, "needs x86-64 Linux to run executables")
+    def testObjectsShareGlobalsButNotLocals(self):
+        library = compileObject("total: int = 100; func add(x: int, y: int): int { return x + y + total; }")
+        # Its own total, which mustn't be confused with the library's
+        main = encodeProgram(MachineProgram([MachineFunction("main", [
+            MachineInstruction("push", ("rbp",)),
+            MachineInstruction("mov", ("rdi", Immediate(40))),
+            MachineInstruction("mov", ("rsi", GlobalMemory("total"))),
+            MachineInstruction("call", (Symbol("add"),)),
+            MachineInstruction("pop", ("rbp",)),
+            MachineInstruction("ret", ()),
+        ])], [("total", 2)]))
+        self.assertEqual(runObjects([library, main]), 142)
+        self.assertEqual(runObjects([main, library]), 142)
+
+    def testErrors(self):
+        objectFile = compileObject("func main(): int { return 0; }")
+        with self.assertRaisesRegex(Exception, "Duplicate symbol 'main'"):
+            linkObjects([objectFile, objectFile])
+        with self.assertRaisesRegex(Exception, "Undefined symbol 'main'"):
+            linkObjects([])
+        with self.assertRaisesRegex(Exception, "Undefined symbol '_start'"):
+            linkObjects([objectFile], includeStart = False)
+
+    def testLayout(self):
+        executable = linkObjects([compileObject("counter: int = 3; func main(): int { return counter; }")])
+        header = ELF_HEADER.unpack_from(executable)
+        self.assertEqual(header[1], ET_EXEC)
+        # _start comes first, right after the headers
+        self.assertEqual(header[4], BASE_ADDRESS + alignTo(ELF_HEADER.size + 3 * PROGRAM_HEADER.size, TEXT_ALIGNMENT))
+        segments = [PROGRAM_HEADER.unpack_from(executable, ELF_HEADER.size + i * PROGRAM_HEADER.size) for i in range(header[10])]
+        self.assertEqual([(segment[0], segment[1]) for segment in segments], [(PT_LOAD, PF_R | PF_X), (PT_LOAD, PF_R | PF_W), (PT_GNU_STACK, PF_R | PF_W)])
+        dataOffset = segments[1][2]
+        self.assertEqual(executable[dataOffset:dataOffset + 8], (3).to_bytes(8, "little"))
+
+    def testDataRelocations(self):
+        library = compileObject("func add(x: int, y: int): int { return x + y; }")
+        main = compileObject("func main(): int { return 0; }")
+        # A table holding add's address, as "dq add" assembles to
+        table = ObjectFile(b"", bytes(8), [ObjectSymbol("table", ".data", 0, isGlobal = True)], dataRelocations = [Relocation(0, R_X86_64_64, "add", 0)])
+        executable = linkObjects([library, main, readObjectFile(writeObjectFile(table))])
+        header = ELF_HEADER.unpack_from(executable)
+        segments = [PROGRAM_HEADER.unpack_from(executable, ELF_HEADER.size + i * PROGRAM_HEADER.size) for i in range(header[10])]
+        dataOffset = segments[1][2]
+        # The library comes right after _start
+        address = header[4] + alignTo(len(START_OBJECT.text), TEXT_ALIGNMENT) + library.findSymbol("add").value
+        self.assertEqual(executable[dataOffset:dataOffset + 8], address.to_bytes(8, "little"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,271 @@
+from parse import *
+from analyze import *
+from fold import *
+from inline import *
+
+# Loop optimizations over the analyzed tree. Whiles are visited innermost
+# first, and each gets two things done to it:
+#
+# Loop-invariant expressions are hoisted: a builtin operator call whose value
+# can't change while the loop runs is computed once, into a new local
+# declared just before the while, and the loop reads the local instead. An
+# operand is invariant if it's a literal, a local that isn't declared or
+# assigned anywhere in the loop, or a global that isn't assigned in it when
+# the loop calls no user functions, since any of them could assign it. Only
+# the largest invariant calls are hoisted, and never =. A division is only
+# hoisted when its divisor is a literal other than 0 and -1, as otherwise it
+# could trap where the loop body never ran it. Hoisted locals get a name with
+# a "." in it, which can't clash with any identifier.
+#
+# Loops with a provable trip count are unrolled: the condition is i != N
+# with N a literal, i is a local given a literal value by the statement that
+# last writes it before the while, and the body's only write to i is one
+# i = i + c or i = i - c at its top level, so it runs exactly once per
+# iteration. If the body stepped that many times lands exactly on N, the
+# loop runs (N - start) / c times, and when that many copies of the body fit
+# in the budget, counted in nodes, the while is replaced by the copies.
+# Otherwise the body is repeated the largest number of times in
+# UNROLL_FACTORS that fits and divides the trip count, saving the test and
+# jump in between.
+#
+# Locals belong to the whole function, so copies of a body declaring a
+# local just write it again.
+
+DEFAULT_UNROLL_BUDGET = 100
+UNROLL_FACTORS = [8, 4, 2]
+
+class LoopOptimizer:
+    def __init__(self, nodes, programDetails, unrollBudget = DEFAULT_UNROLL_BUDGET):
+        self.nodes = nodes
+        self.programDetails = programDetails
+        self.unrollBudget = unrollBudget
+        self.globalVariableIds = set(id(variableNode) for variableNode in programDetails.globalVariables.values())
+        self.currentFunction = None
+        # Expressions moved out of loops
+        self.hoistedCount = 0
+        # Loops replaced by copies of their body
+        self.unrolledCount = 0
+        # Loops whose body was repeated inside them
+        self.partiallyUnrolledCount = 0
+
+    def optimize(self):
+        for functionDetails in self.programDetails.functions.values():
+            self.currentFunction = functionDetails
+            functionDetails.node.statements = self.optimizeStatements(functionDetails.node.statements)
+        self.currentFunction = None
+
+    def optimizeStatements(self, statements):
+        optimized = []
+        for statement in statements:
+            if isinstance(statement, IfNode):
+                statement.statements = self.optimizeStatements(statement.statements)
+                statement.elseStatements = self.optimizeStatements(statement.elseStatements)
+            elif isinstance(statement, WhileNode):
+                statement.statements = self.optimizeStatements(statement.statements)
+                optimized.extend(self.hoistInvariants(statement))
+                unrolled = self.unroll(statement, optimized)
+                if unrolled is not None:
+                    optimized.extend(unrolled)
+                    continue
+            optimized.append(statement)
+        return optimized
+
+    # Returns declarations of the hoisted expressions, to go before the loop
+    def hoistInvariants(self, loop):
+        self.assigned = findAssignedVariables([loop])
+        self.callsFunctions = containsUserCall(loop)
+        hoisted = []
+        loop.conditional = self.hoistExpression(loop.conditional, hoisted)
+        self.hoistFromStatements(loop.statements, hoisted)
+        return hoisted
+
+    # Inner loops have already had anything invariant in this loop hoisted
+    # out of them, since it's invariant in them too
+    def hoistFromStatements(self, statements, hoisted):
+        for statement in statements:
+            if isinstance(statement, (DeclarationNode, ReturnNode)):
+                if statement.expression is not None:
+                    statement.expression = self.hoistExpression(statement.expression, hoisted)
+            elif isinstance(statement, IfNode):
+                statement.conditional = self.hoistExpression(statement.conditional, hoisted)
+                self.hoistFromStatements(statement.statements, hoisted)
+                self.hoistFromStatements(statement.elseStatements, hoisted)
+            elif isinstance(statement, CallNode) and isAssignment(statement):
+                statement.arguments[1] = self.hoistExpression(statement.arguments[1], hoisted)
+            elif isinstance(statement, CallNode):
+                self.hoistExpression(statement, hoisted)
+
+    # Returns the expression with its largest invariant calls replaced by
+    # locals, appending their declarations to hoisted. Built bottom-up with
+    # an explicit stack, the same as Inliner.inlineExpression.
+    def hoistExpression(self, expression, hoisted):
+        # (node, whether it's invariant)
+        values = []
+        stack = [(expression, False)]
+        while len(stack) > 0:
+            node, argumentsDone = stack.pop()
+            if isinstance(node, CallNode):
+                if not argumentsDone:
+                    stack.append((node, True))
+                    for argument in reversed(node.arguments):
+                        stack.append((argument, False))
+                    continue
+                arguments = values[len(values) - len(node.arguments):]
+                del values[len(values) - len(node.arguments):]
+                invariant = (node.signature in BUILTINS and not isAssignment(node)
+                        and all(argumentInvariant for argument, argumentInvariant in arguments) and not self.mayTrap(node))
+                if not invariant:
+                    # Its invariant arguments are as large as they get
+                    for i, (argument, argumentInvariant) in enumerate(arguments):
+                        if argumentInvariant and isinstance(argument, CallNode):
+                            node.arguments[i] = self.hoist(argument, hoisted)
+                values.append((node, invariant))
+            elif isinstance(node, IdentifierNode):
+                values.append((node, self.isInvariantVariable(node.variable)))
+            else:
+                values.append((node, True))
+        node, invariant = values[0]
+        if invariant and isinstance(node, CallNode):
+            return self.hoist(node, hoisted)
+        return node
+
+    def hoist(self, expression, hoisted):
+        variable = VariableNode("loop.{}".format(self.hoistedCount), expression.resolvedType)
+        self.hoistedCount += 1
+        self.currentFunction.localVariables[variable.name] = variable
+        hoisted.append(DeclarationNode(variable, expression))
+        identifier = IdentifierNode(variable.name)
+        identifier.variable = variable
+        identifier.resolvedType = expression.resolvedType
+        return identifier
+
+    def isInvariantVariable(self, variable):
+        if id(variable) in self.assigned:
+            return False
+        return id(variable) not in self.globalVariableIds or not self.callsFunctions
+
+    # Division by anything but a literal other than 0 and -1 can trap
+    def mayTrap(self, node):
+        if node.identifier != "/":
+            return False
+        divisor = node.arguments[1]
+        return not isinstance(divisor, LiteralNode) or divisor.value in (0, -1)
+
+    def formatReport(self):
+        return "Loop optimization: {} expressions hoisted, {} loops unrolled, {} partially unrolled".format(
+            self.hoistedCount, self.unrolledCount, self.partiallyUnrolledCount)
+
+    # Returns what replaces the loop, or None to keep it as it is
+    def unroll(self, loop, preceding):
+        tripCount = self.findTripCount(loop, preceding)
+        if tripCount is None:
+            return None
+        size = countNodes(loop.statements)
+        if tripCount * size <= self.unrollBudget:
+            self.unrolledCount += 1
+            copies = []
+            for i in range(tripCount):
+                copies.extend(cloneStatements(loop.statements, {}, {}))
+            return copies
+        for factor in UNROLL_FACTORS:
+            if tripCount % factor == 0 and factor * size <= self.unrollBudget:
+                self.partiallyUnrolledCount += 1
+                body = []
+                for i in range(factor):
+                    body.extend(cloneStatements(loop.statements, {}, {}))
+                loop.statements = body
+                return [loop]
+        return None
+
+    # How many times the loop runs, if it can be proven from the statements
+    # before it, else None
+    def findTripCount(self, loop, preceding):
+        condition = loop.conditional
+        if not isinstance(condition, CallNode) or condition.signature not in BUILTINS or condition.identifier != "!=":
+            return None
+        counter, end = condition.arguments
+        if isinstance(counter, LiteralNode):
+            counter, end = end, counter
+        if not isinstance(counter, IdentifierNode) or not isIntLiteral(end) or id(counter.variable) in self.globalVariableIds:
+            return None
+        variable = counter.variable
+        # A return at the top level of the body ends the first iteration
+        if any(isinstance(statement, ReturnNode) for statement in loop.statements):
+            return None
+        steps = [statement for statement in loop.statements if isAssignmentTo(statement, variable)]
+        if len(steps) != 1:
+            return None
+        others = [statement for statement in loop.statements if statement is not steps[0]]
+        if id(variable) in findAssignedVariables(others):
+            return None
+        step = findStep(steps[0], variable)
+        start = findStartValue(variable, preceding)
+        if step is None or start is None:
+            return None
+        distance = end.value - start
+        if distance % step != 0 or distance // step < 0:
+            return None
+        return distance // step
+
+def isIntLiteral(node):
+    return isinstance(node, LiteralNode) and node.type == "int"
+
+def isAssignmentTo(statement, variable):
+    return isinstance(statement, CallNode) and isAssignment(statement) and statement.arguments[0].variable is variable
+
+# c for variable = variable + c, variable = c + variable or -c for
+# variable = variable - c, where c is a literal other than 0
+def findStep(assignment, variable):
+    expression = assignment.arguments[1]
+    if not isinstance(expression, CallNode) or expression.signature not in BUILTINS:
+        return None
+    left, right = expression.arguments
+    if expression.identifier == "+" and isIntLiteral(left):
+        left, right = right, left
+    if not isinstance(left, IdentifierNode) or left.variable is not variable or not isIntLiteral(right) or right.value == 0:
+        return None
+    if expression.identifier == "+":
+        return right.value
+    if expression.identifier == "-":
+        return -right.value
+    return None
+
+# The literal variable holds after the statements, if the last one to write
+# it does so at the top level
+def findStartValue(variable, statements):
+    for statement in reversed(statements):
+        if isinstance(statement, DeclarationNode) and statement.variable is variable:
+            return statement.expression.value if isIntLiteral(statement.expression) else None
+        if isAssignmentTo(statement, variable):
+            return statement.arguments[1].value if isIntLiteral(statement.arguments[1]) else None
+        if id(variable) in findAssignedVariables([statement]):
+            return None
+    return None
+
+# Whether the loop calls anything but a builtin, in its condition or body
+def containsUserCall(loop):
+    stack = [loop]
+    while len(stack) > 0:
+        node = stack.pop()
+        if isinstance(node, CallNode):
+            if node.signature not in BUILTINS:
+                return True
+            stack.extend(node.arguments)
+        elif isinstance(node, (DeclarationNode, ReturnNode)):
+            if node.expression is not None:
+                stack.append(node.expression)
+        elif isinstance(node, IfNode):
+            stack.append(node.conditional)
+            stack.extend(node.statements)
+            stack.extend(node.elseStatements)
+        elif isinstance(node, WhileNode):
+            stack.append(node.conditional)
+            stack.extend(node.statements)
+    return False
+
+# Optimizes the loops in the analyzed program in place and returns the
+# LoopOptimizer, for its counts
+def optimizeLoops(nodes, programDetails, unrollBudget = DEFAULT_UNROLL_BUDGET):
+    optimizer = LoopOptimizer(nodes, programDetails, unrollBudget)
+    optimizer.optimize()
+    return optimizer
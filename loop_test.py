@@ -0,0 +1,264 @@
+import contextlib
+import io
+import os
+import tempfile
+import unittest
+import cli
+from lex import *
+from parse import *
+from analyze import *
+from loop import *
+from vm import *
+from compile_test import PROGRAMS, PRESSURE_PROGRAM
+
+def loopSource(originalString, **options):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    optimizer = optimizeLoops(nodes, programDetails, **options)
+    return nodes, programDetails, optimizer
+
+# What compute() returns on the VM and how many instructions that took
+def runOnVM(nodes, programDetails, arguments):
+    program = compileBytecode(nodes, programDetails)
+    machine = VirtualMachine(program)
+    result = machine.call(program.findFunction("compute", ["int"] * len(arguments)), arguments)
+    return result, machine.executedCount
+
+# Runs compute() with and without the pass, checking they agree, and
+# returns the optimizer and both instruction counts
+def compareOnVM(originalString, arguments = [], **options):
+    nodes, programDetails, optimizer = loopSource(originalString, **options)
+    result, optimizedCount = runOnVM(nodes, programDetails, arguments)
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    expected, plainCount = runOnVM(nodes, programDetails, arguments)
+    if result != expected:
+        raise Exception("Loop optimization changed the result: {} and {}".format(expected, result))
+    return optimizer, plainCount, optimizedCount
+
+def findWhiles(statements):
+    whiles = []
+    stack = list(statements)
+    while len(stack) > 0:
+        statement = stack.pop()
+        if isinstance(statement, IfNode):
+            stack.extend(statement.statements)
+            stack.extend(statement.elseStatements)
+        elif isinstance(statement, WhileNode):
+            whiles.append(statement)
+            stack.extend(statement.statements)
+    return whiles
+
+def findLocals(programDetails):
+    for functionDetails in programDetails.functions.values():
+        return functionDetails.localVariables
+
+class TestLoop(unittest.TestCase):
+    def testHoisting(self):
+        optimizer, plainCount, optimizedCount = compareOnVM("""
+        scale: int = 3;
+        func compute(n: int): int {
+            total: int = 0;
+            i: int = 0;
+            while i != n {
+                total = total + (scale * n + 7) / 5 + i * (n - 1);
+                i = i + 1;
+            }
+            return total;
+        }""", [50])
+        # scale * n + 7 / 5 and n - 1
+        self.assertEqual(optimizer.hoistedCount, 2)
+        self.assertLess(optimizedCount, plainCount)
+        nodes, programDetails, optimizer = loopSource("func compute(n: int): int { i: int = 0; while i != n { i = i + n * 2; } return i; }")
+        statements = nodes[0].statements
+        self.assertIsInstance(statements[1], DeclarationNode)
+        self.assertEqual(statements[1].variable.name, "loop.0")
+        self.assertIn("loop.0", findLocals(programDetails))
+        self.assertIs(statements[2].statements[0].arguments[1].arguments[1].variable, statements[1].variable)
+
+    def testAssignedNotHoisted(self):
+        nodes, programDetails, optimizer = loopSource("""
+        func compute(n: int): int {
+            i: int = 0;
+            x: int = 1;
+            while i != n {
+                t: int = n * 2;
+                x = x + t * 3;
+                if x == 4 { n = n + 1; }
+                i = i + 1;
+            }
+            return x;
+        }""")
+        self.assertEqual(optimizer.hoistedCount, 0)
+
+    def testGlobalsAndCalls(self):
+        source = """
+        g: int = 2;
+        func bump(): int { g = g + 1; return 0; }
+        func compute(n: int): int {
+            i: int = 0;
+            x: int = 0;
+            while i != n {
+                x = x + g * 10 + bump() * (n + 1);
+                i = i + 1;
+            }
+            return x;
+        }"""
+        # Only n + 1, as bump() could change g
+        optimizer, plainCount, optimizedCount = compareOnVM(source, [5])
+        self.assertEqual(optimizer.hoistedCount, 1)
+        optimizer, plainCount, optimizedCount = compareOnVM(source.replace("bump() * ", ""), [5])
+        self.assertEqual(optimizer.hoistedCount, 2)
+        optimizer, plainCount, optimizedCount = compareOnVM("""
+        g: int = 2;
+        func compute(n: int): int {
+            i: int = 0;
+            while i != n { g = g * 3 + 1; i = i + 1; }
+            return g;
+        }""", [5])
+        self.assertEqual(optimizer.hoistedCount, 0)
+
+    def testTrappingDivisionNotHoisted(self):
+        # A loop that never runs mustn't divide by n
+        source = """
+        func compute(n: int): int {
+            i: int = 0;
+            x: int = 0;
+            while i != n { x = x + 100 / n + n / 4 + n / 0; i = i + 1; }
+            return x;
+        }"""
+        optimizer, plainCount, optimizedCount = compareOnVM(source, [0])
+        self.assertEqual(optimizer.hoistedCount, 1)
+
+    def testFullUnroll(self):
+        optimizer, plainCount, optimizedCount = compareOnVM("""
+        func compute(n: int): int {
+            total: int = n;
+            i: int = 10;
+            while 0 != i {
+                t: int = total * 3;
+                total = t + i;
+                i = i - 2;
+            }
+            j: int = 7;
+            while j != 7 { total = 0; j = j + 1; }
+            return total;
+        }""", [4])
+        self.assertEqual(optimizer.unrolledCount, 2)
+        self.assertLess(optimizedCount, plainCount)
+        nodes, programDetails, optimizer = loopSource("func compute(): int { i: int = 0; x: int = 0; while i != 3 { x = x + i; i = i + 1; } return x; }")
+        self.assertEqual(findWhiles(nodes[0].statements), [])
+        self.assertEqual(countNodes(nodes[0].statements), 4 + 3 * 10 + 2)
+
+    def testPartialUnroll(self):
+        source = """
+        func compute(n: int): int {
+            i: int = 0;
+            x: int = n;
+            while i != 1000 {
+                x = x * 31 + i;
+                i = i + 1;
+            }
+            return x;
+        }"""
+        optimizer, plainCount, optimizedCount = compareOnVM(source, [3])
+        self.assertEqual(optimizer.partiallyUnrolledCount, 1)
+        self.assertLess(optimizedCount, plainCount)
+        nodes, programDetails, optimizer = loopSource(source)
+        self.assertEqual(len(findWhiles(nodes[0].statements)[0].statements), 16)
+        # Nothing fits the budget
+        nodes, programDetails, optimizer = loopSource(source, unrollBudget = 10)
+        self.assertEqual(len(findWhiles(nodes[0].statements)[0].statements), 2)
+        nodes, programDetails, optimizer = loopSource(source.replace("1000", "999"))
+        self.assertEqual(len(findWhiles(nodes[0].statements)[0].statements), 2)
+
+    def testUnprovableNotUnrolled(self):
+        loops = [
+            # Unknown start
+            "i: int = n; while i != 4 { x = x + 1; i = i + 1; }",
+            "i: int = 0; if n == 1 { i = 2; } while i != 4 { x = x + 1; i = i + 1; }",
+            # The step doesn't run on every iteration
+            "i: int = 0; while i != 4 { if x == 1 { i = i + 1; } i = i + 1; }",
+            "i: int = 0; while i != 4 { if x == 1 { i = i + 1; } else { i = i + 1; } }",
+            # Not a literal end or step
+            "i: int = 0; while i != n { x = x + 1; i = i + 1; }",
+            "i: int = 0; while i != 4 { x = x + 1; i = i + n; }",
+            "i: int = 0; while i != 4 { x = x + 1; i = i * 2; }",
+            # Steps past the end
+            "i: int = 0; while i != 5 { x = x + 1; i = i + 2; }",
+            "i: int = 0; while i != 5 { x = x + 1; i = i - 1; }",
+            # Ends the first iteration
+            "i: int = 0; while i != 4 { i = i + 1; return x; }",
+        ]
+        for loop in loops:
+            with self.subTest(loop):
+                nodes, programDetails, optimizer = loopSource("func compute(n: int): int { x: int = 0; " + loop + " return x; }")
+                self.assertEqual(optimizer.unrolledCount + optimizer.partiallyUnrolledCount, 0)
+
+    def testNestedLoops(self):
+        optimizer, plainCount, optimizedCount = compareOnVM("""
+        func compute(n: int): int {
+            total: int = 0;
+            i: int = 0;
+            while i != n {
+                j: int = 0;
+                while j != 4 {
+                    total = total + (n * 5 + 1) * j;
+                    j = j + 1;
+                }
+                i = i + 1;
+            }
+            return total;
+        }""", [20])
+        self.assertEqual(optimizer.unrolledCount, 1)
+        self.assertLess(optimizedCount * 2, plainCount)
+
+    def testProgramsAgree(self):
+        for originalString, expected in PROGRAMS + [(PRESSURE_PROGRAM, 650)]:
+            for unrollBudget in (0, DEFAULT_UNROLL_BUDGET, 1000):
+                with self.subTest(originalString, unrollBudget = unrollBudget):
+                    nodes, programDetails, optimizer = loopSource(originalString, unrollBudget = unrollBudget)
+                    self.assertEqual(runOnVM(nodes, programDetails, [])[0], toInt64(expected))
+
+    def testFoldAfterUnroll(self):
+        # The copy for i = 0 divides by zero, but its guard never lets it run
+        source = """
+        func main(): int {
+            i: int = 0 - 2;
+            x: int = 0;
+            while i != 1 {
+                if i != 0 { x = x + 10 / i; }
+                i = i + 1;
+            }
+            return x;
+        }"""
+        with tempfile.TemporaryDirectory() as directory:
+            sourcePath = os.path.join(directory, "program.ul")
+            with open(sourcePath, "w") as outputFile:
+                outputFile.write(source)
+            for flags in ([], ["--fold", "--loops", "--report-loops"]):
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    self.assertEqual(cli.main(["run", sourcePath] + flags), 0)
+                self.assertEqual(output.getvalue().split("\n")[-2:], ["-15", ""])
+        self.assertIn("1 loops unrolled", output.getvalue())
+
+    def testCli(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sourcePath = os.path.join(directory, "program.ul")
+            with open(sourcePath, "w") as outputFile:
+                outputFile.write("""
+                func main(): int {
+                    i: int = 0;
+                    x: int = 0;
+                    while i != 4 { x = x + i * 2; i = i + 1; }
+                    return x;
+                }""")
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                self.assertEqual(cli.main(["run", sourcePath, "--report-loops", "--fold"]), 0)
+        self.assertEqual(output.getvalue().split("\n")[1:], ["12", ""])
+        self.assertIn("1 loops unrolled", output.getvalue())
+
+if __name__ == "__main__":
+    unittest.main()
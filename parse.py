@@ -1,11 +1,20 @@
 from utils import *
+from lex import *
 
 # Only include position information on nodes where it'll be helpful further down the pipeline.
 
+# resolvedType, signature and variable are filled in by Analyzer.annotate.
+
+# Nodes are slotted since large programs have millions of them. See arena.py
+# for an even more compact flat representation.
+
 class LiteralNode:
+    __slots__ = ("type", "value", "resolvedType")
+
     def __init__(self, _type, value):
         self.type = _type
         self.value = value
+        self.resolvedType = None
 
     def __repr__(self):
         return "LiteralNode(type = '{}', value = '{}')".format(self.type, self.value)
@@ -16,10 +25,14 @@ class LiteralNode:
                 and self.value == other.value)
 
 class CallNode:
+    __slots__ = ("identifier", "arguments", "pos", "resolvedType", "signature")
+
     def __init__(self, identifier, arguments, pos = None):
         self.identifier = identifier
         self.arguments = arguments
         self.pos = pos
+        self.resolvedType = None
+        self.signature = None
 
     def __repr__(self):
         return "CallNode(identifier = '{}', arguments = '{}', pos = '{}')".format(self.identifier, self.arguments, self.pos)
@@ -31,6 +44,8 @@ class CallNode:
                 and self.arguments == other.arguments)
 
 class IfNode:
+    __slots__ = ("conditional", "statements", "elseStatements")
+
     def __init__(self, conditional, statements, elseStatements):
         self.conditional = conditional
         self.statements = statements
@@ -46,6 +61,8 @@ class IfNode:
                 and self.elseStatements == other.elseStatements)
 
 class WhileNode:
+    __slots__ = ("conditional", "statements")
+
     def __init__(self, conditional, statements):
         self.conditional = conditional
         self.statements = statements
@@ -59,9 +76,13 @@ class WhileNode:
                 and self.statements == other.statements)
 
 class IdentifierNode:
+    __slots__ = ("value", "pos", "resolvedType", "variable")
+
     def __init__(self, value, pos = None):
         self.value = value
         self.pos = pos
+        self.resolvedType = None
+        self.variable = None
 
     def __repr__(self):
         return "IdentifierNode(value = '{}', pos = '{}')".format(self.value, self.pos)
@@ -72,6 +93,8 @@ class IdentifierNode:
                 and self.value == other.value)
 
 class VariableNode:
+    __slots__ = ("name", "type")
+
     def __init__(self, name, _type):
         self.name = name
         self.type = _type
@@ -85,6 +108,8 @@ class VariableNode:
                 and self.type == other.type)
 
 class GlobalDeclarationNode:
+    __slots__ = ("variable", "literal")
+
     def __init__(self, variable, literal):
         self.variable = variable
         self.literal = literal
@@ -98,6 +123,8 @@ class GlobalDeclarationNode:
                 and self.literal == other.literal)
 
 class DeclarationNode:
+    __slots__ = ("variable", "expression")
+
     def __init__(self, variable, expression):
         self.variable = variable
         self.expression = expression
@@ -111,6 +138,8 @@ class DeclarationNode:
                 and self.expression == other.expression)
 
 class FunctionNode:
+    __slots__ = ("name", "type", "parameters", "statements")
+
     def __init__(self, name, _type, parameters, statements):
         self.name = name
         self.type = _type
@@ -128,6 +157,8 @@ class FunctionNode:
             and self.statements == other.statements)
 
 class ReturnNode:
+    __slots__ = ("expression",)
+
     def __init__(self, expression):
         self.expression = expression
 
@@ -138,82 +169,111 @@ class ReturnNode:
         return (isinstance(other, self.__class__)
                 and self.expression == other.expression)
 
+# Binding power of each infix operator by token kind, 0 for anything that
+# isn't one. All infix operators are left associative.
+INFIX_PRECEDENCE = [0] * len(KIND_NAMES)
+INFIX_PRECEDENCE[KIND_EQUAL] = 1
+INFIX_PRECEDENCE[KIND_NOT_EQUAL] = 1
+INFIX_PRECEDENCE[KIND_PLUS] = 2
+INFIX_PRECEDENCE[KIND_MINUS] = 2
+INFIX_PRECEDENCE[KIND_MULTIPLY] = 3
+INFIX_PRECEDENCE[KIND_DIVIDE] = 3
+PREFIX_PRECEDENCE = 4
+
+# Entries on the operator stack of Parser.parseExpression
+OPERATOR_INFIX = 0
+OPERATOR_PREFIX = 1
+OPERATOR_PAREN = 2
+OPERATOR_CALL = 3
+
 class Parser:
+    # tokens can be a TokenStream, a list of Tokens or any iterator of Tokens
+    # (e.g. Lexxer.lexStream)
     def __init__(self, tokens, originalString):
         self.originalString = originalString
         self.tokens = tokens
-        self.buffer = ArrayBuffer(tokens)
+        if isinstance(tokens, TokenStream):
+            self.buffer = TokenStreamBuffer(tokens)
+        elif isinstance(tokens, list):
+            self.buffer = TokenBuffer(ArrayBuffer(tokens))
+        else:
+            self.buffer = TokenBuffer(StreamBuffer(iter(tokens)))
 
     def parse(self):
-        nodes = []
+        # Nodes only point down the tree
+        with gcPaused():
+            return list(self.parseIter())
+
+    # Yields one top-level node at a time. Tokens are released once their
+    # declaration has been parsed, so when reading from a stream the memory
+    # used is bounded by the largest top-level declaration.
+    def parseIter(self):
         while self.buffer.remaining() > 0:
-            nodes.append(self.parseTopLevel())
-        return nodes
+            node = self.parseTopLevel()
+            self.buffer.release()
+            yield node
 
     def parseTopLevel(self):
-        peekToken = self.buffer.peek()
-        if peekToken.match("syntax", "func"):
+        if self.buffer.peekKind() == KIND_FUNC:
             return self.parseFunction()
         else:
             return self.parseGlobalDeclaration()
 
     def parseGlobalDeclaration(self):
         variableNode = self.parseVariable()
-        self.requireToken("syntax", "=")
+        self.requireToken(KIND_ASSIGN)
         literalNode = self.parseLiteral()
-        self.requireToken("syntax", ";")
+        self.requireToken(KIND_SEMICOLON)
         return GlobalDeclarationNode(variableNode, literalNode)
 
     def parseStatement(self):
-        peekToken = self.buffer.peek()
-        if peekToken.match("syntax", "if"):
+        peekKind = self.buffer.peekKind()
+        if peekKind == KIND_IF:
             return self.parseIf()
-        elif peekToken.match("syntax", "while"):
+        elif peekKind == KIND_WHILE:
             return self.parseWhile()
-        elif peekToken.match("syntax", "return"):
+        elif peekKind == KIND_RETURN:
             return self.parseReturn()
         else:
-            identifierToken = self.requireToken("identifier", None)
+            identifierToken = self.requireToken(KIND_IDENTIFIER)
             node = None
-            if self.buffer.peek().match("syntax", "("):
+            peekKind = self.buffer.peekKind()
+            if peekKind == KIND_LEFT_PAREN:
                 node = self.parseCall(identifierToken)
-            elif self.buffer.peek().match("syntax", ":"):
+            elif peekKind == KIND_COLON:
                 node = self.parseDeclarationFromIdentifier(identifierToken)
             else:
-                equalToken = self.requireToken("syntax", "=")
+                equalToken = self.requireToken(KIND_ASSIGN)
                 expression = self.parseExpression()
                 # = is a call node for now. if, while, and func all have an impact on the assembly structure. = does not.
-                node = CallNode("=", [IdentifierNode(identifierToken.value, identifierToken.pos), expression], equalToken.pos)
-            self.requireToken("syntax", ";")
+                identifierNode = IdentifierNode(self.buffer.value(identifierToken), self.buffer.position(identifierToken))
+                node = CallNode("=", [identifierNode, expression], self.buffer.position(equalToken))
+            self.requireToken(KIND_SEMICOLON)
             return node
 
     def parseDeclarationFromIdentifier(self, identifierToken):
         variableNode = self.parseVariableFromIdentifier(identifierToken)
-        self.requireToken("syntax", "=")
+        self.requireToken(KIND_ASSIGN)
         expressionNode = self.parseExpression()
         return DeclarationNode(variableNode, expressionNode)
 
     def parseFunction(self):
-        self.requireToken("syntax", "func")
-        nameIdentifierToken = self.requireToken("identifier", None, "Name is missing.")
-        self.requireToken("syntax", "(")
+        self.requireToken(KIND_FUNC)
+        nameIdentifierToken = self.requireToken(KIND_IDENTIFIER, "Name is missing.")
+        self.requireToken(KIND_LEFT_PAREN)
         parameterNodes = []
-        if not self.buffer.peek().match("syntax", ")"):
+        if self.buffer.peekKind() != KIND_RIGHT_PAREN:
             parameterNodes.append(self.parseVariable())
-            while True:
-                peekToken = self.buffer.peek()
-                if peekToken is not None and peekToken.match("syntax", ","):
-                    self.buffer.consume()
-                    parameterNodes.append(self.parseVariable())
-                else:
-                    break
-        self.requireToken("syntax", ")")
-        self.requireToken("syntax", ":")
-        typeIdentifierToken = self.requireToken("identifier", None, "Type is missing.")
+            while self.buffer.peekKind() == KIND_COMMA:
+                self.buffer.consume()
+                parameterNodes.append(self.parseVariable())
+        self.requireToken(KIND_RIGHT_PAREN)
+        self.requireToken(KIND_COLON)
+        typeIdentifierToken = self.requireToken(KIND_IDENTIFIER, "Type is missing.")
         statements = self.parseStatementBlock()
         return FunctionNode(
-            nameIdentifierToken.value,
-            typeIdentifierToken.value,
+            self.buffer.value(nameIdentifierToken),
+            self.buffer.value(typeIdentifierToken),
             parameterNodes,
             statements
         )
@@ -229,145 +289,137 @@ class Parser:
         conditional = self.parseExpression()
         statements = self.parseStatementBlock()
         elseStatements = []
-        peekToken = self.buffer.peek()
-        if peekToken is not None and peekToken.match("syntax", "else"):
+        if self.buffer.peekKind() == KIND_ELSE:
             self.buffer.consume()
             elseStatements = self.parseStatementBlock()
         return IfNode(conditional, statements, elseStatements)
 
     def parseReturn(self):
-        self.requireToken("syntax", "return")
-        peekToken = self.buffer.peek()
+        self.requireToken(KIND_RETURN)
         expression = None
-        if not peekToken.match("syntax", ";"):
+        if self.buffer.peekKind() != KIND_SEMICOLON:
             expression = self.parseExpression()
-        self.requireToken("syntax", ";")
+        self.requireToken(KIND_SEMICOLON)
         return ReturnNode(expression)
 
     def parseStatementBlock(self):
-        self.requireToken("syntax", "{")
+        self.requireToken(KIND_LEFT_BRACE)
         statements = []
-        while self.buffer.remaining() > 0 and not self.buffer.peek().match("syntax", "}"):
+        while self.buffer.remaining() > 0 and self.buffer.peekKind() != KIND_RIGHT_BRACE:
             statements.append(self.parseStatement())
-        self.requireToken("syntax", "}")
+        self.requireToken(KIND_RIGHT_BRACE)
         return statements
 
+    # Iterative precedence climbing: operands and pending operators are kept on
+    # explicit stacks, along with a marker for every open parenthesis and call,
+    # so neither long operator chains nor deep nesting use Python call frames.
     def parseExpression(self):
-        left = self.parseInfixL1()
-        opToken = self.buffer.peek()
-        if opToken is not None and opToken.matchList("syntax", ["!=", "=="]):
-            self.buffer.consume()
-            right = self.parseInfixL1()
-            return CallNode(opToken.value, [left, right], opToken.pos)
-        else:
-            return left
-
-    def parseInfixL1(self):
-        left = self.parseInfixL2()
-        opToken = self.buffer.peek()
-        if opToken is not None and opToken.matchList("syntax", ["+", "-"]):
-            self.buffer.consume()
-            right = self.parseInfixL2()
-            return CallNode(opToken.value, [left, right], opToken.pos)
-        else:
-            return left
-
-    def parseInfixL2(self):
-        left = self.parsePrefix()
-        opToken = self.buffer.peek()
-        if opToken is not None and opToken.matchList("syntax", ["*", "/"]):
-            self.buffer.consume()
-            right = self.parsePrefix()
-            return CallNode(opToken.value, [left, right], opToken.pos)
-        else:
-            return left
-
-    def parsePrefix(self):
-        prefix = None
-        right = None
-        peekToken = self.buffer.peek()
-        if peekToken is None:
-            return None
-        if peekToken.matchList("syntax", ["-"]):
-            token = self.buffer.consume()
-            prefix = token.value
-            peekToken = self.buffer.peek()
-
-        if peekToken is None:
-            return None
-        if peekToken.isLiteral():
-            right = self.parseLiteral()
-        elif peekToken.match("syntax", "("):
-            self.buffer.consume()
-            right = self.parseExpression()
-            self.requireToken("syntax", ")")
-        else:
-            identifierToken = self.requireToken("identifier", None)
-            if self.buffer.peek().match("syntax", "("):
-                right = self.parseCall(identifierToken)
+        operands = []
+        operators = []
+        while True:
+            # Expecting an operand, possibly preceded by prefix operators
+            peekKind = self.buffer.peekKind()
+            if peekKind == KIND_MINUS:
+                token = self.buffer.consume()
+                operators.append((OPERATOR_PREFIX, PREFIX_PRECEDENCE, "-", self.buffer.position(token), None))
+                continue
+            elif peekKind == KIND_LEFT_PAREN:
+                self.buffer.consume()
+                operators.append((OPERATOR_PAREN, 0, None, None, None))
+                continue
+            elif peekKind == KIND_INTEGER_LITERAL or peekKind == KIND_STRING_LITERAL:
+                operands.append(self.parseLiteral())
             else:
-                right = IdentifierNode(identifierToken.value, identifierToken.pos)
-
-        if prefix is None:
-            return right
+                identifierToken = self.requireToken(KIND_IDENTIFIER)
+                identifier = self.buffer.value(identifierToken)
+                position = self.buffer.position(identifierToken)
+                if self.buffer.peekKind() != KIND_LEFT_PAREN:
+                    operands.append(IdentifierNode(identifier, position))
+                else:
+                    self.buffer.consume()
+                    if self.buffer.peekKind() == KIND_RIGHT_PAREN:
+                        self.buffer.consume()
+                        operands.append(CallNode(identifier, [], position))
+                    else:
+                        operators.append((OPERATOR_CALL, 0, identifier, position, len(operands)))
+                        continue
+
+            # Expecting an infix operator, or the end of an argument, a
+            # parenthesised expression or the whole expression
+            while True:
+                peekKind = self.buffer.peekKind()
+                precedence = INFIX_PRECEDENCE[peekKind]
+                if precedence > 0:
+                    # Everything is left associative, so reduce equal precedence too
+                    while len(operators) > 0 and operators[-1][1] >= precedence:
+                        self.reduceOperator(operands, operators.pop())
+                    token = self.buffer.consume()
+                    operators.append((OPERATOR_INFIX, precedence, KIND_NAMES[peekKind], self.buffer.position(token), None))
+                    break
+                while len(operators) > 0 and operators[-1][1] > 0:
+                    self.reduceOperator(operands, operators.pop())
+                if len(operators) == 0:
+                    return operands.pop()
+                operatorType, _, identifier, position, argumentStart = operators[-1]
+                if operatorType == OPERATOR_CALL and peekKind == KIND_COMMA:
+                    self.buffer.consume()
+                    break
+                self.requireToken(KIND_RIGHT_PAREN)
+                operators.pop()
+                if operatorType == OPERATOR_CALL:
+                    argumentNodes = operands[argumentStart:]
+                    del operands[argumentStart:]
+                    operands.append(CallNode(identifier, argumentNodes, position))
+
+    def reduceOperator(self, operands, operator):
+        operatorType, _, identifier, position, _ = operator
+        if operatorType == OPERATOR_INFIX:
+            right = operands.pop()
+            left = operands.pop()
+            operands.append(CallNode(identifier, [left, right], position))
         else:
-            return CallNode(prefix, [right], opToken.pos)
+            operands.append(CallNode(identifier, [operands.pop()], position))
 
     def parseLiteral(self):
+        kind = self.buffer.peekKind()
         token = self.buffer.consume()
-        if not token.isLiteral():
+        if kind != KIND_INTEGER_LITERAL and kind != KIND_STRING_LITERAL:
             self.raiseSyntaxError("Expected a literal.")
-        if token.matchType("integerLiteral"):
-            return LiteralNode("int", token.value)
+        if kind == KIND_INTEGER_LITERAL:
+            return LiteralNode("int", self.buffer.value(token))
 
     def parseCall(self, identifierToken):
-        self.requireToken("syntax", "(")
+        self.requireToken(KIND_LEFT_PAREN)
         argumentNodes = []
-        if not self.buffer.peek().match("syntax", ")"):
+        if self.buffer.peekKind() != KIND_RIGHT_PAREN:
             argumentNodes.append(self.parseExpression())
-            while True:
-                argPeekToken = self.buffer.peek()
-                if argPeekToken is not None and argPeekToken.match("syntax", ","):
-                    self.buffer.consume()
-                    argumentNodes.append(self.parseExpression())
-                else:
-                    break
-        self.requireToken("syntax", ")")
-        return CallNode(identifierToken.value, argumentNodes, identifierToken.pos)
+            while self.buffer.peekKind() == KIND_COMMA:
+                self.buffer.consume()
+                argumentNodes.append(self.parseExpression())
+        self.requireToken(KIND_RIGHT_PAREN)
+        return CallNode(self.buffer.value(identifierToken), argumentNodes, self.buffer.position(identifierToken))
 
     def parseVariable(self):
-        identifierToken = self.requireToken("identifier", None)
+        identifierToken = self.requireToken(KIND_IDENTIFIER)
         return self.parseVariableFromIdentifier(identifierToken)
 
     def parseVariableFromIdentifier(self, identifierToken):
-        self.requireToken("syntax", ":", "Missing ':' before type.")
-        typeIdentifierToken = self.requireToken("identifier", None)
-        return VariableNode(identifierToken.value, typeIdentifierToken.value)
+        self.requireToken(KIND_COLON, "Missing ':' before type.")
+        typeIdentifierToken = self.requireToken(KIND_IDENTIFIER)
+        return VariableNode(self.buffer.value(identifierToken), self.buffer.value(typeIdentifierToken))
 
     def raiseSyntaxError(self, message):
-        displayError(self.originalString, self.buffer.lookback().pos, message)
+        displayError(self.originalString, self.buffer.lookbackPosition(), message)
         raise Exception("Syntax error")
 
-    def requireToken(self, _type, value, additionalDetails = ""):
-        peekToken = self.buffer.peek()
-        if peekToken is None or not ((value is None and peekToken.matchType(_type)) or peekToken.match(_type, value)):
-            missing = value
-            if missing is None:
-                missing = _type
-            self.raiseSyntaxError("Detected a missing '{}'. {}".format(missing, additionalDetails))
+    def requireToken(self, kind, additionalDetails = ""):
+        if self.buffer.peekKind() != kind:
+            self.raiseSyntaxError("Detected a missing '{}'. {}".format(KIND_NAMES[kind], additionalDetails))
         return self.buffer.consume()
 
-    def requireTokens(self, type_value_pairs, additionalDetails = ""):
-        peekToken = self.buffer.peek()
-        matched = False
-        matchedToken = None
-        values = []
-        for _type, value in type_value_pairs:
-            if peekToken.match(_type, value):
-                matched = True
-                matchedToken = self.buffer.consume()
-                break
-            values.append(value)
-        if not matched:
-            self.raiseSyntaxError("Detected a missing '{}'. {}".format("' or '".join(values), additionalDetails))
-        return matchedToken
+    def requireTokens(self, kinds, additionalDetails = ""):
+        peekKind = self.buffer.peekKind()
+        if peekKind not in kinds:
+            names = [KIND_NAMES[kind] for kind in kinds]
+            self.raiseSyntaxError("Detected a missing '{}'. {}".format("' or '".join(names), additionalDetails))
+        return self.buffer.consume()
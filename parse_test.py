@@ -1,3 +1,5 @@
+import io
+import sys
 import unittest
 from parse import *
 from lex import *
@@ -63,6 +65,60 @@ class TestParse(unittest.TestCase):
         )
         self.assertEqual(actual, expected)
 
+    def testLeftAssociativity(self):
+        originalString = "a - b - c * d / e == -f"
+        lexxer = Lexxer(originalString)
+        tokens = lexxer.lex()
+        parser = Parser(tokens, originalString)
+        actual = parser.parseExpression()
+        expected = CallNode(
+            "==",
+            [
+                CallNode(
+                    "-",
+                    [
+                        CallNode("-", [IdentifierNode("a"), IdentifierNode("b")]),
+                        CallNode(
+                            "/",
+                            [
+                                CallNode("*", [IdentifierNode("c"), IdentifierNode("d")]),
+                                IdentifierNode("e")
+                            ]
+                        )
+                    ]
+                ),
+                CallNode("-", [IdentifierNode("f")])
+            ]
+        )
+        self.assertEqual(actual, expected)
+
+    def testNestedCalls(self):
+        originalString = "f(g(), -(1 + x), h(y, (2)))"
+        lexxer = Lexxer(originalString)
+        tokens = lexxer.lex()
+        parser = Parser(tokens, originalString)
+        actual = parser.parseExpression()
+        expected = CallNode(
+            "f",
+            [
+                CallNode("g", []),
+                CallNode("-", [CallNode("+", [LiteralNode("int", 1), IdentifierNode("x")])]),
+                CallNode("h", [IdentifierNode("y"), LiteralNode("int", 2)])
+            ]
+        )
+        self.assertEqual(actual, expected)
+        self.assertEqual(actual.arguments[1].pos, 7)
+
+    def testDeepNesting(self):
+        depth = 10 * sys.getrecursionlimit()
+        originalString = "(" * depth + "f(" * depth + "1" + ")" * (2 * depth) + " + 2"
+        lexxer = Lexxer(originalString)
+        parser = Parser(lexxer.lexCompact(), originalString)
+        actual = parser.parseExpression()
+        self.assertEqual(actual.identifier, "+")
+        self.assertEqual(actual.arguments[1], LiteralNode("int", 2))
+        self.assertEqual(parser.buffer.remaining(), 0)
+
     def testIf(self):
         originalString = "if 1 { myFun(); }"
         lexxer = Lexxer(originalString)
@@ -109,8 +165,8 @@ class TestParse(unittest.TestCase):
                 CallNode(
                     "+",
                     [
-                        LiteralNode("int", 1),
-                        CallNode("+", [LiteralNode("int", 2), LiteralNode("int", 3)])
+                        CallNode("+", [LiteralNode("int", 1), LiteralNode("int", 2)]),
+                        LiteralNode("int", 3)
                     ]
                 )
         )
@@ -154,5 +210,44 @@ class TestParse(unittest.TestCase):
         ]
         self.assertEqual(actual, expected)
 
+    def testParseStream(self):
+        originalString = """
+        myNum: int = 1;
+        func myFunction(x: int): int {
+            while x != myNum {
+                x = x - 1;
+            }
+            return x;
+        }
+        func main(): int {
+            return myFunction(10);
+        }
+        """
+        expected = Parser(Lexxer(originalString).lex(), originalString).parse()
+        tokens = Lexxer(None).lexStream(io.StringIO(originalString), 16)
+        parser = Parser(tokens, None)
+        actual = []
+        for node in parser.parseIter():
+            # Only the tail of the previous declaration is held on to
+            self.assertLessEqual(len(parser.buffer.buffer.window), 1)
+            actual.append(node)
+        self.assertEqual(actual, expected)
+
+    def testParseCompact(self):
+        originalString = """
+        myNum: int = 1;
+        func myFunction(x: int, y: int): int {
+            if x == -myNum {
+                y = (x + 1) * y;
+            }
+            return myFunction(x / 2, y);
+        }
+        """
+        expected = Parser(Lexxer(originalString).lex(), originalString).parse()
+        actual = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+        self.assertEqual(actual, expected)
+        # Positions are recovered from the offsets
+        self.assertEqual(actual[1].statements[0].conditional.pos, expected[1].statements[0].conditional.pos)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,295 @@
+import re
+
+# A peephole optimizer for x86-64 Intel syntax assembly, either dialect in
+# compile.py or hand written like add.s. The text is parsed into lines, and a
+# table of rules is tried at each position of a sliding window over them,
+# until a whole pass changes nothing. Lines no rule touches are written back
+# exactly as they were read, except that a label sharing a line with an
+# instruction, as in target: mov rax, 1, is put on a line of its own.
+#
+# Every rule is safe wherever it matches: nothing that reads or writes
+# flags is removed or reordered, so it doesn't matter what later code
+# expects of them. Only 64-bit registers are compared, since writing a
+# 32-bit register also zeroes the upper half.
+
+REGISTER_ALIASES = {
+        "rax": ["eax", "ax", "al", "ah"], "rbx": ["ebx", "bx", "bl", "bh"], "rcx": ["ecx", "cx", "cl", "ch"], "rdx": ["edx", "dx", "dl", "dh"],
+        "rsi": ["esi", "si", "sil"], "rdi": ["edi", "di", "dil"], "rbp": ["ebp", "bp", "bpl"], "rsp": ["esp", "sp", "spl"],
+}
+for number in range(8, 16):
+    REGISTER_ALIASES["r{}".format(number)] = ["r{}{}".format(number, suffix) for suffix in ("d", "w", "b")]
+FULL_REGISTERS = {}
+for register, aliases in REGISTER_ALIASES.items():
+    FULL_REGISTERS[register] = register
+    for alias in aliases:
+        FULL_REGISTERS[alias] = register
+
+# NASM directives and data, which are never instructions to rewrite
+DIRECTIVES = {"section", "segment", "global", "extern", "default", "bits", "align", "db", "dw", "dd", "dq", "times", "resb", "resq"}
+ENDS_BLOCK = {"jmp", "ret"}
+
+# Instructions that can be removed as unreachable. A line starting with any
+# other word may be a NASM label written without a colon, as in
+# target mov rax, 1, so nothing after a jmp or ret is removed past it.
+KNOWN_MNEMONICS = {
+    "mov", "movzx", "movsx", "movsxd", "lea", "add", "sub", "imul", "mul", "idiv", "div", "neg", "not", "inc", "dec",
+    "and", "or", "xor", "shl", "shr", "sar", "cmp", "test", "push", "pop", "call", "ret", "jmp", "cqo", "cdq",
+    "leave", "nop", "xchg", "syscall",
+    "je", "jne", "jz", "jnz", "jl", "jle", "jg", "jge", "jb", "jbe", "ja", "jae", "js", "jns",
+    "sete", "setne", "setl", "setle", "setg", "setge", "setb", "setbe", "seta", "setae",
+}
+
+# A label at the start of a line with more on it
+LEADING_LABEL_PATTERN = re.compile(r"\s*([A-Za-z_.$?@][A-Za-z0-9_.$?@]*):\s*")
+
+WORD_PATTERN = re.compile(r"[A-Za-z_.$][A-Za-z0-9_.$]*")
+
+# Kinds of line
+INSTRUCTION = "instruction"
+LABEL = "label"
+OTHER = "other"
+
+class AsmLine:
+    __slots__ = ("kind", "text", "mnemonic", "operands", "label")
+
+    def __init__(self, kind, text, mnemonic = None, operands = None, label = None):
+        self.kind = kind
+        # As read, or None for a line a rule made, which is formatted
+        self.text = text
+        self.mnemonic = mnemonic
+        self.operands = operands or []
+        self.label = label
+
+    def __repr__(self):
+        if self.kind == INSTRUCTION:
+            return "AsmLine({} {})".format(self.mnemonic, ", ".join(self.operands))
+        return "AsmLine({}, {!r})".format(self.kind, self.text)
+
+    def format(self):
+        if self.text is not None:
+            return self.text
+        if len(self.operands) == 0:
+            return "  " + self.mnemonic
+        return "  {} {}".format(self.mnemonic, ", ".join(self.operands))
+
+def makeInstruction(mnemonic, *operands):
+    return AsmLine(INSTRUCTION, None, mnemonic, list(operands))
+
+# Splits operands on the commas that aren't inside brackets or quotes
+def splitOperands(text):
+    operands = []
+    depth = 0
+    quote = None
+    start = 0
+    for i, character in enumerate(text):
+        if quote is not None:
+            if character == quote:
+                quote = None
+        elif character == "'" or character == '"':
+            quote = character
+        elif character == "[":
+            depth += 1
+        elif character == "]":
+            depth -= 1
+        elif character == "," and depth == 0:
+            operands.append(text[start:i])
+            start = i + 1
+    operands.append(text[start:])
+    # Spacing is normalized so the same operand always compares equal
+    return [" ".join(operand.split()) for operand in operands if operand.strip() != ""]
+
+def stripComment(text):
+    quote = None
+    for i, character in enumerate(text):
+        if quote is not None:
+            if character == quote:
+                quote = None
+        elif character == "'" or character == '"':
+            quote = character
+        elif character == ";" or character == "#":
+            return text[:i]
+    return text
+
+def parseLine(text):
+    code = stripComment(text).strip()
+    if code == "" or code.startswith(".") and not code.endswith(":"):
+        return AsmLine(OTHER, text)
+    if code.endswith(":") and " " not in code:
+        return AsmLine(LABEL, text, label = code[:-1])
+    parts = code.split(None, 1)
+    mnemonic = parts[0].lower()
+    if mnemonic in DIRECTIVES:
+        return AsmLine(OTHER, text)
+    operands = splitOperands(parts[1]) if len(parts) > 1 else []
+    return AsmLine(INSTRUCTION, text, mnemonic, operands)
+
+def parseAssembly(assembly):
+    lines = assembly.split("\n")
+    # A trailing newline doesn't make another line
+    if lines[-1] == "":
+        lines.pop()
+    parsed = []
+    for line in lines:
+        match = LEADING_LABEL_PATTERN.match(line)
+        if match is not None and stripComment(line[match.end():]).strip() != "":
+            # Split so that removing the instruction can't take the label with it
+            parsed.append(AsmLine(LABEL, line[:match.end()].rstrip(), label = match.group(1)))
+            line = "  " + line[match.end():]
+        parsed.append(parseLine(line))
+    return parsed
+
+def isRegister(operand):
+    return operand in REGISTER_ALIASES
+
+def isMemory(operand):
+    return "[" in operand
+
+# The 64-bit registers an operand reads, e.g. rbp for qword [rbp - 8]
+def registersIn(operand):
+    return set(FULL_REGISTERS[word] for word in WORD_PATTERN.findall(operand.lower()) if word in FULL_REGISTERS)
+
+def isInstruction(line, mnemonic, operandCount):
+    return line.kind == INSTRUCTION and line.mnemonic == mnemonic and len(line.operands) == operandCount
+
+# Rules take the lines and a position, and return how many lines from there
+# they replace and what with, or None if they don't match
+class PeepholeRule:
+    def __init__(self, name, description, match):
+        self.name = name
+        self.description = description
+        self.match = match
+
+# mov rax, rax
+def matchMoveToSelf(lines, i):
+    line = lines[i]
+    if isInstruction(line, "mov", 2) and line.operands[0] == line.operands[1] and isRegister(line.operands[0]):
+        return 1, []
+    return None
+
+# push rax; pop rax or push rax; pop rbx
+def matchPushPop(lines, i):
+    if i + 1 >= len(lines) or not isInstruction(lines[i], "push", 1) or not isInstruction(lines[i + 1], "pop", 1):
+        return None
+    source = lines[i].operands[0]
+    destination = lines[i + 1].operands[0]
+    if source == destination:
+        return 2, []
+    if isRegister(source) and isRegister(destination):
+        return 2, [makeInstruction("mov", destination, source)]
+    return None
+
+# mov [slot], rax; mov rcx, [slot] reads back what was just stored, so it's
+# the same as mov rcx, rax, or nothing when it's loaded into rax again
+def matchLoadAfterStore(lines, i):
+    if i + 1 >= len(lines) or not isInstruction(lines[i], "mov", 2) or not isInstruction(lines[i + 1], "mov", 2):
+        return None
+    slot, stored = lines[i].operands
+    loaded, source = lines[i + 1].operands
+    if not isMemory(slot) or source != slot or not isRegister(stored) or not isRegister(loaded):
+        return None
+    if loaded == stored:
+        return 2, [lines[i]]
+    return 2, [lines[i], makeInstruction("mov", loaded, stored)]
+
+# mov rax, rcx; mov rcx, rax: the second copies back what's already there
+def matchMoveBack(lines, i):
+    if i + 1 >= len(lines) or not isInstruction(lines[i], "mov", 2) or not isInstruction(lines[i + 1], "mov", 2):
+        return None
+    first = lines[i].operands
+    second = lines[i + 1].operands
+    if first[0] != second[1] or first[1] != second[0] or not isRegister(first[0]) or not isRegister(first[1]):
+        return None
+    return 2, [lines[i]]
+
+# mov rax, 1; mov rax, rcx: the first value is never read
+def matchOverwrittenMove(lines, i):
+    if i + 1 >= len(lines) or not isInstruction(lines[i], "mov", 2) or not isInstruction(lines[i + 1], "mov", 2):
+        return None
+    register = lines[i].operands[0]
+    if not isRegister(register) or lines[i + 1].operands[0] != register or register in registersIn(lines[i + 1].operands[1]):
+        return None
+    return 2, [lines[i + 1]]
+
+# jmp .L1 or jz .L1 straight before .L1:, perhaps among other labels. Any
+# other line in between, even one that may define a symbol, stops the search.
+def matchJumpToNext(lines, i):
+    line = lines[i]
+    if line.kind != INSTRUCTION or not line.mnemonic.startswith("j") or len(line.operands) != 1:
+        return None
+    j = i + 1
+    while j < len(lines) and lines[j].kind == LABEL:
+        if lines[j].label == line.operands[0]:
+            return 1, []
+        j += 1
+    return None
+
+# Instructions after a jmp or ret that no label leads to. Only known
+# instructions are removed, since any other line may define a symbol.
+def matchUnreachable(lines, i):
+    if lines[i].kind != INSTRUCTION or lines[i].mnemonic not in ENDS_BLOCK:
+        return None
+    j = i + 1
+    while j < len(lines) and lines[j].kind == INSTRUCTION and lines[j].mnemonic in KNOWN_MNEMONICS:
+        j += 1
+    if j == i + 1:
+        return None
+    return j - i, [lines[i]]
+
+RULES = [
+    PeepholeRule("move-to-self", "mov of a register to itself", matchMoveToSelf),
+    PeepholeRule("push-pop", "push then pop, removed or made a mov", matchPushPop),
+    PeepholeRule("load-after-store", "load of the value just stored to memory", matchLoadAfterStore),
+    PeepholeRule("move-back", "mov back of a register just copied", matchMoveBack),
+    PeepholeRule("overwritten-move", "mov to a register the next mov overwrites", matchOverwrittenMove),
+    PeepholeRule("jump-to-next", "jump to the label that follows it", matchJumpToNext),
+    PeepholeRule("unreachable", "instructions after jmp or ret with no label before them", matchUnreachable),
+]
+
+# The most lines before a change that a rule can look at, to step back by
+# so that a match the change made possible is found
+LOOKBEHIND = 2
+
+class PeepholeOptimizer:
+    def __init__(self, assembly, rules = RULES):
+        self.lines = parseAssembly(assembly)
+        self.rules = rules
+        self.hits = dict((rule.name, 0) for rule in rules)
+        self.linesBefore = len(self.lines)
+        self.passCount = 0
+
+    def optimize(self):
+        changed = True
+        while changed:
+            changed = self.runPass()
+            self.passCount += 1
+        return "".join(line.format() + "\n" for line in self.lines)
+
+    def runPass(self):
+        lines = self.lines
+        changed = False
+        i = 0
+        while i < len(lines):
+            for rule in self.rules:
+                result = rule.match(lines, i)
+                if result is not None:
+                    count, replacement = result
+                    lines[i:i + count] = replacement
+                    self.hits[rule.name] += 1
+                    changed = True
+                    i = max(0, i - LOOKBEHIND)
+                    break
+            else:
+                i += 1
+        return changed
+
+    def removedCount(self):
+        return self.linesBefore - len(self.lines)
+
+    def formatReport(self):
+        hits = ", ".join("{} {}".format(name, count) for name, count in self.hits.items() if count > 0)
+        return "Peephole: {} lines removed in {} passes ({})".format(self.removedCount(), self.passCount, hits or "no rules matched")
+
+# The optimized assembly and the optimizer, for its counters
+def optimizeAssembly(assembly):
+    optimizer = PeepholeOptimizer(assembly)
+    return optimizer.optimize(), optimizer
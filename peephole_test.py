@@ -0,0 +1,139 @@
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import cli
+from compile_test import HARNESS, PROGRAMS, PRESSURE_PROGRAM, analyzeSource
+from encode_test import randomProgram
+from compile import *
+from peephole import *
+
+def optimizeLines(*lines):
+    return optimizeAssembly("".join(line + "\n" for line in lines))
+
+class TestPeephole(unittest.TestCase):
+    def assertOptimized(self, lines, expectedLines, rule):
+        output, optimizer = optimizeLines(*lines)
+        self.assertEqual(output, "".join(line + "\n" for line in expectedLines))
+        self.assertGreater(optimizer.hits[rule], 0)
+
+    def assertUnchanged(self, lines):
+        output, optimizer = optimizeLines(*lines)
+        self.assertEqual(output, "".join(line + "\n" for line in lines))
+        self.assertEqual(sum(optimizer.hits.values()), 0)
+
+    def testMoveToSelf(self):
+        self.assertOptimized(["  mov rax, rax", "  ret"], ["  ret"], "move-to-self")
+        # Writing a 32-bit register zeroes the upper half, so it isn't a no-op
+        self.assertUnchanged(["  mov eax, eax", "  ret"])
+
+    def testPushPop(self):
+        self.assertOptimized(["  push rbx", "  pop rbx", "  ret"], ["  ret"], "push-pop")
+        self.assertOptimized(["  push rax", "  pop rcx", "  ret"], ["  mov rcx, rax", "  ret"], "push-pop")
+        self.assertUnchanged(["  push qword [rbp - 8]", "  pop rcx", "  ret"])
+
+    def testLoadAfterStore(self):
+        self.assertOptimized(["  mov qword [rbp - 8], rax", "  mov rax, qword [rbp - 8]"], ["  mov qword [rbp - 8], rax"], "load-after-store")
+        self.assertOptimized(["  mov QWORD PTR [rbp-8], rax", "  mov rcx, QWORD PTR [rbp-8]"], ["  mov QWORD PTR [rbp-8], rax", "  mov rcx, rax"], "load-after-store")
+        self.assertUnchanged(["  mov qword [rbp - 8], rax", "  mov rax, qword [rbp - 16]"])
+
+    def testMoveBack(self):
+        self.assertOptimized(["  mov rax, rcx", "  mov rcx, rax", "  ret"], ["  mov rax, rcx", "  ret"], "move-back")
+
+    def testOverwrittenMove(self):
+        self.assertOptimized(["  mov rax, 1", "  mov rax, rcx", "  ret"], ["  mov rax, rcx", "  ret"], "overwritten-move")
+        # The second reads the first's value
+        self.assertUnchanged(["  mov rax, rbp", "  mov rax, qword [rax - 8]", "  ret"])
+        self.assertUnchanged(["  mov rax, 1", "  mov rax, eax", "  ret"])
+
+    def testJumpToNext(self):
+        self.assertOptimized(["  jmp .L2", ".L1:", ".L2:", "  ret"], [".L1:", ".L2:", "  ret"], "jump-to-next")
+        self.assertOptimized(["  cmp rax, rcx", "  je .L1", ".L1:", "  ret"], ["  cmp rax, rcx", ".L1:", "  ret"], "jump-to-next")
+        self.assertUnchanged(["  jmp .L2", ".L1:", "  ret", ".L2:", "  ret"])
+
+    def testUnreachable(self):
+        self.assertOptimized(["  jmp .L1", "  mov rax, 1", "  add rax, 2", ".L1:", "  ret"], [".L1:", "  ret"], "unreachable")
+        self.assertOptimized(["  ret", "  mov rax, 1", "f:", "  ret"], ["  ret", "f:", "  ret"], "unreachable")
+        # Data isn't code
+        self.assertUnchanged(["  ret", "  dq 5"])
+
+    def testLabelWithInstruction(self):
+        # The label is put on its own line, and the jump to it stays reachable
+        output, optimizer = optimizeLines("  jmp .L1", "target: mov rax, 1 ; one", "  ret", ".L1:", "  ret")
+        self.assertEqual(output, "  jmp .L1\ntarget:\n  mov rax, 1 ; one\n  ret\n.L1:\n  ret\n")
+        self.assertEqual(sum(optimizer.hits.values()), 0)
+        self.assertOptimized(["  jmp target", "target: ret"], ["target:", "  ret"], "jump-to-next")
+        # NASM allows a label without a colon
+        self.assertUnchanged(["  jmp .L1", "target mov rax, 1", "  ret", ".L1:", "  ret"])
+        self.assertEqual([line.kind for line in parseAssembly("f: ret\n")], [LABEL, INSTRUCTION])
+        self.assertEqual(parseAssembly("f:\n")[0].label, "f")
+
+    def testRulesEnableEachOther(self):
+        # Removing the mov to self brings the push and pop together
+        output, optimizer = optimizeLines("  push rbx", "  mov rax, rax", "  pop rbx", "  ret")
+        self.assertEqual(output, "  ret\n")
+        self.assertEqual(optimizer.hits["move-to-self"], 1)
+        self.assertEqual(optimizer.hits["push-pop"], 1)
+        self.assertEqual(optimizer.removedCount(), 3)
+
+    def testOtherLinesKept(self):
+        # add.s, with a comment, tabs, directives and data
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "add.s")) as inputFile:
+            assembly = inputFile.read()
+        self.assertEqual(optimizeAssembly(assembly)[0], assembly)
+        self.assertEqual(parseLine("  lea rdi, [rel message] ; comment").operands, ["rdi", "[rel message]"])
+        self.assertEqual(parseLine("  db 'a, b', 0").kind, OTHER)
+        self.assertEqual(parseLine(".L1:").label, ".L1")
+
+    @unittest.skipIf(shutil.which("gcc") is None, "needs gcc to link")
+    def testProgramsRun(self):
+        sources = [(originalString, expected) for originalString, expected in PROGRAMS] + [(PRESSURE_PROGRAM, 650)]
+        with tempfile.TemporaryDirectory() as directory:
+            assemblyPath = os.path.join(directory, "program.s")
+            harnessPath = os.path.join(directory, "harness.c")
+            executablePath = os.path.join(directory, "program")
+            with open(harnessPath, "w") as outputFile:
+                outputFile.write(HARNESS)
+            for originalString, expected in sources:
+                for allocateRegisters in (True, False):
+                    with self.subTest(originalString, allocateRegisters = allocateRegisters):
+                        nodes, programDetails = analyzeSource(originalString)
+                        assembly = CodeGenerator(lowerProgram(nodes, programDetails), GAS, allocateRegisters = allocateRegisters).generate()
+                        with open(assemblyPath, "w") as outputFile:
+                            outputFile.write(optimizeAssembly(assembly)[0])
+                        subprocess.run(["gcc", "-no-pie", "-o", executablePath, harnessPath, assemblyPath], check = True)
+                        output = subprocess.run([executablePath], check = True, capture_output = True, text = True).stdout
+                        self.assertEqual(int(output), toInt64(expected))
+
+    def testShrinksGeneratedCode(self):
+        nodes, programDetails = analyzeSource(randomProgram(0))
+        assembly = CodeGenerator(lowerProgram(nodes, programDetails), allocateRegisters = False).generate()
+        output, optimizer = optimizeAssembly(assembly)
+        self.assertGreater(optimizer.hits["load-after-store"], 0)
+        self.assertLess(len(output), len(assembly))
+        # Already optimized code has nothing left to match
+        self.assertEqual(optimizeAssembly(output)[0], output)
+
+    def testCli(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sourcePath = os.path.join(directory, "program.ul")
+            plainPath = os.path.join(directory, "plain.s")
+            optimizedPath = os.path.join(directory, "optimized.s")
+            stagePath = os.path.join(directory, "stage.s")
+            with open(sourcePath, "w") as outputFile:
+                outputFile.write(PRESSURE_PROGRAM)
+            self.assertEqual(cli.main([sourcePath, "--no-cache", "-o", plainPath]), 0)
+            self.assertEqual(cli.main([sourcePath, "--no-cache", "--peephole", "-o", optimizedPath]), 0)
+            self.assertEqual(cli.main(["peephole", plainPath, "-o", stagePath]), 0)
+            with open(optimizedPath) as inputFile:
+                optimized = inputFile.read()
+            with open(stagePath) as inputFile:
+                self.assertEqual(inputFile.read(), optimized)
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                cli.main([sourcePath, "--peephole", "-c", "-o", optimizedPath])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import hashlib
+import io
+import json
+import os
+import socketserver
+from contextlib import redirect_stdout, redirect_stderr
+from lex import *
+from parse import *
+from analyze import *
+from client import *
+
+# A resident compile server. Clients connect over a Unix socket and send one
+# JSON request per connection:
+#   {"argv": [...], "cwd": "..."}
+# and get back the output the compile would have printed and its exit status:
+#   {"output": "...", "status": 0}
+# Parsed and analyzed results are kept in memory per file, keyed by a hash of
+# the file's content rather than its modification time, so an edit is always
+# picked up even if it lands within the same timestamp tick.
+
+class CompiledFile:
+    def __init__(self, digest, nodes, programDetails):
+        self.digest = digest
+        self.nodes = nodes
+        self.programDetails = programDetails
+
+class CompileCache:
+    def __init__(self):
+        # Absolute path -> CompiledFile for the last content that compiled cleanly
+        self.files = {}
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, path):
+        path = os.path.abspath(path)
+        with open(path, "rb") as inputFile:
+            content = inputFile.read()
+        digest = hashlib.sha256(content).digest()
+        compiledFile = self.files.get(path)
+        if compiledFile is not None and compiledFile.digest == digest:
+            self.hits += 1
+            return compiledFile
+        self.misses += 1
+        # Drop the stale entry first so a failed compile doesn't leave it behind
+        self.files.pop(path, None)
+        inputString = content.decode()
+        nodes = Parser(Lexxer(inputString).lexCompact(), inputString).parse()
+        programDetails = Analyzer(nodes, inputString).analyze()
+        compiledFile = CompiledFile(digest, nodes, programDetails)
+        self.files[path] = compiledFile
+        return compiledFile
+
+class CompileRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        output = io.StringIO()
+        status = 0
+        # Requests are handled one at a time, so changing the working directory
+        # for the duration of one is safe
+        previousDirectory = os.getcwd()
+        try:
+            os.chdir(request["cwd"])
+            with redirect_stdout(output), redirect_stderr(output):
+                try:
+                    status = self.server.handleArgs(request["argv"]) or 0
+                except SystemExit as e:
+                    # argparse exits on bad arguments
+                    status = e.code if isinstance(e.code, int) else 1
+                except Exception as e:
+                    print(e)
+                    status = 1
+        finally:
+            os.chdir(previousDirectory)
+        self.wfile.write((json.dumps({"output": output.getvalue(), "status": status}) + "\n").encode())
+
+# handleArgs(argv) runs a single compile and returns its exit status
+class CompileServer(socketserver.UnixStreamServer):
+    def __init__(self, socketPath, handleArgs):
+        self.socketPath = socketPath
+        self.handleArgs = handleArgs
+        # Left behind if a previous server didn't shut down cleanly
+        if os.path.exists(socketPath):
+            os.unlink(socketPath)
+        super().__init__(socketPath, CompileRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socketPath):
+            os.unlink(self.socketPath)
@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+import cli
+from server import *
+
+PROGRAM = """func add(x: int, y: int): int {
+  return x + y;
+}
+"""
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.socketPath = os.path.join(self.directory.name, "compile.sock")
+        self.cache = CompileCache()
+        self.server = CompileServer(self.socketPath, lambda argv: cli.main(argv, self.cache))
+        self.thread = threading.Thread(target = self.server.serve_forever, args = (0.01,))
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.directory.cleanup()
+
+    def writeSource(self, text):
+        path = os.path.join(self.directory.name, "source.ul")
+        with open(path, "w") as outputFile:
+            outputFile.write(text)
+        return path
+
+    def testReusesUnchangedFiles(self):
+        path = self.writeSource(PROGRAM)
+        self.assertEqual(sendRequest(self.socketPath, [path]), ("", 0))
+        self.assertEqual(sendRequest(self.socketPath, [path]), ("", 0))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def testRelativePaths(self):
+        self.writeSource(PROGRAM)
+        self.assertEqual(sendRequest(self.socketPath, ["source.ul"], self.directory.name), ("", 0))
+
+    def testInvalidatesOnContentChange(self):
+        path = self.writeSource(PROGRAM)
+        self.assertEqual(sendRequest(self.socketPath, [path]), ("", 0))
+        stat = os.stat(path)
+        # Same length and modification time, different content
+        self.writeSource(PROGRAM.replace("x + y", "x + z"))
+        os.utime(path, ns = (stat.st_atime_ns, stat.st_mtime_ns))
+        output, status = sendRequest(self.socketPath, [path])
+        self.assertEqual(status, 1)
+        self.assertIn("Variable not found: 'z'", output)
+        self.writeSource(PROGRAM)
+        self.assertEqual(sendRequest(self.socketPath, [path]), ("", 0))
+        self.assertEqual(self.cache.misses, 3)
+
+    def testBadArguments(self):
+        output, status = sendRequest(self.socketPath, ["--no-such-flag"])
+        self.assertEqual(status, 2)
+        self.assertIn("unrecognized arguments", output)
+        # An abbreviation forwardedArgs leaves in
+        output, status = sendRequest(self.socketPath, ["a.ul", "--conn", self.socketPath])
+        self.assertEqual(status, 2)
+        self.assertIn("can't be forwarded", output)
+
+    def testForwardedArgs(self):
+        self.assertEqual(cli.forwardedArgs(["a.ul", "--connect", "s", "--stream"]), ["a.ul", "--stream"])
+        self.assertEqual(cli.forwardedArgs(["--connect=s", "a.ul"]), ["a.ul"])
+        self.assertEqual(findConnectSocket(["a.ul", "--connect", "s"]), "s")
+        self.assertEqual(findConnectSocket(["--connect=s", "a.ul"]), "s")
+        self.assertIsNone(findConnectSocket(["a.ul", "--stream"]))
+
+    def testThinClientProcess(self):
+        path = self.writeSource(PROGRAM.replace("x + y", "x + z"))
+        # Prints which compiler modules the client process imported
+        script = "import runpy, sys; sys.argv = sys.argv[1:]; runpy.run_path(sys.argv[0], run_name = '__main__')"
+        command = [sys.executable, "-c", "import atexit, sys; atexit.register(lambda: print(sorted(set(sys.modules) & {'lex', 'parse', 'analyze', 'compile'}))); " + script]
+        cliPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+        result = subprocess.run(command + [cliPath, path, "--connect", self.socketPath], capture_output = True, text = True,
+                cwd = os.path.dirname(cliPath))
+        self.assertEqual(result.returncode, 1)
+        self.assertIn("Variable not found: 'z'", result.stdout)
+        self.assertTrue(result.stdout.endswith("[]\n"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import json
+import time
+import tracemalloc
+from contextlib import nullcontext
+from parse import *
+
+# Measurements of a compile, for finding out which phase is slow: each
+# phase's wall time and the peak memory it allocated, traced with
+# tracemalloc, and counts of tokens, AST nodes by class, function signature
+# lookups and errors.
+#
+# Nothing is measured unless a CompileStats is passed in. Counting hooks are
+# only installed on the instances being watched, so the lexer, parser and
+# analyzer run exactly the same code when there are no stats.
+
+NO_PHASE = nullcontext()
+
+class PhaseStats:
+    def __init__(self, name, seconds, peakBytes):
+        self.name = name
+        self.seconds = seconds
+        self.peakBytes = peakBytes
+
+class CompileStats:
+    def __init__(self, traceMemory = True):
+        self.traceMemory = traceMemory
+        self.startedTracing = False
+        self.phases = []
+        self.counters = {}
+        self.nodeCounts = {}
+        self.analyzers = []
+        self.failedPhase = None
+
+    def count(self, name, amount = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # Times the with block as the named phase. Peak memory is the most
+    # allocated at once during it, over what was allocated before it.
+    def phase(self, name):
+        return MeasuredPhase(self, name)
+
+    # Yields the tokens, counting them as they go past, for streams that
+    # can't be counted afterwards
+    def countTokens(self, tokens):
+        for token in tokens:
+            self.count("tokens")
+            yield token
+
+    # Counts every lookup of a call's function signature by the analyzer
+    def watchAnalyzer(self, analyzer):
+        findSignature = analyzer.findFunctionSignatureFromCallNode
+
+        def countedFindSignature(callNode):
+            self.count("signatureLookups")
+            return findSignature(callNode)
+
+        analyzer.findFunctionSignatureFromCallNode = countedFindSignature
+        self.counters.setdefault("signatureLookups", 0)
+        self.analyzers.append(analyzer)
+
+    def countNodes(self, nodes):
+        stack = list(nodes)
+        while len(stack) > 0:
+            node = stack.pop()
+            name = type(node).__name__
+            self.nodeCounts[name] = self.nodeCounts.get(name, 0) + 1
+            if isinstance(node, FunctionNode):
+                stack.extend(node.parameters)
+                stack.extend(node.statements)
+            elif isinstance(node, GlobalDeclarationNode):
+                stack.append(node.variable)
+                stack.append(node.literal)
+            elif isinstance(node, DeclarationNode):
+                stack.append(node.variable)
+                if node.expression is not None:
+                    stack.append(node.expression)
+            elif isinstance(node, ReturnNode):
+                if node.expression is not None:
+                    stack.append(node.expression)
+            elif isinstance(node, CallNode):
+                stack.extend(node.arguments)
+            elif isinstance(node, IfNode):
+                stack.append(node.conditional)
+                stack.extend(node.statements)
+                stack.extend(node.elseStatements)
+            elif isinstance(node, WhileNode):
+                stack.append(node.conditional)
+                stack.extend(node.statements)
+
+    # Stops tracing memory if this started it, and takes the error counts
+    # from the watched analyzers
+    def finish(self):
+        if self.startedTracing:
+            tracemalloc.stop()
+            self.startedTracing = False
+        if len(self.analyzers) > 0:
+            self.counters["errors"] = sum(len(analyzer.errors) for analyzer in self.analyzers)
+
+    def toDict(self):
+        result = {
+            "phases": [{"name": phase.name, "seconds": phase.seconds, "peakBytes": phase.peakBytes} for phase in self.phases],
+            "totalSeconds": sum(phase.seconds for phase in self.phases),
+            "counters": self.counters,
+            "nodes": dict(sorted(self.nodeCounts.items())),
+        }
+        if self.failedPhase is not None:
+            result["failedPhase"] = self.failedPhase
+        return result
+
+    def toJson(self):
+        return json.dumps(self.toDict(), indent = 2)
+
+class MeasuredPhase:
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        if self.stats.traceMemory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.stats.startedTracing = True
+            tracemalloc.reset_peak()
+            self.startBytes = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exceptionType, exception, traceback):
+        seconds = time.perf_counter() - self.start
+        peakBytes = 0
+        if self.stats.traceMemory:
+            peakBytes = tracemalloc.get_traced_memory()[1] - self.startBytes
+        self.stats.phases.append(PhaseStats(self.name, seconds, peakBytes))
+        if exceptionType is not None and self.stats.failedPhase is None:
+            self.stats.failedPhase = self.name
+        return False
+
+# The phase to run code under: measured if there are stats, else nothing
+def measurePhase(stats, name):
+    if stats is None:
+        return NO_PHASE
+    return stats.phase(name)
@@ -0,0 +1,103 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import tracemalloc
+import unittest
+import cli
+from lex import *
+from parse import *
+from analyze import *
+from stats import *
+
+SOURCE = """
+total: int = 3;
+func add(x: int, y: int): int { return x + y; }
+func main(): int {
+    a: int = add(1, total);
+    if a == 4 { a = add(a, 1); }
+    return a;
+}
+"""
+
+class TestStats(unittest.TestCase):
+    def testPhases(self):
+        stats = CompileStats()
+        with stats.phase("lex"):
+            tokens = Lexxer(SOURCE).lex()
+        with stats.phase("allocate"):
+            kept = [[i] for i in range(10000)]
+        with self.assertRaises(Exception):
+            with stats.phase("fail"):
+                raise Exception("failed")
+        stats.finish()
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertEqual([phase.name for phase in stats.phases], ["lex", "allocate", "fail"])
+        self.assertGreater(stats.phases[1].peakBytes, 10000 * 56)
+        self.assertEqual(stats.toDict()["failedPhase"], "fail")
+
+    def testCounters(self):
+        stats = CompileStats(traceMemory = False)
+        tokens = list(stats.countTokens(Lexxer(SOURCE).lex()))
+        nodes = Parser(tokens, SOURCE).parse()
+        stats.countNodes(nodes)
+        analyzer = Analyzer(nodes, SOURCE)
+        stats.watchAnalyzer(analyzer)
+        analyzer.analyze()
+        stats.finish()
+        self.assertEqual(stats.counters, {"tokens": len(tokens), "signatureLookups": 5, "errors": 0})
+        self.assertEqual(stats.nodeCounts, {
+            "CallNode": 5, "DeclarationNode": 1, "FunctionNode": 2, "GlobalDeclarationNode": 1, "IdentifierNode": 7,
+            "IfNode": 1, "LiteralNode": 4, "ReturnNode": 2, "VariableNode": 4})
+
+    def testNothingInstalledWithoutStats(self):
+        # The analyzer keeps its own method, nothing wraps it
+        self.assertNotIn("findFunctionSignatureFromCallNode", vars(Analyzer([], "")))
+        self.assertIs(measurePhase(None, "lex"), NO_PHASE)
+
+    def testCli(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sourcePath = os.path.join(directory, "program.ul")
+            statsPath = os.path.join(directory, "stats.json")
+            profilePath = os.path.join(directory, "profile.txt")
+            with open(sourcePath, "w") as outputFile:
+                outputFile.write(SOURCE)
+            self.assertEqual(cli.main([sourcePath, "--stats-file", statsPath, "--profile-file", profilePath, "--fold", "-o", os.path.join(directory, "program.s")]), 0)
+            with open(statsPath) as inputFile:
+                result = json.load(inputFile)
+            with open(profilePath) as inputFile:
+                profile = inputFile.read()
+        self.assertEqual([phase["name"] for phase in result["phases"]], ["lex", "parse", "analyze", "optimize", "codegen"])
+        self.assertEqual(result["counters"]["signatureLookups"], 5)
+        self.assertEqual(result["nodes"]["FunctionNode"], 2)
+        self.assertIn("cumulative", profile)
+
+    def testFlagsBeforeFiles(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sourcePath = os.path.join(directory, "program.ul")
+            with open(sourcePath, "w") as outputFile:
+                outputFile.write(SOURCE)
+            errors = io.StringIO()
+            with contextlib.redirect_stderr(errors):
+                self.assertEqual(cli.main(["--stats", "--profile", sourcePath]), 0)
+        # Both went to stderr, and the file was still compiled
+        self.assertEqual(json.JSONDecoder().raw_decode(errors.getvalue())[0]["counters"]["signatureLookups"], 5)
+        self.assertIn("cumulative", errors.getvalue())
+
+    def testProfileSkipsCache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sourcePath = os.path.join(directory, "program.ul")
+            profilePath = os.path.join(directory, "profile.txt")
+            cacheDirectory = os.path.join(directory, "cache")
+            with open(sourcePath, "w") as outputFile:
+                outputFile.write(SOURCE)
+            # The second run would otherwise just load the first one's output
+            for _ in range(2):
+                self.assertEqual(cli.main([sourcePath, "--cache-dir", cacheDirectory, "--profile-file", profilePath, "-o", os.path.join(directory, "program.s")]), 0)
+                with open(profilePath) as inputFile:
+                    self.assertIn("(analyze)", inputFile.read())
+            self.assertFalse(os.path.exists(cacheDirectory))
+
+if __name__ == "__main__":
+    unittest.main()
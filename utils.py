@@ -1,17 +1,27 @@
+import gc
+from bisect import bisect_right
+from contextlib import contextmanager
+
+# Pauses the cyclic garbage collector for the with block, for code that
+# allocates in bulk without making cyclic garbage, where it would otherwise
+# rescan everything built so far more and more often as it grows. Leaves it
+# disabled afterwards if it already was.
+@contextmanager
+def gcPaused():
+    wasEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if wasEnabled:
+            gc.enable()
+
 def repeat(char, length):
     string = ""
     for i in range(length):
         string += char
     return string
 
-def stringToNumber(string):
-    number = 0
-    for char in string:
-        number *= 10
-        # ord(c) converts a character to its numeric value
-        number += ord(char) - ord("0")
-    return number
-
 def isDigit(char):
     return char >= "0" and char <= "9"
 
@@ -21,32 +31,81 @@ def isAlpha(char):
 def isIdentifier(char):
     return isAlpha(char) or char == "_"
 
-def displayError(string, pos, errorMessage):
+# Maps offsets back to lines and columns for diagnostics. The index of line
+# starts is only built the first time it's needed, since most runs never
+# report an error. The text itself can be left out and read from path on
+# first use, for when the input was streamed.
+class SourceFile:
+    def __init__(self, text, path = None):
+        self.text = text
+        self.path = path
+        self.lineStarts = None
+
+    def getText(self):
+        if self.text is None:
+            with open(self.path) as inputFile:
+                self.text = inputFile.read()
+        return self.text
+
+    def getLineStarts(self):
+        if self.lineStarts is None:
+            text = self.getText()
+            lineStarts = [0]
+            index = text.find("\n")
+            while index >= 0:
+                lineStarts.append(index + 1)
+                index = text.find("\n", index + 1)
+            self.lineStarts = lineStarts
+        return self.lineStarts
+
+    def position(self, offset):
+        lineStarts = self.getLineStarts()
+        linePos = bisect_right(lineStarts, offset) - 1
+        return (linePos, offset - lineStarts[linePos])
+
+    def line(self, linePos):
+        lineStarts = self.getLineStarts()
+        if linePos < 0 or linePos >= len(lineStarts):
+            return ""
+        if linePos + 1 < len(lineStarts):
+            return self.text[lineStarts[linePos]:lineStarts[linePos + 1] - 1]
+        return self.text[lineStarts[linePos]:]
+
+INT64_MIN = -(1 << 63)
+
+# Wraps an integer around to a signed 64-bit value, the same way the
+# generated code's arithmetic does
+def toInt64(value):
+    value &= (1 << 64) - 1
+    if value >= 1 << 63:
+        value -= 1 << 64
+    return value
+
+def toSourceFile(source):
+    if isinstance(source, SourceFile):
+        return source
+    return SourceFile(source)
+
+# pos is an offset into the source, which can be a string or a SourceFile.
+# Pass a SourceFile when displaying many errors so the line index is reused.
+def displayError(source, pos, errorMessage):
     if pos == None:
         print()
         print(errorMessage)
         print()
+    elif source == None:
+        print()
+        print("At offset {}:".format(pos))
+        print(errorMessage)
+        print()
     else:
-        errorLinePos, errorCharPos = pos
-        linePos = 0
-        linePrevious = ""
-        line = ""
-        lineNext = ""
-        for char in string:
-            if char == "\n":
-                if linePos > errorLinePos:
-                    break
-                linePrevious = line
-                line = lineNext
-                lineNext = ""
-                linePos += 1
-            else:
-                lineNext += char
+        source = toSourceFile(source)
+        errorLinePos, errorCharPos = source.position(pos)
         print()
-        print(linePrevious)
-        print(line)
+        print(source.line(errorLinePos - 1))
+        print(source.line(errorLinePos))
         print(repeat("-", errorCharPos) + "^")
-        print(lineNext)
+        print(source.line(errorLinePos + 1))
         print(errorMessage)
         print()
 
@@ -78,37 +137,57 @@ class ArrayBuffer:
         self.i += 1
         return item
 
-class TrackedStringBuffer:
-    def __init__(self, string):
+    # The whole array is already in memory, so there's nothing to give back
+    def release(self):
+        pass
+
+# Same interface as ArrayBuffer, but pulls items from an iterator on demand.
+# Consumed items are kept until release() is called so that the caller can
+# still hold on to them, e.g. for the duration of a single declaration.
+class StreamBuffer:
+    def __init__(self, iterator):
         self.i = 0
-        self.string = string
-        self.linePos = 0
-        self.charPos = 0
+        self.window = []
+        self.iterator = iterator
+        self.last = None
+
+    def fill(self):
+        if self.i < len(self.window):
+            return True
+        for item in self.iterator:
+            self.window.append(item)
+            return True
+        return False
 
     def remaining(self):
-        return len(self.string) - self.i
+        if not self.fill():
+            return 0
+        return len(self.window) - self.i
+
+    def lookback(self):
+        if self.i <= 0:
+            if self.last is not None:
+                return self.last
+            return self.peek()
+
+        return self.window[self.i - 1]
 
     def peek(self):
-        if self.i > len(self.string) - 1:
-            return ""
+        if not self.fill():
+            return None
 
-        return self.string[self.i]
+        return self.window[self.i]
 
     def consume(self):
-        if self.i > len(self.string) - 1:
-            return ""
+        if not self.fill():
+            return None
 
-        char = self.string[self.i]
+        item = self.window[self.i]
         self.i += 1
+        return item
 
-        if char == "\n":
-            self.linePos += 1
-            self.charPos = 0
-        else:
-            self.charPos += 1
-
-        return char
-
-    def position(self):
-        return (self.linePos, self.charPos - 1)
-
+    def release(self):
+        if self.i > 0:
+            self.last = self.window[self.i - 1]
+            del self.window[:self.i]
+            self.i = 0
@@ -0,0 +1,44 @@
+import gc
+import io
+import unittest
+from contextlib import redirect_stdout
+from utils import *
+
+class TestUtils(unittest.TestCase):
+    def testSourceFilePosition(self):
+        source = SourceFile("first\n\nthird line\nlast")
+        self.assertEqual(source.position(0), (0, 0))
+        self.assertEqual(source.position(4), (0, 4))
+        self.assertEqual(source.position(6), (1, 0))
+        self.assertEqual(source.position(12), (2, 5))
+        self.assertEqual(source.position(21), (3, 3))
+        self.assertEqual(source.line(2), "third line")
+        self.assertEqual(source.line(3), "last")
+        self.assertEqual(source.line(4), "")
+
+    def testDisplayError(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            displayError("a: int = 1;\nb: int = c;\n", 21, "Variable not found: 'c'.")
+        expected = "\na: int = 1;\nb: int = c;\n---------^\n\nVariable not found: 'c'.\n\n"
+        self.assertEqual(output.getvalue(), expected)
+
+    def testGcPaused(self):
+        with gcPaused():
+            self.assertFalse(gc.isenabled())
+        self.assertTrue(gc.isenabled())
+        # A caller that already disabled it keeps it disabled
+        gc.disable()
+        try:
+            with gcPaused():
+                pass
+            self.assertFalse(gc.isenabled())
+        finally:
+            gc.enable()
+        with self.assertRaises(Exception):
+            with gcPaused():
+                raise Exception("failed")
+        self.assertTrue(gc.isenabled())
+
+if __name__ == "__main__":
+    unittest.main()
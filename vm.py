@@ -0,0 +1,382 @@
+from ir import *
+from compile import *
+
+# A bytecode backend that runs programs directly, without an assembler.
+# Each function's SSA IR (see ir.py) is compiled to a flat list of register
+# machine instructions, the same way compile.py lowers it for x86-64: every
+# IR value gets its own register in the function's frame, and phis become
+# copies on the edges into their block.
+#
+# Instructions are tuples of (opcode, a, b, c), decoded once at compile
+# time: register numbers, immediates, jump targets as instruction indices
+# and callees as the VMFunction itself. Constants are preloaded into
+# registers of their own, so a call starts from a copy of its function's
+# register template. The dispatch loop unpacks one tuple per instruction and
+# doesn't build any objects of its own, apart from the frames of calls.
+#
+# Superinstructions cover the most common operator patterns: arithmetic
+# with a literal operand, and an == or != feeding a branch, which becomes a
+# single compare and jump.
+
+OP_MOVE = 0                         # a = b
+OP_ADD_IMMEDIATE = 1                # a = b + c, with c a value
+OP_JUMP_IF_EQUAL = 2                # to c if a == b
+OP_JUMP_IF_NOT_EQUAL = 3            # to c if a != b
+OP_JUMP_IF_EQUAL_IMMEDIATE = 4      # to c if a == b, with b a value
+OP_JUMP_IF_NOT_EQUAL_IMMEDIATE = 5  # to c if a != b, with b a value
+OP_JUMP = 6                         # to a
+OP_ADD = 7                          # a = b + c
+OP_SUB = 8                          # a = b - c
+OP_MUL = 9                          # a = b * c
+OP_SUB_IMMEDIATE = 10               # a = b - c, with c a value
+OP_MUL_IMMEDIATE = 11               # a = b * c, with c a value
+OP_JUMP_IF_ZERO = 12                # to b if a is 0
+OP_CALL = 13                        # a = call of the VMFunction b with the registers in c
+OP_RETURN = 14                      # a from the function
+OP_LOAD_GLOBAL = 15                 # a = global number b
+OP_STORE_GLOBAL = 16                # global number b = a
+OP_EQ = 17                          # a = 1 if b == c, else 0
+OP_NE = 18                          # a = 1 if b != c, else 0
+OP_DIV = 19                         # a = b / c, truncated
+
+OP_NAMES = [
+        "move", "addImmediate", "jumpIfEqual", "jumpIfNotEqual", "jumpIfEqualImmediate",
+        "jumpIfNotEqualImmediate", "jump", "add", "sub", "mul", "subImmediate", "mulImmediate",
+        "jumpIfZero", "call", "return", "loadGlobal", "storeGlobal", "eq", "ne", "div",
+]
+
+INT64_MAX = (1 << 63) - 1
+
+MAX_CALL_DEPTH = 1000000
+
+REGISTER_OPS = {"add": OP_ADD, "sub": OP_SUB, "mul": OP_MUL, "div": OP_DIV, "eq": OP_EQ, "ne": OP_NE}
+IMMEDIATE_OPS = {"add": OP_ADD_IMMEDIATE, "sub": OP_SUB_IMMEDIATE, "mul": OP_MUL_IMMEDIATE}
+# The jump taken to the false target, for a branch on each comparison
+FUSED_JUMPS = {"eq": OP_JUMP_IF_NOT_EQUAL, "ne": OP_JUMP_IF_EQUAL}
+FUSED_IMMEDIATE_JUMPS = {"eq": OP_JUMP_IF_NOT_EQUAL_IMMEDIATE, "ne": OP_JUMP_IF_EQUAL_IMMEDIATE}
+
+class VMFunction:
+    def __init__(self, signature, parameterCount):
+        self.signature = signature
+        self.parameterCount = parameterCount
+        self.code = []
+        # Initial registers: zeros, with the constants in place
+        self.template = []
+
+    def __repr__(self):
+        return "VMFunction({})".format(self.signature)
+
+class VMProgram:
+    def __init__(self, functions, globalNames, globalValues):
+        # Signature -> VMFunction
+        self.functions = functions
+        self.globalNames = globalNames
+        self.globalValues = globalValues
+
+    def findFunction(self, name, paramTypes = []):
+        for signature, function in self.functions.items():
+            if signature.partialMatch(name, paramTypes):
+                return function
+        return None
+
+# Compiles one function. superinstructions = False only uses the plain
+# register forms, for comparison.
+class FunctionCompiler:
+    def __init__(self, compiler, function, vmFunction):
+        self.compiler = compiler
+        self.function = function
+        self.vmFunction = vmFunction
+        self.superinstructions = compiler.superinstructions
+        self.registerCount = function.valueCount
+        # Constant value -> the register it's preloaded in
+        self.constantRegisters = {}
+        # Instructions as lists until jump targets are known
+        self.code = []
+        # Block or trampoline label -> instruction index
+        self.labels = {}
+        # (instruction index, operand index, label) to fill in
+        self.fixups = []
+        self.useCounts = {}
+        for block in function.blocks:
+            for phi in block.phis:
+                for predecessor, value in phi.incoming:
+                    self.addUse(value)
+            for instruction in block.instructions:
+                for operand in instruction.operands:
+                    self.addUse(operand)
+
+    def addUse(self, value):
+        if isinstance(value, Value):
+            self.useCounts[value] = self.useCounts.get(value, 0) + 1
+
+    def newRegister(self):
+        register = self.registerCount
+        self.registerCount += 1
+        return register
+
+    def register(self, value):
+        if isinstance(value, Constant):
+            constant = toInt64(value.value)
+            register = self.constantRegisters.get(constant)
+            if register is None:
+                register = self.newRegister()
+                self.constantRegisters[constant] = register
+            return register
+        return value.id
+
+    def emit(self, op, a = None, b = None, c = None):
+        self.code.append([op, a, b, c])
+
+    def emitJump(self, op, a, b, label):
+        operands = [op, a, b, None]
+        # The target goes in the first free operand
+        position = operands.index(None)
+        self.fixups.append((len(self.code), position, label))
+        self.code.append(operands)
+
+    def compile(self):
+        blocks = self.function.blocks
+        # The branch each fused comparison's result goes to
+        fused = set()
+        for i, block in enumerate(blocks):
+            self.labels[block] = len(self.code)
+            nextBlock = blocks[i + 1] if i + 1 < len(blocks) else None
+            instructions = block.instructions
+            for j, instruction in enumerate(instructions):
+                if instruction in fused:
+                    continue
+                if self.superinstructions and self.canFuse(instruction, instructions, j):
+                    fused.add(instruction)
+                    self.compileFusedBranch(block, instruction, instructions[j + 1], nextBlock)
+                    fused.add(instructions[j + 1])
+                    continue
+                self.compileInstruction(block, instruction, nextBlock)
+        for index, position, label in self.fixups:
+            self.code[index][position] = self.labels[label]
+        template = [0] * self.registerCount
+        for constant, register in self.constantRegisters.items():
+            template[register] = constant
+        self.vmFunction.code = [tuple(instruction) for instruction in self.code]
+        self.vmFunction.template = template
+
+    # An == or != whose only use is the branch right after it
+    def canFuse(self, instruction, instructions, j):
+        if instruction.op not in FUSED_JUMPS or j + 1 >= len(instructions):
+            return False
+        branch = instructions[j + 1]
+        return (branch.op == "branch" and branch.operands[0] is instruction.result
+                and self.useCounts.get(instruction.result) == 1)
+
+    def compileInstruction(self, block, instruction, nextBlock):
+        op = instruction.op
+        if op in BINARY_OPS:
+            left, right = instruction.operands
+            if self.superinstructions and op in IMMEDIATE_OPS:
+                # Addition and multiplication don't care which side the literal is on
+                if isinstance(left, Constant) and not isinstance(right, Constant) and op != "sub":
+                    left, right = right, left
+                if isinstance(right, Constant) and not isinstance(left, Constant):
+                    self.emit(IMMEDIATE_OPS[op], instruction.result.id, self.register(left), toInt64(right.value))
+                    return
+            self.emit(REGISTER_OPS[op], instruction.result.id, self.register(left), self.register(right))
+        elif op == "call":
+            callee = self.compiler.vmFunctions[instruction.callee]
+            arguments = tuple(self.register(operand) for operand in instruction.operands)
+            self.emit(OP_CALL, instruction.result.id, callee, arguments)
+        elif op == "load":
+            self.emit(OP_LOAD_GLOBAL, instruction.result.id, self.compiler.globalIndices[instruction.name])
+        elif op == "store":
+            self.emit(OP_STORE_GLOBAL, self.register(instruction.operands[0]), self.compiler.globalIndices[instruction.name])
+        elif op == "jump":
+            self.jumpTo(block, instruction.targets[0], nextBlock)
+        elif op == "branch":
+            self.compileBranch(block, instruction, OP_JUMP_IF_ZERO, self.register(instruction.operands[0]), None, nextBlock)
+        elif op == "return":
+            self.emit(OP_RETURN, self.register(instruction.operands[0]))
+        else:
+            raise Exception("Can't compile '{}' to bytecode".format(instruction))
+
+    def compileFusedBranch(self, block, comparison, branch, nextBlock):
+        left, right = comparison.operands
+        if isinstance(left, Constant) and not isinstance(right, Constant):
+            left, right = right, left
+        if isinstance(right, Constant) and not isinstance(left, Constant):
+            op = FUSED_IMMEDIATE_JUMPS[comparison.op]
+            self.compileBranch(block, branch, op, self.register(left), toInt64(right.value), nextBlock)
+        else:
+            op = FUSED_JUMPS[comparison.op]
+            self.compileBranch(block, branch, op, self.register(left), self.register(right), nextBlock)
+
+    # Jumps to the false target with op, and falls through to the true one.
+    # An edge into a block with phis gets its own copies on the way.
+    def compileBranch(self, block, branch, op, a, b, nextBlock):
+        trueTarget, falseTarget = branch.targets
+        falseLabel = falseTarget
+        if len(falseTarget.phis) > 0:
+            falseLabel = (block, falseTarget)
+        self.emitJump(op, a, b, falseLabel)
+        self.jumpTo(block, trueTarget, nextBlock if falseLabel is falseTarget else None)
+        if falseLabel is not falseTarget:
+            self.labels[falseLabel] = len(self.code)
+            self.jumpTo(block, falseTarget, nextBlock)
+
+    # Copies block's values into target's phis, then jumps unless target is
+    # laid out next
+    def jumpTo(self, block, target, nextBlock):
+        copies = []
+        for phi in target.phis:
+            for predecessor, value in phi.incoming:
+                if predecessor is block:
+                    copies.append((phi.result.id, self.register(value)))
+        for dst, src in sequentializeCopies(copies, self.newRegister):
+            self.emit(OP_MOVE, dst, src)
+        if target is not nextBlock:
+            self.emitJump(OP_JUMP, None, None, target)
+
+class BytecodeCompiler:
+    # program is an IRProgram, see ir.lowerProgram
+    def __init__(self, program, superinstructions = True):
+        self.program = program
+        self.superinstructions = superinstructions
+        self.vmFunctions = {}
+        self.globalIndices = {}
+
+    def compile(self):
+        globalNames = []
+        globalValues = []
+        for irGlobal in self.program.globals:
+            self.globalIndices[irGlobal.name] = len(globalNames)
+            globalNames.append(irGlobal.name)
+            globalValues.append(toInt64(irGlobal.value))
+        # Every function exists before any call to it is compiled
+        for function in self.program.functions:
+            self.vmFunctions[function.signature] = VMFunction(function.signature, len(function.parameters))
+        for function in self.program.functions:
+            FunctionCompiler(self, function, self.vmFunctions[function.signature]).compile()
+        return VMProgram(self.vmFunctions, globalNames, globalValues)
+
+class VirtualMachine:
+    def __init__(self, program):
+        self.program = program
+        self.globals = list(program.globalValues)
+        # Instructions run by the last call
+        self.executedCount = 0
+
+    def call(self, function, arguments):
+        if len(arguments) != function.parameterCount:
+            raise Exception("{} takes {} arguments, not {}".format(function.signature, function.parameterCount, len(arguments)))
+        globals = self.globals
+        code = function.code
+        registers = function.template[:]
+        for i, argument in enumerate(arguments):
+            registers[i] = toInt64(argument)
+        # Callers' (code, pc, registers, result register)
+        frames = []
+        pc = 0
+        executed = 0
+        # Tested roughly in order of how often they run
+        while True:
+            op, a, b, c = code[pc]
+            pc += 1
+            executed += 1
+            if op == OP_MOVE:
+                registers[a] = registers[b]
+            elif op == OP_ADD_IMMEDIATE:
+                value = registers[b] + c
+                if value > INT64_MAX or value < INT64_MIN:
+                    value = toInt64(value)
+                registers[a] = value
+            elif op == OP_JUMP_IF_EQUAL:
+                if registers[a] == registers[b]:
+                    pc = c
+            elif op == OP_JUMP_IF_NOT_EQUAL:
+                if registers[a] != registers[b]:
+                    pc = c
+            elif op == OP_JUMP_IF_EQUAL_IMMEDIATE:
+                if registers[a] == b:
+                    pc = c
+            elif op == OP_JUMP_IF_NOT_EQUAL_IMMEDIATE:
+                if registers[a] != b:
+                    pc = c
+            elif op == OP_JUMP:
+                pc = a
+            elif op == OP_ADD:
+                value = registers[b] + registers[c]
+                if value > INT64_MAX or value < INT64_MIN:
+                    value = toInt64(value)
+                registers[a] = value
+            elif op == OP_SUB:
+                value = registers[b] - registers[c]
+                if value > INT64_MAX or value < INT64_MIN:
+                    value = toInt64(value)
+                registers[a] = value
+            elif op == OP_MUL:
+                value = registers[b] * registers[c]
+                if value > INT64_MAX or value < INT64_MIN:
+                    value = toInt64(value)
+                registers[a] = value
+            elif op == OP_SUB_IMMEDIATE:
+                value = registers[b] - c
+                if value > INT64_MAX or value < INT64_MIN:
+                    value = toInt64(value)
+                registers[a] = value
+            elif op == OP_MUL_IMMEDIATE:
+                value = registers[b] * c
+                if value > INT64_MAX or value < INT64_MIN:
+                    value = toInt64(value)
+                registers[a] = value
+            elif op == OP_JUMP_IF_ZERO:
+                if registers[a] == 0:
+                    pc = b
+            elif op == OP_CALL:
+                if len(frames) >= MAX_CALL_DEPTH:
+                    self.executedCount = executed
+                    raise Exception("Call stack overflow calling {}".format(b.signature))
+                frames.append((code, pc, registers, a))
+                calleeRegisters = b.template[:]
+                for i, register in enumerate(c):
+                    calleeRegisters[i] = registers[register]
+                code = b.code
+                registers = calleeRegisters
+                pc = 0
+            elif op == OP_RETURN:
+                value = registers[a]
+                if len(frames) == 0:
+                    self.executedCount = executed
+                    return value
+                code, pc, registers, result = frames.pop()
+                registers[result] = value
+            elif op == OP_LOAD_GLOBAL:
+                registers[a] = globals[b]
+            elif op == OP_STORE_GLOBAL:
+                globals[b] = registers[a]
+            elif op == OP_EQ:
+                registers[a] = 1 if registers[b] == registers[c] else 0
+            elif op == OP_NE:
+                registers[a] = 1 if registers[b] != registers[c] else 0
+            elif op == OP_DIV:
+                left = registers[b]
+                right = registers[c]
+                if right == 0:
+                    self.executedCount = executed
+                    raise Exception("Division by zero")
+                if left == INT64_MIN and right == -1:
+                    self.executedCount = executed
+                    raise Exception("Division overflow")
+                value = abs(left) // abs(right)
+                if (left < 0) != (right < 0):
+                    value = -value
+                registers[a] = value
+            else:
+                raise Exception("Unknown opcode {}".format(op))
+
+# Textual form of a function's instructions, one per line with its index
+def formatCode(function):
+    lines = []
+    for pc, (op, a, b, c) in enumerate(function.code):
+        operands = [operand for operand in (a, b, c) if operand is not None]
+        lines.append("{:>4}: {} {}".format(pc, OP_NAMES[op], ", ".join(repr(operand) for operand in operands)).rstrip())
+    return "\n".join(lines)
+
+def compileBytecode(nodes, programDetails, superinstructions = True):
+    return BytecodeCompiler(lowerProgram(nodes, programDetails), superinstructions).compile()
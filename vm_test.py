@@ -0,0 +1,119 @@
+import unittest
+from lex import *
+from parse import *
+from analyze import *
+from vm import *
+
+def compileSource(originalString, superinstructions = True):
+    nodes = Parser(Lexxer(originalString).lexCompact(), originalString).parse()
+    programDetails = Analyzer(nodes, originalString).analyze()
+    return compileBytecode(nodes, programDetails, superinstructions)
+
+# Runs compute with both instruction sets and checks they agree
+def runCompute(originalString, arguments = []):
+    results = []
+    for superinstructions in (True, False):
+        program = compileSource(originalString, superinstructions)
+        function = program.findFunction("compute", ["int"] * len(arguments))
+        results.append(VirtualMachine(program).call(function, arguments))
+    if results[0] != results[1]:
+        raise Exception("Superinstructions changed the result: {} and {}".format(results[0], results[1]))
+    return results[0]
+
+class TestVM(unittest.TestCase):
+    def testArithmetic(self):
+        self.assertEqual(runCompute("func compute(): int { return 1 + 2 * 3 - 10 / 3; }"), 4)
+        self.assertEqual(runCompute("func compute(x: int): int { return (0 - 7) / x + x / 2; }", [2]), -2)
+        self.assertEqual(runCompute("func compute(x: int): int { return (x == 3) + (x != 3) * 10 + (2 != x) * 100; }", [3]), 101)
+
+    def testWraparound(self):
+        self.assertEqual(runCompute("func compute(x: int): int { return x + 1; }", [9223372036854775807]), -9223372036854775808)
+        self.assertEqual(runCompute("func compute(x: int): int { return x * x + x; }", [4294967296]), 4294967296)
+        self.assertEqual(runCompute("func compute(x: int): int { return 0 - x - 2; }", [9223372036854775807]), 9223372036854775807)
+
+    def testDivisionErrors(self):
+        with self.assertRaisesRegex(Exception, "Division by zero"):
+            runCompute("func compute(x: int): int { return 1 / x; }", [0])
+        with self.assertRaisesRegex(Exception, "Division overflow"):
+            runCompute("func compute(x: int): int { return (0 - 9223372036854775807 - 1) / x; }", [-1])
+
+    def testLoopsAndPhis(self):
+        self.assertEqual(runCompute("""
+        func compute(n: int): int {
+            a: int = 1;
+            b: int = 2;
+            i: int = 0;
+            while i != n {
+                t: int = a;
+                a = b;
+                b = t;
+                i = i + 1;
+            }
+            return a * 10 + b;
+        }""", [5]), 21)
+        self.assertEqual(runCompute("""
+        func pick(x: int): int {
+            y: int = 3;
+            if x == 1 { y = 10; } else { if x == 2 { return 7; } }
+            return y;
+        }
+        func compute(): int { return pick(1) * 100 + pick(2) * 10 + pick(3); }"""), 1073)
+
+    def testCallsAndGlobals(self):
+        self.assertEqual(runCompute("""
+        counter: int = 5;
+        func bump(by: int): int {
+            counter = counter + by;
+            return counter;
+        }
+        func fib(n: int): int {
+            if n == 0 { return 0; }
+            if n == 1 { return 1; }
+            return fib(n - 1) + fib(n - 2);
+        }
+        func compute(): int {
+            bump(2);
+            x: int = bump(3);
+            return x * 100 + counter + fib(15) * 10000;
+        }"""), 6101010)
+
+    def testDeepRecursion(self):
+        self.assertEqual(runCompute("""
+        func sum(n: int): int {
+            if n == 0 { return 0; }
+            return n + sum(n - 1);
+        }
+        func compute(n: int): int { return sum(n); }""", [100000]), 5000050000)
+
+    def testSuperinstructions(self):
+        originalString = """
+        func compute(n: int): int {
+            i: int = 0;
+            total: int = 0;
+            while i != n {
+                total = total + i * 3;
+                i = i + 1;
+            }
+            return total;
+        }"""
+        program = compileSource(originalString)
+        function = program.findFunction("compute", ["int"])
+        code = formatCode(function)
+        self.assertIn("mulImmediate", code)
+        self.assertIn("addImmediate", code)
+        self.assertIn("jumpIfEqual", code)
+        self.assertNotIn(" ne ", code)
+        machine = VirtualMachine(program)
+        self.assertEqual(machine.call(function, [10]), 135)
+        plainProgram = compileSource(originalString, False)
+        plainMachine = VirtualMachine(plainProgram)
+        plainMachine.call(plainProgram.findFunction("compute", ["int"]), [10])
+        self.assertLess(machine.executedCount, plainMachine.executedCount)
+
+    def testWrongArgumentCount(self):
+        program = compileSource("func compute(x: int): int { return x; }")
+        with self.assertRaises(Exception):
+            VirtualMachine(program).call(program.findFunction("compute", ["int"]), [])
+
+if __name__ == "__main__":
+    unittest.main()